@@ -0,0 +1,58 @@
+"""
+Cost of a diagnostics sample
+
+Compares one `GlobalDiagnostics.evaluate()` call with the previous approach of pulling the velocity
+and density fields into NumPy and reducing them there, and with a single LBM time step.
+
+Usage (from the repository root):
+    python benchmarks/diagnostics_cost.py --size 1024
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy import create_scenario
+from learn_lbmpy.diagnostics import GlobalDiagnostics
+
+
+def best_of(function, repeat=10):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def numpy_diagnostics(scenario):
+    scenario.post_run()  # macroscopic values are only written at the end of a run
+    u = scenario.velocity_slice(masked=False)
+    rho = scenario.density_slice(masked=False)
+    kinetic_energy = 0.5 * (rho * (u ** 2).sum(axis=-1)).sum()
+    vorticity = np.gradient(u[..., 1], axis=0) - np.gradient(u[..., 0], axis=1)
+    return rho.sum(), kinetic_energy, 0.5 * (vorticity ** 2).sum()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=1024)
+    args = parser.parse_args()
+
+    scenario = create_scenario('shear_layer', width=args.size, height=args.size, seed=0)
+    diagnostics = GlobalDiagnostics(scenario)
+    scenario.run(2)
+
+    t_step = best_of(lambda: scenario.run(1))
+    t_kernel = best_of(diagnostics.evaluate)
+    t_numpy = best_of(lambda: numpy_diagnostics(scenario))
+
+    print(f"{args.size}x{args.size} shear layer")
+    print(f"  one time step            : {t_step * 1e3:8.2f} ms")
+    print(f"  in-kernel diagnostics    : {t_kernel * 1e3:8.2f} ms")
+    print(f"  gather + NumPy reduction : {t_numpy * 1e3:8.2f} ms")
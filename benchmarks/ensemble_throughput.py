@@ -0,0 +1,76 @@
+"""
+Ensemble throughput
+
+Compares three ways of advancing N small fully periodic shear layers:
+1) N separate `create_fully_periodic_flow` scenarios, run one after another,
+2) one `PeriodicEnsemble` holding all N members,
+3) a single large domain with the same total number of cells (upper bound).
+
+Usage (from the repository root):
+    python benchmarks/ensemble_throughput.py --members 16 --size 100 --steps 200
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+from lbmpy import LBMConfig, Method
+from lbmpy.scenarios import create_fully_periodic_flow
+
+from learn_lbmpy.ensemble import PeriodicEnsemble
+from learn_lbmpy.scenarios import shear_layer_velocity, _kernel_config
+
+
+def mlups(cells, steps, seconds):
+    return cells * steps / seconds * 1e-6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--members', type=int, default=16)
+    parser.add_argument('--size', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--method', default='SRT')
+    args = parser.parse_args()
+
+    n, size, steps = args.members, args.size, args.steps
+    lbm_config = LBMConfig(method=Method[args.method], relaxation_rate=1.97, compressible=True)
+    config = _kernel_config()
+    velocities = [shear_layer_velocity(size, size, seed=m) for m in range(n)]
+
+    # 1) one scenario per member. Kernels are identical, so only the first one is compiled.
+    scenarios = [create_fully_periodic_flow(initial_velocity=v, lbm_config=lbm_config, config=config)
+                 for v in velocities]
+    for s in scenarios:
+        s.run(1)
+    start = time.perf_counter()
+    for s in scenarios:
+        for _ in range(steps):
+            s.run(1)
+    separate_step = mlups(n * size * size, steps, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for s in scenarios:
+        s.run(steps)
+    separate_loop = mlups(n * size * size, steps, time.perf_counter() - start)
+
+    # 2) all members in one ensemble
+    ensemble = PeriodicEnsemble(velocities, lbm_config=lbm_config, config=config)
+    ensemble.run(1)
+    ensemble_mlups = ensemble.benchmark_run(steps)
+
+    # 3) one large domain with the same number of cells
+    side = int(round(np.sqrt(n))) * size
+    large = create_fully_periodic_flow(initial_velocity=shear_layer_velocity(side, n * size * size // side),
+                                       lbm_config=lbm_config, config=config)
+    large_mlups = large.benchmark_run(steps)
+
+    print(f"{n} members of {size}x{size}, {args.method}, {steps} steps")
+    print(f"  separate scenarios, run(1) per step : {separate_step:8.1f} MLUPS")
+    print(f"  separate scenarios, run(steps)      : {separate_loop:8.1f} MLUPS")
+    print(f"  ensemble                            : {ensemble_mlups:8.1f} MLUPS")
+    print(f"  single large domain                 : {large_mlups:8.1f} MLUPS")
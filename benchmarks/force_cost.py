@@ -0,0 +1,65 @@
+"""
+Cost of recording obstacle forces
+
+Runs the Re=100000 cylinder of `04_cumulant_lbm` with the plain `NoSlip` obstacle, with the force
+accumulating `MomentumExchangeNoSlip` sampled every step, and sampled every 10 steps, and compares
+with lbmpy's Python `force_on_boundary` evaluated every step.
+
+Usage (from the repository root):
+    python benchmarks/force_cost.py --steps 2000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from learn_lbmpy import create_scenario
+from learn_lbmpy.forces import ForceEvaluator
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def python_forces(scenario, steps):
+    obstacle = [b for b in scenario.boundary_handling.boundary_objects if b.name == 'obstacle'][0]
+    for _ in range(steps):
+        scenario.run(1)
+        scenario.boundary_handling.force_on_boundary(obstacle)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--reference-length', type=int, default=30)
+    args = parser.parse_args()
+
+    def cylinder(obstacle_forces):
+        scenario = create_scenario('cylinder', reference_length=args.reference_length, obstacle_forces=obstacle_forces)
+        scenario.run(10)
+        return scenario
+
+    plain = cylinder(False)
+    t_plain = timed(lambda: plain.run(args.steps))
+
+    t_every = {}
+    for every in (1, 10):
+        scenario = cylinder(True)
+        forces = ForceEvaluator(scenario, 'obstacle', every=every)
+        t_every[every] = timed(lambda: forces.run(args.steps))
+
+    python = cylinder(False)
+    python_steps = max(1, args.steps // 10)
+    t_python = timed(lambda: python_forces(python, python_steps)) * args.steps / python_steps
+
+    print(f"cylinder {plain.domain_size}, {args.steps} steps")
+    for label, t in [("no force evaluation", t_plain),
+                     ("in-kernel, every step", t_every[1]),
+                     ("in-kernel, every 10 steps", t_every[10]),
+                     ("force_on_boundary, every step", t_python)]:
+        print(f"  {label:30s}: {t:7.2f} s  ({t / t_plain:5.2f}x)")
@@ -0,0 +1,73 @@
+"""
+Cost of the live viewer for the simulation
+
+Runs a scenario in chunks of `--every` steps: without frames, publishing frames with no viewer attached, with a
+viewer process that keeps up and with a slow viewer that spends `--delay` seconds on each frame
+(`learn_lbmpy.live`). Reports MLUPS (best of `--repeats`), the frames published, shown and dropped, and the time
+spent publishing. The simulation never waits for the viewer, so the slow viewer only shows up as dropped frames -
+and, on a machine with a single core, as the CPU time the viewer process takes from the simulation.
+
+Usage (from the repository root):
+    python benchmarks/live_viewer.py --scenario cylinder --steps 2000 --fps 20 --every 10
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from learn_lbmpy.live import LivePublisher, frame_shape, launch_viewer, run_live, velocity_magnitude_frame
+from learn_lbmpy.registry import create_scenario
+
+
+def best_time(function, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_chunks(scenario, time_steps, every):
+    for _ in range(time_steps // every):
+        scenario.run(every)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenario', default='cylinder')
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--fps', type=float, default=20)
+    parser.add_argument('--every', type=int, default=10, help='time steps between frame offers')
+    parser.add_argument('--step', type=int, default=1, help='spatial decimation of the frames')
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds per frame of the slow viewer')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    scenario = create_scenario(args.scenario)
+    scenario.run(args.every)  # compile
+    cells = scenario.number_of_cells * args.steps
+    frame = velocity_magnitude_frame(scenario, args.step)
+
+    print(f"{args.scenario} on {scenario.domain_size}, {args.steps} steps, frame budget {args.fps:g} fps, "
+          f"frames of {frame_shape(scenario, args.step)}")
+    print(f"{'variant':20s}{'MLUPS':>8s}{'published':>11s}{'shown':>8s}{'dropped':>9s}{'publish s':>11s}")
+    duration = best_time(lambda: run_chunks(scenario, args.steps, args.every), args.repeats)
+    print(f"{'no frames':20s}{cells / duration * 1e-6:8.1f}")
+
+    for label, viewer, delay in [('no viewer', False, 0.0), ('viewer', True, 0.0),
+                                 (f'slow viewer {args.delay:g} s', True, args.delay)]:
+        with LivePublisher(frame_shape(scenario, args.step), fps=args.fps, label=label) as live:
+            process = launch_viewer(live.name, display=False, delay=delay, quiet=True) if viewer else None
+            while process is not None and not live.viewer_attached:
+                time.sleep(0.01)
+            duration = best_time(lambda: run_live(scenario, live, args.steps, every=args.every, frame=frame),
+                                 args.repeats)
+            stats = live.stats
+        if process is not None:
+            process.wait()
+        print(f"{label:20s}{cells / duration * 1e-6:8.1f}{stats['published']:11d}{stats['shown']:8d}"
+              f"{stats['dropped']:9d}{stats['publish_time']:11.3f}")
@@ -0,0 +1,82 @@
+"""
+Cost of the multiphase physics terms
+
+Adds the terms of the Shan-Chen solver one at a time to a periodic single-phase SRT kernel of the same
+stencil and reports the MLUPS and the time per cell update of each step:
+1) single phase, 2) plus a constant Guo body force, 3) plus the Shan-Chen interaction force in a separate
+stream and collide kernel, 4) the same force fused into one stream-collide kernel, 5) plus no-slip walls
+with a contact angle. The variants are measured alternately and the best of `--repeats` runs is kept.
+
+Usage (from the repository root):
+    python benchmarks/multiphase_cost.py --dim 3 --sizes 32 64 --steps 20 --repeats 5
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy import index_lists
+from learn_lbmpy.multiphase import PseudopotentialMultiphase, coexistence_densities, droplet_density
+from learn_lbmpy.scenarios import _kernel_config
+
+
+def single_phase(domain_size, stencil, force):
+    from dataclasses import replace
+    from lbmpy import ForceModel, LBMConfig, LBStencil, Method, Stencil
+    from lbmpy.scenarios import create_fully_periodic_flow
+
+    dim = len(domain_size)
+    lbm_config = LBMConfig(stencil=LBStencil(Stencil[stencil]), method=Method.SRT, relaxation_rate=1.0,
+                           compressible=True, zero_centered=False)
+    if force:
+        lbm_config = replace(lbm_config, force=(1e-6,) + (0,) * (dim - 1), force_model=ForceModel.GUO)
+    return create_fully_periodic_flow(np.zeros(domain_size + (dim,)), lbm_config=lbm_config, config=_kernel_config())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--dim', type=int, choices=(2, 3), default=3)
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help="edge length of the cubic (square) domain, default 32 64 in 3D and 256 512 in 2D")
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--interaction-strength', type=float, default=-5.0)
+    args = parser.parse_args()
+
+    sizes = args.sizes or ([32, 64] if args.dim == 3 else [256, 512])
+    stencil = 'D3Q19' if args.dim == 3 else 'D2Q9'
+    walls = ('B', 'T') if args.dim == 3 else ('S', 'N')
+    liquid, vapour = coexistence_densities(args.interaction_strength)
+    index_lists.install()
+
+    print(f"{stencil}, G = {args.interaction_strength}")
+    print(f"{'domain':>12s}  {'variant':32s}{'MLUPS':>8s}{'ns/cell':>9s}{'+ns/cell':>10s}")
+    for n in sizes:
+        domain_size = (n,) * args.dim
+        density = droplet_density(domain_size, radius=n / 4, liquid=liquid, vapour=vapour, width=4.0)
+        config = _kernel_config()
+        variants = {
+            'single phase': single_phase(domain_size, stencil, force=False),
+            '+ constant Guo force': single_phase(domain_size, stencil, force=True),
+            '+ Shan-Chen force, split': PseudopotentialMultiphase(
+                density, args.interaction_strength, fused=False, config=config, name='split'),
+            '+ Shan-Chen force, fused': PseudopotentialMultiphase(
+                density, args.interaction_strength, fused=True, config=config, name='fused'),
+            '+ contact-angle walls': PseudopotentialMultiphase(
+                density, args.interaction_strength, walls=walls, wall_density=0.5, fused=True, config=config,
+                name='walls'),
+        }
+        mlups = dict.fromkeys(variants, 0.0)
+        for _ in range(args.repeats):
+            for label, scenario in variants.items():
+                mlups[label] = max(mlups[label], scenario.benchmark_run(args.steps))
+
+        reference = 1e3 / mlups['single phase']
+        for label in variants:
+            ns = 1e3 / mlups[label]
+            print(f"{'x'.join(map(str, domain_size)):>12s}  {label:32s}{mlups[label]:8.1f}{ns:9.1f}"
+                  f"{ns - reference:10.1f}")
@@ -0,0 +1,50 @@
+"""
+Cost of the coupled thermocapillary layer at several update rates of the temperature
+
+Runs `learn_lbmpy.thermocapillary.ThermocapillaryLayer` with the temperature and the surface force updated every
+step and every n-th step (`--every`), and reports MLUPS, the time per cell update, the task calls and the ghost
+layer synchronizations per time step of the schedule. The variants are measured alternately, the best of
+`--repeats` runs is kept.
+
+Usage (from the repository root):
+    python benchmarks/multirate_coupling.py --dim 2 --sizes 256 --every 1 2 4 8
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from learn_lbmpy import index_lists
+from learn_lbmpy.scenarios import _kernel_config
+from learn_lbmpy.thermocapillary import ThermocapillaryLayer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--dim', type=int, choices=(2, 3), default=2)
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help="layer length n of the n x n/4 (x n/4) domain, default 256 512 in 2D and 64 128 in 3D")
+    parser.add_argument('--every', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--steps', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    sizes = args.sizes or ([256, 512] if args.dim == 2 else [64, 128])
+    index_lists.install()
+    print(f"{'domain':>12s}  {'temperature':16s}{'MLUPS':>8s}{'ns/cell':>9s}{'calls/step':>12s}{'syncs/step':>12s}")
+    for n in sizes:
+        domain_size = (n,) + (n // 4,) * (args.dim - 1)
+        variants = {f'every {every}' if every > 1 else 'every step': ThermocapillaryLayer(
+                    domain_size, thermal_every=every, config=_kernel_config(), name=f'every_{every}')
+                    for every in args.every}
+        mlups = dict.fromkeys(variants, 0.0)
+        for _ in range(args.repeats):
+            for label, layer in variants.items():
+                mlups[label] = max(mlups[label], layer.benchmark_run(args.steps))
+
+        for label, layer in variants.items():
+            stats = layer.scheduler.statistics
+            calls = sum(stats['task_calls'].values()) / stats['cycle']
+            print(f"{'x'.join(map(str, domain_size)):>12s}  {label:16s}{mlups[label]:8.1f}{1e3 / mlups[label]:9.1f}"
+                  f"{calls:12.2f}{stats['syncs'] / stats['cycle']:12.2f}")
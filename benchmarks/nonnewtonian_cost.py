@@ -0,0 +1,67 @@
+"""
+Cost of the in-kernel viscosity models
+
+Runs the force driven channel with Newtonian MRT and with the power-law, Carreau and Bingham models of
+`learn_lbmpy.nonnewtonian` (same MRT method, shear relaxation rate from the local shear rate) and reports
+MLUPS and the extra time per cell update over the Newtonian kernel. `--iterations` sets the fixed-point
+iterations for the implicit shear rate. The variants are measured alternately, the best of `--repeats`
+runs is kept.
+
+Usage (from the repository root):
+    python benchmarks/nonnewtonian_cost.py --dim 3 --sizes 32 64 --iterations 1 3
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from learn_lbmpy import create_scenario, index_lists
+from learn_lbmpy.scenarios import _kernel_config
+
+
+def newtonian_channel(domain_size, force):
+    from lbmpy import LBMConfig, Method
+    from lbmpy.scenarios import create_channel
+
+    lbm_config = LBMConfig(method=Method.MRT, relaxation_rate=1.0, stencil=_stencil(len(domain_size)))
+    return create_channel(domain_size=domain_size, force=force, duct=True, lbm_config=lbm_config,
+                          config=_kernel_config())
+
+
+def _stencil(dim):
+    from lbmpy import LBStencil, Stencil
+    return LBStencil(Stencil.D2Q9 if dim == 2 else Stencil.D3Q19)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--dim', type=int, choices=(2, 3), default=3)
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help="channel width n of the n x n (x n) domain, default 32 64 in 3D and 256 512 in 2D")
+    parser.add_argument('--iterations', type=int, nargs='+', default=[1, 3])
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    sizes = args.sizes or ([32, 64] if args.dim == 3 else [256, 512])
+    index_lists.install()
+    print(f"{'domain':>12s}  {'model':24s}{'MLUPS':>8s}{'ns/cell':>9s}{'+ns/cell':>10s}")
+    for n in sizes:
+        domain_size = (n,) * args.dim
+        variants = {'Newtonian MRT': newtonian_channel(domain_size, 1e-6)}
+        for model in ('power_law', 'carreau', 'bingham'):
+            for iterations in args.iterations:
+                variants[f'{model}, {iterations} it.'] = create_scenario(
+                    'nonnewtonian_channel', domain_size=domain_size, model=model, iterations=iterations)
+        mlups = dict.fromkeys(variants, 0.0)
+        for _ in range(args.repeats):
+            for label, scenario in variants.items():
+                mlups[label] = max(mlups[label], scenario.benchmark_run(args.steps))
+
+        reference = 1e3 / mlups['Newtonian MRT']
+        for label in variants:
+            ns = 1e3 / mlups[label]
+            print(f"{'x'.join(map(str, domain_size)):>12s}  {label:24s}{mlups[label]:8.1f}{ns:9.1f}"
+                  f"{ns - reference:10.1f}")
@@ -0,0 +1,66 @@
+"""
+Porous media at scale
+
+Builds the `porous_media` scenario (random sphere packing, body force, periodic) and reports the
+setup time split into packing and scenario creation, the throughput of the time loop with the
+permeability convergence checks, and the peak memory. With --max-steps the flow is run to
+convergence and the permeability is printed.
+
+Usage (from the repository root):
+    python benchmarks/porous_media.py --size 256 --dtype float32 --steps 100
+    python benchmarks/porous_media.py --size 128 --max-steps 20000
+"""
+
+import argparse
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from learn_lbmpy import create_scenario
+from learn_lbmpy.porous import PermeabilityRun, random_sphere_packing
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--porosity', type=float, default=0.4)
+    parser.add_argument('--radius', type=float, default=8)
+    parser.add_argument('--dtype', default='float32')
+    parser.add_argument('--steps', type=int, default=100, help='time steps for the throughput measurement')
+    parser.add_argument('--every', type=int, default=50, help='time steps between convergence checks')
+    parser.add_argument('--max-steps', type=int, default=0, help='run to convergence, at most this many steps')
+    args = parser.parse_args()
+    domain_size = (args.size,) * 3
+
+    _, t_packing = timed(lambda: random_sphere_packing(domain_size, args.porosity, args.radius, seed=0))
+    scenario, t_setup = timed(lambda: create_scenario('porous_media', domain_size=domain_size,
+                                                      porosity=args.porosity, sphere_radius=args.radius,
+                                                      dtype=args.dtype))
+    run = PermeabilityRun(scenario, every=args.every)
+    _, t_first = timed(lambda: scenario.run(1))
+    # the run stops early once the flux has converged
+    steps_before = scenario.time_steps_run
+    _, t_steps = timed(lambda: run.run(args.steps))
+    steps = scenario.time_steps_run - steps_before
+    cells = args.size ** 3
+
+    print(f"porous_media {args.size}^3, porosity {run.porosity:.3f}, sphere radius {args.radius}, {args.dtype}")
+    print(f"  sphere packing            : {t_packing:7.2f} s ({len(scenario.packing['radii'])} spheres)")
+    print(f"  scenario creation         : {t_setup:7.2f} s (packing, boundary flags, kernel generation)")
+    print(f"  first step (index lists)  : {t_first:7.2f} s")
+    print(f"  {steps} steps, check every {args.every}: {t_steps:7.2f} s -> "
+          f"{steps * cells / t_steps / 1e6:.1f} MLUPS")
+    print(f"  peak memory               : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** 2:.2f} GiB")
+
+    if args.max_steps:
+        run.run(args.max_steps)
+        print("  " + run.report())
@@ -0,0 +1,49 @@
+"""
+Uniform vs. locally refined cylinder
+
+Compares the `cylinder` scenario with `cylinder_refined` at the same resolution of the body
+(`reference_length` cells of the finest level) over the same physical time.
+
+Usage (from the repository root):
+    python benchmarks/refinement_cost.py --reference-length 120 --steps 200
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy import create_scenario
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--reference-length', type=int, default=120)
+    parser.add_argument('--levels', type=int, default=3)
+    parser.add_argument('--steps', type=int, default=200, help='time steps of the coarsest level')
+    args = parser.parse_args()
+    fine_steps = args.steps * 2 ** (args.levels - 1)
+
+    refined = create_scenario('cylinder_refined', reference_length=args.reference_length, levels=args.levels)
+    refined.run(2)
+    t_refined = timed(lambda: refined.run(args.steps))
+
+    uniform = create_scenario('cylinder', reference_length=args.reference_length)
+    uniform.run(2)
+    t_uniform = timed(lambda: uniform.run(fine_steps))
+
+    uniform_cells = int(np.prod(uniform.domain_size))
+    print(refined.cell_count_report())
+    print(f"uniform {uniform.domain_size}: {fine_steps} steps in {t_uniform:.2f} s")
+    print(f"refined: {args.steps} level-0 steps in {t_refined:.2f} s -> {t_uniform / t_refined:.1f}x faster, "
+          f"{uniform_cells / sum(refined.level_cells()):.1f}x fewer cells")
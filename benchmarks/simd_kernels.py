@@ -0,0 +1,99 @@
+"""
+Scalar vs. SIMD vectorized stream-collide kernels
+
+For each collision model the stream-collide kernel of a `LatticeBoltzmannStep` is timed as scalar code
+(which the C compiler may still auto-vectorize) and with explicit AVX2/AVX-512 intrinsics, with and
+without non-temporal stores. Instruction sets the CPU lacks are skipped. Throughput is the best of
+several repetitions, in million lattice updates per second; the last column is the largest
+difference of the PDFs to the scalar kernel.
+
+Usage (from the repository root):
+    python benchmarks/simd_kernels.py --size 128 96 64 --steps 20
+    python benchmarks/simd_kernels.py --size 32 32 32 --steps 200      # fits into the cache
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy.targets import cpu_instruction_sets, vectorize_config
+
+MODELS = [('SRT', 'D3Q19'), ('TRT', 'D3Q19'), ('MRT', 'D3Q19'), ('CENTRAL_MOMENT', 'D3Q27'), ('CUMULANT', 'D3Q27')]
+
+
+def create(method, stencil, domain_size, config):
+    from lbmpy import LBMConfig, LBStencil, Method, Stencil
+    from lbmpy.lbstep import LatticeBoltzmannStep
+
+    lbm_config = LBMConfig(stencil=LBStencil(Stencil[stencil]), method=Method[method], relaxation_rate=1.8,
+                           compressible=method == 'CUMULANT')
+    scenario = LatticeBoltzmannStep(domain_size=domain_size, periodicity=True, lbm_config=lbm_config, config=config)
+    # the timed loop does not synchronize the ghost layers, they have to hold the same values in all variants
+    for name in (scenario.pdf_array_name, scenario._tmp_arr_name):
+        scenario.data_handling.fill(name, 0.0, ghost_layers=True)
+    rng = np.random.default_rng(0)
+    for b in scenario.data_handling.iterate(ghost_layers=False):
+        b[scenario.velocity_data_name][...] = 0.01 * rng.standard_normal(b[scenario.velocity_data_name].shape)
+    scenario.set_pdf_fields_from_macroscopic_values()
+    return scenario
+
+
+def measure(scenario, steps, repeat):
+    """MLUPS of the stream-collide kernel alone (no ghost layer synchronization, no boundaries)"""
+    dh = scenario.data_handling
+    kernel = scenario._lbmKernels[0]
+    src, dst = scenario.pdf_array_name, scenario._tmp_arr_name
+
+    def step():
+        dh.run_kernel(kernel, **scenario.kernel_params)
+        dh.swap(src, dst)
+
+    for _ in range(2):
+        step()
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(steps):
+            step()
+        best = min(best, time.perf_counter() - start)
+    return steps * int(np.prod(dh.shape)) / best / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, nargs=3, default=(128, 96, 64))
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--models', nargs='*', default=[m for m, _ in MODELS])
+    args = parser.parse_args()
+
+    from pystencils import CreateKernelConfig, Target
+
+    variants = [('scalar', None, False)]
+    for instruction_set in ('avx2', 'avx512'):
+        if instruction_set in cpu_instruction_sets():
+            variants += [(instruction_set, instruction_set, False), (f'{instruction_set}+nt', instruction_set, True)]
+
+    print(f"domain {tuple(args.size)}, {args.steps} steps, CPU instruction sets: {', '.join(cpu_instruction_sets())}")
+    print(f"{'model':16s} {'stencil':8s}" + ''.join(f"{name:>12s}" for name, _, _ in variants) + "   max |diff|")
+    for method, stencil in [m for m in MODELS if m[0] in args.models]:
+        results, pdfs, reference = [], [], None
+        for name, instruction_set, nontemporal in variants:
+            config = CreateKernelConfig(target=Target.CPU)
+            if instruction_set is not None:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    config = vectorize_config(config, instruction_set, nontemporal_stores=nontemporal)
+            scenario = create(method, stencil, tuple(args.size), config)
+            results.append(measure(scenario, args.steps, args.repeat))
+            state = scenario.data_handling.gather_array(scenario.pdf_array_name).copy()
+            reference = state if reference is None else reference
+            # all variants ran the same number of steps from the same initial state
+            pdfs.append(np.max(np.abs(state - reference)))
+        print(f"{method:16s} {stencil:8s}" + ''.join(f"{r:12.1f}" for r in results) + f"   {max(pdfs):.1e}")
@@ -0,0 +1,81 @@
+"""
+Synchronous vs. background snapshot output
+
+Runs the shear layer and writes the velocity field every few steps, once with `np.savez_compressed`
+in the time loop and once through a double-buffered `SnapshotWriter`.
+
+Usage (from the repository root):
+    python benchmarks/snapshot_output.py --size 1024 --steps 400 --every 20
+    python benchmarks/snapshot_output.py --step 4 --dtype float16     # with a capture policy
+
+The overlap needs a free core for the writer thread; on a single core only the cheaper compression
+level helps.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy import create_scenario
+from learn_lbmpy.output import CapturePolicy, SnapshotWriter, record_snapshots
+
+
+def synchronous(scenario, directory, time_steps, every):
+    for _ in range(time_steps // every):
+        scenario.run(every)
+        velocity = scenario.data_handling.gather_array(scenario.velocity_data_name)
+        np.savez_compressed(os.path.join(directory, f"snapshot_{scenario.time_steps_run:08d}.npz"),
+                            velocity=velocity)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--steps', type=int, default=400)
+    parser.add_argument('--every', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--level', type=int, default=1, help='zlib level of the SnapshotWriter')
+    parser.add_argument('--step', type=int, default=1, help='spatial decimation of the SnapshotWriter')
+    parser.add_argument('--dtype', default=None, help='storage dtype of the SnapshotWriter, e.g. float16')
+    args = parser.parse_args()
+
+    def shear_layer():
+        scenario = create_scenario('shear_layer', width=args.size, height=args.size, seed=0)
+        scenario.run(2)
+        return scenario
+
+    scenario = shear_layer()
+    start = time.perf_counter()
+    scenario.run(args.steps)
+    t_none = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        scenario = shear_layer()
+        start = time.perf_counter()
+        synchronous(scenario, directory, args.steps, args.every)
+        t_sync = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        scenario = shear_layer()
+        start = time.perf_counter()
+        policy = CapturePolicy(step=args.step, dtype=args.dtype)
+        writer = SnapshotWriter(directory, compression_level=args.level, threads=args.threads, capture_policy=policy)
+        record_snapshots(scenario, writer, args.steps, args.every)
+        t_loop = time.perf_counter() - start
+        writer.close()
+        t_async = time.perf_counter() - start
+        stats = writer.stats
+
+    print(f"{args.size}x{args.size} shear layer, {args.steps} steps, snapshot every {args.every} steps")
+    print(f"  no output                   : {t_none:6.2f} s")
+    print(f"  synchronous savez_compressed: {t_sync:6.2f} s")
+    print(f"  SnapshotWriter              : {t_async:6.2f} s (time loop done after {t_loop:.2f} s)")
+    print(f"    capture {stats['capture_time']:.2f} s, stalled {stats['stall_time']:.2f} s, "
+          f"written in background {stats['write_time']:.2f} s, {stats['bytes_written'] / 2 ** 20:.1f} MiB")
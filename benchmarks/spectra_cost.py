@@ -0,0 +1,77 @@
+"""
+Cost of streaming energy spectra
+
+Compares one spectrum of `learn_lbmpy.spectra.SpectrumAnalyzer` (staged snapshots, batched real FFT into
+preallocated buffers, shell sums with a precomputed bincount) with a one-off NumPy function (gathered
+velocity, complex FFT per component, shells recomputed for every call), and with one LBM time step. Also
+prints the memory kept per sample: a spectrum instead of a velocity snapshot.
+
+Usage (from the repository root):
+    python benchmarks/spectra_cost.py --size 512 --batch 8
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy import create_scenario
+from learn_lbmpy.spectra import SpectrumAnalyzer
+
+
+def best_of(function, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def numpy_spectrum(scenario):
+    u = scenario.velocity_slice(masked=False)
+    shape = u.shape[:-1]
+    power = sum(np.abs(np.fft.fftn(u[..., i])) ** 2 for i in range(u.shape[-1]))
+    k = np.meshgrid(*(np.fft.fftfreq(n) * 2 * np.pi for n in shape), indexing='ij')
+    width = 2 * np.pi / max(shape)
+    shells = np.rint(np.sqrt(sum(k_i ** 2 for k_i in k)) / width).astype(int)
+    return np.bincount(shells.ravel(), weights=power.ravel()) / (2 * np.prod(shape, dtype=float) ** 2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--batch', type=int, default=8)
+    args = parser.parse_args()
+
+    scenario = create_scenario('shear_layer', width=args.size, height=args.size, seed=0)
+    scenario.run(2)
+    dh = scenario.data_handling
+    velocity = dh.cpu_arrays[scenario.velocity_data_name][1:-1, 1:-1]
+
+    def streaming(analyzer, samples):
+        for i in range(samples):
+            analyzer.add(i, velocity)
+        analyzer.flush()
+
+    single, batched = SpectrumAnalyzer(scenario.domain_size, batch=1), SpectrumAnalyzer(scenario.domain_size,
+                                                                                         batch=args.batch)
+    streaming(batched, args.batch)
+    assert np.allclose(batched.series['energy'][-1], numpy_spectrum(scenario)[:batched.shells])
+
+    t_step = best_of(lambda: scenario.run(1))
+    t_numpy = best_of(lambda: numpy_spectrum(scenario))
+    t_single = best_of(lambda: streaming(single, 1))
+    t_batched = best_of(lambda: streaming(batched, args.batch)) / args.batch
+
+    print(f"{args.size}x{args.size} shear layer, per spectrum")
+    print(f"  one time step                 : {t_step * 1e3:8.2f} ms")
+    print(f"  one-off NumPy spectrum        : {t_numpy * 1e3:8.2f} ms")
+    print(f"  streaming, batch 1            : {t_single * 1e3:8.2f} ms")
+    print(f"  streaming, batch {args.batch:<3d}          : {t_batched * 1e3:8.2f} ms")
+    print(f"  kept per sample: spectrum {2 * batched.shells * 8 / 1024:.1f} KiB instead of a snapshot "
+          f"{velocity.nbytes / 1024 ** 2:.1f} MiB")
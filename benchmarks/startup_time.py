@@ -0,0 +1,68 @@
+"""
+Startup-time measurement
+
+Compares the time from interpreter start to the first completed time step for
+1) the tutorial style `from lbmpy.session import *` and
+2) the lazily importing `learn_lbmpy` package.
+
+Each variant runs in a fresh interpreter several times and the minimum is reported, so the
+numbers are not polluted by a cold file system cache. Kernel compilation is cached by pystencils
+after the first run, which affects both variants in the same way.
+
+Usage (from the repository root):
+    python benchmarks/startup_time.py --repeat 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+VARIANTS = {
+    'session import only': "from lbmpy.session import *",
+    'learn_lbmpy import only': "import learn_lbmpy",
+    'session, first step': (
+        "from lbmpy.session import *\n"
+        "s = create_lid_driven_cavity(domain_size=(100, 100), "
+        "lbm_config=LBMConfig(method=Method.SRT, relaxation_rate=1.6))\n"
+        "s.run(1)"
+    ),
+    'learn_lbmpy, first step': (
+        "import learn_lbmpy\n"
+        "s = learn_lbmpy.create_scenario('lid_driven_cavity', domain_size=(100, 100))\n"
+        "s.run(1)"
+    ),
+}
+
+
+def time_snippet(code, repeat):
+    env = dict(os.environ, LEARN_LBMPY_TARGET=os.environ.get('LEARN_LBMPY_TARGET', 'cpu'))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get('PYTHONPATH')]))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, env=env, cwd=REPO_ROOT,
+                       stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # warm up the kernel cache so both variants measure imports, not the first compilation
+    time_snippet(VARIANTS['learn_lbmpy, first step'], 1)
+
+    results = {name: time_snippet(code, args.repeat) for name, code in VARIANTS.items()}
+    for name, seconds in results.items():
+        print(f"{name:28s} {seconds:6.2f} s")
+
+    saved = results['session, first step'] - results['learn_lbmpy, first step']
+    print(f"\nTime to first step saved per process: {saved:.2f} s "
+          f"({saved / results['session, first step'] * 100:.0f} %)")
@@ -0,0 +1,66 @@
+"""
+Fused versus split thermal kernels
+
+Runs 3D Rayleigh-Benard convection (D3Q19 flow, D3Q7 temperature) with the flow and the temperature
+distribution advanced
+1) by one fused kernel, with T and u kept in registers,
+2) by two kernels, coupled through the temperature and velocity fields,
+and reports MLUPS of the time loop, the bytes per cell update that follow from the fields the kernels read
+and write, and the difference of the temperature fields after the run. The variants are measured
+alternately and the best of `--repeats` runs is kept, so a noisy machine affects both alike.
+
+Usage (from the repository root):
+    python benchmarks/thermal_fused.py --sizes 32 64 128 --steps 20 --repeats 5
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy import index_lists
+from learn_lbmpy.scenarios import _kernel_config
+from learn_lbmpy.thermal import ThermalConvection
+
+
+def bytes_per_cell(scenario):
+    """Bytes loaded and stored by the kernels of one cell update (every field value once, no caches)"""
+    total = 0
+    for kernel in scenario._kernels:
+        for field in kernel.kernel.get_fields():
+            total += int(np.prod(field.index_shape)) * field.dtype.itemsize
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[32, 64, 128],
+                        help="edge length n of the n x n x n/2 domain")
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--rayleigh-number', type=float, default=1e4)
+    parser.add_argument('--method', default='SRT')
+    args = parser.parse_args()
+
+    index_lists.install()
+    print(f"{'domain':>14s}{'variant':>8s}{'kernels':>9s}{'B/cell':>8s}{'MLUPS':>8s}{'max |dT|':>11s}")
+    for n in args.sizes:
+        domain_size = (n, n, n // 2)
+        scenarios = {fused: ThermalConvection(domain_size, args.rayleigh_number, hot_wall='B', cold_wall='T',
+                                              fused=fused, method=args.method, seed=0, config=_kernel_config(),
+                                              name='fused' if fused else 'split')
+                     for fused in (True, False)}
+        mlups = {True: 0.0, False: 0.0}
+        for _ in range(args.repeats):
+            for fused, scenario in scenarios.items():
+                mlups[fused] = max(mlups[fused], scenario.benchmark_run(args.steps))
+
+        # the split variant sees T of the previous step, so the fields differ slightly
+        difference = np.max(np.abs(scenarios[True].temperature - scenarios[False].temperature))
+        for fused, scenario in scenarios.items():
+            print(f"{'x'.join(map(str, domain_size)):>14s}{'fused' if fused else 'split':>8s}"
+                  f"{len(scenario._kernels):9d}{bytes_per_cell(scenario):8d}{mlups[fused]:8.1f}{difference:11.2e}")
+        print(f"{'':14s} fused/split {mlups[True] / mlups[False]:.2f}")
@@ -0,0 +1,82 @@
+"""
+Voxelization time and accuracy
+
+Voxelizes a triangulated sphere on an N^3 grid serially, with the thread pool, and from the disk
+cache, and compares the mask with the analytic sphere. Then the link-wise wall distances of all
+boundary links are computed and compared with the exact distances to the sphere.
+
+Usage (from the repository root):
+    python benchmarks/voxelize_cost.py --size 256 --subdivisions 5
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from learn_lbmpy.voxelizer import sphere_mesh, voxelize
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def boundary_links(solid, stencil):
+    """Fluid cell midpoints and offsets of all links pointing into a solid cell"""
+    positions, offsets = [], []
+    for offset in stencil:
+        neighbour_solid = np.roll(solid, shift=[-o for o in offset], axis=(0, 1, 2))
+        cells = np.argwhere(~solid & neighbour_solid)
+        positions.append(cells + 0.5)
+        offsets.append(np.broadcast_to(offset, cells.shape))
+    return np.concatenate(positions), np.concatenate(offsets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--subdivisions', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    n = args.size
+    centre, radius = np.full(3, n / 2), 0.4 * n
+    mesh = sphere_mesh(centre, radius, args.subdivisions)
+    domain_size = (n, n, n)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        serial, t_serial = timed(lambda: voxelize(mesh, domain_size, workers=1, cache=False))
+        pooled, t_pooled = timed(lambda: voxelize(mesh, domain_size, workers=args.workers, cache_dir=cache_dir))
+        cached, t_cached = timed(lambda: voxelize(mesh, domain_size, cache_dir=cache_dir))
+    assert cached.from_cache and np.array_equal(serial.solid, pooled.solid) and np.array_equal(serial.solid, cached.solid)
+
+    x, y, z = np.meshgrid(*[np.arange(n) + 0.5] * 3, indexing='ij', sparse=True)
+    analytic = (x - centre[0]) ** 2 + (y - centre[1]) ** 2 + (z - centre[2]) ** 2 < radius ** 2
+    differing = np.count_nonzero(serial.solid != analytic)
+
+    stencil = [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1) if abs(i) + abs(j) + abs(k) in (1, 2)]
+    positions, offsets = boundary_links(serial.solid, stencil)
+    q, t_q = timed(lambda: serial.link_wall_distances(positions, offsets))
+    a = (offsets ** 2).sum(axis=1)
+    b = 2 * ((positions - centre) * offsets).sum(axis=1)
+    c = ((positions - centre) ** 2).sum(axis=1) - radius ** 2
+    exact = (-b - np.sqrt(np.maximum(b * b - 4 * a * c, 0))) / (2 * a)
+    # links whose ends lie on different sides of the analytic sphere as well
+    consistent = (c > 0) & (exact <= 1)
+
+    print(f"sphere with {len(mesh)} triangles on {n}^3 cells")
+    print(f"  serial voxelization          : {t_serial:7.2f} s")
+    print(f"  {args.workers} worker threads             : {t_pooled:7.2f} s")
+    print(f"  from disk cache              : {t_cached:7.2f} s")
+    print(f"  cells differing from analytic: {differing} of {analytic.sum()} solid cells")
+    print(f"  wall distances of {len(q)} D3Q19 links: {t_q:.2f} s, "
+          f"|q - q_exact| mean {np.mean(np.abs(q - exact)[consistent]):.4f}, "
+          f"max {np.max(np.abs(q - exact)[consistent]):.3f} ({np.count_nonzero(~consistent)} links cut by facets only)")
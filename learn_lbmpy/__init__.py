@@ -0,0 +1,45 @@
+"""
+learn_lbmpy - importable versions of the tutorial scenarios
+
+The tutorial scripts all start with `from lbmpy.session import *`, which pulls in SymPy, matplotlib,
+IPython widgets and the complete lbmpy surface before the first time step is run. This package
+collects the same scenarios behind a small registry so they can be created and run from Python
+or from the command line (`python -m learn_lbmpy`) while only importing what is actually needed.
+
+Importing this package is cheap: submodules are loaded on first attribute access and the
+scenario factories import lbmpy inside their function bodies.
+
+Example:
+    import learn_lbmpy
+    scenario = learn_lbmpy.create_scenario('lid_driven_cavity', domain_size=(100, 100))
+    scenario.run(100)
+"""
+
+import importlib
+
+__all__ = ['create_scenario', 'get_scenario', 'list_scenarios', 'register_scenario', 'detect_target']
+
+# attribute name -> submodule providing it. Resolved lazily in __getattr__.
+_LAZY_ATTRIBUTES = {
+    'create_scenario': 'registry',
+    'get_scenario': 'registry',
+    'list_scenarios': 'registry',
+    'register_scenario': 'registry',
+    'detect_target': 'targets',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f'.{_LAZY_ATTRIBUTES[name]}', __name__)
+        return getattr(module, name)
+    try:
+        return importlib.import_module(f'.{name}', __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f'{__name__}.{name}':
+            raise
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
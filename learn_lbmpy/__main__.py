@@ -0,0 +1,5 @@
+import sys
+
+from learn_lbmpy.cli import main
+
+sys.exit(main())
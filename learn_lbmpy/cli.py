@@ -0,0 +1,411 @@
+"""
+Command line runner
+
+    python -m learn_lbmpy list
+    python -m learn_lbmpy run lid_driven_cavity --steps 100 --set relaxation_rate=1.9 --plot ldc.png
+    python -m learn_lbmpy run channel --steps 500 --profile trace.json
+    python -m learn_lbmpy run cylinder --steps 100000 --live
+    python -m learn_lbmpy validate --budget-scale 2
+    python -m learn_lbmpy codegen tutorials/basics/04_cumulant_lbm/01_cumulant_lbm.py --test-run --json cg.json
+    python -m learn_lbmpy roofline SRT MRT CENTRAL_MOMENT:D3Q27 CUMULANT:D3Q27 --size 128 128 128
+    python -m learn_lbmpy jobs submit cylinder --steps 100000 --output velocity --output plot
+    python -m learn_lbmpy jobs run --cpus 4 --max-jobs 2
+    python -m learn_lbmpy multilevel channel --factor 2 --set "domain_size=(120,40)" --compare
+    python -m learn_lbmpy spectrum shear_layer --set width=256 --set height=256 --steps 20000 --every 500 --plot e.png
+
+Heavy modules (matplotlib, lbmpy.plot) are only imported when an option needs them.
+"""
+
+import argparse
+import ast
+import os
+import sys
+import time
+
+
+def parse_assignment(text):
+    """Parses `key=value` from the command line. Values are Python literals, plain strings otherwise."""
+    key, sep, value = text.partition('=')
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"expected key=value, got {text!r}")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return key.strip(), value
+
+
+def _cmd_list(args):
+    from learn_lbmpy.registry import list_scenarios
+
+    for spec in list_scenarios():
+        print(f"{spec.name:20s} {spec.description}")
+        if args.verbose:
+            for key, value in spec.defaults.items():
+                print(f"{'':22s}{key} = {value!r}")
+
+
+def _save_plot(scenario, filename):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import lbmpy.plot as lbm_plt
+
+    plt.figure(dpi=200)
+    lbm_plt.vector_field(scenario.velocity_slice(), step=max(1, min(scenario.domain_size[:2]) // 30))
+    plt.title(f"{scenario.name} after {scenario.time_steps_run} steps")
+    plt.savefig(filename)
+    plt.close()
+
+
+def _cmd_run(args):
+    from learn_lbmpy.registry import create_scenario
+
+    t_start = time.perf_counter()
+    scenario = create_scenario(args.scenario, **dict(args.set))
+    t_created = time.perf_counter()
+    if args.profile:
+        from learn_lbmpy.profiler import StepProfiler
+        profiler = StepProfiler(scenario)
+        profiler.run(args.steps)
+    elif args.live:
+        _run_live(scenario, args)
+    else:
+        scenario.run(args.steps)
+    t_run = time.perf_counter()
+
+    print(f"{args.scenario}: {args.steps} steps on {scenario.domain_size}")
+    print(f"  setup {t_created - t_start:.2f} s, run {t_run - t_created:.2f} s "
+          f"({scenario.number_of_cells * args.steps / max(t_run - t_created, 1e-12) * 1e-6:.1f} MLUPS incl. warmup)")
+
+    if args.profile:
+        print(profiler.report())
+        profiler.save_trace(args.profile)
+        print(f"  trace written to {args.profile} (open in https://ui.perfetto.dev)")
+    if args.save:
+        import numpy as np
+        np.savez_compressed(args.save, velocity=scenario.velocity_slice(masked=False))
+        print(f"  velocity written to {args.save}")
+    if args.plot:
+        _save_plot(scenario, args.plot)
+        print(f"  plot written to {args.plot}")
+
+
+def _run_live(scenario, args):
+    from learn_lbmpy.live import LivePublisher, frame_shape, launch_viewer, run_live, velocity_magnitude_frame
+
+    with LivePublisher(frame_shape(scenario, args.live_step), fps=args.live_fps, label=args.scenario) as live:
+        viewer = launch_viewer(live.name, display=not args.no_display)
+        run_live(scenario, live, args.steps, every=args.live_every,
+                 frame=velocity_magnitude_frame(scenario, args.live_step))
+        stats = live.stats
+    print(f"  live: {stats['published']} frames published ({stats['publish_time']:.2f} s), "
+          f"{stats['shown']} shown, {stats['dropped']} dropped by the viewer")
+    viewer.wait()
+
+
+def _cmd_view(args):
+    from learn_lbmpy.live import run_viewer
+
+    shown, dropped = run_viewer(args.name, display=not args.no_display, delay=args.delay)
+    print(f"viewer: {shown} frames shown, {dropped} dropped")
+
+
+def _cmd_codegen(args):
+    if args.cold:
+        # fresh joblib and JIT caches; must be set before pystencils is imported
+        import tempfile
+        cache = tempfile.mkdtemp(prefix='learn_lbmpy_codegen_')
+        os.environ['XDG_CACHE_HOME'] = cache
+        os.environ['PYSTENCILS_CACHE_DIR'] = os.path.join(cache, 'pystencils')
+    from learn_lbmpy.codegen_timing import CodegenTimer
+
+    timer = CodegenTimer(count_operations=not args.no_operations)
+    if args.target.endswith('.py'):
+        import runpy
+        script = os.path.abspath(args.target)
+        init_globals = {'is_test_run': True} if args.test_run else None
+        sys.argv = [script]
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(script))
+        try:
+            with timer:
+                runpy.run_path(script, init_globals=init_globals, run_name='__main__')
+        finally:
+            os.chdir(cwd)
+            # the phases up to an error in the script are reported as well
+            _codegen_report(args, timer)
+    else:
+        from learn_lbmpy.registry import create_scenario
+        with timer:
+            scenario = create_scenario(args.target, **dict(args.set))
+            scenario.run(args.steps)
+        _codegen_report(args, timer)
+
+
+def _codegen_report(args, timer):
+    print(f"code generation phases of {args.target}{' (cold caches)' if args.cold else ''}")
+    print(timer.report(details=args.details))
+    if args.json:
+        timer.save_json(args.json)
+        print(f"  phases written to {args.json}")
+
+
+def _cmd_validate(args):
+    import json
+    from learn_lbmpy.validation import list_cases, run_validation
+
+    if args.list:
+        for case in list_cases():
+            print(f"{case.name:20s} min {case.min_mlups:5.1f} MLUPS  {case.description}")
+        return 0
+    results = run_validation(args.cases, budget_scale=args.budget_scale, verbose=True)
+    failed = [r.name for r in results if not r.passed]
+    print(f"{len(results) - len(failed)}/{len(results)} cases passed" + (f", failed: {', '.join(failed)}" if failed else ''))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([r.as_dict() for r in results], f, indent=1)
+    return 1 if failed else 0
+
+
+def _cmd_roofline(args):
+    import json
+    from lbmpy import LBMConfig, LBStencil, Method, Stencil
+    from learn_lbmpy.roofline import Roofline
+
+    roofline = Roofline()
+    for model in args.models:
+        method, _, stencil = model.partition(':')
+        stencil = LBStencil(Stencil[(stencil or args.stencil).upper()])
+        lbm_config = LBMConfig(stencil=stencil, method=Method[method.upper()], relaxation_rate=args.relaxation_rate,
+                               compressible=args.compressible or method.upper() == 'CUMULANT')
+        size = None
+        if args.size:
+            size = tuple(args.size[:stencil.D]) if len(args.size) > 1 else (args.size[0],) * stencil.D
+        roofline.evaluate(f"{method} {stencil.name}", lbm_config, domain_size=size, measure=not args.no_measure,
+                          steps=args.steps)
+    print(roofline.report())
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(roofline.as_dict(), f, indent=1)
+
+
+def _cmd_jobs(args):
+    import json
+    from learn_lbmpy.jobs import JobQueue
+
+    queue = JobQueue(args.dir)
+    if args.action == 'submit':
+        if args.target.endswith('.py'):
+            job_id = queue.submit_script(args.target, test_run=args.test_run, time_budget=args.time_budget,
+                                         threads=args.threads, memory_mb=args.memory or 1024, priority=args.priority)
+        else:
+            job_id = queue.submit(args.target, dict(args.set), steps=args.steps, time_budget=args.time_budget,
+                                  outputs=args.output or ('velocity',), threads=args.threads,
+                                  memory_mb=args.memory or 512, priority=args.priority)
+        print(f"job {job_id} queued in {queue.directory}")
+    elif args.action == 'list':
+        if args.json:
+            print(json.dumps([j.as_dict() for j in queue.jobs()], indent=1))
+        else:
+            print(queue.report())
+    elif args.action == 'log':
+        print(queue.log(args.id), end='')
+    elif args.action == 'cancel':
+        for job_id in args.ids:
+            queue.cancel(job_id)
+    elif args.action == 'requeue':
+        for job_id in args.ids:
+            queue.requeue(job_id)
+    elif args.action == 'run':
+        try:
+            queue.run(cpus=args.cpus, memory_mb=args.memory, max_jobs=args.max_jobs, wait=args.wait)
+        except KeyboardInterrupt:
+            print("interrupted, running jobs are queued again")
+        print(queue.report())
+
+
+def _cmd_multilevel(args):
+    import json
+    from learn_lbmpy.multilevel import coarse_to_fine
+
+    result = coarse_to_fine(args.scenario, dict(args.set), factor=args.factor, scaling=args.scaling, steps=args.steps,
+                            tolerance=args.tolerance, chunk=args.chunk, max_steps=args.max_steps,
+                            nonequilibrium=not args.equilibrium_only, compare=args.compare)
+    print(result.report())
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result.as_dict(), f, indent=1)
+    if args.plot:
+        _save_plot(result.scenario, args.plot)
+
+
+def _cmd_spectrum(args):
+    import numpy as np
+    from learn_lbmpy.registry import create_scenario
+    from learn_lbmpy.spectra import SpectrumRecorder
+
+    scenario = create_scenario(args.scenario, **dict(args.set))
+    recorder = SpectrumRecorder(scenario, every=args.every, batch=args.batch, viscosity=args.viscosity)
+    t_start = time.perf_counter()
+    recorder.run(args.steps)
+    duration = time.perf_counter() - t_start
+    series, k = recorder.series, recorder.wavenumbers
+
+    print(f"{args.scenario}: {args.steps} steps on {scenario.domain_size}, {len(series['time'])} spectra of "
+          f"{len(k)} shells in {duration:.2f} s")
+    print(f"{'time':>10s}{'energy':>14s}{'dissipation':>14s}{'peak k':>10s}")
+    for i, t in enumerate(series['time']):
+        dissipation = series['dissipation'][i].sum() if 'dissipation' in series else float('nan')
+        print(f"{t:10d}{series['energy'][i].sum():14.4e}{dissipation:14.4e}{k[np.argmax(series['energy'][i])]:10.4f}")
+    if args.save:
+        np.savez_compressed(args.save, wavenumbers=k, **series)
+        print(f"  spectra written to {args.save}")
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        plt.figure(dpi=200)
+        colors = plt.cm.viridis(np.linspace(0, 1, len(series['time'])))
+        for energy, t, color in zip(series['energy'], series['time'], colors):
+            plt.loglog(k[1:], energy[1:], color=color, label=f"t = {t}")
+        plt.xlabel('wavenumber k')
+        plt.ylabel('E(k)')
+        if len(series['time']) <= 10:
+            plt.legend()
+        plt.savefig(args.plot)
+        plt.close()
+        print(f"  plot written to {args.plot}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m learn_lbmpy', description=__doc__.strip().split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('list', help='list registered scenarios')
+    p.add_argument('-v', '--verbose', action='store_true', help='show default parameters')
+    p.set_defaults(func=_cmd_list)
+
+    p = sub.add_parser('run', help='create and run a scenario')
+    p.add_argument('scenario')
+    p.add_argument('--steps', type=int, default=100)
+    p.add_argument('--set', type=parse_assignment, action='append', default=[], metavar='KEY=VALUE',
+                   help='override a scenario parameter, may be repeated')
+    p.add_argument('--plot', metavar='FILE', help='save a vector field plot of the final state')
+    p.add_argument('--save', metavar='FILE', help='save the final velocity field as .npz')
+    p.add_argument('--profile', metavar='FILE', help='profile the time steps, write a Chrome trace JSON')
+    p.add_argument('--live', action='store_true', help='show |u| in a separate viewer process while running')
+    p.add_argument('--live-fps', type=float, default=20, help='frame budget of the live viewer')
+    p.add_argument('--live-every', type=int, default=10, help='time steps between frame offers')
+    p.add_argument('--live-step', type=int, default=1, help='spatial decimation of the live frames')
+    p.add_argument('--no-display', action='store_true', help='live viewer without a window (consumes frames only)')
+    p.set_defaults(func=_cmd_run)
+
+    p = sub.add_parser('view', help='live viewer for a run started with --live')
+    p.add_argument('name', help='shared memory block of the run')
+    p.add_argument('--no-display', action='store_true', help='only consume and count the frames')
+    p.add_argument('--delay', type=float, default=0.0, help='seconds per frame without display (a slow viewer)')
+    p.set_defaults(func=_cmd_view)
+
+    p = sub.add_parser('codegen', help='time the code generation phases of a scenario or tutorial script')
+    p.add_argument('target', help='scenario name or path to a .py script')
+    p.add_argument('--steps', type=int, default=1, help='time steps run after creating a scenario')
+    p.add_argument('--set', type=parse_assignment, action='append', default=[], metavar='KEY=VALUE',
+                   help='override a scenario parameter, may be repeated')
+    p.add_argument('--test-run', action='store_true', help="define `is_test_run` for the script (short run)")
+    p.add_argument('--cold', action='store_true', help='use empty joblib and JIT caches')
+    p.add_argument('--details', action='store_true', help='list every call, nested')
+    p.add_argument('--no-operations', action='store_true', help='do not count operations')
+    p.add_argument('--json', metavar='FILE', help='write all phases as JSON')
+    p.set_defaults(func=_cmd_codegen)
+
+    p = sub.add_parser('validate', help='check scenarios against analytical and reference solutions')
+    p.add_argument('cases', nargs='*', help='cases to run (default: all)')
+    p.add_argument('--list', action='store_true', help='list the cases')
+    p.add_argument('--budget-scale', type=float, default=1.0, help='divide the MLUPS floors, for slow machines')
+    p.add_argument('--json', metavar='FILE', help='write the results as JSON')
+    p.set_defaults(func=_cmd_validate)
+
+    p = sub.add_parser('roofline', help='operation counts and roofline estimates of stream-collide kernels')
+    p.add_argument('models', nargs='*', default=['SRT', 'TRT', 'MRT', 'CENTRAL_MOMENT:D3Q27', 'CUMULANT:D3Q27'],
+                   help='METHOD or METHOD:STENCIL')
+    p.add_argument('--stencil', default='D3Q19', help='stencil of the models without one')
+    p.add_argument('--compressible', action='store_true', help='compressible equilibria (always for cumulants)')
+    p.add_argument('--relaxation-rate', type=float, default=1.8)
+    p.add_argument('--size', type=int, nargs='+', help='domain of the measured kernels (one value: all axes), default 128^3 and 2048^2')
+    p.add_argument('--steps', type=int, default=10)
+    p.add_argument('--no-measure', action='store_true', help='only count and estimate')
+    p.add_argument('--json', metavar='FILE', help='write machine numbers and kernel costs as JSON')
+    p.set_defaults(func=_cmd_roofline)
+
+    p = sub.add_parser('multilevel', help='coarse-to-fine start: develop the flow on a coarser grid first')
+    p.add_argument('scenario')
+    p.add_argument('--set', type=parse_assignment, action='append', default=[], metavar='KEY=VALUE',
+                   help='override a scenario parameter of the fine grid, may be repeated')
+    p.add_argument('--factor', type=int, default=2, help='coarsening factor')
+    p.add_argument('--scaling', choices=('diffusive', 'acoustic'), default='diffusive')
+    p.add_argument('--steps', type=int, help='fine steps covered by the coarse grid (no steady state)')
+    p.add_argument('--tolerance', type=float, default=1e-5, help='relative velocity change per chunk')
+    p.add_argument('--chunk', type=int, default=500, help='fine steps between convergence checks')
+    p.add_argument('--max-steps', type=int, default=10 ** 6)
+    p.add_argument('--equilibrium-only', action='store_true', help='do not transfer the non-equilibrium part')
+    p.add_argument('--compare', action='store_true', help='also run the fine grid from a cold start')
+    p.add_argument('--plot', metavar='FILE', help='save a vector field plot of the final fine state')
+    p.add_argument('--json', metavar='FILE', help='write the step counts and run times as JSON')
+    p.set_defaults(func=_cmd_multilevel)
+
+    p = sub.add_parser('spectrum', help='energy and dissipation spectra of a fully periodic scenario while it runs')
+    p.add_argument('scenario')
+    p.add_argument('--set', type=parse_assignment, action='append', default=[], metavar='KEY=VALUE',
+                   help='override a scenario parameter, may be repeated')
+    p.add_argument('--steps', type=int, default=10000)
+    p.add_argument('--every', type=int, default=500, help='time steps between spectra')
+    p.add_argument('--batch', type=int, help='snapshots per batched FFT, default up to 8 for small domains')
+    p.add_argument('--viscosity', type=float, help='default: from the shear relaxation rate')
+    p.add_argument('--plot', metavar='FILE', help='save the energy spectra as log-log plot')
+    p.add_argument('--save', metavar='FILE', help='save wavenumbers and spectra as .npz')
+    p.set_defaults(func=_cmd_spectrum)
+
+    p = sub.add_parser('jobs', help='local job queue for headless batch runs')
+    p.add_argument('--dir', default=os.environ.get('LEARN_LBMPY_JOBS', 'jobs'),
+                   help='queue directory (default $LEARN_LBMPY_JOBS or ./jobs)')
+    p.set_defaults(func=_cmd_jobs)
+    actions = p.add_subparsers(dest='action', required=True)
+    q = actions.add_parser('submit', help='queue a scenario or a script job')
+    q.add_argument('target', help='scenario name or path to a .py script')
+    q.add_argument('--steps', type=int)
+    q.add_argument('--time-budget', type=float, metavar='SECONDS',
+                   help='seconds of time stepping (scenario) or run time limit (script)')
+    q.add_argument('--set', type=parse_assignment, action='append', default=[], metavar='KEY=VALUE',
+                   help='override a scenario parameter, may be repeated')
+    q.add_argument('--output', action='append', choices=('velocity', 'density', 'plot'),
+                   help='written after the last step, may be repeated (default velocity)')
+    q.add_argument('--test-run', action='store_true', help="define `is_test_run` for the script")
+    q.add_argument('--threads', type=int, default=1, help='cores and OpenMP threads of the job')
+    q.add_argument('--memory', type=float, metavar='MB', help='memory limit (default 512, scripts 1024)')
+    q.add_argument('--priority', type=int, default=0)
+    q = actions.add_parser('list', help='jobs with state and results')
+    q.add_argument('--json', action='store_true')
+    q = actions.add_parser('log', help='output of a job')
+    q.add_argument('id', type=int)
+    q = actions.add_parser('cancel', help='cancel queued or running jobs')
+    q.add_argument('ids', type=int, nargs='+')
+    q = actions.add_parser('requeue', help='queue finished, failed or cancelled jobs again')
+    q.add_argument('ids', type=int, nargs='+')
+    q = actions.add_parser('run', help='run the queued jobs')
+    q.add_argument('--cpus', type=int, help='cores to use (default all)')
+    q.add_argument('--memory', type=float, metavar='MB', help='memory of all running jobs (default 80%% of RAM)')
+    q.add_argument('--max-jobs', type=int, help='concurrent jobs (default --cpus)')
+    q.add_argument('--wait', action='store_true', help='keep waiting for new jobs')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
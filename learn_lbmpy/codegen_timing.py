@@ -0,0 +1,320 @@
+"""
+Phase timing for the code generation pipeline
+
+The start-up of `04_cumulant_lbm/01_cumulant_lbm.py` or `turbulence/06_smagorinsky.py` is spent in
+SymPy (deriving the method and the collision rule), in pystencils (turning the update rule into a
+kernel and rendering C code) and in the C compiler. A `CodegenTimer` wraps the entry points of these
+stages while it is active and records one entry per call:
+
+- `create_lb_method`                     moment/cumulant method from the `LBMConfig`
+- `create_lb_collision_rule`             collision rule, simplified (joblib disk cache of pystencils)
+- `create_lb_update_rule`                collision rule plus streaming (joblib disk cache)
+- `create_kernel`                        pystencils kernel from the update rule
+- `compile`                              rendering the C++ module and loading it
+- `c_compiler`                           the compiler run inside `compile`, only on a JIT cache miss
+- `first_run`                            the first call of every compiled kernel
+
+Calls nest (the update rule creates the collision rule, which creates the method), so each entry has
+its wall time and its self time, i.e. the wall time minus that of the nested entries. The cached
+stages record whether they were served from the cache; the symbolic stages and `create_kernel` also
+record the operation count (additions, multiplications, divisions, ...) of the assignments they
+return or receive.
+
+Example:
+    with CodegenTimer() as timer:
+        scenario = create_scenario('shear_layer', method='CUMULANT', compressible=True)
+        scenario.run(1)
+    print(timer.report())
+    timer.save_json('codegen.json')
+
+The wrappers replace the functions in every imported module that refers to them, so they also catch
+the names imported with `from lbmpy.session import *`. `python -m learn_lbmpy codegen` runs a
+scenario or a tutorial script under a timer.
+"""
+
+import json
+import sys
+import time
+import warnings
+from collections import defaultdict
+
+PHASES = ('create_lb_method', 'create_lb_collision_rule', 'create_lb_update_rule', 'create_kernel', 'compile',
+          'c_compiler', 'first_run')
+
+
+class Phase:
+    """One timed call. `parent` is the index of the enclosing phase in `CodegenTimer.phases` (or None)."""
+
+    def __init__(self, name, label, start, depth, parent):
+        self.name = name
+        self.label = label
+        self.start = start
+        self.depth = depth
+        self.parent = parent
+        self.wall = 0.0
+        self.children = 0.0
+        self.cache = None           # 'hit', 'miss' or None if the stage is not cached
+        self.operations = None      # dict of operation counts
+
+    @property
+    def self_time(self):
+        return self.wall - self.children
+
+    def as_dict(self):
+        return {'name': self.name, 'label': self.label, 'start': self.start, 'wall': self.wall,
+                'self': self.self_time, 'depth': self.depth, 'parent': self.parent, 'cache': self.cache,
+                'operations': self.operations}
+
+
+def _operation_count(assignments):
+    from pystencils.sympyextensions import count_operations
+
+    if hasattr(assignments, 'all_assignments'):
+        assignments = assignments.all_assignments
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')     # "Unknown sympy node ... counting will be inaccurate"
+            counts = count_operations(list(assignments), only_type=None)
+    except Exception:
+        # kernels may contain nodes that are not SymPy expressions (e.g. reductions)
+        return None
+    return {key: int(value) for key, value in counts.items() if value}
+
+
+def _total_operations(operations):
+    return sum(operations.values()) if operations else 0
+
+
+class CodegenTimer:
+    """Records the code generation phases of everything created while the timer is active.
+
+    Args:
+        count_operations: count the operations of the rules and kernels. Counting walks the SymPy
+                          expressions and is done outside the timed region.
+        first_run: also time the first call of every kernel compiled while the timer is active. The
+                   wrapper stays on the kernel until that call, even after the timer is closed.
+    """
+
+    def __init__(self, count_operations=True, first_run=True):
+        self.count_operations = count_operations
+        self.first_run = first_run
+        self.phases = []
+        self._stack = []
+        self._patched = []
+        self._t0 = None
+        self._elapsed = 0.0
+
+    # ---- recording ----
+
+    def _begin(self, name, label=''):
+        parent = self._stack[-1] if self._stack else None
+        self.phases.append(Phase(name, label, time.perf_counter() - self._t0, len(self._stack), parent))
+        self._stack.append(len(self.phases) - 1)
+        return self.phases[-1]
+
+    def _end(self, phase):
+        phase.wall = time.perf_counter() - self._t0 - phase.start
+        self._stack.pop()
+        if phase.parent is not None:
+            self.phases[phase.parent].children += phase.wall
+
+    def _timed(self, name, function, label=None, operations=None, cached=False):
+        """Wrapper of `function` recording a phase per call.
+
+        `label(args, kwargs, result)` describes the call, `operations(args, kwargs, result)` returns the
+        assignments to count. For `cached` functions a call is a cache hit unless `_track_cache` sees a miss.
+        """
+        timer = self
+
+        def wrapper(*args, **kwargs):
+            phase = timer._begin(name)
+            phase.cache = 'hit' if cached else None
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                timer._end(phase)
+            if label:
+                phase.label = label(args, kwargs, result)
+            if operations and timer.count_operations:
+                phase.operations = _operation_count(operations(args, kwargs, result))
+            return result
+
+        wrapper.__wrapped__ = function
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+    def _track_cache(self, memorized):
+        """joblib only calls `MemorizedFunc._call` if the result is not in the cache"""
+        timer = self
+        original = memorized._call
+
+        def _call(*args, **kwargs):
+            timer.phases[timer._stack[-1]].cache = 'miss'
+            return original(*args, **kwargs)
+
+        memorized._call = _call
+        self._patched.append((memorized, '_call', None))
+
+    def _first_run(self, wrapper):
+        timer, invocable = self, wrapper._invocable
+        label = wrapper.kernel.name
+
+        def first_call(**kwargs):
+            wrapper._invocable = invocable
+            start = time.perf_counter()
+            invocable(**kwargs)
+            phase = Phase('first_run', label, start - timer._t0, 0, None)
+            phase.wall = time.perf_counter() - start
+            timer.phases.append(phase)
+
+        wrapper._invocable = first_call
+
+    # ---- installing the wrappers ----
+
+    def _replace(self, owner, name, replacement):
+        self._patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def _replace_everywhere(self, original, replacement):
+        """Rebinds every module level name referring to `original`"""
+        for module in list(sys.modules.values()):
+            namespace = getattr(module, '__dict__', None)
+            if not namespace:
+                continue
+            for name, value in list(namespace.items()):
+                if value is original:
+                    self._replace(module, name, replacement)
+
+    def _install(self):
+        import lbmpy.creationfunctions as lbm_creation
+        import pystencils.codegen.driver as driver
+        from pystencils.codegen import Kernel
+        from pystencils.jit.cpu.cpujit import CpuJit
+
+        def method_label(args, kwargs, method):
+            return f"{type(method).__name__} D{method.dim}Q{len(method.stencil)}"
+
+        def rule_label(args, kwargs, rule):
+            return method_label(args, kwargs, rule.method)
+
+        def kernel_label(args, kwargs, kernel):
+            return kernel.name
+
+        self._replace_everywhere(lbm_creation.create_lb_method, self._timed(
+            'create_lb_method', lbm_creation.create_lb_method, method_label))
+        for name in ('create_lb_collision_rule', 'create_lb_update_rule'):
+            memorized = getattr(lbm_creation, name)
+            cached = hasattr(memorized, '_call')
+            if cached:
+                self._track_cache(memorized)
+            self._replace_everywhere(memorized, self._timed(name, memorized, rule_label,
+                                                            operations=lambda a, k, result: result, cached=cached))
+
+        def kernel_input(args, kwargs, result):
+            return args[0] if args else kwargs.get('assignments', ())
+        self._replace_everywhere(driver.create_kernel, self._timed('create_kernel', driver.create_kernel,
+                                                                   kernel_label, operations=kernel_input))
+
+        timer = self
+        compile_kernel = Kernel.compile
+        compile_extension = CpuJit._compile_extension_module
+
+        def compile(kernel):
+            phase = timer._begin('compile', kernel.name)
+            # the JIT targets without a cache of their own (GPU) leave `cache` empty
+            phase.cache = 'hit' if kernel.target.is_cpu() else None
+            try:
+                wrapper = compile_kernel(kernel)
+            finally:
+                timer._end(phase)
+            if timer.first_run and hasattr(wrapper, '_invocable'):
+                timer._first_run(wrapper)
+            return wrapper
+
+        def _compile_extension_module(jit, src_file, lib_file):
+            timer.phases[timer._stack[-1]].cache = 'miss'
+            phase = timer._begin('c_compiler', src_file.stem[:19])
+            try:
+                return compile_extension(jit, src_file, lib_file)
+            finally:
+                timer._end(phase)
+
+        self._replace(Kernel, 'compile', compile)
+        self._replace(CpuJit, '_compile_extension_module', _compile_extension_module)
+
+    def __enter__(self):
+        if self._t0 is None:
+            self._t0 = time.perf_counter()
+        started = time.perf_counter()
+        self._install()
+        # the rebinding scan is bookkeeping, not code generation
+        self._t0 += time.perf_counter() - started
+        self._entered = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._patched):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patched.clear()
+        self._elapsed += time.perf_counter() - self._entered
+        return False
+
+    # ---- results ----
+
+    def summary(self):
+        """Per phase name: calls, wall and self time, cache hits/misses and operations, slowest first"""
+        rows = defaultdict(lambda: {'calls': 0, 'wall': 0.0, 'self': 0.0, 'hits': 0, 'misses': 0, 'operations': 0})
+        for phase in self.phases:
+            row = rows[phase.name]
+            row['calls'] += 1
+            row['self'] += phase.self_time
+            # a nested call of the same stage is already contained in the outer one
+            if not any(self.phases[p].name == phase.name for p in self._ancestors(phase)):
+                row['wall'] += phase.wall
+            row['hits'] += phase.cache == 'hit'
+            row['misses'] += phase.cache == 'miss'
+            row['operations'] += _total_operations(phase.operations)
+        return dict(sorted(rows.items(), key=lambda item: -item[1]['self']))
+
+    def _ancestors(self, phase):
+        while phase.parent is not None:
+            yield phase.parent
+            phase = self.phases[phase.parent]
+
+    @property
+    def total_time(self):
+        """Time spent with the timer active, including everything that is not code generation"""
+        return self._elapsed
+
+    def report(self, details=False):
+        summary = self.summary()
+        tracked = sum(row['self'] for row in summary.values())
+        lines = [f"{'phase':26s}{'calls':>6s}{'wall [s]':>10s}{'self [s]':>10s}{'share':>7s}"
+                 f"{'cache hit/miss':>16s}{'operations':>12s}"]
+        for name, row in summary.items():
+            cache = f"{row['hits']}/{row['misses']}" if row['hits'] + row['misses'] else '-'
+            share = row['self'] / tracked * 100 if tracked else 0.0
+            lines.append(f"{name:26s}{row['calls']:6d}{row['wall']:10.3f}{row['self']:10.3f}{share:6.0f}%"
+                         f"{cache:>16s}{row['operations'] or '-':>12}")
+        lines.append(f"{'code generation total':26s}{'':6s}{'':10s}{tracked:10.3f}")
+        if self._elapsed:
+            lines.append(f"{'timer active':26s}{'':6s}{'':10s}{self._elapsed:10.3f}")
+        if details:
+            lines.append('')
+            for phase in self.phases:
+                cache = f" [{phase.cache}]" if phase.cache else ''
+                ops = f" {_total_operations(phase.operations)} ops" if phase.operations else ''
+                lines.append(f"{phase.start:9.3f} s  {'  ' * phase.depth}{phase.name} {phase.label}: "
+                             f"{phase.wall:.3f} s (self {phase.self_time:.3f} s){cache}{ops}")
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return {'total_time': self._elapsed, 'summary': self.summary(),
+                'phases': [phase.as_dict() for phase in self.phases]}
+
+    def save_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
@@ -0,0 +1,221 @@
+"""
+Global flow diagnostics computed inside generated kernels
+
+Tracking the decay of the shear layer in the fully periodic tutorials used to mean gathering the
+full `velocity` field into NumPy after every few steps. The kernels generated here read the PDF
+field directly, compute density and velocity per cell and reduce them to a handful of scalars
+(total mass, kinetic energy, enstrophy, maximum velocity, momentum) with pystencils reduction
+assignments. Only these scalars leave the kernel, so a sample costs one read-only sweep over the
+PDFs and no full-field copy - also on the GPU.
+
+Example:
+    scenario = create_scenario('shear_layer')
+    diagnostics = GlobalDiagnostics(scenario, every=50)
+    diagnostics.run(5000)
+    t, e = diagnostics.series['time'], diagnostics.series['kinetic_energy']
+"""
+
+import numpy as np
+import sympy as sp
+
+ALL_QUANTITIES = ('mass', 'kinetic_energy', 'enstrophy', 'max_velocity', 'momentum', 'fluid_cells')
+DEFAULT_QUANTITIES = ('mass', 'kinetic_energy', 'enstrophy', 'max_velocity', 'momentum')
+
+
+def macroscopic_value_assignments(method, pdf_field, offset, suffix):
+    """Density and velocity of the cell at `offset`, computed from the PDFs in `pdf_field`.
+
+    All symbols get `suffix` appended, so the assignments of several cells can live in one kernel.
+
+    Returns:
+        tuple (assignments, density symbol, tuple of velocity symbols)
+    """
+    dim = method.dim
+    rho = sp.Symbol(f'density_{suffix}')
+    u = sp.symbols(f'velocity_{suffix}_:{dim}')
+    pdfs = [pdf_field[tuple(offset)](i) for i in range(len(method.stencil))]
+    ac = method.conserved_quantity_computation.output_equations_from_pdfs(pdfs, {'density': rho, 'velocity': u})
+    renamed = {a.lhs: sp.Symbol(f'{a.lhs.name}_{suffix}') for a in ac.subexpressions}
+    ac = ac.new_with_substitutions(renamed, substitute_on_lhs=True)
+    return ac.all_assignments, rho, u
+
+
+def diagnostics_assignments(method, pdf_field, quantities=DEFAULT_QUANTITIES, flag_field=None, domain_flag=1):
+    """Creates the assignments of a kernel reducing the PDF field to global diagnostics.
+
+    Args:
+        method: lattice Boltzmann method the PDFs belong to
+        pdf_field: pystencils field holding the (post-streaming) PDFs
+        quantities: subset of `ALL_QUANTITIES`
+        flag_field: optional boundary handling flag field. If given, only cells with `domain_flag` set are
+                    counted and non-fluid neighbours enter the vorticity with zero velocity.
+        domain_flag: flag value marking fluid cells
+
+    Returns:
+        tuple (assignments, dict mapping output name -> reduction symbol)
+    """
+    import pystencils as ps
+    from pystencils.sympyextensions.integer_functions import bitwise_and
+
+    unknown = set(quantities) - set(ALL_QUANTITIES)
+    if unknown:
+        raise ValueError(f"Unknown diagnostic quantities {sorted(unknown)}. Available: {ALL_QUANTITIES}")
+
+    dim = method.dim
+    dtype = 'double'
+
+    def fluid_indicator(offset):
+        if flag_field is None:
+            return sp.Integer(1)
+        return sp.Piecewise((1, sp.Ne(bitwise_and(flag_field[tuple(offset)], domain_flag), 0)), (0, True))
+
+    center = (0,) * dim
+    assignments, rho, u = macroscopic_value_assignments(method, pdf_field, center, 'c')
+    w = sp.Symbol('w_fluid')
+    assignments.append(ps.Assignment(w, fluid_indicator(center)))
+
+    u_sq = sum(u_i ** 2 for u_i in u)
+    outputs = {}
+    reductions = []
+
+    def add(name, expr, reduction=ps.AddReductionAssignment):
+        symbol = ps.TypedSymbol(name, dtype)
+        outputs[name] = symbol
+        # accumulated in double precision also for single precision PDF fields
+        reductions.append(reduction(symbol, ps.tcast(expr, dtype)))
+
+    if 'mass' in quantities:
+        add('mass', w * rho)
+    if 'fluid_cells' in quantities:
+        add('fluid_cells', w)
+    if 'kinetic_energy' in quantities:
+        add('kinetic_energy', w * rho * u_sq / 2)
+    if 'max_velocity' in quantities:
+        add('max_velocity_sq', w * u_sq, ps.MaxReductionAssignment)
+    if 'momentum' in quantities:
+        for i in range(dim):
+            add(f'momentum_{i}', w * rho * u[i])
+
+    if 'enstrophy' in quantities:
+        # central differences of the velocity, neighbour velocities computed from the neighbour PDFs
+        neighbour_u = {}
+        for axis in range(dim):
+            for sign in (-1, 1):
+                offset = tuple(sign if d == axis else 0 for d in range(dim))
+                suffix = f"{'m' if sign < 0 else 'p'}{'xyz'[axis]}"
+                nb_assignments, _, nb_u = macroscopic_value_assignments(method, pdf_field, offset, suffix)
+                assignments += nb_assignments
+                nb_w = sp.Symbol(f'w_{suffix}')
+                assignments.append(ps.Assignment(nb_w, fluid_indicator(offset)))
+                neighbour_u[offset] = [nb_w * c for c in nb_u]
+
+        def derivative(component, axis):
+            plus = tuple(1 if d == axis else 0 for d in range(dim))
+            minus = tuple(-1 if d == axis else 0 for d in range(dim))
+            return (neighbour_u[plus][component] - neighbour_u[minus][component]) / 2
+
+        if dim == 2:
+            vorticity = [derivative(1, 0) - derivative(0, 1)]
+        else:
+            vorticity = [derivative(2, 1) - derivative(1, 2),
+                         derivative(0, 2) - derivative(2, 0),
+                         derivative(1, 0) - derivative(0, 1)]
+        add('enstrophy', w * sum(o ** 2 for o in vorticity) / 2)
+
+    return assignments + reductions, outputs
+
+
+class GlobalDiagnostics:
+    """In-kernel global diagnostics for a `LatticeBoltzmannStep`, recorded as in-memory time series.
+
+    Args:
+        scenario: `LatticeBoltzmannStep` (e.g. from `create_scenario`)
+        quantities: subset of `ALL_QUANTITIES`
+        every: sampling cadence in time steps used by `run`
+    """
+
+    def __init__(self, scenario, quantities=DEFAULT_QUANTITIES, every=10):
+        import pystencils as ps
+
+        self.scenario = scenario
+        self.every = every
+        self.quantities = tuple(quantities)
+
+        dh = scenario.data_handling
+        bh = scenario.boundary_handling
+        self._data_handling = dh
+        self._pdf_name = scenario.pdf_array_name
+        target = dh.default_target
+        self._gpu = target.is_gpu()
+
+        has_boundaries = len(bh.boundary_objects) > 0
+        flag_field = dh.fields[bh.flag_array_name] if has_boundaries else None
+        domain_flag = int(bh.flag_interface.domain_flag) if has_boundaries else 1
+
+        assignments, self._outputs = diagnostics_assignments(scenario.method, dh.fields[self._pdf_name],
+                                                             self.quantities, flag_field, domain_flag)
+        pdf_dtype = dh.fields[self._pdf_name].dtype.numpy_dtype
+        config = ps.CreateKernelConfig(target=target, ghost_layers=dh.ghost_layers_of_field(self._pdf_name),
+                                       default_dtype=str(pdf_dtype))
+        self._kernel = ps.create_kernel(assignments, config=config).compile()
+
+        sync_names = [self._pdf_name] + ([bh.flag_array_name] if has_boundaries else [])
+        self._sync = dh.synchronization_function(sync_names, target=target) if 'enstrophy' in self.quantities \
+            else (lambda: None)
+
+        if self._gpu:
+            import cupy as xp
+        else:
+            xp = np
+        self._buffers = {name: xp.zeros(1) for name in self._outputs}
+        self._neutral = {name: (-np.inf if name == 'max_velocity_sq' else 0.0) for name in self._outputs}
+        self._series = {'time': []}
+
+    def evaluate(self):
+        """Runs the diagnostics kernel on the current state and returns a dict of scalars."""
+        dh = self._data_handling
+        self._sync()
+        for name, buffer in self._buffers.items():
+            buffer.fill(self._neutral[name])
+        arrays = dh.gpu_arrays if self._gpu else dh.cpu_arrays
+        self._kernel(**{**arrays, **self._buffers})
+
+        raw = {name: float(buffer[0]) for name, buffer in self._buffers.items()}
+        result = {}
+        for q in self.quantities:
+            if q == 'max_velocity':
+                result[q] = float(np.sqrt(max(raw['max_velocity_sq'], 0.0)))
+            elif q == 'momentum':
+                result[q] = tuple(raw[f'momentum_{i}'] for i in range(self.scenario.method.dim))
+            else:
+                result[q] = raw[q]
+        return result
+
+    def sample(self):
+        """Evaluates the diagnostics and appends them to the time series."""
+        result = self.evaluate()
+        self._series['time'].append(self.scenario.time_steps_run)
+        for key, value in result.items():
+            self._series.setdefault(key, []).append(value)
+        return result
+
+    def run(self, time_steps):
+        """Runs the scenario for `time_steps` steps, sampling every `self.every` steps."""
+        if not self._series['time'] or self._series['time'][-1] != self.scenario.time_steps_run:
+            self.sample()
+        done = 0
+        while done < time_steps:
+            chunk = min(self.every, time_steps - done)
+            self.scenario.run(chunk)
+            done += chunk
+            self.sample()
+
+    @property
+    def series(self):
+        """Recorded time series as dict of NumPy arrays, momentum has shape (samples, dim)"""
+        return {key: np.array(values) for key, values in self._series.items()}
+
+    def mass_drift(self):
+        """Relative change of the total mass with respect to the first sample."""
+        mass = self.series['mass']
+        return (mass - mass[0]) / mass[0]
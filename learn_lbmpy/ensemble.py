@@ -0,0 +1,162 @@
+"""
+Batched ensembles of small, fully periodic 2D simulations
+
+Running many 100x100 cases one after another is dominated by per-call overhead: every
+`scenario.run(1)` goes through the Python time loop, the ghost layer synchronization and a kernel
+call for a domain that is processed in a few microseconds. An ensemble packs N independent members
+that share the same LB method into one array with an additional ensemble axis and advances all of
+them with a single kernel call per time step.
+
+The ensemble axis is appended as a third spatial coordinate. The 2D update rule generated by lbmpy
+is rewritten so that every field access gets a zero offset along that axis - PDFs therefore never
+stream from one member into another, and periodicity is only applied in x and y.
+
+Example:
+    velocities = [shear_layer_velocity(100, 100, seed=s) for s in range(16)]
+    ensemble = PeriodicEnsemble(velocities, lbm_config=LBMConfig(method=Method.SRT, relaxation_rate=1.97))
+    ensemble.run(1000)
+    u_5 = ensemble.member_velocity(5)     # (100, 100, 2) view, no copy
+"""
+
+import numpy as np
+
+from learn_lbmpy.solver import FixedStepSolver
+
+
+def embed_in_ensemble(assignments, fields):
+    """Rewrites 2D field accesses of `assignments` into accesses of 3D fields with zero z offset.
+
+    Args:
+        assignments: assignment collection or list of assignments generated for 2D fields
+        fields: dict mapping the name of each 2D field to its 3D counterpart
+
+    Returns:
+        the assignments with all accesses of the given fields substituted
+    """
+    from pystencils import Field
+
+    substitutions = {}
+    for access in assignments.atoms(Field.Access):
+        field3d = fields.get(access.field.name)
+        if field3d is None:
+            continue
+        substitutions[access] = field3d[tuple(access.offsets) + (0,)](*access.index)
+
+    if hasattr(assignments, 'new_with_substitutions'):
+        return assignments.new_with_substitutions(substitutions, substitute_on_lhs=True)
+    return [a.subs(substitutions) for a in assignments]
+
+
+class PeriodicEnsemble(FixedStepSolver):
+    """N independent fully periodic 2D simulations advanced by one kernel call per time step.
+
+    Args:
+        initial_velocities: array of shape (N, nx, ny, 2) or sequence of N arrays of shape (nx, ny, 2)
+        lbm_config: `LBMConfig` shared by all members. Must use a 2D stencil.
+        initial_density: scalar or array of shape (N, nx, ny)
+        config: pystencils `CreateKernelConfig`; by default the target from `detect_target()` is used
+        name: prefix of the arrays in the data handling
+    """
+
+    def __init__(self, initial_velocities, lbm_config=None, initial_density=1.0, config=None, name='ensemble'):
+        import pystencils as ps
+        from lbmpy import LBMConfig, LBMOptimisation, create_lb_update_rule
+        from lbmpy.macroscopic_value_kernels import macroscopic_values_getter, pdf_initialization_assignments
+
+        from learn_lbmpy.targets import detect_target
+
+        initial_velocities = np.asarray(initial_velocities, dtype=np.float64)
+        if initial_velocities.ndim != 4 or initial_velocities.shape[-1] != 2:
+            raise ValueError(f"initial_velocities must have shape (N, nx, ny, 2), got {initial_velocities.shape}")
+
+        if lbm_config is None:
+            lbm_config = LBMConfig()
+        if lbm_config.stencil.D != 2:
+            raise ValueError("Ensembles are only implemented for 2D stencils")
+        if config is None:
+            config = ps.CreateKernelConfig(target=detect_target())
+
+        self.name = name
+        self.members = initial_velocities.shape[0]
+        self.domain_size = initial_velocities.shape[1:3]
+        self.dim = 2
+        self.time_steps_run = 0
+
+        target = config.get_target()
+        self._gpu = target.is_gpu()
+        q = lbm_config.stencil.Q
+
+        self._pdf_name, self._tmp_name = f'{name}_pdfSrc', f'{name}_pdfTmp'
+        self.velocity_data_name, self.density_data_name = f'{name}_velocity', f'{name}_density'
+
+        dh = ps.create_data_handling(self.domain_size + (self.members,), periodicity=(True, True, False),
+                                     default_target=target)
+        self._data_handling = dh
+        src = dh.add_array(self._pdf_name, values_per_cell=q, gpu=self._gpu)
+        dh.add_array(self._tmp_name, values_per_cell=q, gpu=self._gpu, cpu=not self._gpu)
+        vel = dh.add_array(self.velocity_data_name, values_per_cell=2, gpu=self._gpu)
+        rho = dh.add_array(self.density_data_name, values_per_cell=1, gpu=self._gpu)
+        fields3d = {f.name: f for f in (src, dh.fields[self._tmp_name], vel, rho)}
+
+        # the update rule is generated for 2D fields with the same names and then lifted to 3D
+        src2d, dst2d = ps.fields(f"{self._pdf_name}({q}), {self._tmp_name}({q}): double[2D]", layout='fzyx')
+        update = create_lb_update_rule(lbm_config=lbm_config,
+                                       lbm_optimisation=LBMOptimisation(symbolic_field=src2d,
+                                                                        symbolic_temporary_field=dst2d))
+        self.method = update.method
+        self._lbm_config = lbm_config
+        self._kernels = [ps.create_kernel(embed_in_ensemble(update, fields3d), config=config).compile()]
+
+        # initialization and macroscopic getter only read the cell itself - no lifting needed
+        init = pdf_initialization_assignments(self.method, rho.center, vel.center_vector, src.center_vector)
+        getter = macroscopic_values_getter(self.method, rho.center, vel.center_vector, src)
+        self._init_kernel = ps.create_kernel(init, config=config).compile()
+        self._getter_kernel = ps.create_kernel(getter, config=config).compile()
+        self._macroscopic_names = (self.velocity_data_name, self.density_data_name)
+
+        self._sync_src = dh.synchronization_function([self._pdf_name], target=target)
+        self._sync_tmp = dh.synchronization_function([self._tmp_name], target=target)
+        self._swap_pairs = ((self._pdf_name, self._tmp_name),)
+
+        for arr_name, value in ((self.velocity_data_name, initial_velocities),
+                                (self.density_data_name, np.broadcast_to(initial_density,
+                                                                         (self.members,) + self.domain_size))):
+            inner = self._inner(dh.cpu_arrays[arr_name])
+            inner[...] = np.moveaxis(np.asarray(value), 0, 2).reshape(inner.shape)
+            if self._gpu:
+                dh.to_gpu(arr_name)
+        dh.run_kernel(self._init_kernel)
+        self._macroscopic_up_to_date = True
+
+    @property
+    def number_of_cells(self):
+        """Total number of cells over all members"""
+        return self.members * int(np.prod(self.domain_size))
+
+    @staticmethod
+    def _inner(arr, ghost_layers=1):
+        gl = ghost_layers
+        return arr[gl:-gl, gl:-gl, gl:-gl, ...]
+
+    @property
+    def velocity(self):
+        """Velocities of all members as (N, nx, ny, 2) view into the data handling"""
+        self._update_macroscopic_values()
+        return np.moveaxis(self._inner(self._data_handling.cpu_arrays[self.velocity_data_name]), 2, 0)
+
+    @property
+    def density(self):
+        """Densities of all members as (N, nx, ny) view into the data handling"""
+        self._update_macroscopic_values()
+        return np.moveaxis(self._inner(self._data_handling.cpu_arrays[self.density_data_name]), 2, 0)
+
+    def member_velocity(self, member):
+        return self.velocity[member]
+
+    def member_density(self, member):
+        return self.density[member]
+
+    def velocity_slice(self, slice_obj=None, masked=False, member=0):
+        """Velocity of a single member, mirrors `LatticeBoltzmannStep.velocity_slice`"""
+        result = self.member_velocity(member)
+        return result if slice_obj is None else result[slice_obj]
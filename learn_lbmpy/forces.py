@@ -0,0 +1,245 @@
+"""
+Drag and lift on obstacles by momentum exchange
+
+The obstacles in `04_cumulant_lbm` and `04_channel_flow.py` are `NoSlip("obstacle")` boundaries,
+but the force on them was never evaluated. lbmpy's `force_on_boundary` loops over the boundary
+index list in Python; here the momentum exchange
+
+    F = sum over boundary links of 2 f_i c_i
+
+is accumulated by a reduction inside the generated boundary kernel instead, so the bounce-back and
+the force summation happen in the same sweep over the index list and only D scalars leave it.
+
+Use `MomentumExchangeNoSlip` in place of `NoSlip` for the obstacle and attach a `ForceEvaluator`:
+
+    scenario = create_scenario('cylinder', obstacle_forces=True)
+    forces = ForceEvaluator(scenario, 'obstacle', reference_velocity=0.05, reference_length=30)
+    forces.run(20000)
+    t, cd, cl = forces.times, forces.drag_coefficient(), forces.lift_coefficient()
+    print(forces.strouhal_number())
+
+The PDFs are stored zero-centered (deviation from the lattice weights), so the force is measured
+relative to the background pressure, which cancels on closed obstacles.
+"""
+
+import numpy as np
+import sympy as sp
+
+from lbmpy.boundaries import NoSlip
+
+
+def force_symbols(name, dim):
+    """Reduction symbols the boundary kernel of the boundary named `name` accumulates the force into"""
+    import pystencils as ps
+    return tuple(ps.TypedSymbol(f'force_{name}_{i}', 'double') for i in range(dim))
+
+
+def attach_force_buffers(scenario, boundary):
+    """Adds the one-element force arrays of `boundary` to `scenario.kernel_params` (if not there yet)
+    and returns them. Scenarios with a `MomentumExchangeNoSlip` cannot run without them."""
+    if scenario.data_handling.default_target.is_gpu():
+        import cupy as xp
+    else:
+        xp = np
+    buffers = []
+    for symbol in force_symbols(boundary.name, scenario.method.dim):
+        buffers.append(scenario.kernel_params.setdefault(symbol.name, xp.zeros(1)))
+    return buffers
+
+
+class MomentumExchangeNoSlip(NoSlip):
+    """`NoSlip` whose boundary kernel also sums up the momentum exchanged with the fluid.
+
+    The force components are accumulated into the kernel parameters `force_<name>_<i>`, which have
+    to be passed to the boundary handling as one-element arrays - `ForceEvaluator` does that by adding
+    them to `scenario.kernel_params` (see `attach_force_buffers`). The kernel adds to the arrays, it
+    does not overwrite them. lbmpy's `force_on_boundary` calls the boundary kernels without these
+    arguments and therefore does not work on this boundary.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+
+    def get_additional_code_nodes(self, lb_method):
+        from lbmpy.lookup_tables import NeighbourOffsetArrays
+        return [NeighbourOffsetArrays(lb_method.stencil)]
+
+    def __call__(self, f_out, f_in, dir_symbol, inv_dir, lb_method, index_field, force_vector):
+        import pystencils as ps
+        from lbmpy.lookup_tables import NeighbourOffsetArrays
+        from pystencils.sympyextensions.typed_sympy import tcast
+
+        exchanged = sp.Symbol('momentum_exchange')
+        subexpressions = [ps.Assignment(exchanged, sp.Float(2.0) * f_out(dir_symbol))]
+        offset = NeighbourOffsetArrays.neighbour_offset(dir_symbol, lb_method.stencil)
+        reductions = [ps.AddReductionAssignment(symbol, exchanged * tcast.as_numeric(o))
+                      for symbol, o in zip(force_symbols(self.name, lb_method.dim), offset)]
+
+        bounce_back = [ps.Assignment(f_in(inv_dir[dir_symbol]), f_out(dir_symbol))]
+        return ps.AssignmentCollection(bounce_back + reductions, subexpressions=subexpressions)
+
+
+def dominant_frequency(signal, sample_spacing=1.0):
+    """Frequency of the strongest peak in the spectrum of `signal` (mean removed), in cycles per unit
+    of `sample_spacing`. The peak position is refined by a parabola through the three largest bins."""
+    signal = np.asarray(signal, dtype=float)
+    signal = (signal - signal.mean()) * np.hanning(len(signal))
+    n_fft = 4 * len(signal)
+    spectrum = np.abs(np.fft.rfft(signal, n=n_fft))
+    spectrum[0] = 0.0
+    k = int(np.argmax(spectrum))
+    if 0 < k < len(spectrum) - 1:
+        left, centre, right = np.log(spectrum[k - 1:k + 2] + 1e-300)
+        denominator = left - 2 * centre + right
+        if denominator != 0:
+            k = k + 0.5 * (left - right) / denominator
+    return k / (n_fft * sample_spacing)
+
+
+class ForceEvaluator:
+    """Records the force on a `MomentumExchangeNoSlip` boundary of a `LatticeBoltzmannStep`.
+
+    Args:
+        scenario: `LatticeBoltzmannStep` whose boundary handling contains the boundary
+        boundary: the `MomentumExchangeNoSlip` object or its name
+        reference_velocity: velocity used for the force coefficients and the Strouhal number
+        reference_length: obstacle diameter
+        reference_density: density used for the force coefficients
+        every: sampling cadence in time steps used by `run`. With every > 1 each sample is the force
+               averaged over the last `every` steps.
+        drag_axis: axis of the mean flow, lift is measured along the next axis
+    """
+
+    def __init__(self, scenario, boundary='obstacle', reference_velocity=None, reference_length=None,
+                 reference_density=1.0, every=1, drag_axis=0):
+        bh = scenario.boundary_handling
+        if isinstance(boundary, str):
+            matches = [b for b in bh.boundary_objects if b.name == boundary]
+            if not matches:
+                raise ValueError(f"No boundary named '{boundary}'. "
+                                 f"Available: {[b.name for b in bh.boundary_objects]}")
+            boundary = matches[0]
+        if not isinstance(boundary, MomentumExchangeNoSlip):
+            raise TypeError(f"Boundary '{boundary.name}' does not accumulate forces - "
+                            f"set it with MomentumExchangeNoSlip('{boundary.name}') instead of {type(boundary).__name__}")
+
+        self.scenario = scenario
+        self.boundary = boundary
+        self.every = every
+        self.reference_velocity = reference_velocity
+        self.reference_length = reference_length
+        self.reference_density = reference_density
+        self.drag_axis = drag_axis
+        self.lift_axis = (drag_axis + 1) % scenario.method.dim
+
+        # the boundary handling receives scenario.kernel_params in time_step() and in the compiled time loop
+        self._buffers = attach_force_buffers(scenario, boundary)
+
+        self._times = []
+        self._forces = []
+        self._step = 0
+        self._accumulated_steps = 0
+
+    def _read_and_reset(self):
+        force = np.array([float(b[0]) for b in self._buffers])
+        for b in self._buffers:
+            b.fill(0.0)
+        return force
+
+    def reset(self):
+        """Discards the force accumulated since the last sample."""
+        self._read_and_reset()
+        self._accumulated_steps = 0
+
+    def _record(self):
+        self._step += 1
+        self._accumulated_steps += 1
+        if self._step % self.every == 0:
+            self._times.append(self._step)
+            self._forces.append(self._read_and_reset() / self._accumulated_steps)
+            self._accumulated_steps = 0
+
+    def _recording_time_loop(self):
+        """Time loop built like `LatticeBoltzmannStep.get_time_loop` (see `learn_lbmpy.solver.lb_step_calls`),
+        with a recording call at the end of each step"""
+        from pystencils.timeloop import TimeLoop
+        from learn_lbmpy.solver import lb_step_calls
+
+        scenario = self.scenario
+        steps, _ = lb_step_calls(scenario)
+        recording = TimeLoop(steps=2)
+        recording.add_pre_run_function(scenario.pre_run)
+        recording.add_post_run_function(scenario.post_run)
+        recording.add_single_step_function(scenario.time_step)
+        recording.add_single_step_function(self._record)
+        for calls in steps:
+            for _, _, function, kwargs in calls:
+                recording.add_call(function, kwargs)
+            recording.add_call(self._record, {})
+        return recording
+
+    def run(self, time_steps):
+        """Runs the scenario for `time_steps` steps and records a force sample every `self.every` steps."""
+        scenario = self.scenario
+        time_loop = self._recording_time_loop()
+        self._step = scenario.time_steps_run
+        time_loop.run(time_steps)
+        scenario.time_steps_run += time_loop.time_steps_run
+
+    # ----------------------------------------------- results ------------------------------------------------------
+
+    @property
+    def times(self):
+        return np.array(self._times)
+
+    @property
+    def forces(self):
+        """Force samples, shape (samples, dim)"""
+        return np.array(self._forces).reshape(len(self._forces), -1)
+
+    @property
+    def drag(self):
+        return self.forces[:, self.drag_axis]
+
+    @property
+    def lift(self):
+        return self.forces[:, self.lift_axis]
+
+    def _reference_force(self):
+        if self.reference_velocity is None or self.reference_length is None:
+            raise ValueError("Force coefficients need reference_velocity and reference_length")
+        area = self.reference_length if self.scenario.method.dim == 2 else np.pi * self.reference_length ** 2 / 4
+        return 0.5 * self.reference_density * self.reference_velocity ** 2 * area
+
+    def drag_coefficient(self):
+        """C_d = 2 F_drag / (rho U^2 D), with the frontal area pi D^2 / 4 instead of D in 3D"""
+        return self.drag / self._reference_force()
+
+    def lift_coefficient(self):
+        return self.lift / self._reference_force()
+
+    def strouhal_number(self, skip=0.5):
+        """Strouhal number St = f D / U from the dominant frequency of the lift signal.
+
+        Args:
+            skip: fraction of the recorded samples discarded as start-up transient
+
+        Returns None if the lift does not oscillate (fewer than two periods in the analysed part).
+        """
+        if self.reference_velocity is None or self.reference_length is None:
+            raise ValueError("The Strouhal number needs reference_velocity and reference_length")
+        times = self.times
+        lift = self.lift[int(skip * len(times)):]
+        if len(lift) < 8:
+            return None
+        crossings = np.count_nonzero(np.diff(np.sign(lift - lift.mean())) != 0)
+        if crossings < 4:
+            return None
+        spacing = float(np.median(np.diff(times))) if len(times) > 1 else 1.0
+        frequency = dominant_frequency(lift, spacing)
+        return frequency * self.reference_length / self.reference_velocity
+
+    def mean_coefficients(self, skip=0.5):
+        """Time-averaged (C_d, C_l) over the samples after the start-up fraction `skip`"""
+        start = int(skip * len(self._times))
+        return float(np.mean(self.drag_coefficient()[start:])), float(np.mean(self.lift_coefficient()[start:]))
@@ -0,0 +1,124 @@
+"""
+Vectorized boundary index lists
+
+Before the first time step the boundary handling turns the flag field into index lists of boundary
+links. pystencils does this with a Cython extension; without Cython (it is compiled on the fly by
+`pyximport`, which is not a dependency of this repository) it falls back to a Python loop over every
+boundary cell and every stencil direction. For the sphere packings of `porous_media` that loop takes
+minutes at 128^3 and much longer at 256^3, far longer than the simulation steps.
+
+`create_boundary_index_list` below computes the same links, in the same order, with one vectorized
+pass per stencil direction. `prepare(*boundary_handlings)` builds the index lists of the given boundary
+handlings with it; the scenarios with large 3D geometries call it before they return. Boundaries set later are
+indexed by pystencils itself again. `install()` instead replaces the function of pystencils for the whole
+process, for scripts that create many such boundary handlings; nothing in the package calls it. Neither
+changes anything if the Cython functions are available.
+"""
+
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def _shifted(array, direction, fill):
+    """array[cell + direction] for all cells, `fill` where the neighbour lies outside the array"""
+    result = np.full_like(array, fill)
+    target, source = [], []
+    for d, n in zip(direction, array.shape):
+        target.append(slice(max(0, -d), n - max(0, d)))
+        source.append(slice(max(0, d), n - max(0, -d)))
+    result[tuple(target)] = array[tuple(source)]
+    return result
+
+
+def create_boundary_index_list(flag_field, stencil, boundary_mask, fluid_mask, nr_of_ghost_layers=1,
+                               inner_or_boundary=True, single_link=False):
+    """Drop-in replacement of `pystencils.boundaries.createindexlist.create_boundary_index_list`.
+
+    Only the variant the boundary handling uses for the lattice Boltzmann boundaries
+    (`inner_or_boundary=True`, `single_link=False`) is vectorized; other calls go to pystencils.
+    """
+    from pystencils.boundaries import createindexlist
+
+    if not inner_or_boundary or single_link:
+        return _original(flag_field, stencil, boundary_mask, fluid_mask, nr_of_ghost_layers, inner_or_boundary,
+                         single_link)
+
+    dim = flag_field.ndim
+    stencil = np.asarray(stencil)
+    index_dtype = createindexlist.default_index_array_dtype.numpy_dtype
+    dtype = np.dtype([(name, index_dtype) for name in createindexlist.boundary_index_array_coordinate_names[:dim]]
+                     + [(createindexlist.direction_member_name, index_dtype)])
+
+    # fluid cells inside the ghost layers that have a neighbour flagged with exactly `boundary_mask`
+    interior = np.zeros(flag_field.shape, dtype=bool)
+    interior[(slice(nr_of_ghost_layers, -nr_of_ghost_layers or None),) * dim] = True
+    candidates = interior & ((flag_field & fluid_mask) != 0)
+    exact_boundary = flag_field == boundary_mask
+    near_boundary = np.zeros(flag_field.shape, dtype=bool)
+    for direction in stencil:
+        near_boundary |= _shifted(exact_boundary, direction, False)
+    candidates &= near_boundary
+
+    # links from these cells to all neighbours with the boundary bit set, ordered like pystencils:
+    # by z, y, x of the cell, then by direction
+    is_boundary = (flag_field & boundary_mask) != 0
+    cells, directions = [], []
+    for dir_idx, direction in enumerate(stencil):
+        linked = np.nonzero(candidates & _shifted(is_boundary, direction, False))
+        cells.append(np.stack(linked, axis=-1))
+        directions.append(np.full(len(linked[0]), dir_idx))
+    cells, directions = np.concatenate(cells), np.concatenate(directions)
+    sort_keys = [directions, cells[:, 0]] + [cells[:, d] for d in range(1, dim)]
+    order = np.lexsort(sort_keys)
+
+    result = np.empty(len(order), dtype=dtype)
+    for d, name in enumerate(createindexlist.boundary_index_array_coordinate_names[:dim]):
+        result[name] = cells[order, d]
+    result[createindexlist.direction_member_name] = directions[order]
+    return result
+
+
+_original = None
+
+
+def _replace():
+    """Puts the vectorized function in place of the pystencils one; returns False if nothing was replaced"""
+    global _original
+    from pystencils.boundaries import createindexlist
+
+    current = createindexlist.create_boundary_index_list
+    if createindexlist.cython_funcs_available or current is create_boundary_index_list:
+        return False
+    _original = current
+    createindexlist.create_boundary_index_list = create_boundary_index_list
+    return True
+
+
+@contextmanager
+def vectorized_index_lists():
+    """Uses the vectorized index list creation inside the `with` block only (if Cython is missing)"""
+    from pystencils.boundaries import createindexlist
+
+    replaced = _replace()
+    try:
+        yield
+    finally:
+        if replaced:
+            createindexlist.create_boundary_index_list = _original
+
+
+def prepare(*boundary_handlings):
+    """Builds the index lists of `boundary_handlings` now, with the vectorized function"""
+    with vectorized_index_lists():
+        for boundary_handling in boundary_handlings:
+            boundary_handling.prepare()
+
+
+def install():
+    """Replaces the pure Python index list creation of pystencils by the vectorized one for the whole process.
+
+    This affects every boundary handling created afterwards, also outside this package. Scripts opt in by
+    calling it; use `prepare` to speed up single boundary handlings instead.
+    """
+    _replace()
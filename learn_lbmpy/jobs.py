@@ -0,0 +1,434 @@
+"""
+Local job queue for headless batch runs
+
+Long runs are started by hand, one at a time. A `JobQueue` keeps scenario and script jobs in an SQLite
+database in a directory and runs them as separate worker processes, without any external service:
+
+- a scenario job is a registered scenario with parameters, a number of time steps and/or a time budget
+  (seconds of time stepping), and the outputs to write: 'velocity', 'density' (`.npz`) and 'plot' (`.png`)
+- a script job runs a tutorial script with the job directory as working directory, so the figures and
+  animations it writes are collected there; `test_run` defines `is_test_run` for a short run
+
+`JobQueue.run()` starts queued jobs while they fit into the limits: `cpus` cores (each job is pinned to
+`threads` free cores, with `OMP_NUM_THREADS` set accordingly), `memory_mb` of declared memory and `max_jobs`
+concurrent jobs. Stream-collide kernels are bound by memory bandwidth, so a few concurrent jobs already
+saturate it; `max_jobs` below the number of cores avoids jobs slowing each other down. A job whose
+resident set size exceeds its declared `memory_mb` is stopped and marked failed.
+
+Every state change is written to the database at once. Jobs that were running when the scheduler was
+interrupted or killed are queued again when it restarts. Each job has its own directory
+`<queue>/<id>/` with the output of the worker (`log.txt`), `result.json` (time steps, run time, MLUPS,
+peak memory) and its artifacts.
+
+Example:
+    queue = JobQueue('jobs')
+    queue.submit('cylinder', steps=100000, outputs=('velocity', 'plot'))
+    queue.submit('shear_layer', params={'width': 512, 'height': 512}, time_budget=600)
+    queue.submit_script('tutorials/basics/05_non_dim_and_scaling/01_scaling.py', time_budget=3600)
+    queue.run(cpus=4, max_jobs=2)
+
+From the command line: `python -m learn_lbmpy jobs submit cylinder --steps 100000 --output plot`,
+`python -m learn_lbmpy jobs run --cpus 4 --max-jobs 2`, `python -m learn_lbmpy jobs list`.
+"""
+
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+OUTPUTS = ('velocity', 'density', 'plot')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    params TEXT NOT NULL,
+    steps INTEGER,
+    time_budget REAL,
+    outputs TEXT NOT NULL,
+    threads INTEGER NOT NULL,
+    memory_mb REAL NOT NULL,
+    priority INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    result TEXT
+)
+"""
+
+
+@dataclass
+class Job:
+    """A row of the job table"""
+    id: int
+    kind: str
+    target: str
+    params: dict
+    steps: int
+    time_budget: float
+    outputs: tuple
+    threads: int
+    memory_mb: float
+    priority: int
+    state: str
+    cancel_requested: bool
+    attempts: int
+    pid: int
+    submitted: float
+    started: float
+    finished: float
+    error: str
+    result: dict = field(default=None)
+
+    @classmethod
+    def from_row(cls, row):
+        values = dict(row)
+        values['params'] = json.loads(values['params'])
+        values['outputs'] = tuple(json.loads(values['outputs']))
+        values['cancel_requested'] = bool(values['cancel_requested'])
+        values['result'] = json.loads(values['result']) if values['result'] else None
+        return cls(**values)
+
+    @property
+    def name(self):
+        return os.path.basename(self.target) if self.kind == 'script' else self.target
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _process_rss(pid):
+    """Resident set size of process `pid` in bytes, None if unknown"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class JobQueue:
+    """Jobs stored in `<directory>/jobs.sqlite`, see the module docstring"""
+
+    def __init__(self, directory='jobs'):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = os.path.abspath(directory)
+        self._db = sqlite3.connect(os.path.join(self.directory, 'jobs.sqlite'), timeout=30, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(_SCHEMA)
+        self._running = {}      # job id -> (Popen, cores, log file)
+
+    def job_directory(self, job_id):
+        return os.path.join(self.directory, str(job_id))
+
+    # ------------------------------------------------ submitting ------------------------------------------------
+
+    def _insert(self, kind, target, params, steps, time_budget, outputs, threads, memory_mb, priority):
+        cursor = self._db.execute(
+            "INSERT INTO jobs (kind, target, params, steps, time_budget, outputs, threads, memory_mb, priority, "
+            "state, submitted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?)",
+            (kind, target, json.dumps(params), steps, time_budget, json.dumps(list(outputs)), threads, memory_mb,
+             priority, time.time()))
+        job_id = cursor.lastrowid
+        os.makedirs(self.job_directory(job_id), exist_ok=True)
+        return job_id
+
+    def submit(self, scenario, params=None, steps=None, time_budget=None, outputs=('velocity',), threads=1,
+               memory_mb=512, priority=0):
+        """Queues a scenario job and returns its id.
+
+        Args:
+            scenario: name of a registered scenario
+            params: scenario parameters overriding the defaults
+            steps: time steps to run
+            time_budget: seconds of time stepping; the job stops after the chunk that exceeds it
+            outputs: any of 'velocity', 'density', 'plot', written after the last step
+            threads: cores (and OpenMP threads) of the job
+            memory_mb: declared memory; the job is stopped when its resident set size exceeds it
+            priority: jobs with a higher priority start first
+        """
+        from learn_lbmpy.registry import get_scenario
+
+        spec = get_scenario(scenario)
+        params = dict(params or {})
+        unknown = set(params) - set(spec.defaults)
+        if unknown:
+            raise TypeError(f"Scenario '{scenario}' got unknown parameter(s) {sorted(unknown)}")
+        if steps is None and time_budget is None:
+            raise ValueError("A scenario job needs `steps`, `time_budget` or both")
+        unknown = set(outputs) - set(OUTPUTS)
+        if unknown:
+            raise ValueError(f"Unknown output(s) {sorted(unknown)}, use {OUTPUTS}")
+        return self._insert('scenario', scenario, params, steps, time_budget, outputs, threads, memory_mb, priority)
+
+    def submit_script(self, script, test_run=False, time_budget=None, threads=1, memory_mb=1024, priority=0):
+        """Queues a script job; a `time_budget` (seconds) stops the script, the job then fails."""
+        script = os.path.abspath(script)
+        if not os.path.isfile(script):
+            raise FileNotFoundError(script)
+        return self._insert('script', script, {'test_run': test_run}, None, time_budget, (), threads, memory_mb,
+                            priority)
+
+    # ------------------------------------------------ inspecting ------------------------------------------------
+
+    def jobs(self, states=None):
+        rows = self._db.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+        result = [Job.from_row(r) for r in rows]
+        return [j for j in result if states is None or j.state in states]
+
+    def job(self, job_id):
+        row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No job {job_id} in {self.directory}")
+        return Job.from_row(row)
+
+    def log(self, job_id):
+        try:
+            with open(os.path.join(self.job_directory(job_id), 'log.txt')) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def cancel(self, job_id):
+        """Cancels a queued job at once; a running job is stopped by the scheduler."""
+        self._db.execute("UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'",
+                         (time.time(), job_id))
+        self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = 'running'", (job_id,))
+
+    def requeue(self, job_id):
+        """Queues a finished, failed or cancelled job again."""
+        self._db.execute("UPDATE jobs SET state = 'queued', cancel_requested = 0, error = NULL, result = NULL, "
+                         "started = NULL, finished = NULL, pid = NULL WHERE id = ? AND state != 'running'",
+                         (job_id,))
+
+    def report(self):
+        lines = [f"{'id':>4s}  {'state':10s}{'job':24s}{'steps':>9s}{'budget':>8s}{'MLUPS':>8s}{'run s':>9s}"
+                 f"{'peak MB':>9s}  error"]
+        for j in self.jobs():
+            r = j.result or {}
+            steps = r.get('time_steps', j.steps)
+            lines.append(f"{j.id:4d}  {j.state:10s}{j.name[:23]:24s}{steps if steps is not None else '-':>9}"
+                         f"{j.time_budget if j.time_budget else '-':>8}"
+                         f"{format(r['mlups'], '.1f') if 'mlups' in r else '-':>8s}"
+                         f"{format(r['run_time'], '.1f') if 'run_time' in r else '-':>9s}"
+                         f"{format(r['peak_rss'] / 2 ** 20, '.0f') if r.get('peak_rss') else '-':>9s}"
+                         f"  {j.error or ''}")
+        return '\n'.join(lines)
+
+    # ------------------------------------------------ scheduling ------------------------------------------------
+
+    def _set(self, job_id, **values):
+        columns = ', '.join(f"{k} = ?" for k in values)
+        self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", tuple(values.values()) + (job_id,))
+
+    def _is_worker(self, pid, job_id):
+        """True if process `pid` is the worker of job `job_id` (the pid may have been reused since)"""
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                arguments = f.read().decode(errors='replace').split('\0')
+        except OSError:
+            return False
+        return 'learn_lbmpy.jobs' in arguments and arguments[-3:-1] == [self.directory, str(job_id)]
+
+    def recover(self):
+        """Queues jobs again that are marked running but have no worker of this scheduler (after a restart)."""
+        for job in self.jobs(states=('running',)):
+            if job.id in self._running:
+                continue
+            if job.pid and self._is_worker(job.pid, job.id):
+                try:
+                    os.kill(job.pid, signal.SIGTERM)  # orphaned worker of a killed scheduler
+                except OSError:
+                    pass
+            self._set(job.id, state='cancelled' if job.cancel_requested else 'queued', pid=None,
+                      finished=time.time() if job.cancel_requested else None)
+
+    def _start(self, job, cores):
+        command = [sys.executable, '-m', 'learn_lbmpy.jobs', self.directory, str(job.id)]
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        env['OMP_NUM_THREADS'] = str(job.threads)
+        env.setdefault('MPLBACKEND', 'Agg')
+        pin = cores and hasattr(os, 'sched_setaffinity')
+        log = open(os.path.join(self.job_directory(job.id), 'log.txt'), 'a')
+        log.write(f"--- attempt {job.attempts + 1}, {time.strftime('%Y-%m-%d %H:%M:%S')}"
+                  f"{', cores ' + ','.join(map(str, cores)) if pin else ''}\n")
+        log.flush()
+        process = subprocess.Popen(command, env=env, cwd=self.job_directory(job.id), stdout=log,
+                                   stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                   preexec_fn=(lambda: os.sched_setaffinity(0, cores)) if pin else None)
+        self._running[job.id] = (process, cores, log)
+        self._set(job.id, state='running', pid=process.pid, started=time.time(), finished=None, error=None,
+                  attempts=job.attempts + 1)
+
+    def _stop(self, job_id, state, error):
+        process, _, _ = self._running[job_id]
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        self._finish(job_id, state, error)
+
+    def _finish(self, job_id, state, error=None):
+        process, _, log = self._running.pop(job_id)
+        process.wait()
+        log.close()
+        result = None
+        try:
+            with open(os.path.join(self.job_directory(job_id), 'result.json')) as f:
+                result = f.read()
+        except FileNotFoundError:
+            pass
+        if state is None:
+            state = 'done' if process.returncode == 0 else 'failed'
+            if state == 'failed':
+                lines = self.log(job_id).strip().splitlines()
+                error = f"exit code {process.returncode}: {lines[-1] if lines else ''}"
+        self._set(job_id, state=state, finished=time.time(), error=error, result=result, pid=None)
+
+    def _check_running(self):
+        for job_id in list(self._running):
+            process = self._running[job_id][0]
+            if process.poll() is not None:
+                self._finish(job_id, None)
+                continue
+            job = self.job(job_id)
+            rss = _process_rss(process.pid)
+            if job.cancel_requested:
+                self._stop(job_id, 'cancelled', 'cancelled while running')
+            elif rss is not None and rss > job.memory_mb * 2 ** 20:
+                self._stop(job_id, 'failed', f"memory limit: {rss / 2 ** 20:.0f} MB > {job.memory_mb:g} MB")
+            elif job.kind == 'script' and job.time_budget and time.time() - job.started > job.time_budget:
+                self._stop(job_id, 'failed', f"time budget of {job.time_budget:g} s exceeded")
+
+    def run(self, cpus=None, memory_mb=None, max_jobs=None, poll_interval=0.5, wait=False):
+        """Runs queued jobs within the limits until the queue is empty (or forever with `wait`).
+
+        Args:
+            cpus: cores to use, default all cores available to this process
+            memory_mb: total declared memory of the running jobs, default 80% of the physical memory
+            max_jobs: maximum number of concurrent jobs, default `cpus`
+            poll_interval: seconds between checks of the workers and the queue
+            wait: keep waiting for new jobs when the queue is empty
+        """
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+        cores = cores[:cpus] if cpus else cores
+        if memory_mb is None:
+            memory_mb = 0.8 * os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2 ** 20
+        max_jobs = max_jobs or len(cores)
+
+        self.recover()
+        try:
+            while True:
+                self._check_running()
+                busy = {c for _, used, _ in self._running.values() for c in used}
+                used_memory = sum(self.job(i).memory_mb for i in self._running)
+                queued = sorted(self.jobs(states=('queued',)), key=lambda j: (-j.priority, j.id))
+                for job in queued:
+                    if job.threads > len(cores) or job.memory_mb > memory_mb:
+                        self._set(job.id, state='failed', finished=time.time(),
+                                  error=f"needs {job.threads} cores and {job.memory_mb:g} MB, the limits are "
+                                        f"{len(cores)} cores and {memory_mb:.0f} MB")
+                        continue
+                    free = [c for c in cores if c not in busy]
+                    if len(self._running) >= max_jobs or job.threads > len(free) or \
+                            used_memory + job.memory_mb > memory_mb:
+                        continue
+                    self._start(job, free[:job.threads])
+                    busy.update(free[:job.threads])
+                    used_memory += job.memory_mb
+                if not self._running and not wait and not self.jobs(states=('queued',)):
+                    break
+                time.sleep(poll_interval)
+        finally:
+            # interrupted: the workers are stopped and their jobs queued again
+            for job_id in list(self._running):
+                self._stop(job_id, 'queued', None)
+
+
+# ------------------------------------------------------ worker ------------------------------------------------------
+
+def _run_scenario(job):
+    import numpy as np
+
+    from learn_lbmpy.memory import peak_rss
+    from learn_lbmpy.registry import create_scenario
+
+    start = time.perf_counter()
+    scenario = create_scenario(job.target, **job.params)
+    setup_time = time.perf_counter() - start
+    print(f"{job.target} {job.params} on {scenario.domain_size}, setup {setup_time:.1f} s", flush=True)
+
+    # chunks of about a second, so the time budget is met closely and progress shows up in the log
+    done, run_time, chunk = 0, 0.0, 10
+    while (job.steps is None or done < job.steps) and (job.time_budget is None or run_time < job.time_budget):
+        steps = chunk if job.steps is None else min(chunk, job.steps - done)
+        start = time.perf_counter()
+        scenario.run(steps)
+        duration = time.perf_counter() - start
+        done += steps
+        run_time += duration
+        rate = steps / max(duration, 1e-6)
+        chunk = max(10, min(int(rate), 10 * chunk))
+        if job.time_budget is not None:
+            chunk = max(1, min(chunk, int(rate * (job.time_budget - run_time)) + 1))
+        print(f"step {done}: {run_time:.1f} s, {scenario.number_of_cells * steps / max(duration, 1e-12) * 1e-6:.1f} "
+              f"MLUPS", flush=True)
+
+    artifacts = []
+    if 'velocity' in job.outputs:
+        np.savez_compressed('velocity.npz', velocity=scenario.velocity_slice(masked=False))
+        artifacts.append('velocity.npz')
+    if 'density' in job.outputs:
+        np.savez_compressed('density.npz', density=scenario.density_slice())
+        artifacts.append('density.npz')
+    if 'plot' in job.outputs:
+        from learn_lbmpy.cli import _save_plot
+        _save_plot(scenario, 'plot.png')
+        artifacts.append('plot.png')
+    return {'time_steps': done, 'setup_time': setup_time, 'run_time': run_time,
+            'mlups': scenario.number_of_cells * done / run_time * 1e-6 if run_time else None,
+            'peak_rss': peak_rss(), 'artifacts': artifacts}
+
+
+def _run_script(job):
+    import runpy
+
+    from learn_lbmpy.memory import peak_rss
+
+    before = set(os.listdir('.'))
+    init_globals = {'is_test_run': True} if job.params.get('test_run') else None
+    sys.argv = [job.target]
+    sys.path.insert(0, os.path.dirname(job.target))
+    start = time.perf_counter()
+    runpy.run_path(job.target, init_globals=init_globals, run_name='__main__')
+    return {'run_time': time.perf_counter() - start, 'peak_rss': peak_rss(),
+            'artifacts': sorted(set(os.listdir('.')) - before - {'log.txt'})}
+
+
+def _work(directory, job_id):
+    """Runs a job in the current directory (the job directory) and writes `result.json`"""
+    queue = JobQueue(directory)
+    job = queue.job(job_id)
+    if os.path.exists('result.json'):
+        os.remove('result.json')
+    result = _run_script(job) if job.kind == 'script' else _run_scenario(job)
+    with open('result.json.part', 'w') as f:
+        json.dump(result, f, indent=1)
+    os.replace('result.json.part', 'result.json')
+
+
+if __name__ == '__main__':
+    _work(sys.argv[1], int(sys.argv[2]))
@@ -0,0 +1,308 @@
+"""
+Live, non-blocking viewer over a shared-memory frame ring
+
+The cumulant and scaling scripts build a 600-frame animation before anything is shown, and a long run
+cannot be watched while it executes. Here the simulation publishes decimated frames into a ring of a few
+slots in shared memory and a separate viewer process renders the newest one:
+
+- `LivePublisher.publish()` copies one frame into the next slot and returns. It never waits for the
+  viewer. Frames are only published at a fixed frame budget (`fps`); calls in between return at once
+  and do not even compute the frame when it is passed as a callable.
+- `LiveViewer.poll()` reads the newest slot. Frames that were overwritten before the viewer got to them,
+  or that changed while being read, are counted as dropped; the counts are written back into the shared
+  header, so the publisher can report them without any synchronization.
+
+Each slot carries a sequence number that is set to -1 while the slot is written (a seqlock): the viewer
+reads the number, copies the frame and accepts the copy only if the number is unchanged.
+
+Example:
+    with LivePublisher((256, 64), fps=20) as live:
+        viewer = launch_viewer(live.name)       # python -m learn_lbmpy view <name>
+        run_live(scenario, live, time_steps=100000, every=50)
+        print(live.stats)
+
+From the command line: `python -m learn_lbmpy run cylinder --steps 100000 --live`.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time as _time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_METADATA_BYTES = 4096
+# control words: frames published, closed flag, viewers attached, frames shown and dropped by the viewer
+_PUBLISHED, _CLOSED, _ATTACHED, _SHOWN, _DROPPED = range(5)
+_CONTROL_WORDS = 8
+
+
+class _FrameRing:
+    """Views into the shared memory block: metadata, control words, per slot sequence number, time and frame"""
+
+    def __init__(self, shm, metadata):
+        self.shm = shm
+        self.metadata = metadata
+        self.shape = tuple(metadata['shape'])
+        self.dtype = np.dtype(metadata['dtype'])
+        slots = metadata['slots']
+        offset = _METADATA_BYTES
+        self.control = np.ndarray(_CONTROL_WORDS, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.control.nbytes
+        self.sequence = np.ndarray(slots, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.sequence.nbytes
+        self.times = np.ndarray(slots, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.times.nbytes
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def size(shape, dtype, slots):
+        return _METADATA_BYTES + 8 * (_CONTROL_WORDS + 2 * slots) + slots * int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+    def release(self):
+        # the views have to go before the block can be closed
+        del self.control, self.sequence, self.times, self.frames
+        self.shm.close()
+
+
+class LivePublisher:
+    """Simulation side of the frame ring.
+
+    Args:
+        shape: shape of a frame, e.g. the decimated 2D velocity magnitude
+        dtype: frame dtype; float32 halves the copy of float64 fields
+        slots: frames in the ring. Three let the viewer read one slot while the next two are written.
+        fps: frame budget, at most `fps` frames per second of wall clock time are published
+        name: name of the shared memory block, generated if None
+        label: shown by the viewer, e.g. the scenario name
+    """
+
+    def __init__(self, shape, dtype='float32', slots=3, fps=20, name=None, label=''):
+        shape = tuple(int(n) for n in shape)
+        metadata = {'shape': shape, 'dtype': np.dtype(dtype).str, 'slots': slots, 'fps': fps, 'label': label}
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=_FrameRing.size(shape, dtype, slots))
+        encoded = json.dumps(metadata).encode()
+        if len(encoded) > _METADATA_BYTES:
+            raise ValueError("label too long")
+        self._shm.buf[:len(encoded)] = encoded
+        self._ring = _FrameRing(self._shm, metadata)
+        self._ring.control[:] = 0
+        self._ring.sequence[:] = -1
+        self.name = self._shm.name
+        self.interval = 1.0 / fps
+        self._next_due = 0.0
+        self._closed = False
+        self._stats = {'published': 0, 'throttled': 0, 'publish_time': 0.0}
+
+    def due(self):
+        """True if the frame budget allows the next frame now"""
+        return _time.perf_counter() >= self._next_due
+
+    def publish(self, time, frame):
+        """Copies `frame` (array, or callable returning one) into the next slot, if the frame budget allows it.
+
+        Returns False without touching `frame` if the last frame was published less than 1/fps seconds ago.
+        """
+        now = _time.perf_counter()
+        if now < self._next_due:
+            self._stats['throttled'] += 1
+            return False
+        # a slow publish does not lead to a burst of frames afterwards
+        self._next_due = max(self._next_due + self.interval, now)
+        if callable(frame):
+            frame = frame()
+
+        ring = self._ring
+        number = int(ring.control[_PUBLISHED])
+        slot = number % len(ring.sequence)
+        ring.sequence[slot] = -1
+        np.copyto(ring.frames[slot], frame, casting='unsafe')
+        ring.times[slot] = time
+        ring.sequence[slot] = number
+        ring.control[_PUBLISHED] = number + 1
+        self._stats['published'] += 1
+        self._stats['publish_time'] += _time.perf_counter() - now
+        return True
+
+    @property
+    def stats(self):
+        """Frames published, throttled by the frame budget, shown and dropped by the viewer.
+
+        Frames published but neither shown nor dropped were published before the viewer attached, or are
+        still in the ring.
+        """
+        result = dict(self._stats)
+        result.update(self._viewer_counts if self._closed else self._read_viewer_counts())
+        return result
+
+    @property
+    def viewer_attached(self):
+        return not self._closed and bool(self._ring.control[_ATTACHED])
+
+    def _read_viewer_counts(self):
+        return {'shown': int(self._ring.control[_SHOWN]), 'dropped': int(self._ring.control[_DROPPED])}
+
+    def close(self):
+        """Tells the viewer that no more frames follow and removes the shared memory block."""
+        if not self._closed:
+            self._viewer_counts = self._read_viewer_counts()
+            self._ring.control[_CLOSED] = 1
+            self._closed = True
+            self._ring.release()
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # before 3.13 attaching registers the block with the resource tracker of this process, which would
+    # remove it when the viewer exits while the simulation is still publishing
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class LiveViewer:
+    """Viewer side of the frame ring, attached to the block `name` of a `LivePublisher`"""
+
+    def __init__(self, name):
+        shm = _attach(name)
+        metadata = json.loads(bytes(shm.buf[:_METADATA_BYTES]).rstrip(b'\0'))
+        self._ring = _FrameRing(shm, metadata)
+        self.label = metadata['label']
+        self.fps = metadata['fps']
+        self.shape = self._ring.shape
+        self._frame = np.empty(self.shape, dtype=self._ring.dtype)
+        # frames published before the viewer attached are neither shown nor dropped
+        self._last = int(self._ring.control[_PUBLISHED]) - 1
+        self.shown = 0
+        self.dropped = 0
+        self._ring.control[_ATTACHED] += 1
+
+    @property
+    def closed(self):
+        return bool(self._ring.control[_CLOSED])
+
+    def poll(self):
+        """(time step, frame) of the newest frame, or None if there is no new one. The frame is reused."""
+        ring = self._ring
+        newest = int(ring.control[_PUBLISHED]) - 1
+        if newest <= self._last:
+            return None
+        slot = newest % len(ring.sequence)
+        if int(ring.sequence[slot]) != newest:
+            return None  # being written, or already the next round
+        time = int(ring.times[slot])
+        np.copyto(self._frame, ring.frames[slot])
+        if int(ring.sequence[slot]) != newest:
+            return None  # overwritten while copying; picked up as dropped with the next frame
+        self.dropped += newest - self._last - 1
+        self.shown += 1
+        self._last = newest
+        ring.control[_SHOWN] = self.shown
+        ring.control[_DROPPED] = self.dropped
+        return time, self._frame
+
+    def close(self):
+        self._ring.release()
+
+
+def run_viewer(name, display=True, delay=0.0, timeout=10.0, cmap='viridis'):
+    """Shows the frames of the publisher `name` until it closes (or the window is closed).
+
+    With `display=False` frames are only consumed, `delay` seconds each, which stands in for a slow viewer.
+    Waits up to `timeout` seconds for the block to appear. Returns the number of frames shown and dropped.
+    """
+    deadline = _time.perf_counter() + timeout
+    while True:
+        try:
+            viewer = LiveViewer(name)
+            break
+        except FileNotFoundError:
+            if _time.perf_counter() > deadline:
+                raise
+            _time.sleep(0.05)
+
+    try:
+        if not display:
+            while not viewer.closed:
+                if viewer.poll() is None:
+                    _time.sleep(0.5 / viewer.fps)
+                elif delay:
+                    _time.sleep(delay)
+        else:
+            import matplotlib.pyplot as plt
+
+            figure, axes = plt.subplots()
+            image = axes.imshow(np.zeros(viewer.shape[::-1]), origin='lower', cmap=cmap)
+            figure.colorbar(image, ax=axes)
+            plt.show(block=False)
+            while not viewer.closed and plt.fignum_exists(figure.number):
+                latest = viewer.poll()
+                if latest is not None:
+                    time, frame = latest
+                    image.set_data(frame.T)
+                    image.set_clim(np.nanmin(frame), np.nanmax(frame))
+                    axes.set_title(f"{viewer.label}  t = {time}  shown {viewer.shown}, dropped {viewer.dropped}")
+                figure.canvas.draw_idle()
+                plt.pause(0.5 / viewer.fps)
+            plt.close(figure)
+        return viewer.shown, viewer.dropped
+    finally:
+        viewer.close()
+
+
+def launch_viewer(name, display=True, delay=0.0, quiet=False):
+    """Starts `python -m learn_lbmpy view <name>` as a separate process and returns the `Popen`.
+
+    `quiet` discards the summary the viewer prints when the publisher closes.
+    """
+    command = [sys.executable, '-m', 'learn_lbmpy', 'view', name]
+    if not display:
+        command += ['--no-display', '--delay', str(delay)]
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL if quiet else None)
+
+
+def velocity_magnitude_frame(scenario, step=1, slice_obj=None):
+    """Callable returning |u| of `scenario` decimated by `step`; 3D scenarios are cut in the middle of z"""
+    if slice_obj is None and len(scenario.domain_size) == 3:
+        slice_obj = (slice(None), slice(None), scenario.domain_size[2] // 2)
+
+    def frame():
+        velocity = np.asarray(scenario.velocity_slice(slice_obj, masked=False))[::step, ::step]
+        magnitude = np.sqrt(np.sum(velocity ** 2, axis=-1))
+        return magnitude.reshape(magnitude.shape[:2])  # the cut through z keeps an axis of length 1
+
+    return frame
+
+
+def frame_shape(scenario, step=1):
+    """Shape of the frames of `velocity_magnitude_frame(scenario, step)`"""
+    return tuple(len(range(0, n, step)) for n in scenario.domain_size[:2])
+
+
+def run_live(scenario, publisher, time_steps, every=10, frame=None):
+    """Runs `scenario` for `time_steps` steps in chunks of `every` and offers a frame after each chunk.
+
+    `frame` defaults to `velocity_magnitude_frame(scenario)`; it is only evaluated when the frame budget of
+    `publisher` allows a frame, so a small `every` costs little more than the chunked `run()` calls.
+    """
+    frame = frame or velocity_magnitude_frame(scenario)
+    done = 0
+    while done < time_steps:
+        chunk = min(every, time_steps - done)
+        scenario.run(chunk)
+        done += chunk
+        publisher.publish(scenario.time_steps_run, frame)
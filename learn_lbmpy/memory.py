@@ -0,0 +1,325 @@
+"""
+Memory accounting for data handlings, boundary index arrays and recording buffers
+
+A scenario holds its memory in a few places: the arrays of the data handling (`src`, `dst`,
+`velField` in `04_cumulant_lbm`, the PDF, velocity, density and flag fields of a
+`LatticeBoltzmannStep`), the index arrays of the boundary handling (one entry per boundary link)
+and whatever buffers the user attaches (probes, snapshot staging buffers, lists of copied fields).
+`MemoryReport` lists them:
+
+- every field with shape, dtype, the bytes of the interior cells, the ghost layer overhead and the
+  padding added by `alignment=True`, on the CPU and, if present, on the GPU
+- the boundary index arrays per boundary object
+- registered buffers, sized recursively (NumPy/CuPy arrays in lists, dicts and `learn_lbmpy` objects)
+- the resident set size, sampled in a background thread while `run` advances the scenario
+
+and flags arrays that could be dropped or stored in a smaller dtype.
+
+Example:
+    memory = MemoryReport(scenario)
+    memory.add_buffer('probes', probes)
+    memory.run(1000)
+    print(memory.report())
+"""
+
+import os
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+def allocated_nbytes(array):
+    """Bytes of the allocation behind `array`, including the padding of aligned arrays"""
+    owner = array
+    while isinstance(getattr(owner, 'base', None), np.ndarray):
+        owner = owner.base
+    return int(owner.nbytes)
+
+
+def _owner_id(array):
+    owner = array
+    while getattr(owner, 'base', None) is not None and hasattr(owner.base, 'nbytes'):
+        owner = owner.base
+    return id(owner)
+
+
+def buffer_nbytes(obj, exclude=(), _seen=None):
+    """Bytes held by the arrays in `obj`: arrays, containers and `learn_lbmpy` objects, recursively.
+
+    Arrays sharing an allocation are counted once; allocations with an id in `exclude` (e.g. the fields
+    of the data handling that a probe holds a view of) are skipped.
+    """
+    seen = set(exclude) if _seen is None else _seen
+    if hasattr(obj, 'nbytes') and hasattr(obj, 'dtype'):
+        key = _owner_id(obj)
+        if key in seen:
+            return 0
+        seen.add(key)
+        return allocated_nbytes(obj) if isinstance(obj, np.ndarray) else int(obj.nbytes)
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, dict):
+        return sum(buffer_nbytes(v, _seen=seen) for v in obj.values())
+    if isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == 'deque':
+        return sum(buffer_nbytes(v, _seen=seen) for v in obj)
+    if type(obj).__module__.startswith('learn_lbmpy') and hasattr(obj, '__dict__'):
+        return sum(buffer_nbytes(v, _seen=seen) for v in vars(obj).values())
+    return 0
+
+
+def current_rss():
+    """Resident set size of this process in bytes (None where /proc is not available)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss():
+    """Largest resident set size of this process so far, in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024     # bytes on macOS, KiB elsewhere
+
+
+def _format_bytes(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(n) < 1024 or unit == 'GiB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+class RssSampler:
+    """Samples the resident set size in a background thread while active.
+
+    Example:
+        with RssSampler(interval=0.05) as rss:
+            scenario.run(1000)
+        print(rss.peak, rss.samples)
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = []       # (seconds since start, bytes)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self, start):
+        rss = current_rss()
+        if rss is not None:
+            self.samples.append((time.perf_counter() - start, rss))
+
+    def _work(self, start):
+        while not self._stop.wait(self.interval):
+            self._sample(start)
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._stop.clear()
+        self._sample(start)
+        self._thread = threading.Thread(target=self._work, args=(start,), name='RssSampler', daemon=True)
+        self._thread.start()
+        self._start = start
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample(self._start)
+        return False
+
+    @property
+    def peak(self):
+        return max((rss for _, rss in self.samples), default=None)
+
+
+class MemoryReport:
+    """Memory held by a scenario (or a bare data handling) and by registered buffers.
+
+    Args:
+        source: `LatticeBoltzmannStep`, any object with a `data_handling`, or a data handling
+        kernels: compiled kernels working on the data handling. Fields no kernel accesses are flagged as
+                 droppable. Default: the kernels of a `LatticeBoltzmannStep`; none for a bare data handling,
+                 which disables the check.
+        boundary_handlings: boundary handlings on a bare data handling (`bh` in `04_cumulant_lbm`) whose
+                            index arrays are accounted. The one of a scenario is found automatically.
+    """
+
+    def __init__(self, source, kernels=None, boundary_handlings=()):
+        if hasattr(source, 'data_handling'):
+            self.scenario, self.data_handling = source, source.data_handling
+        else:
+            self.scenario, self.data_handling = None, source
+        self.kernels = list(kernels) if kernels is not None else self._scenario_kernels()
+        self.boundary_handlings = list(boundary_handlings)
+        self._buffers = {}
+        self.rss = None
+
+    def _scenario_kernels(self):
+        scenario = self.scenario
+        if scenario is None or not hasattr(scenario, '_lbmKernels'):
+            return None
+        kernels = list(scenario._lbmKernels) + [scenario._getterKernel, scenario._setterKernel]
+        for info in scenario.boundary_handling._boundary_object_to_boundary_info.values():
+            kernels.append(info.kernel)
+        return kernels
+
+    def add_buffer(self, name, obj):
+        """Registers a buffer (array, list of snapshots, `ProbeSet`, `SnapshotWriter`, ...) to be accounted"""
+        self._buffers[name] = obj
+
+    def run(self, time_steps, interval=0.05):
+        """Advances the scenario by `time_steps` with the resident set size sampled every `interval` seconds"""
+        self.rss = RssSampler(interval)
+        with self.rss:
+            self.scenario.run(time_steps)
+        return self.rss
+
+    # ---- accounting ----
+
+    def _accessed_fields(self):
+        if self.kernels is None:
+            return None
+        names = set()
+        for kernel in self.kernels:
+            names.update(f.name for f in kernel.kernel.get_fields())
+        return names
+
+    def _boundary_handlings(self):
+        """Boundary handlings whose index arrays are accounted"""
+        result = list(self.boundary_handlings)
+        if self.scenario is not None and getattr(self.scenario, 'boundary_handling', None) is not None:
+            result.append(self.scenario.boundary_handling)
+        return result
+
+    def fields(self):
+        """One row per array of the data handling"""
+        dh = self.data_handling
+        interior_cells = int(np.prod(dh.shape))
+        rows = []
+        for name in dh.array_names:
+            info = dh._field_information[name]
+            arrays = [('cpu', dh.cpu_arrays.get(name)), ('gpu', dh.gpu_arrays.get(name))]
+            for device, array in arrays:
+                if array is None:
+                    continue
+                itemsize = array.dtype.itemsize
+                values = int(np.prod(info['values_per_cell'])) if info['values_per_cell'] else 1
+                interior = interior_cells * values * itemsize
+                allocated = allocated_nbytes(array) if device == 'cpu' else int(array.nbytes)
+                rows.append({'name': name, 'device': device, 'shape': tuple(array.shape),
+                             'dtype': str(array.dtype), 'layout': info['layout'],
+                             'ghost_layers': info['ghost_layers'], 'interior': interior,
+                             'ghost': int(array.nbytes) - interior, 'padding': allocated - int(array.nbytes),
+                             'total': allocated})
+        return rows
+
+    def index_arrays(self):
+        """One row per boundary object: number of links and bytes of its index arrays (all blocks)"""
+        rows = []
+        for bh in self._boundary_handlings():
+            for device, custom_data in (('cpu', self.data_handling.custom_data_cpu),
+                                        ('gpu', self.data_handling.custom_data_gpu)):
+                block_data = custom_data.get(bh._index_array_name)
+                if block_data is None:
+                    continue
+                for boundary, index_list in block_data.boundary_object_to_index_list.items():
+                    rows.append({'name': getattr(boundary, 'name', type(boundary).__name__), 'device': device,
+                                 'links': int(index_list.shape[0]), 'dtype': str(index_list.dtype),
+                                 'total': int(index_list.nbytes)})
+        return rows
+
+    def buffers(self):
+        dh = self.data_handling
+        field_owners = {_owner_id(a) for arrays in (dh.cpu_arrays, dh.gpu_arrays) for a in arrays.values()}
+        return [{'name': name, 'total': buffer_nbytes(obj, exclude=field_owners)}
+                for name, obj in self._buffers.items()]
+
+    def suggestions(self):
+        """Arrays that could be dropped or stored with a smaller dtype: list of (array name, bytes saved, reason)"""
+        dh = self.data_handling
+        scenario = self.scenario
+        accessed = self._accessed_fields()
+        flag_fields = {bh.flag_interface.flag_field_name for bh in self._boundary_handlings()}
+        pdf_fields = set()
+        if scenario is not None and hasattr(scenario, '_lbmKernels'):
+            pdf_fields = {scenario._pdf_arr_name, scenario._tmp_arr_name}
+        result = []
+        rows = self.fields()
+        cpu_bytes = {row['name']: row['total'] for row in rows if row['device'] == 'cpu'}
+        all_bytes = {}
+        for row in rows:
+            all_bytes[row['name']] = all_bytes.get(row['name'], 0) + row['total']
+
+        for name in dh.array_names:
+            array = dh.cpu_arrays.get(name)
+            if array is None:
+                continue
+            if accessed is not None and name not in accessed and name not in flag_fields:
+                result.append((name, all_bytes[name], "not accessed by any kernel"))
+                continue
+            if name in dh.gpu_arrays and name in pdf_fields - {scenario._pdf_arr_name}:
+                result.append((name, cpu_bytes[name], "CPU copy of the temporary PDF field is never used on the GPU"))
+            if name in flag_fields:
+                bits = int(np.bitwise_or.reduce(array, axis=None)).bit_length()
+                smaller = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(t).bits >= bits)
+                if np.dtype(smaller).itemsize < array.dtype.itemsize:
+                    saved = all_bytes[name] * (1 - np.dtype(smaller).itemsize / array.dtype.itemsize)
+                    result.append((name, int(saved), f"flag field uses {bits} bits, {np.dtype(smaller).name} suffices"))
+                continue
+            if array.dtype == np.float64:
+                reason = "float32 PDFs (default_dtype='float32') halve it" if name in pdf_fields else \
+                    "float64, float32 would halve it"
+                result.append((name, all_bytes[name] // 2, reason))
+            if name not in pdf_fields and array.size and array.min() == array.max():
+                # checked on the current values: a field not written yet is constant, too
+                result.append((name, all_bytes[name], f"holds only {array.flat[0].item()!r} so far, "
+                                                      "a constant could be a kernel parameter"))
+        return result
+
+    # ---- output ----
+
+    def as_dict(self):
+        result = {'fields': self.fields(), 'index_arrays': self.index_arrays(), 'buffers': self.buffers(),
+                  'suggestions': [{'name': n, 'saved': s, 'reason': r} for n, s, r in self.suggestions()],
+                  'current_rss': current_rss(), 'peak_rss': peak_rss()}
+        if self.rss is not None:
+            result['sampled_rss'] = self.rss.samples
+        return result
+
+    def report(self):
+        fields, index_arrays, buffers = self.fields(), self.index_arrays(), self.buffers()
+        w = max([14] + [len(row['name']) + 1 for row in fields])
+        lines = [f"{'field':{w}s}{'dev':>4s}{'shape':>22s}{'dtype':>9s}{'interior':>11s}{'ghost':>11s}"
+                 f"{'padding':>11s}{'total':>11s}"]
+        for row in fields:
+            ghost_share = row['ghost'] / row['total'] * 100 if row['total'] else 0
+            lines.append(f"{row['name']:{w}s}{row['device']:>4s}{str(row['shape']):>22s}{row['dtype']:>9s}"
+                         f"{_format_bytes(row['interior']):>11s}{_format_bytes(row['ghost']):>11s}"
+                         f"{_format_bytes(row['padding']):>11s}{_format_bytes(row['total']):>11s}"
+                         f"  ({ghost_share:.0f} % ghost)")
+        for row in index_arrays:
+            lines.append(f"{'index ' + row['name']:{w + 22}s}{row['device']:>4s}{row['links']:>10d} links"
+                         f"{_format_bytes(row['total']):>19s}")
+        for row in buffers:
+            lines.append(f"{'buffer ' + row['name']:{w + 26}s}{_format_bytes(row['total']):>34s}")
+        tracked = sum(r['total'] for r in fields + index_arrays + buffers)
+        lines.append(f"{'tracked total':{w + 26}s}{_format_bytes(tracked):>34s}")
+
+        rss = current_rss()
+        if rss is not None:
+            lines.append(f"resident set size {_format_bytes(rss)}, peak {_format_bytes(peak_rss())}"
+                         f" (untracked: Python, SymPy, compiled kernels, ... {_format_bytes(rss - tracked)})")
+        if self.rss is not None and self.rss.peak is not None:
+            lines.append(f"peak during run {_format_bytes(self.rss.peak)} ({len(self.rss.samples)} samples)")
+
+        suggestions = self.suggestions()
+        if suggestions:
+            lines.append("could be dropped or downcast:")
+            for name, saved, reason in suggestions:
+                lines.append(f"  {name:{w}s} -{_format_bytes(saved):>10s}  {reason}")
+        return '\n'.join(lines)
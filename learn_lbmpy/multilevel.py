@@ -0,0 +1,283 @@
+"""
+Coarse-to-fine initialization
+
+`04_channel_flow.py` and the scaled channel of `01_scaling.py` spend most of their time steps developing
+the flow: in a channel of height H the slowest mode decays with H^2 / (pi^2 nu), i.e. after about 64000
+steps for H = 40 cells and relaxation rate 1.97. On a grid coarsened by a factor r the same flow
+develops in r^2 times fewer steps (diffusive scaling) on r^d times fewer cells. `coarse_to_fine`
+
+1. creates the scenario on the coarse grid with the same Reynolds number and runs it to a steady state,
+2. interpolates density, velocity and the non-equilibrium part of the PDFs onto the fine grid,
+3. continues on the fine grid to the steady state,
+
+and, with `compare=True`, also runs the fine grid from a cold start to report the fine steps saved.
+
+Two scalings keep the Reynolds number u L / nu of the coarse grid:
+
+- 'diffusive': same relaxation rate, lattice velocity r times larger, force r^3 times larger, one coarse step
+  is r^2 fine steps. Cheapest, but the Mach number grows with r.
+- 'acoustic': same lattice velocity, viscosity r times smaller (relaxation rate closer to 2), force r times
+  larger, one coarse step is r fine steps.
+
+The PDFs are stored after collision, so the non-equilibrium part is scaled by
+(tau_fine - 1) / (tau_coarse - 1) * s / r (s = fine / coarse lattice velocity), as in `refinement.py`.
+
+Example:
+    result = coarse_to_fine('channel', {'domain_size': (120, 40)}, factor=2, compare=True)
+    print(result.report())
+
+From the command line:
+    python -m learn_lbmpy multilevel channel --factor 2 --set "domain_size=(120,40)" --compare
+"""
+
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+# scenario parameters scaled by `coarse_parameters`: lengths in cells and lattice velocities
+_LENGTHS = ('obstacle_radius', 'reference_length', 'radius', 'sphere_radius', 'width', 'height')
+_VELOCITIES = ('initial_velocity', 'velocity_magnitude', 'lid_velocity', 'maximal_velocity', 'u_max')
+
+
+def scaling_factors(relaxation_rate, factor, scaling='diffusive'):
+    """Coarse relaxation rate, the ratios coarse / fine of lattice velocity, force and time step, and the
+    factor of the non-equilibrium part from coarse to fine"""
+    if scaling == 'diffusive':
+        result = {'relaxation_rate': relaxation_rate, 'velocity': factor, 'force': factor ** 3, 'time': factor ** 2}
+    elif scaling == 'acoustic':
+        viscosity = (1 / relaxation_rate - 0.5) / 3 / factor
+        result = {'relaxation_rate': 1 / (3 * viscosity + 0.5), 'velocity': 1, 'force': factor, 'time': factor}
+    else:
+        raise ValueError(f"Unknown scaling '{scaling}', use 'diffusive' or 'acoustic'")
+    # coarse -> fine scaling of the post-collision non-equilibrium part; singular for tau_coarse = 1
+    tau_fine, tau_coarse = 1 / relaxation_rate, 1 / result['relaxation_rate']
+    result['nonequilibrium'] = 0.0 if abs(tau_coarse - 1) < 1e-12 else \
+        (tau_fine - 1) / (tau_coarse - 1) / result['velocity'] / factor
+    return result
+
+
+def coarse_parameters(params, factor, scaling='diffusive'):
+    """Parameters of a registered scenario on a grid coarsened by `factor`, see the module docstring.
+
+    Knows `domain_size`, `relaxation_rate`, `force`, the lengths in `_LENGTHS` and the velocities in `_VELOCITIES`.
+    """
+    if 'relaxation_rate' not in params:
+        raise ValueError("coarse_to_fine needs a scenario with a `relaxation_rate` parameter")
+    scale = scaling_factors(params['relaxation_rate'], factor, scaling)
+    result = dict(params)
+    result['relaxation_rate'] = scale['relaxation_rate']
+    for key, value in params.items():
+        if key == 'domain_size':
+            if any(n % factor for n in value):
+                raise ValueError(f"domain_size {tuple(value)} is not divisible by {factor}")
+            result[key] = tuple(n // factor for n in value)
+        elif key in _LENGTHS and value:
+            result[key] = value / factor if isinstance(value, float) else max(1, value // factor)
+        elif key == 'force' and value is not None:
+            result[key] = scale['force'] * np.asarray(value) if np.ndim(value) else scale['force'] * value
+        elif key in _VELOCITIES and value is not None:
+            result[key] = tuple(scale['velocity'] * v for v in value) if np.ndim(value) else scale['velocity'] * value
+    return result
+
+
+def prolongate(array, factor, periodicity, order=3):
+    """Interpolation of cell-centred data (spatial axes first) onto a grid `factor` times finer.
+
+    `order` 3 interpolates with cubic Lagrange polynomials through four coarse cells, which is exact for the
+    parabolic profile of a channel; `order` 1 linearly. Periodic axes wrap around, at the other borders the
+    stencil is shifted inwards, i.e. the half coarse cell next to the border is extrapolated.
+    """
+    for axis, periodic in enumerate(periodicity):
+        n = array.shape[axis]
+        points = min(order + 1, n)
+        position = (np.arange(n * factor) + 0.5) / factor - 0.5      # fine cell centres in coarse cell units
+        first = np.floor(position).astype(np.int64) - (points - 1) // 2
+        if not periodic:
+            first = np.clip(first, 0, n - points)
+        t = position - first
+        shape = [1] * array.ndim
+        shape[axis] = -1
+        result = 0
+        for j in range(points):
+            weight = np.prod([(t - m) / (j - m) for m in range(points) if m != j], axis=0)
+            result = result + weight.reshape(shape) * np.take(array, (first + j) % n, axis=axis)
+        array = result
+    return array
+
+
+def _on_gpu(scenario):
+    from pystencils import Target
+    return scenario.data_handling.default_target == Target.GPU
+
+
+def _interior(scenario, name):
+    """Interior of array `name` (CPU copy of the field, brought up to date from the GPU)"""
+    dh = scenario.data_handling
+    if _on_gpu(scenario):
+        dh.to_cpu(name)
+    gl = dh.ghost_layers_of_field(name)
+    return dh.cpu_arrays[name][(slice(gl, -gl),) * dh.dim]
+
+
+def _nonequilibrium(scenario):
+    """Non-equilibrium part of the PDFs (interior cells); replaces the PDFs by their equilibrium"""
+    pdfs = _interior(scenario, scenario.pdf_array_name).copy()
+    scenario.set_pdf_fields_from_macroscopic_values()
+    return pdfs - _interior(scenario, scenario.pdf_array_name)
+
+
+def transfer(coarse, fine, factor, scale, nonequilibrium=True):
+    """Sets the PDFs of `fine` from the state of `coarse`, a grid `factor` times coarser.
+
+    `scale` are the `scaling_factors` of the coarse grid: velocities are divided by scale['velocity'], density
+    deviations by its square (the pressure scales with rho u^2) and the non-equilibrium part is multiplied by
+    scale['nonequilibrium'].
+    """
+    periodicity = fine.data_handling.periodicity
+    coarse_velocity = _interior(coarse, coarse.velocity_data_name).copy()
+    coarse_density = _interior(coarse, coarse.density_data_name).copy()
+    neq = _nonequilibrium(coarse) if nonequilibrium else None
+
+    dh = fine.data_handling
+    velocity = _interior(fine, fine.velocity_data_name)
+    velocity[...] = prolongate(coarse_velocity, factor, periodicity) / scale['velocity']
+    density = _interior(fine, fine.density_data_name)
+    density[...] = 1 + (prolongate(coarse_density, factor, periodicity) - 1) / scale['velocity'] ** 2
+    if _on_gpu(fine):
+        dh.to_gpu(fine.velocity_data_name)
+        dh.to_gpu(fine.density_data_name)
+    fine.set_pdf_fields_from_macroscopic_values()
+
+    if nonequilibrium:
+        pdfs = _interior(fine, fine.pdf_array_name)
+        pdfs += scale['nonequilibrium'] * prolongate(neq, factor, periodicity)
+        if _on_gpu(fine):
+            dh.to_gpu(fine.pdf_array_name)
+
+
+def run_to_steady_state(scenario, chunk, tolerance, max_steps):
+    """Runs in chunks until max |u_new - u_old| / max |u| < tolerance; returns the time steps run"""
+    previous = np.array(scenario.velocity_slice(masked=False))
+    steps = 0
+    while steps < max_steps:
+        scenario.run(chunk)
+        steps += chunk
+        current = np.array(scenario.velocity_slice(masked=False))
+        if np.max(np.abs(current - previous)) < tolerance * max(np.max(np.abs(current)), 1e-30):
+            break
+        previous = current
+    return steps
+
+
+@dataclass
+class CoarseToFineResult:
+    """Time steps and run times (time stepping and transfer, without scenario setup) of `coarse_to_fine`"""
+    name: str
+    factor: int
+    scaling: str
+    fine_cells: int
+    coarse_cells: int
+    coarse_steps: int
+    fine_steps: int
+    coarse_time: float
+    fine_time: float
+    time_ratio: int
+    steps: int = None
+    cold_steps: int = None
+    cold_time: float = None
+    difference: float = None
+
+    @property
+    def coarse_cost(self):
+        """Cost of the coarse run in fine time steps (cell updates / fine cells)"""
+        return self.coarse_steps * self.coarse_cells / self.fine_cells
+
+    @property
+    def steps_saved(self):
+        """Fine steps a cold start needs more; the fine steps covered by the coarse grid with fixed `steps`"""
+        if self.cold_steps is not None:
+            return self.cold_steps - self.fine_steps
+        return self.steps
+
+    def as_dict(self):
+        result = {k: v for k, v in vars(self).items() if k != 'scenario'}
+        return dict(result, coarse_cost=self.coarse_cost, steps_saved=self.steps_saved)
+
+    def report(self):
+        lines = [f"{self.name}: coarse grid 1/{self.factor} ({self.scaling} scaling), {self.coarse_steps} steps "
+                 f"= {self.coarse_steps * self.time_ratio} fine steps of physical time "
+                 f"for the work of {self.coarse_cost:.0f}, {self.coarse_time:.1f} s",
+                 f"  fine grid after the coarse start: {self.fine_steps} steps, {self.fine_time:.1f} s"]
+        if self.cold_steps is not None:
+            lines += [f"  fine grid from a cold start: {self.cold_steps} steps, {self.cold_time:.1f} s",
+                      f"  fine steps saved: {self.steps_saved} ({self.steps_saved / max(self.cold_steps, 1):.0%}), "
+                      f"run time {self.cold_time / (self.coarse_time + self.fine_time):.1f}x shorter; "
+                      f"max velocity difference of the final states {self.difference:.1e} (relative)"]
+        elif self.steps is not None:
+            lines.append(f"  fine steps saved: {self.steps_saved} (physical time covered by the coarse grid)")
+        return '\n'.join(lines)
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def coarse_to_fine(name, params=None, factor=2, scaling='diffusive', steps=None, tolerance=1e-5, chunk=500,
+                   max_steps=10 ** 6, nonequilibrium=True, compare=False):
+    """Runs the registered scenario `name` with a coarse-to-fine start.
+
+    Args:
+        params: scenario parameters of the fine grid (defaults of the registry otherwise)
+        factor: coarsening factor, 2 or 4
+        scaling: 'diffusive' or 'acoustic', see the module docstring
+        steps: None runs the coarse grid and then the fine grid to a steady state. For flows without one
+               (vortex shedding), the coarse grid covers the physical time of `steps` fine steps instead and
+               the fine grid starts from there; a cold start runs `steps` fine steps.
+        tolerance: steady state criterion, relative velocity change per `chunk` fine steps
+        chunk: fine time steps between convergence checks; the coarse grid checks after the same physical time
+        max_steps: limit of the fine time steps of each run (and of the coarse run, in fine steps)
+        nonequilibrium: also transfer the non-equilibrium part of the PDFs
+        compare: also run the fine grid from a cold start
+    Returns: `CoarseToFineResult`; the fine scenario is in its `scenario` attribute
+    """
+    from learn_lbmpy.registry import get_scenario
+
+    spec = get_scenario(name)
+    params = dict(spec.defaults, **(params or {}))
+    scale = scaling_factors(params['relaxation_rate'], factor, scaling)
+    ratio = scale['time']
+    coarse_chunk = max(1, int(round(chunk / ratio)))
+
+    def to_steady_state(scenario, chunk, max_steps):
+        return run_to_steady_state(scenario, chunk, tolerance, max_steps)
+
+    def fixed(scenario, time_steps):
+        scenario.run(time_steps)
+        return time_steps
+
+    coarse = spec.create(**coarse_parameters(params, factor, scaling))
+    if steps is None:
+        coarse_steps, coarse_time = _timed(to_steady_state, coarse, coarse_chunk, max(1, max_steps // ratio))
+    else:
+        coarse_steps, coarse_time = _timed(fixed, coarse, max(1, int(round(steps / ratio))))
+
+    fine = spec.create(**params)
+    _, transfer_time = _timed(transfer, coarse, fine, factor, scale, nonequilibrium)
+    fine_steps, fine_time = (0, 0.0) if steps is not None else _timed(to_steady_state, fine, chunk, max_steps)
+
+    result = CoarseToFineResult(name, factor, scaling, fine.number_of_cells, coarse.number_of_cells, coarse_steps,
+                                fine_steps, coarse_time, fine_time + transfer_time, ratio, steps)
+    if compare:
+        cold = spec.create(**params)
+        if steps is None:
+            result.cold_steps, result.cold_time = _timed(to_steady_state, cold, chunk, max_steps)
+        else:
+            result.cold_steps, result.cold_time = _timed(fixed, cold, steps)
+        warm_velocity = np.array(fine.velocity_slice(masked=False))
+        result.difference = float(np.max(np.abs(warm_velocity - np.array(cold.velocity_slice(masked=False)))) /
+                                  max(np.max(np.abs(warm_velocity)), 1e-30))
+    result.scenario = fine
+    return result
@@ -0,0 +1,359 @@
+"""
+Single-component multiphase flow with the Shan-Chen pseudopotential model
+
+Liquid and vapour separate because of an attractive interaction between neighbouring cells: every cell
+feels the force
+
+    F(x) = -G psi(rho(x)) sum_i w_i psi(rho(x + c_i)) c_i,    psi(rho) = rho_0 (1 - exp(-rho / rho_0))
+
+which is applied with the Guo force model. Below the critical value G = -4 (rho_0 = 1) the fluid splits
+into a liquid and a vapour phase with a diffuse interface of a few cells. The equation of state is
+p = rho c_s^2 + G c_s^2 psi^2 / 2, which gives the pressure inside and outside of droplets and bubbles
+for the Laplace law dp = sigma / R (2D) or 2 sigma / R (3D).
+
+The force needs psi of all neighbours, i.e. an interface gradient. The kernels store psi instead of the
+density, so the exponential is evaluated once per cell and not once per neighbour. Two variants exist:
+
+- `fused=True` (default): one stream-collide kernel. It pulls the PDFs, computes the force from the psi
+  field of the previous step (double buffered, read with a stencil) and writes psi of the new density
+  next to the new PDFs. psi of the neighbours therefore lags one time step behind, which does not change
+  steady states (droplets, bubbles, contact angles).
+- `fused=False`: the usual two kernel scheme. A stream kernel writes psi after streaming, the ghost
+  layers of psi are synchronized and a collide kernel applies the force from the current neighbours.
+
+Walls are no-slip (bounce-back). Their wettability is set by `wall_density`, the density the force sees
+in the wall cells: values near the liquid density wet the wall (small contact angle), values near the
+vapour density do not. For G = -5 the wall densities 0.5, 0.7 and 1.3 give about 120, 90 and 40 degrees.
+psi of the wall is stored in the ghost layers of the psi field, which no kernel writes to.
+
+Example:
+    liquid, vapour = coexistence_densities(-5.0)
+    density = droplet_density((160, 80), radius=25, liquid=liquid, vapour=vapour, wall='S')
+    scenario = PseudopotentialMultiphase(density, walls=('S', 'N'), wall_density=0.5)
+    scenario.run(10000)
+    print(contact_angle(scenario.density, wall='S'))
+"""
+
+import numpy as np
+
+from learn_lbmpy.solver import FixedStepSolver
+
+_AXES = {'W': (0, -1), 'E': (0, 1), 'S': (1, -1), 'N': (1, 1), 'B': (2, -1), 'T': (2, 1)}
+
+
+def psi(rho, reference_density=1.0):
+    """Pseudopotential of the Shan-Chen model; works on arrays and SymPy expressions"""
+    import sympy as sp
+
+    if isinstance(rho, sp.Basic):
+        return reference_density * (1 - sp.exp(-rho / reference_density))
+    return reference_density * (1 - np.exp(-np.asarray(rho) / reference_density))
+
+
+def equation_of_state(rho, interaction_strength=-5.0, reference_density=1.0):
+    """Pressure p = rho / 3 + G psi^2 / 6 of the Shan-Chen fluid"""
+    return rho / 3 + interaction_strength * psi(rho, reference_density) ** 2 / 6
+
+
+def coexistence_densities(interaction_strength=-5.0, reference_density=1.0):
+    """Liquid and vapour density of a flat interface from the Maxwell construction of the Shan-Chen EOS.
+
+    For this pseudopotential the equal-area rule holds in psi'/psi^2 instead of 1/rho^2 (Shan & Chen 1994):
+    p(vapour) = p(liquid) = p_0 and the integral of (p_0 - p) psi'/psi^2 between both densities vanishes.
+    """
+    g, r0 = interaction_strength, reference_density
+    if g >= -4 / r0:
+        raise ValueError("no phase separation for G >= -4 / rho_0")
+
+    def bisect(function, low, high, iterations=100):
+        for _ in range(iterations):
+            middle = 0.5 * (low + high)
+            if (function(low) > 0) == (function(middle) > 0):
+                low = middle
+            else:
+                high = middle
+        return 0.5 * (low + high)
+
+    def p(rho):
+        return equation_of_state(rho, g, r0)
+
+    def dp(rho):
+        return 1 / 3 + g * psi(rho, r0) * np.exp(-rho / r0) / 3
+
+    # spinodal densities (dp/drho = 0) around the maximum of psi' psi at rho_0 ln 2
+    rho_max = bisect(dp, 1e-9, r0 * np.log(2))
+    rho_min = bisect(dp, r0 * np.log(2), 50 * r0)
+
+    def phases(p0):
+        vapour = bisect(lambda r: p(r) - p0, 1e-9, rho_max)
+        liquid = bisect(lambda r: p(r) - p0, rho_min, 50 * r0)
+        return vapour, liquid
+
+    def area(p0):
+        vapour, liquid = phases(p0)
+        rho = np.linspace(vapour, liquid, 4001)
+        integrand = (p0 - p(rho)) * np.exp(-rho / r0) / psi(rho, r0) ** 2
+        return np.sum(0.5 * (integrand[1:] + integrand[:-1]) * np.diff(rho))
+
+    p0 = bisect(area, max(p(rho_min), 1e-12), p(rho_max))
+    vapour, liquid = phases(p0)
+    return float(liquid), float(vapour)
+
+
+def droplet_density(domain_size, center=None, radius=None, liquid=1.93, vapour=0.156, width=2.0, bubble=False,
+                    wall=None):
+    """Density of a circular (2D) or spherical (3D) droplet, or of a bubble with `bubble=True`.
+
+    Args:
+        center: in cells, default: middle of the domain, or on the `wall` if given
+        radius: default: a quarter of the smallest extent
+        width: interface width of the tanh profile
+        wall: direction of a wall the droplet sits on ('S', ...); only used for the default center
+    """
+    shape = tuple(domain_size)
+    if radius is None:
+        radius = min(shape) / 4
+    if center is None:
+        center = [n / 2 for n in shape]
+        if wall is not None:
+            axis, side = _AXES[wall]
+            center[axis] = 0.0 if side < 0 else shape[axis]
+    coordinates = np.meshgrid(*[np.arange(n) + 0.5 for n in shape], indexing='ij')
+    r = np.sqrt(sum((x - c) ** 2 for x, c in zip(coordinates, center)))
+    inside = 0.5 * (1 - np.tanh(2 * (r - radius) / width))
+    if bubble:
+        inside = 1 - inside
+    return vapour + (liquid - vapour) * inside
+
+
+def contact_angle(density, wall='S', threshold=None):
+    """Contact angle in degrees of a 2D droplet sitting on `wall`, from a circle fitted to its interface.
+
+    The interface is where the density crosses `threshold` (default: the mean of the minimum and the
+    maximum); only points more than two cells away from the wall and in the half of the domain next to it
+    are fitted, so wetting films on an opposite wall are ignored. The wall itself lies half a cell outside
+    of the first fluid cell.
+    """
+    density = np.asarray(density)
+    axis, side = _AXES[wall]
+    if axis != 1 or density.ndim != 2:
+        raise NotImplementedError("contact_angle supports 2D droplets on the 'S' or 'N' wall")
+    if side > 0:
+        density = density[:, ::-1]
+    if threshold is None:
+        threshold = 0.5 * (density.min() + density.max())
+
+    # sub-cell interface positions along both axes by linear interpolation
+    points = []
+    for values, transpose in ((density, False), (density.T, True)):
+        a, b = values[:-1, :], values[1:, :]
+        i, j = np.nonzero((a - threshold) * (b - threshold) < 0)
+        position = i + 0.5 + (threshold - a[i, j]) / (b[i, j] - a[i, j])
+        other = j + 0.5
+        points.append(np.column_stack((other, position) if transpose else (position, other)))
+    x, y = np.concatenate(points).T
+    keep = (y > 2.5) & (y < density.shape[1] / 2)
+    x, y = x[keep], y[keep]
+
+    # algebraic circle fit: x^2 + y^2 + D x + E y + F = 0
+    a = np.column_stack((x, y, np.ones_like(x)))
+    d, e, f = np.linalg.lstsq(a, -(x ** 2 + y ** 2), rcond=None)[0]
+    xc, yc = -d / 2, -e / 2
+    radius = np.sqrt(xc ** 2 + yc ** 2 - f)
+    # wall at y = 0; a center below the wall means an angle below 90 degrees
+    return float(np.degrees(np.arccos(np.clip(-yc / radius, -1, 1))))
+
+
+def shan_chen_force(psi_field, stencil, interaction_strength, center=None):
+    """Force vector -G psi(x) sum_i w_i psi(x + c_i) c_i with accesses of the pseudopotential `psi_field`.
+
+    `center` replaces the access of the cell itself (e.g. by psi of the density computed in the kernel).
+    """
+    from lbmpy.maxwellian_equilibrium import get_weights
+
+    weights = get_weights(stencil)
+    center = psi_field.center if center is None else center
+    neighbours = [0] * stencil.D
+    for w, c in zip(weights, stencil):
+        if any(c):
+            for d in range(stencil.D):
+                neighbours[d] += w * psi_field[tuple(c)] * c[d]
+    return tuple(-interaction_strength * center * n for n in neighbours)
+
+
+class PseudopotentialMultiphase(FixedStepSolver):
+    """Shan-Chen liquid-vapour flow on a periodic domain with optional flat walls.
+
+    Args:
+        initial_density: array with the density of every cell, e.g. from `droplet_density`
+        interaction_strength: G; phase separation below -4 / rho_0
+        reference_density: rho_0 of the pseudopotential
+        relaxation_rate: of the shear viscosity
+        walls: directions ('W', 'E', 'S', 'N', 'B', 'T') of no-slip walls; all other axes are periodic
+        wall_density: density the interaction force sees in the walls, sets the contact angle; by default
+            psi of the wall is the mean of psi of both phases, which gives about 90 degrees
+        fused: compute the interface force inside the stream-collide kernel, see the module docstring
+        method: collision model ('SRT', 'TRT', 'MRT', ...), always compressible
+        stencil: default D2Q9 in 2D, D3Q19 in 3D
+        config: pystencils `CreateKernelConfig`; by default the target from `detect_target()` is used
+        name: prefix of the arrays in the data handling
+    """
+
+    def __init__(self, initial_density, interaction_strength=-5.0, reference_density=1.0, relaxation_rate=1.0,
+                 walls=(), wall_density=None, fused=True, method='SRT', stencil=None, config=None,
+                 name='multiphase'):
+        import pystencils as ps
+        import sympy as sp
+        from dataclasses import replace
+        from lbmpy import ForceModel, LBMConfig, LBMOptimisation, LBStencil, Method, Stencil
+        from lbmpy import create_lb_update_rule
+        from lbmpy.boundaries import NoSlip
+        from lbmpy.boundaries.boundaryhandling import LatticeBoltzmannBoundaryHandling
+        from lbmpy.macroscopic_value_kernels import macroscopic_values_getter
+        from lbmpy.updatekernels import create_stream_pull_with_output_kernel
+        from pystencils.slicing import slice_from_direction
+
+        from learn_lbmpy.targets import detect_target
+
+        initial_density = np.asarray(initial_density, dtype=np.float64)
+        self.name = name
+        self.domain_size = initial_density.shape
+        self.dim = initial_density.ndim
+        self.fused = fused
+        self.interaction_strength = interaction_strength
+        self.reference_density = reference_density
+        self.walls = tuple(walls)
+        self.time_steps_run = 0
+        if config is None:
+            config = ps.CreateKernelConfig(target=detect_target())
+        target = config.get_target()
+        self._gpu = target.is_gpu()
+
+        if stencil is None:
+            stencil = 'D2Q9' if self.dim == 2 else 'D3Q19'
+        stencil = stencil if isinstance(stencil, LBStencil) else LBStencil(Stencil[stencil.upper()])
+        method = method if isinstance(method, Method) else Method[method.upper()]
+        if any(_AXES[w][0] >= self.dim for w in self.walls):
+            raise ValueError(f"walls {self.walls} do not exist in {self.dim}D")
+
+        periodicity = tuple(not any(_AXES[w][0] == axis for w in self.walls) for axis in range(self.dim))
+        dh = ps.create_data_handling(self.domain_size, periodicity=periodicity, default_target=target)
+        self._data_handling = dh
+        self._pdf_names = (f'{name}_pdfs', f'{name}_pdfs_tmp')
+        self._psi_names = (f'{name}_psi', f'{name}_psi_tmp') if fused else (f'{name}_psi',)
+        self.velocity_data_name, self.density_data_name = f'{name}_velocity', f'{name}_density'
+        q = stencil.Q
+        src = dh.add_array(self._pdf_names[0], values_per_cell=q, gpu=self._gpu)
+        dst = dh.add_array(self._pdf_names[1], values_per_cell=q, gpu=self._gpu, cpu=not self._gpu)
+        psi_fields = [dh.add_array(n, values_per_cell=1, gpu=self._gpu) for n in self._psi_names]
+        velocity = dh.add_array(self.velocity_data_name, values_per_cell=self.dim, gpu=self._gpu)
+        density = dh.add_array(self.density_data_name, values_per_cell=1, gpu=self._gpu)
+
+        # The kernels store psi instead of rho: one exponential per cell instead of one per neighbour
+        lbm_config = LBMConfig(stencil=stencil, method=method, relaxation_rate=relaxation_rate, compressible=True,
+                               zero_centered=False)
+        if fused:
+            # psi of the cell itself belongs to the density just pulled, the neighbours' to the last step
+            psi_center = sp.Symbol('psi')
+            force = shan_chen_force(psi_fields[0], stencil, interaction_strength, center=psi_center)
+            update = create_lb_update_rule(
+                lbm_config=replace(lbm_config, force=force, force_model=ForceModel.GUO),
+                lbm_optimisation=LBMOptimisation(symbolic_field=src, symbolic_temporary_field=dst))
+            rho = update.method.zeroth_order_equilibrium_moment_symbol
+            update.subexpressions.append(ps.Assignment(psi_center, psi(rho, reference_density)))
+            update.main_assignments.append(ps.Assignment(psi_fields[1].center, psi_center))
+            update.topological_sort(sort_subexpressions=True, sort_main_assignments=False)
+            self.method = update.method
+            self._kernels = [self._compile(update, config, 'shan_chen_stream_collide')]
+            self._swap_pairs = (self._pdf_names, self._psi_names)
+        else:
+            force = shan_chen_force(psi_fields[0], stencil, interaction_strength)
+            collision = create_lb_update_rule(
+                lbm_config=replace(lbm_config, force=force, force_model=ForceModel.GUO,
+                                   kernel_type='collide_only'),
+                lbm_optimisation=LBMOptimisation(symbolic_field=dst))
+            self.method = collision.method
+            stream = create_stream_pull_with_output_kernel(self.method, src, dst, {'density': psi_fields[0]})
+            stream = stream.copy([ps.Assignment(a.lhs, psi(a.rhs, reference_density))
+                                  if a.lhs == psi_fields[0].center else a for a in stream.main_assignments])
+            self._kernels = [self._compile(stream, config, 'stream_psi'),
+                             self._compile(collision, config, 'shan_chen_collide')]
+            self._swap_pairs = (self._pdf_names,)
+            self._sync_psi = dh.synchronization_function([self._psi_names[0]], target=target)
+
+        getter = macroscopic_values_getter(self.method, density, velocity, src)
+        # src holds post-collision PDFs with the momentum m + F, while the getter adds F / 2 to get the
+        # velocity (m + F / 2) / rho of the collision: insert -F of the current psi for the force
+        force = dict(zip(sp.symbols('F_x F_y F_z')[:self.dim],
+                         [-f for f in shan_chen_force(psi_fields[0], stencil, interaction_strength)]))
+        getter = getter.copy(subexpressions=[ps.Assignment(a.lhs, force.get(a.lhs, a.rhs))
+                                             for a in getter.subexpressions])
+        self._getter_kernel = self._compile(getter, config, 'macroscopic_getter')
+        self._macroscopic_names = (self.velocity_data_name, self.density_data_name)
+
+        self._sync_src = dh.synchronization_function([self._pdf_names[0], self._psi_names[0]], target=target)
+        self._sync_tmp = dh.synchronization_function([self._pdf_names[1], self._psi_names[-1]], target=target)
+
+        self.boundary_handling = LatticeBoltzmannBoundaryHandling(
+            self.method, dh, self._pdf_names[0], name=f'{name}_bh', target=target, openmp=config.cpu_openmp)
+        for wall in self.walls:
+            self.boundary_handling.set_boundary(NoSlip('wall'), slice_from_direction(wall, self.dim))
+        self._boundary_handlings = (self.boundary_handling,)
+
+        self.wall_density = wall_density
+        self._initialize(initial_density)
+
+    @staticmethod
+    def _compile(assignments, config, function_name):
+        import pystencils as ps
+
+        kernel_config = config.copy()
+        kernel_config.function_name = function_name
+        return ps.create_kernel(assignments, config=kernel_config).compile()
+
+    def _initialize(self, initial_density):
+        """Fluid at rest with the given density; the walls get psi of `wall_density` in the psi ghost layers"""
+        dh, r0 = self._data_handling, self.reference_density
+        weights = np.array([float(w) for w in self.method.weights])
+        inner = (slice(1, -1),) * self.dim
+        dh.fill(self._pdf_names[0], 0.0, ghost_layers=True)
+        dh.cpu_arrays[self._pdf_names[0]][inner] = initial_density[..., np.newaxis] * weights
+        if self.wall_density is None:
+            # neutral wetting: psi of the wall is the mean of psi of both phases
+            wall_psi = 0.5 * (psi(initial_density.min(), r0) + psi(initial_density.max(), r0))
+        else:
+            wall_psi = psi(self.wall_density, r0)
+        for name in self._psi_names:
+            dh.fill(name, wall_psi, ghost_layers=True)
+            dh.cpu_arrays[name][inner] = psi(initial_density, r0)
+        if self._gpu:
+            dh.all_to_gpu()
+        self._macroscopic_up_to_date = False
+
+    # ---- time stepping ----
+
+    def _calls(self):
+        """Functions of one time step; the split variant synchronizes psi between its kernels"""
+        if self.fused:
+            return self._kernels
+        return [self._kernels[0], self._sync_psi, self._kernels[1]]
+
+    # ---- results ----
+
+    @property
+    def density(self):
+        return self._macroscopic_array(self.density_data_name)
+
+    @property
+    def pressure(self):
+        """Pressure from the equation of state"""
+        return equation_of_state(self.density, self.interaction_strength, self.reference_density)
+
+    def density_slice(self, slice_obj=None):
+        return self._macroscopic_array(self.density_data_name, slice_obj)
+
+    def laplace_pressure(self):
+        """Pressure at the domain centre minus the pressure in the domain corner, sigma / R for a droplet or
+        a bubble in the centre (2D)"""
+        p = self.pressure
+        return float(p[tuple(n // 2 for n in self.domain_size)] - p[(0,) * self.dim])
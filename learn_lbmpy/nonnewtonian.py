@@ -0,0 +1,239 @@
+"""
+Generalized Newtonian fluids: power-law, Carreau and Bingham viscosity in the collision kernel
+
+The models follow `lbmpy.non_newtonian_models.add_cassons_model`: they take a collision rule with a symbolic
+shear relaxation rate, replace it by a local relaxation rate and append the equations for it. The shear rate
+comes from the non-equilibrium part of the PDFs of the cell itself, like in `tutorials/turbulence/06_smagorinsky.py`,
+so no extra field and no gradient stencil is needed:
+
+    shear_rate = 3 omega / (2 rho) |Pi_neq|,    |Pi_neq| = sqrt(2 Pi_neq : Pi_neq)
+
+Since omega depends on the viscosity and the viscosity on the shear rate, the pair is found by a few fixed-point
+iterations shear_rate -> nu(shear_rate) -> omega -> shear_rate, started from the shear relaxation rate of the
+collision rule. For a power law the error shrinks at least by |1 - n| per iteration, for Bingham fluids by
+3 (nu - nu_p) omega < 1. The relaxation rate is clamped to [omega_min, omega_max] for stability, which also
+regularizes the zero-shear limit of shear-thinning fluids.
+
+Viscosities, yield stresses and shear rates are in lattice units (kinematic).
+
+Example:
+    parameters = PowerLawParameters(consistency=0.01, flow_index=0.5)
+    scenario = create_scenario('nonnewtonian_channel', model=parameters, force=2e-5)
+    scenario.run(40000)
+    print(np.max(np.abs(channel_velocity(scenario) - channel_profile(parameters, scenario.force, 64))))
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import sympy as sp
+
+
+def _exp(x):
+    return sp.exp(x) if isinstance(x, sp.Basic) else np.exp(x)
+
+
+@dataclass
+class PowerLawParameters:
+    consistency: float
+    """
+    K of nu = K shear_rate^(n - 1)
+    """
+    flow_index: float
+    """
+    n < 1: shear thinning, n > 1: shear thickening
+    """
+    omega_min: float = 0.2
+    """
+    The minimal shear relaxation rate that is used as a lower bound
+    """
+    omega_max: float = 1.98
+    """
+    The maximal shear relaxation rate that is used as an upper bound
+    """
+
+    def viscosity(self, shear_rate):
+        return self.consistency * shear_rate ** (self.flow_index - 1)
+
+
+@dataclass
+class CarreauParameters:
+    zero_shear_viscosity: float
+    """
+    Viscosity nu_0 for vanishing shear rates
+    """
+    infinite_shear_viscosity: float
+    """
+    Viscosity nu_inf for large shear rates
+    """
+    relaxation_time: float
+    """
+    lambda: the fluid starts thinning at shear rates around 1 / lambda
+    """
+    flow_index: float
+    """
+    n of nu = nu_inf + (nu_0 - nu_inf) (1 + (lambda shear_rate)^2)^((n - 1) / 2)
+    """
+    omega_min: float = 0.2
+    omega_max: float = 1.98
+
+    def viscosity(self, shear_rate):
+        thinning = (1 + (self.relaxation_time * shear_rate) ** 2) ** ((self.flow_index - 1) / 2)
+        return self.infinite_shear_viscosity + (self.zero_shear_viscosity - self.infinite_shear_viscosity) * thinning
+
+
+@dataclass
+class BinghamParameters:
+    plastic_viscosity: float
+    """
+    Viscosity nu_p above the yield stress
+    """
+    yield_stress: float
+    """
+    Kinematic yield stress tau_y / rho; below it the fluid moves as a rigid plug
+    """
+    regularization: float = 1e3
+    """
+    m of the Papanastasiou regularization nu = nu_p + tau_y (1 - exp(-m shear_rate)) / shear_rate
+    """
+    omega_min: float = 0.2
+    omega_max: float = 1.98
+
+    def viscosity(self, shear_rate):
+        return self.plastic_viscosity + self.yield_stress * (1 - _exp(-self.regularization * shear_rate)) / shear_rate
+
+
+# Default fluids and body forces of the `nonnewtonian_channel` scenario: u_max about 0.05 at a width of 64 cells
+CHANNEL_MODELS = {
+    'power_law': (PowerLawParameters(consistency=0.01, flow_index=0.5), 2.1e-5),
+    'carreau': (CarreauParameters(zero_shear_viscosity=0.3, infinite_shear_viscosity=0.005, relaxation_time=200.0,
+                                  flow_index=0.5), 3e-5),
+    'bingham': (BinghamParameters(plastic_viscosity=0.05, yield_stress=1e-4), 1e-5),
+}
+
+
+def add_viscosity_model(collision_rule, parameter, iterations=3, omega_output_field=None):
+    r"""Replaces the shear relaxation rate of `collision_rule` by the local rate of a viscosity model.
+
+    Args:
+        collision_rule: collision rule with a symbolic shear relaxation rate, which is also the start value
+                        of the fixed-point iterations (e.g. the rate of the zero-shear viscosity)
+        parameter: `PowerLawParameters`, `CarreauParameters`, `BinghamParameters` or any object with a
+                   `viscosity(shear_rate)` method and `omega_min`/`omega_max` attributes
+        iterations: number of fixed-point iterations for the implicit shear rate
+        omega_output_field: optional field the local relaxation rate is written to
+    """
+    from lbmpy.relaxationrates import get_shear_relaxation_rate, relaxation_rate_from_lattice_viscosity
+    from lbmpy.utils import extract_shear_relaxation_rate, frobenius_norm, second_order_moment_tensor
+    from pystencils import Assignment
+
+    method = collision_rule.method
+    equilibrium = method.equilibrium_distribution
+
+    omega_s = get_shear_relaxation_rate(method)
+    omega_s, found_symbolic_shear_relaxation = extract_shear_relaxation_rate(collision_rule, omega_s)
+
+    if not found_symbolic_shear_relaxation:
+        raise ValueError("For viscosity models the shear relaxation rate has to be a symbol or it has to be "
+                         "assigned to a single equation in the assignment list")
+
+    rho = equilibrium.density if equilibrium.compressible else equilibrium.background_density
+    f_neq = sp.Matrix(method.pre_collision_pdf_symbols) - method.get_equilibrium_terms()
+    pi_neq, adapted_omega = sp.symbols("Pi_neq omega_new")
+
+    eqs = [Assignment(pi_neq, frobenius_norm(second_order_moment_tensor(f_neq, method.stencil), factor=2))]
+    omega = omega_s
+    for i in range(iterations):
+        shear_rate, nu, omega_new = sp.symbols(f"shear_rate_{i} nu_{i} omega_{i}")
+        new_omega = relaxation_rate_from_lattice_viscosity(nu)
+        # the floor keeps nu finite for shear-thinning fluids at rest, the clamp does the rest
+        eqs += [Assignment(shear_rate, sp.Max(sp.Rational(3, 2) * omega * pi_neq / rho, 1e-12)),
+                Assignment(nu, parameter.viscosity(shear_rate)),
+                Assignment(omega_new, sp.Piecewise((parameter.omega_min, new_omega < parameter.omega_min),
+                                                   (parameter.omega_max, new_omega > parameter.omega_max),
+                                                   (new_omega, True)))]
+        omega = omega_new
+    eqs.append(Assignment(adapted_omega, omega))
+
+    collision_rule = collision_rule.new_with_substitutions({omega_s: adapted_omega}, substitute_on_lhs=False)
+    collision_rule.subexpressions += eqs
+    collision_rule.topological_sort(sort_subexpressions=True, sort_main_assignments=False)
+
+    if omega_output_field:
+        collision_rule.main_assignments.append(Assignment(omega_output_field.center, adapted_omega))
+
+    return collision_rule
+
+
+def add_power_law_model(collision_rule, parameter: PowerLawParameters, iterations=3, omega_output_field=None):
+    """Power-law fluid nu = K shear_rate^(n - 1), see `add_viscosity_model`"""
+    return add_viscosity_model(collision_rule, parameter, iterations, omega_output_field)
+
+
+def add_carreau_model(collision_rule, parameter: CarreauParameters, iterations=3, omega_output_field=None):
+    """Carreau fluid, see `CarreauParameters` and `add_viscosity_model`"""
+    return add_viscosity_model(collision_rule, parameter, iterations, omega_output_field)
+
+
+def add_bingham_model(collision_rule, parameter: BinghamParameters, iterations=3, omega_output_field=None):
+    """Regularized Bingham plastic, see `BinghamParameters` and `add_viscosity_model`"""
+    return add_viscosity_model(collision_rule, parameter, iterations, omega_output_field)
+
+
+def non_newtonian_collision_rule(lbm_config, parameter, iterations=3, omega_output_field=None):
+    """Collision rule of `lbm_config` with the viscosity model of `parameter`.
+
+    The first relaxation rate of `lbm_config` (the shear rate, a number) is the start value of the fixed-point
+    iterations. The model is added before the simplifications, as `create_lb_collision_rule` does for the
+    Cassons model.
+    """
+    from dataclasses import replace
+    from lbmpy import LBMOptimisation, create_lb_collision_rule
+    from lbmpy.simplificationfactory import create_simplification_strategy
+
+    omega = sp.Symbol('omega_shear')
+    start = lbm_config.relaxation_rates[0]
+    config = replace(lbm_config, relaxation_rate=None, relaxation_rates=[omega] + list(lbm_config.relaxation_rates[1:]))
+    collision_rule = create_lb_collision_rule(lbm_config=config, lbm_optimisation=LBMOptimisation(simplification=False))
+    collision_rule = add_viscosity_model(collision_rule, parameter, iterations, omega_output_field)
+    collision_rule = collision_rule.new_with_substitutions({omega: start})
+    return create_simplification_strategy(collision_rule.method)(collision_rule)
+
+
+def channel_profile(parameter, force, height, points=None):
+    """Steady velocity between two walls `height` cells apart, driven by the body force `force` (kinematic).
+
+    The shear stress grows linearly from the centre, force |y - H/2| = nu(shear_rate) shear_rate, which is solved
+    for the shear rate by bisection and integrated from the wall. The viscosity is limited to the range of
+    `omega_min` and `omega_max` like in the kernel. The profile is returned at the cell centres y = 0.5, 1.5, ...
+    (bounce-back walls at 0 and H), or at `points`.
+    """
+    from lbmpy.relaxationrates import lattice_viscosity_from_relaxation_rate
+
+    nu_min = lattice_viscosity_from_relaxation_rate(parameter.omega_max)
+    nu_max = lattice_viscosity_from_relaxation_rate(parameter.omega_min)
+
+    def stress_of(shear_rate):
+        return shear_rate * np.clip(parameter.viscosity(shear_rate), nu_min, nu_max)
+
+    y = np.linspace(0, height / 2, 4001)
+    stress = force * (height / 2 - y)
+    low, high = np.full_like(y, 1e-14), np.full_like(y, 1.0)
+    while np.any(stress_of(high) < stress):
+        high *= 10
+    for _ in range(100):
+        middle = 0.5 * (low + high)
+        too_small = stress_of(middle) < stress
+        low, high = np.where(too_small, middle, low), np.where(too_small, high, middle)
+    shear_rate = 0.5 * (low + high)
+    velocity = np.concatenate(([0.0], np.cumsum(0.5 * (shear_rate[1:] + shear_rate[:-1]) * np.diff(y))))
+    if points is None:
+        points = np.arange(height) + 0.5
+    distance = np.minimum(points, height - np.asarray(points))
+    return np.interp(distance, y, velocity)
+
+
+def channel_velocity(scenario):
+    """Velocity in flow direction averaged along the periodic axis of a channel scenario"""
+    velocity = scenario.velocity[(slice(None),) * scenario.data_handling.dim]
+    return velocity[..., 0].mean(axis=0)
@@ -0,0 +1,283 @@
+"""
+Asynchronous snapshot output
+
+In the animation scripts every snapshot stops the time loop until the field has been copied,
+handed to matplotlib or written out. A `SnapshotWriter` splits this into two stages:
+
+- `capture()` copies the arrays into one of a few preallocated staging buffers and returns
+- background threads serialize, compress and write the buffers that are already filled
+
+With two staging buffers the simulation fills one while the other is being written. When the writer
+falls behind and no buffer is free, `capture()` either waits (`policy='block'`, the default) or skips
+the snapshot (`policy='drop'`); both are counted in `stats`. NumPy copies and zlib compression release
+the GIL, so writing overlaps with the compiled kernels of the next time steps.
+
+A `CapturePolicy` reduces what is stored at capture time: region-of-interest boxes, spatial
+decimation, float16 quantization and keeping only every n-th time step. Only the selected cells are
+copied into the staging buffers, so the policy also cuts the copy and the compression work.
+
+Example:
+    with SnapshotWriter('out/shear_layer') as writer:
+        record_snapshots(scenario, writer, time_steps=5000, every=50)
+    for time, arrays in load_snapshots('out/shear_layer'):
+        ...
+"""
+
+import glob
+import json
+import os
+import queue
+import threading
+import time as _time
+import zipfile
+
+import numpy as np
+
+
+class CapturePolicy:
+    """What part of a field is stored per snapshot.
+
+    Args:
+        regions: None for the whole domain, a slice (`make_slice[0.2:0.8, :]`, integers are lattice
+                 coordinates, floats are relative) or a dict name -> slice for several boxes. Each region
+                 of quantity `q` is stored as array `q` (single region) or `q_<name>`.
+        step: spatial decimation, keep every `step`-th cell (int, or one int per axis)
+        dtype: storage dtype, e.g. 'float16'. Values are rounded while being copied to the staging buffer.
+        every: temporal decimation, `capture_scenario` only stores time steps divisible by `every`
+
+    Example: the wake behind the cylinder, every third cell as in `vector_field(..., step=3)`, in half precision
+        CapturePolicy(regions=make_slice[0.25:, 0.2:0.8], step=3, dtype='float16')
+    """
+
+    def __init__(self, regions=None, step=1, dtype=None, every=1):
+        self.regions = regions
+        self.step = step
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self.every = every
+
+    def _named_regions(self):
+        if self.regions is None:
+            return {None: None}
+        if isinstance(self.regions, dict):
+            return dict(self.regions)
+        return {None: self.regions}
+
+    def slices(self, domain_size):
+        """dict region name -> tuple of slices into an array without ghost layers"""
+        from pystencils.slicing import normalize_slice
+
+        dim = len(domain_size)
+        steps = (self.step,) * dim if np.isscalar(self.step) else tuple(self.step)
+        result = {}
+        for name, region in self._named_regions().items():
+            region = (slice(None),) * dim if region is None else tuple(region)
+            normalized = normalize_slice(region, domain_size)
+            result[name] = tuple(slice(s.start, s.stop, (s.step or 1) * step) if isinstance(s, slice) else s
+                                 for s, step in zip(normalized, steps))
+        return result
+
+    def select(self, quantity, array, domain_size):
+        """Views of `array` (spatial axes first) for all regions, keyed by stored array name"""
+        return {quantity if name is None else f'{quantity}_{name}': array[slices]
+                for name, slices in self.slices(domain_size).items()}
+
+    def describe(self, domain_size):
+        """JSON-serializable description, written next to the snapshots"""
+        regions = {}
+        for name, slices in self.slices(domain_size).items():
+            regions['' if name is None else name] = [[s.start, s.stop, s.step] if isinstance(s, slice) else s
+                                                     for s in slices]
+        return {'domain_size': list(domain_size), 'regions': regions, 'every': self.every,
+                'dtype': None if self.dtype is None else self.dtype.name}
+
+
+class SnapshotWriter:
+    """Writes snapshots to `<directory>/<prefix>_<time>.npz` from a background thread.
+
+    Args:
+        directory: output directory, created if necessary
+        prefix: file name prefix
+        buffers: number of staging buffers, default `threads + 1` (2 = double buffering)
+        compression_level: zlib level 0-9 of the `.npz` members, 0 stores uncompressed. Level 1 is
+                           about three times faster than the level 6 of `np.savez_compressed` and
+                           compresses simulation data almost as well.
+        threads: number of writer threads
+        policy: 'block' waits for a free staging buffer when the writer falls behind,
+                'drop' skips the snapshot instead
+        capture_policy: optional `CapturePolicy` applied by `capture_scenario` (its dtype also by `capture`)
+    """
+
+    def __init__(self, directory, prefix='snapshot', buffers=None, compression_level=1, threads=1, policy='block',
+                 capture_policy=None):
+        if policy not in ('block', 'drop'):
+            raise ValueError(f"Unknown policy '{policy}', use 'block' or 'drop'")
+        if buffers is None:
+            buffers = threads + 1
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.compression_level = compression_level
+        self.policy = policy
+        self.capture_policy = capture_policy
+        self._policy_written = False
+
+        self._staging = [None] * buffers
+        self._free = queue.Queue()
+        for slot in range(buffers):
+            self._free.put(slot)
+        self._pending = queue.Queue()
+        self._error = None
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {'captured': 0, 'written': 0, 'dropped': 0, 'bytes_written': 0,
+                      'capture_time': 0.0, 'stall_time': 0.0, 'write_time': 0.0}
+
+        self._threads = [threading.Thread(target=self._work, name=f'SnapshotWriter-{i}', daemon=True)
+                         for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    # ----------------------------------------------- simulation side ----------------------------------------------
+
+    def capture(self, time, **arrays):
+        """Copies `arrays` (NumPy or cupy) into a staging buffer and queues them for writing.
+
+        Returns False if the snapshot was dropped because no staging buffer was free.
+        """
+        self._check_error()
+        if self._closed:
+            raise RuntimeError("SnapshotWriter is closed")
+
+        start = _time.perf_counter()
+        if self.policy == 'drop':
+            try:
+                slot = self._free.get_nowait()
+            except queue.Empty:
+                self.stats['dropped'] += 1
+                return False
+        else:
+            slot = self._free.get()
+        copy_start = _time.perf_counter()
+        self.stats['stall_time'] += copy_start - start
+
+        dtype = self.capture_policy.dtype if self.capture_policy is not None else None
+        dtypes = {k: dtype or a.dtype for k, a in arrays.items()}
+        staging = self._staging[slot]
+        if staging is None or staging.keys() != arrays.keys() or \
+                any(staging[k].shape != a.shape or staging[k].dtype != dtypes[k] for k, a in arrays.items()):
+            staging = self._staging[slot] = {k: np.empty(a.shape, dtype=dtypes[k]) for k, a in arrays.items()}
+        for name, array in arrays.items():
+            if hasattr(array, 'get'):  # cupy
+                array.get(out=staging[name])
+            else:
+                np.copyto(staging[name], array)
+
+        self._pending.put((slot, time))
+        self.stats['captured'] += 1
+        self.stats['capture_time'] += _time.perf_counter() - copy_start
+        return True
+
+    def capture_scenario(self, scenario, quantities=('velocity',), time=None):
+        """Captures macroscopic fields of a `LatticeBoltzmannStep` (valid after `run()`).
+
+        `quantities` are 'velocity', 'density' or data handling array names; ghost layers are removed and
+        the capture policy is applied. Returns False if the snapshot was skipped or dropped.
+        """
+        time = scenario.time_steps_run if time is None else time
+        policy = self.capture_policy
+        if policy is not None and time % policy.every != 0:
+            return False
+
+        names = {'velocity': scenario.velocity_data_name, 'density': scenario.density_data_name}
+        dh = scenario.data_handling
+        arrays = {}
+        for q in quantities:
+            array = dh.gather_array(names.get(q, q), ghost_layers=False)
+            arrays.update(policy.select(q, array, dh.shape) if policy is not None else {q: array})
+
+        if policy is not None and not self._policy_written:
+            with open(os.path.join(self.directory, f"{self.prefix}_capture.json"), 'w') as f:
+                json.dump(policy.describe(dh.shape), f, indent=2)
+            self._policy_written = True
+        return self.capture(time, **arrays)
+
+    # ----------------------------------------------- writer side --------------------------------------------------
+
+    def filename(self, time):
+        return os.path.join(self.directory, f"{self.prefix}_{time:08d}.npz")
+
+    def _save(self, filename, time, arrays):
+        """Same layout as `np.savez_compressed`, with a configurable compression level"""
+        compression = zipfile.ZIP_DEFLATED if self.compression_level > 0 else zipfile.ZIP_STORED
+        level = self.compression_level if self.compression_level > 0 else None
+        with zipfile.ZipFile(filename, 'w', compression=compression, compresslevel=level) as zf:
+            for name, array in [('time', np.int64(time))] + list(arrays.items()):
+                with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.asanyarray(array))
+
+    def _work(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.put(None)  # stops the other writer threads as well
+                break
+            slot, time = item
+            try:
+                if self._error is None:
+                    start = _time.perf_counter()
+                    target = self.filename(time)
+                    temporary = target + '.part'
+                    self._save(temporary, time, self._staging[slot])
+                    os.replace(temporary, target)
+                    with self._stats_lock:
+                        self.stats['write_time'] += _time.perf_counter() - start
+                        self.stats['bytes_written'] += os.path.getsize(target)
+                        self.stats['written'] += 1
+            except BaseException as e:  # re-raised in the simulation thread
+                self._error = e
+            finally:
+                self._free.put(slot)
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing a snapshot failed") from error
+
+    def flush(self):
+        """Blocks until all captured snapshots are written."""
+        slots = [self._free.get() for _ in self._staging]
+        for slot in slots:
+            self._free.put(slot)
+        self._check_error()
+
+    def close(self):
+        """Writes the remaining snapshots and stops the writer thread."""
+        if not self._closed:
+            self._closed = True
+            self._pending.put(None)
+            for thread in self._threads:
+                thread.join()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def record_snapshots(scenario, writer, time_steps, every, quantities=('velocity',)):
+    """Runs `scenario` for `time_steps` steps and captures `quantities` every `every` steps."""
+    done = 0
+    while done < time_steps:
+        chunk = min(every, time_steps - done)
+        scenario.run(chunk)
+        done += chunk
+        writer.capture_scenario(scenario, quantities)
+
+
+def load_snapshots(directory, prefix='snapshot'):
+    """Yields (time, dict of arrays) for all snapshots in `directory`, ordered by time."""
+    for filename in sorted(glob.glob(os.path.join(directory, f"{prefix}_*.npz"))):
+        with np.load(filename) as f:
+            yield int(f['time']), {k: f[k] for k in f.files if k != 'time'}
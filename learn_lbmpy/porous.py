@@ -0,0 +1,217 @@
+"""
+Flow through packed beds
+
+The periodic pipe of `02_geom_and_bcs/01_geometry.py` is driven by a body force with `NoSlip`
+walls. The same setup with a random sphere packing instead of the pipe wall gives the Darcy
+permeability of the packing:
+
+    k = nu * <u> / g
+
+with the superficial velocity <u> (flux averaged over fluid and solid cells), the lattice viscosity
+nu and the body force density g. `PermeabilityRun` advances the flow until the flux no longer
+changes and evaluates k. The flux is reduced inside a generated kernel
+(`learn_lbmpy.diagnostics.GlobalDiagnostics`), so convergence checks on 256^3 and larger domains
+don't copy the velocity field.
+
+Example:
+    scenario = create_scenario('porous_media', domain_size=(128, 128, 128), porosity=0.4, sphere_radius=8)
+    run = PermeabilityRun(scenario)
+    run.run(max_steps=20000)
+    print(run.permeability, run.kozeny_carman_permeability())
+"""
+
+import time
+
+import numpy as np
+
+
+# ----------------------------------------------- packing ------------------------------------------------------------
+
+def _sphere_box(centre, radius, domain_size, periodic):
+    """Index arrays (for np.ix_) of the cells around a sphere and the mask of the cells inside it"""
+    indices, distance_sq = [], 0
+    for axis, (c, n) in enumerate(zip(centre, domain_size)):
+        cells = np.arange(int(np.floor(c - radius)), int(np.ceil(c + radius)) + 1)
+        d_sq = (cells + 0.5 - c) ** 2
+        if periodic:
+            cells = cells % n
+        else:
+            inside = (cells >= 0) & (cells < n)
+            cells, d_sq = cells[inside], d_sq[inside]
+        shape = [1] * len(domain_size)
+        shape[axis] = len(cells)
+        indices.append(cells)
+        distance_sq = distance_sq + d_sq.reshape(shape)
+    return np.ix_(*indices), distance_sq < radius ** 2
+
+
+def random_sphere_packing(domain_size, porosity, radius, overlap=True, periodic=True, seed=None, max_attempts=None):
+    """Randomly placed spheres until the fluid fraction of the domain drops to `porosity`.
+
+    Args:
+        domain_size: number of cells
+        porosity: target fluid fraction. The last sphere overshoots it by at most its own volume.
+        radius: sphere radius in cells, or (min, max) for radii drawn uniformly from that range
+        overlap: True places spheres independently (penetrable spheres, any porosity reachable),
+                 False rejects spheres intersecting already placed ones (random sequential addition,
+                 which jams at a solid fraction of about 0.38)
+        periodic: spheres leaving the domain re-enter on the opposite side, as needed for the periodic flow
+        seed: random seed
+        max_attempts: with overlap=False, number of rejected candidates after which a ValueError is raised
+
+    Returns:
+        tuple (solid mask, centres of shape (n, dim), radii of shape (n,))
+    """
+    domain_size = tuple(int(n) for n in domain_size)
+    dim = len(domain_size)
+    radius_range = (float(radius), float(radius)) if np.isscalar(radius) else tuple(float(r) for r in radius)
+    if periodic and 2 * radius_range[1] + 2 >= min(domain_size):
+        raise ValueError("Spheres have to be smaller than half the periodic domain")
+    if not 0 < porosity < 1:
+        raise ValueError("porosity has to be between 0 and 1")
+
+    rng = np.random.default_rng(seed)
+    solid = np.zeros(domain_size, dtype=bool)
+    total = int(np.prod(domain_size))
+    target_solid = (1 - porosity) * total
+    solid_cells = 0
+    centres, radii = [], []
+    rejected = 0
+    if max_attempts is None:
+        max_attempts = 1000 * max(1, int(target_solid / (4 / 3 * np.pi * radius_range[0] ** 3)))
+
+    while solid_cells < target_solid:
+        centre = rng.random(dim) * domain_size
+        r = rng.uniform(*radius_range)
+        if not overlap and centres:
+            offset = np.abs(np.array(centres) - centre)
+            if periodic:
+                offset = np.minimum(offset, np.array(domain_size) - offset)
+            if np.any(np.sum(offset ** 2, axis=1) < (np.array(radii) + r) ** 2):
+                rejected += 1
+                if rejected > max_attempts:
+                    raise ValueError(f"Porosity {porosity} not reachable without overlap, "
+                                     f"jammed at {1 - solid_cells / total:.3f}")
+                continue
+        box, inside = _sphere_box(centre, r, domain_size, periodic)
+        added = inside & ~solid[box]
+        solid_cells += int(np.count_nonzero(added))
+        solid[box] |= inside
+        centres.append(centre)
+        radii.append(r)
+
+    return solid, np.array(centres).reshape(-1, dim), np.array(radii)
+
+
+def kozeny_carman_permeability(porosity, diameter):
+    """Permeability of a bed of spheres with `diameter` after Kozeny-Carman, phi^3 d^2 / (180 (1 - phi)^2)"""
+    return porosity ** 3 * diameter ** 2 / (180 * (1 - porosity) ** 2)
+
+
+# ----------------------------------------------- permeability -------------------------------------------------------
+
+def body_force(method):
+    """Numerical body force vector of a forced lbmpy method"""
+    force_model = method.force_model
+    if force_model is None:
+        raise ValueError("The method has no force model, the flow has to be driven by a body force")
+    return np.array([float(force_model.subs_dict_force.get(f, f)) for f in force_model.symbolic_force_vector])
+
+
+class PermeabilityRun:
+    """Runs a body-force driven periodic flow to steady state and evaluates the Darcy permeability.
+
+    Args:
+        scenario: `LatticeBoltzmannStep` with a forced method, e.g. `create_scenario('porous_media')`
+        axis: flow direction
+        every: time steps between two convergence checks
+        tolerance: converged when the superficial velocity changed by less than this fraction of itself
+                   between two checks
+        reference_diameter: length used for the dimensionless permeability k / d^2 (default: the mean
+                            sphere diameter of a `porous_media` scenario, else 1)
+    """
+
+    def __init__(self, scenario, axis=0, every=200, tolerance=1e-5, reference_diameter=None):
+        from lbmpy.relaxationrates import get_shear_relaxation_rate, lattice_viscosity_from_relaxation_rate
+        from learn_lbmpy.diagnostics import GlobalDiagnostics
+
+        self.scenario = scenario
+        self.axis = axis
+        self.every = every
+        self.tolerance = tolerance
+        self.force = body_force(scenario.method)[axis]
+        self.viscosity = float(lattice_viscosity_from_relaxation_rate(get_shear_relaxation_rate(scenario.method)))
+
+        packing = getattr(scenario, 'packing', None)
+        if reference_diameter is None:
+            reference_diameter = 2 * float(np.mean(packing['radii'])) if packing is not None else 1.0
+        self.reference_diameter = reference_diameter
+
+        self._diagnostics = GlobalDiagnostics(scenario, quantities=('momentum', 'fluid_cells'), every=every)
+        self.total_cells = int(np.prod(scenario.data_handling.shape))
+        self.fluid_cells = None
+        self.converged = False
+        self.steps = []
+        self.superficial_velocities = []
+        self.wall_time = 0.0
+
+    def sample(self):
+        """Superficial velocity <u> along the flow axis in the current state"""
+        values = self._diagnostics.evaluate()
+        self.fluid_cells = values['fluid_cells']
+        velocity = values['momentum'][self.axis] / self.total_cells
+        self.steps.append(self.scenario.time_steps_run)
+        self.superficial_velocities.append(velocity)
+        return velocity
+
+    def run(self, max_steps=100000):
+        """Advances the flow in chunks of `every` steps until the flux converged or `max_steps` steps were run.
+
+        Returns True if the flow converged.
+        """
+        start = time.perf_counter()
+        if not self.superficial_velocities:
+            self.sample()
+        done = 0
+        while done < max_steps and not self.converged:
+            chunk = min(self.every, max_steps - done)
+            self.scenario.run(chunk)
+            done += chunk
+            previous, current = self.superficial_velocities[-1], self.sample()
+            self.converged = current != 0 and abs(current - previous) <= self.tolerance * abs(current)
+        self.wall_time += time.perf_counter() - start
+        return self.converged
+
+    @property
+    def porosity(self):
+        if self.fluid_cells is None:
+            self.sample()
+        return self.fluid_cells / self.total_cells
+
+    @property
+    def superficial_velocity(self):
+        return self.superficial_velocities[-1]
+
+    @property
+    def permeability(self):
+        """Darcy permeability in lattice units (cells^2), k = nu <u> / g"""
+        return self.viscosity * self.superficial_velocity / self.force
+
+    def kozeny_carman_permeability(self):
+        return kozeny_carman_permeability(self.porosity, self.reference_diameter)
+
+    def reynolds_number(self):
+        """Pore Reynolds number with the interstitial velocity and the reference diameter"""
+        return self.superficial_velocity / self.porosity * self.reference_diameter / self.viscosity
+
+    def mlups(self):
+        """Million lattice cell updates per second of the steps run so far (including the convergence checks)"""
+        steps = self.steps[-1] - self.steps[0] if self.steps else 0
+        return steps * self.total_cells / self.wall_time / 1e6 if self.wall_time else 0.0
+
+    def report(self):
+        return (f"porosity {self.porosity:.4f}, k = {self.permeability:.5g} cells^2, "
+                f"k/d^2 = {self.permeability / self.reference_diameter ** 2:.4g} "
+                f"(Kozeny-Carman {self.kozeny_carman_permeability() / self.reference_diameter ** 2:.4g}), "
+                f"Re = {self.reynolds_number():.3g}, {'converged' if self.converged else 'NOT converged'} "
+                f"after {self.steps[-1]} steps")
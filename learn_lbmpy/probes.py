@@ -0,0 +1,290 @@
+"""
+Point, line and plane probes with ring-buffered recording
+
+`04_channel_flow.py` reads the centre line profile once at the end with
+`channel_scenario.velocity[0.5, :, 0]`; recording a signal over time meant copying whole fields.
+A `ProbeSet` instead precomputes integer index arrays for every registered probe and gathers only
+those cells, at every step or at any cadence, into preallocated ring buffers.
+
+Coordinates follow the `make_slice` convention: integers are lattice coordinates (negative values
+count from the end), floats are relative to the domain size.
+
+Two kinds of sources are supported:
+
+- a `LatticeBoltzmannStep`: 'velocity' and 'density' are computed from the gathered PDFs, so they are
+  valid at every step and not only after `run()` has written the macroscopic fields
+- a raw data handling (as in `04_cumulant_lbm`): any array, e.g. a velocity field written by the kernel
+
+Example:
+    probes = ProbeSet(scenario, capacity=10000)
+    probes.add_point('wake', (0.6, 0.5))
+    probes.add_line('centreline', make_slice[0.5, :])
+    probes.run(5000)
+    t, u = probes.times('wake'), probes.values('wake')     # shapes (n,), (n, 1, 2)
+"""
+
+import os
+
+import numpy as np
+
+
+class RingBuffer:
+    """Preallocated buffer for `capacity` samples of fixed shape.
+
+    When full, the oldest sample is overwritten - or, if `flush_callback` is given, the complete buffer
+    is handed to the callback and recording continues in an empty buffer, so no sample is lost.
+    """
+
+    def __init__(self, capacity, sample_shape, dtype=np.float64, flush_callback=None):
+        self.capacity = capacity
+        self.data = np.empty((capacity,) + tuple(sample_shape), dtype=dtype)
+        self.time = np.empty(capacity, dtype=np.int64)
+        self.flush_callback = flush_callback
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, time, sample):
+        if self._count == self.capacity and self.flush_callback is not None:
+            self.flush()
+        self.data[self._next] = sample
+        self.time[self._next] = time
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _order(self):
+        start = (self._next - self._count) % self.capacity
+        return (start + np.arange(self._count)) % self.capacity
+
+    def times(self):
+        return self.time[self._order()]
+
+    def values(self):
+        """Samples in chronological order (a copy)"""
+        return self.data[self._order()]
+
+    def flush(self):
+        """Hands the buffered samples to the flush callback and empties the buffer."""
+        if self._count and self.flush_callback is not None:
+            self.flush_callback(self.times(), self.values())
+        self._next = 0
+        self._count = 0
+
+
+class _Probe:
+    def __init__(self, name, quantity, index_arrays, shape, buffer):
+        self.name = name
+        self.quantity = quantity
+        self.index_arrays = index_arrays
+        self.shape = shape
+        self.buffer = buffer
+
+
+class ProbeSet:
+    """Collection of probes sampled together.
+
+    Args:
+        source: `LatticeBoltzmannStep` or pystencils data handling
+        capacity: number of samples kept per probe
+        every: sampling cadence in time steps used by `run`
+        flush_dir: if given, full buffers are written to `<flush_dir>/<probe>_<chunk>.npz` instead of
+                   being overwritten
+    """
+
+    def __init__(self, source, capacity=1000, every=1, flush_dir=None):
+        self.every = every
+        self.capacity = capacity
+        self.flush_dir = flush_dir
+        if flush_dir is not None:
+            os.makedirs(flush_dir, exist_ok=True)
+
+        if hasattr(source, 'data_handling') and hasattr(source, 'pdf_array_name'):
+            self.scenario = source
+            self._data_handling = source.data_handling
+        else:
+            self.scenario = None
+            self._data_handling = source
+        self._gpu = self._data_handling.default_target.is_gpu()
+        self._probes = {}
+        self._chunks = {}
+        self._macroscopic_function = None
+
+    # ----------------------------------------------- registration -------------------------------------------------
+
+    @property
+    def domain_size(self):
+        return self._data_handling.shape
+
+    def _register(self, name, quantity, cells, shape):
+        """`cells` is an integer array of shape (n, dim) of lattice coordinates without ghost layers"""
+        if name in self._probes:
+            raise ValueError(f"A probe named '{name}' already exists")
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, self._data_handling.dim)
+        if np.any(cells < 0) or np.any(cells >= np.array(self.domain_size)):
+            raise ValueError(f"Probe '{name}' lies (partly) outside of the domain {self.domain_size}")
+
+        gl = self._data_handling.ghost_layers_of_field(self._array_name(quantity))
+        index_arrays = tuple(cells[:, d] + gl for d in range(cells.shape[1]))
+        if self._gpu:
+            import cupy
+            index_arrays = tuple(cupy.asarray(i) for i in index_arrays)
+
+        values_per_cell = self._values_per_cell(quantity)
+        sample_shape = (len(cells),) + ((values_per_cell,) if values_per_cell > 1 else ())
+        flush = self._make_flush_callback(name) if self.flush_dir else None
+        buffer = RingBuffer(self.capacity, sample_shape, flush_callback=flush)
+        self._probes[name] = _Probe(name, quantity, index_arrays, shape, buffer)
+        return self._probes[name]
+
+    def add_region(self, name, slice_obj, quantity='velocity'):
+        """Probe of all cells in `slice_obj` (e.g. `make_slice[0.5, :]` for a line, `make_slice[:, :, 0.5]`
+        for a plane). Samples have shape (n_cells[, values_per_cell]); `probe_shape(name)` gives the
+        shape of the region."""
+        from pystencils.slicing import normalize_slice
+
+        normalized = normalize_slice(tuple(slice_obj), self.domain_size)
+        axes = [np.arange(s.start, s.stop, s.step) if isinstance(s, slice) else np.array([s]) for s in normalized]
+        grids = np.meshgrid(*axes, indexing='ij')
+        shape = tuple(len(a) for a, s in zip(axes, normalized) if isinstance(s, slice))
+        cells = np.stack([g.ravel() for g in grids], axis=-1)
+        return self._register(name, quantity, cells, shape)
+
+    def add_point(self, name, position, quantity='velocity'):
+        """Probe of a single cell, `position` in lattice (int) or relative (float) coordinates"""
+        return self.add_region(name, tuple(position), quantity)
+
+    def add_line(self, name, start, end=None, points=None, quantity='velocity'):
+        """Line probe.
+
+        Either pass a slice as `start` with one ':' entry (`make_slice[0.5, :]`), or two end points
+        `start` and `end` and the number of `points` sampled between them (nearest cell).
+        """
+        if end is None:
+            return self.add_region(name, start, quantity)
+        from pystencils.slicing import normalize_slice
+
+        start = np.array(normalize_slice(tuple(start), self.domain_size), dtype=float)
+        end = np.array(normalize_slice(tuple(end), self.domain_size), dtype=float)
+        if points is None:
+            points = int(np.ceil(np.abs(end - start).max())) + 1
+        t = np.linspace(0, 1, points)[:, np.newaxis]
+        cells = np.rint(start + t * (end - start)).astype(np.int64)
+        cells = np.minimum(cells, np.array(self.domain_size) - 1)
+        return self._register(name, quantity, cells, (points,))
+
+    def add_plane(self, name, axis, position, quantity='velocity'):
+        """Plane probe normal to `axis` at `position` (int or relative float)"""
+        slice_obj = [slice(None)] * self._data_handling.dim
+        slice_obj[axis] = position
+        return self.add_region(name, tuple(slice_obj), quantity)
+
+    # ----------------------------------------------- sampling -----------------------------------------------------
+
+    def _array_name(self, quantity):
+        if self.scenario is not None and quantity in ('velocity', 'density'):
+            return self.scenario.pdf_array_name
+        return quantity
+
+    def _values_per_cell(self, quantity):
+        if self.scenario is not None and quantity in ('velocity', 'density'):
+            return self._data_handling.dim if quantity == 'velocity' else 1
+        return self._data_handling.fields[quantity].values_per_cell()
+
+    def _macroscopic_values(self, pdfs):
+        """Density and velocity from gathered PDFs of shape (n, q)"""
+        if self._macroscopic_function is None:
+            import sympy as sp
+
+            method = self.scenario.method
+            pdf_symbols = sp.symbols(f'f_:{len(method.stencil)}')
+            rho = sp.Symbol('rho_out')
+            u = sp.symbols(f'u_out_:{method.dim}')
+            ac = method.conserved_quantity_computation.output_equations_from_pdfs(
+                pdf_symbols, {'density': rho, 'velocity': u})
+            ac = ac.new_without_subexpressions()
+            outputs = {a.lhs: a.rhs for a in ac.main_assignments}
+            self._macroscopic_function = sp.lambdify(pdf_symbols, [outputs[rho]] + [outputs[c] for c in u], 'numpy')
+
+        rho, *u = self._macroscopic_function(*pdfs.T)
+        n = pdfs.shape[0]
+        return np.broadcast_to(rho, (n,)), np.stack([np.broadcast_to(c, (n,)) for c in u], axis=-1)
+
+    def sample(self, time=None):
+        """Gathers all probes from the current state and appends them to their buffers."""
+        if time is None:
+            time = self.scenario.time_steps_run if self.scenario is not None else 0
+        dh = self._data_handling
+        arrays = dh.gpu_arrays if self._gpu else dh.cpu_arrays
+
+        gathered_pdfs = {}
+        for probe in self._probes.values():
+            arr = arrays[self._array_name(probe.quantity)]
+            if self.scenario is not None and probe.quantity in ('velocity', 'density'):
+                if probe.name not in gathered_pdfs:
+                    pdfs = arr[probe.index_arrays]
+                    gathered_pdfs[probe.name] = pdfs.get() if self._gpu else pdfs
+                rho, u = self._macroscopic_values(gathered_pdfs[probe.name])
+                values = u if probe.quantity == 'velocity' else rho
+            else:
+                values = arr[probe.index_arrays]
+                if self._gpu:
+                    values = values.get()
+            probe.buffer.append(time, values)
+
+    def run(self, time_steps):
+        """Advances the scenario by `time_steps`, sampling every `self.every` steps."""
+        scenario = self.scenario
+        if scenario is None:
+            raise TypeError("run() needs a LatticeBoltzmannStep source; call sample() from your own time loop")
+        scenario.pre_run()
+        for _ in range(time_steps):
+            scenario.time_step()
+            scenario.time_steps_run += 1
+            if scenario.time_steps_run % self.every == 0:
+                self.sample()
+        scenario.post_run()
+
+    # ----------------------------------------------- access -------------------------------------------------------
+
+    def __getitem__(self, name):
+        return self._probes[name]
+
+    @property
+    def names(self):
+        return list(self._probes)
+
+    def probe_shape(self, name):
+        return self._probes[name].shape
+
+    def times(self, name):
+        return self._probes[name].buffer.times()
+
+    def values(self, name):
+        return self._probes[name].buffer.values()
+
+    def _make_flush_callback(self, name):
+        def flush(times, values):
+            chunk = self._chunks.get(name, 0)
+            self._chunks[name] = chunk + 1
+            np.savez(os.path.join(self.flush_dir, f"{name}_{chunk:05d}.npz"), time=times, values=values)
+        return flush
+
+    def flush(self):
+        """Writes all buffered samples to `flush_dir` (no-op without `flush_dir`)."""
+        if self.flush_dir is None:
+            return
+        for probe in self._probes.values():
+            probe.buffer.flush()
+
+    def load(self, name):
+        """Concatenates all flushed chunks and the samples still in memory of probe `name`."""
+        times, values = [], []
+        for chunk in range(self._chunks.get(name, 0)):
+            with np.load(os.path.join(self.flush_dir, f"{name}_{chunk:05d}.npz")) as f:
+                times.append(f['time'])
+                values.append(f['values'])
+        times.append(self.times(name))
+        values.append(self.values(name))
+        return np.concatenate(times), np.concatenate(values)
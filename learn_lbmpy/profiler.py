@@ -0,0 +1,303 @@
+"""
+Per-step time loop profiler
+
+A time step of `LatticeBoltzmannStep.run` is a list of pre-bound calls (ghost layer synchronization,
+one kernel per boundary object, the stream-collide kernel), executed by a pystencils `TimeLoop`. The
+hand-written loop of `04_cumulant_lbm` does the same with `bh()`, `dh.run_kernel(kernel)` and
+`dh.swap`. `StepProfiler` records the duration of every call and of every step, assigned to the phases
+
+- `collision_stream`   the LB kernel(s)
+- `boundary`           boundary kernels, one label per boundary object
+- `sync`               ghost layer synchronization
+- `python_overhead`    what is left of the step: the loop itself, argument passing, the swap
+
+The first three are recorded, `python_overhead` is the step time not covered by them. `run` builds the loop
+from the calls of `learn_lbmpy.solver.lb_step_calls` or `FixedStepSolver.fixed_step_calls`, which also tell
+the phase of each call.
+
+Each recorded call costs two `perf_counter_ns` calls and a list append (about a microsecond, see
+`overhead_per_event`), small compared to kernels that run for tens of microseconds or more. The records are
+aggregated per step into summaries and histograms, and exported as Chrome trace JSON which can be
+opened in Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+
+Example:
+    profiler = StepProfiler(scenario)
+    profiler.run(1000)
+    print(profiler.report())
+    profiler.save_trace('trace.json')
+
+Hand-written loops mark steps and phases themselves:
+    for i in range(steps):
+        with profiler.step():
+            with profiler.phase('boundary'):
+                bh()
+            with profiler.phase('collision_stream'):
+                dh.run_kernel(kernel)
+            dh.swap('src', 'dst')
+
+On the GPU kernel launches return immediately; with `synchronize` (the default for GPU scenarios)
+the profiler waits for the device after each call, so the durations are those of the kernels.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+PHASES = ('collision_stream', 'boundary', 'sync')
+OVERHEAD = 'python_overhead'
+
+
+class StepProfiler:
+    """Records per-call and per-step durations of time loops.
+
+    Args:
+        scenario: `LatticeBoltzmannStep` or solver of `learn_lbmpy.solver` (e.g. `PeriodicEnsemble`) profiled
+                  by `run`. Not needed for the `step` / `phase` context managers.
+        synchronize: wait for the GPU after each call. Default: True for GPU scenarios.
+    """
+
+    def __init__(self, scenario=None, synchronize=None):
+        self.scenario = scenario
+        if synchronize is None:
+            dh = getattr(scenario, 'data_handling', None)
+            synchronize = dh is not None and dh.default_target.is_gpu()
+        self.synchronize = synchronize
+        self._phases = list(PHASES)
+        self._labels = []
+        self._label_index = {}
+        self._events = []       # (phase index, label index, start ns, end ns)
+        self._steps = []        # (start ns, end ns)
+        self._step_start = None
+        self._t0 = time.perf_counter_ns()
+
+    # ---- recording ----
+
+    def _label(self, label):
+        if label not in self._label_index:
+            self._label_index[label] = len(self._labels)
+            self._labels.append(label)
+        return self._label_index[label]
+
+    def _phase(self, phase):
+        if phase not in self._phases:
+            self._phases.append(phase)
+        return self._phases.index(phase)
+
+    def _device_synchronize(self):
+        if self.synchronize:
+            import cupy
+            cupy.cuda.runtime.deviceSynchronize()
+
+    def wrap(self, phase, function, label=None):
+        """`function` with every call recorded under `phase` (and `label`, default: the phase name)"""
+        key = (self._phase(phase), self._label(label or phase))
+        append, clock = self._events.append, time.perf_counter_ns
+        synchronize = self._device_synchronize if self.synchronize else None
+
+        def timed(*args, **kwargs):
+            start = clock()
+            function(*args, **kwargs)
+            if synchronize:
+                synchronize()
+            append(key + (start, clock()))
+
+        return timed
+
+    def begin_step(self):
+        self._step_start = time.perf_counter_ns()
+
+    def end_step(self):
+        self._steps.append((self._step_start, time.perf_counter_ns()))
+
+    @contextmanager
+    def step(self):
+        self.begin_step()
+        try:
+            yield
+        finally:
+            self.end_step()
+
+    @contextmanager
+    def phase(self, phase, label=None):
+        key = (self._phase(phase), self._label(label or phase))
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._device_synchronize()
+            self._events.append(key + (start, time.perf_counter_ns()))
+
+    def reset(self):
+        """Discards all records"""
+        self._events.clear()
+        self._steps.clear()
+
+    # ---- profiling a scenario ----
+
+    def run(self, time_steps):
+        """Runs the scenario for `time_steps` steps with the pre-bound calls of its fixed time loop and records them.
+
+        The results are the same as from `scenario.run`: the calls are those of `scenario.get_time_loop()`, each
+        wrapped by `wrap`, with step markers around each step.
+        """
+        from lbmpy.lbstep import LatticeBoltzmannStep
+        from pystencils.timeloop import TimeLoop
+        from learn_lbmpy.solver import FixedStepSolver, lb_step_calls
+
+        scenario = self.scenario
+        profiled = TimeLoop(steps=2)
+        if isinstance(scenario, FixedStepSolver):
+            steps, swap_pairs = scenario.fixed_step_calls()
+        elif isinstance(scenario, LatticeBoltzmannStep):
+            steps, swap_pairs = lb_step_calls(scenario)
+            profiled.add_pre_run_function(scenario.pre_run)
+            profiled.add_post_run_function(scenario.post_run)
+        else:
+            raise TypeError(f"StepProfiler.run supports LatticeBoltzmannStep and learn_lbmpy.solver scenarios, "
+                            f"got {type(scenario).__name__}; profile its steps with `step()` and `phase()` instead")
+
+        steps = [[(self.wrap(phase, function, label), kwargs) for phase, label, function, kwargs in calls]
+                 for calls in steps]
+        dh = scenario.data_handling
+        gpu = dh.default_target.is_gpu()
+
+        def single_step():
+            # an odd number of steps ends with a single step: the first step of the fixed loop and a swap
+            self.begin_step()
+            for function, kwargs in steps[0]:
+                function(**kwargs)
+            self.end_step()
+            for pair in swap_pairs:
+                dh.swap(*pair, gpu)
+
+        for calls in steps:
+            profiled.add_call(self.begin_step, {})
+            for function, kwargs in calls:
+                profiled.add_call(function, kwargs)
+            profiled.add_call(self.end_step, {})
+        profiled.add_single_step_function(single_step)
+        profiled.run(time_steps)
+        scenario.time_steps_run += profiled.time_steps_run
+        if isinstance(scenario, FixedStepSolver):
+            scenario._macroscopic_up_to_date = False
+
+    # ---- results ----
+
+    def _arrays(self):
+        events = np.array(self._events, dtype=np.int64).reshape(-1, 4)
+        steps = np.array(self._steps, dtype=np.int64).reshape(-1, 2)
+        return events, steps
+
+    def step_times(self):
+        """Per step durations in seconds: dict phase -> array (steps,), including 'step' and `OVERHEAD`"""
+        events, steps = self._arrays()
+        step_of_event = np.searchsorted(steps[:, 0], events[:, 2], side='right') - 1
+        inside = (step_of_event >= 0) & (events[:, 3] <= steps[np.maximum(step_of_event, 0), 1])
+        durations = (events[:, 3] - events[:, 2]) * 1e-9
+        result = {'step': (steps[:, 1] - steps[:, 0]) * 1e-9}
+        accounted = np.zeros(len(steps))
+        for index, phase in enumerate(self._phases):
+            selected = inside & (events[:, 0] == index)
+            if np.any(selected):
+                per_step = np.bincount(step_of_event[selected], durations[selected], minlength=len(steps))
+                result[phase] = per_step
+                accounted += per_step
+        result[OVERHEAD] = np.maximum(result['step'] - accounted, 0.0)
+        return result
+
+    def call_times(self):
+        """Durations in seconds of the individual calls: dict (phase, label) -> array"""
+        events, _ = self._arrays()
+        result = {}
+        for (phase, label) in sorted(set(map(tuple, events[:, :2].tolist()))):
+            selected = (events[:, 0] == phase) & (events[:, 1] == label)
+            result[(self._phases[phase], self._labels[label])] = (events[selected, 3] - events[selected, 2]) * 1e-9
+        return result
+
+    def summary(self):
+        """Per phase: steps, total, mean, median, 95th percentile and maximum time per step, share of the step"""
+        times = self.step_times()
+        total = times['step'].sum()
+        rows = {}
+        for phase, values in times.items():
+            if not len(values):
+                continue
+            rows[phase] = {'steps': len(values), 'total': float(values.sum()), 'mean': float(values.mean()),
+                           'median': float(np.median(values)), 'p95': float(np.percentile(values, 95)),
+                           'max': float(values.max()),
+                           'share': float(values.sum() / total) if total else 0.0}
+        return rows
+
+    def histograms(self, bins=20):
+        """Histograms of the per-step phase times on logarithmic bins: dict phase -> (counts, edges in s)"""
+        result = {}
+        for phase, values in self.step_times().items():
+            values = values[values > 0]
+            if not len(values):
+                continue
+            low, high = values.min(), values.max()
+            edges = np.geomspace(low, high * 1.0001, bins + 1) if high > low else np.array([low, low * 1.0001])
+            result[phase] = np.histogram(values, edges)
+        return result
+
+    @staticmethod
+    def overhead_per_event(samples=10000):
+        """Estimated cost of recording one call in seconds (wrapper around an empty function)"""
+        profiler = StepProfiler()
+        empty = profiler.wrap('empty', lambda: None)
+        start = time.perf_counter()
+        for _ in range(samples):
+            empty()
+        recorded = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(samples):
+            (lambda: None)()
+        return max(recorded - (time.perf_counter() - start), 0.0) / samples
+
+    def report(self, histograms=False, width=40):
+        summary = self.summary()
+        if not summary:
+            return "no steps recorded"
+        lines = [f"{summary['step']['steps']} steps, {summary['step']['total']:.3f} s"
+                 f" ({summary['step']['mean'] * 1e3:.3f} ms per step)",
+                 f"{'phase':18s}{'mean [ms]':>11s}{'median':>10s}{'p95':>10s}{'max':>10s}{'share':>8s}"]
+        for phase, row in summary.items():
+            if phase == 'step':
+                continue
+            lines.append(f"{phase:18s}{row['mean'] * 1e3:11.4f}{row['median'] * 1e3:10.4f}{row['p95'] * 1e3:10.4f}"
+                         f"{row['max'] * 1e3:10.4f}{row['share'] * 100:7.1f}%")
+        calls = self.call_times()
+        if any(phase != label for phase, label in calls):
+            lines.append(f"{'call':30s}{'calls':>8s}{'mean [ms]':>11s}")
+            for (phase, label), values in calls.items():
+                lines.append(f"{phase + ' ' + label:30s}{len(values):8d}{values.mean() * 1e3:11.4f}")
+        if histograms:
+            for phase, (counts, edges) in self.histograms().items():
+                lines.append(f"\n{phase} per step")
+                for count, low, high in zip(counts, edges[:-1], edges[1:]):
+                    bar = '#' * int(round(count / counts.max() * width))
+                    lines.append(f"  {low * 1e3:9.4f} - {high * 1e3:9.4f} ms {count:7d} {bar}")
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        """Chrome trace events: one complete ('X') event per step and per recorded call"""
+        pid = os.getpid()
+        events, steps = self._arrays()
+        overhead = self.step_times()[OVERHEAD]
+        result = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'learn_lbmpy time loop'}}]
+        for i, (start, end) in enumerate(steps.tolist()):
+            result.append({'name': 'step', 'cat': 'step', 'ph': 'X', 'pid': pid, 'tid': 0,
+                           'ts': (start - self._t0) / 1e3, 'dur': (end - start) / 1e3,
+                           'args': {'step': i, 'python_overhead_us': overhead[i] * 1e6}})
+        for phase, label, start, end in events.tolist():
+            result.append({'name': self._labels[label], 'cat': self._phases[phase], 'ph': 'X', 'pid': pid,
+                           'tid': 0, 'ts': (start - self._t0) / 1e3, 'dur': (end - start) / 1e3})
+        return result
+
+    def save_trace(self, filename):
+        """Writes the records as Chrome trace / Perfetto JSON"""
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,410 @@
+"""
+Block-structured local grid refinement
+
+The cylinder of `04_cumulant_lbm` is resolved with `reference_length = 30` cells on a uniform grid,
+so resolving the boundary layer better means refining the whole channel. A `RefinedGrid` instead
+nests rectangular patches, each with half the cell size of its parent: level 0 covers the domain,
+level 1 a box around the obstacle and its wake, level 2 a smaller box around the obstacle, ...
+
+Every level is an ordinary `LatticeBoltzmannStep` on its own data handling with its own kernel
+(compiled for the fixed size of the level, which is markedly faster than one shared kernel for
+variable sizes). With acoustic scaling the lattice velocity is the same on all levels, and the
+coupling follows Dupuis & Chopard (2003):
+
+- relaxation times: tau_fine = 1/2 + 2 (tau_coarse - 1/2), i.e. the same physical viscosity
+- body forces: F_fine = F_coarse / 2, i.e. the same physical acceleration (F scales with dt^2 / dx)
+- sub-cycling: a level makes two time steps per step of its parent
+- coarse -> fine: the ghost layer of a fine level is interpolated (linearly in space, and between
+  the old and new parent state in time) from the parent PDFs. Equilibrium parts are kept, the
+  non-equilibrium part is scaled by (tau_fine - 1) / (2 (tau_coarse - 1)) since the PDFs are stored
+  after collision.
+- fine -> coarse: parent cells covered by the interior of a fine patch get the average of their
+  children, with the inverse scaling of the non-equilibrium part. During the run this is only done
+  in a band along the patch edge, which is all the coarse cells outside read; the whole patch is
+  restricted before output, so level 0 always shows the composite solution.
+
+Example:
+    grid = RefinedGrid((90, 30), boxes=[((0.2, 0.8), (0.2, 0.8)), ((0.25, 0.55), (0.28, 0.72))],
+                       lbm_config=LBMConfig(method=Method.CUMULANT, relaxation_rate=1.99, compressible=True))
+    grid.set_boundary(NoSlip('obstacle'), mask_callback=cylinder)     # on all levels, level-0 coordinates
+    grid.levels[0].boundary_handling.set_boundary(UBB((0.05, 0)), slice_from_direction('W', 2))
+    grid.initialize(velocity=(0.05, 0))
+    grid.run(1000)
+    print(grid.cell_count_report())
+"""
+
+import numpy as np
+import sympy as sp
+
+
+def _refined_relaxation_rate(omega, factor):
+    """Relaxation rate of a level whose cells are `factor` times smaller (acoustic scaling)"""
+    return 1 / (0.5 + factor * (1 / omega - 0.5))
+
+
+def _refined_force(lbm_config, factor):
+    """`force` and `force_model` arguments of `LBMConfig` for a level whose cells are `factor` times smaller
+    (acoustic scaling). A force model object keeps the force it was created with, so it is created anew."""
+    from lbmpy.forcemodels import AbstractForceModel
+
+    force = tuple(f / factor for f in lbm_config.force)
+    force_model = lbm_config.force_model
+    if isinstance(force_model, AbstractForceModel):
+        force_model = type(force_model)(force[:lbm_config.stencil.D])
+    return {'force': force, 'force_model': force_model}
+
+
+class _LevelCoupling:
+    """Precomputed index arrays coupling a fine level to its parent"""
+
+    def __init__(self, fine, parent, box_in_parent, band_width=2):
+        dim = fine.data_handling.dim
+        gl_f = fine.data_handling.ghost_layers_of_field(fine.pdf_array_name)
+        gl_p = parent.data_handling.ghost_layers_of_field(parent.pdf_array_name)
+        fine_shape = fine.data_handling.shape
+
+        # --- coarse -> fine: ghost cells of the fine level, linear interpolation from the parent
+        full_shape = tuple(s + 2 * gl_f for s in fine_shape)
+        ghost = np.ones(full_shape, dtype=bool)
+        ghost[(slice(gl_f, -gl_f),) * dim] = False
+        ghost_cells = np.argwhere(ghost)                                     # array indices
+        position = box_in_parent[:, 0] + (ghost_cells - gl_f + 0.5) / 2 - 0.5   # in parent cell-centre units
+        lower = np.floor(position).astype(np.int64)
+        weight = position - lower
+
+        self.ghost_index = tuple(ghost_cells.T)
+        corners, weights = [], []
+        for corner in np.ndindex(*(2,) * dim):
+            corner = np.array(corner)
+            corners.append(tuple((lower + corner + gl_p).T))
+            weights.append(np.prod(np.where(corner, weight, 1 - weight), axis=1))
+        self.corner_index = corners
+        self.corner_weight = [w[:, np.newaxis] for w in weights]
+
+        # --- fine -> coarse: parent cells covered by the fine interior, one cell away from the patch edge.
+        # Every step only a band of `band_width` cells along the edge is restricted - the coarse cells
+        # outside only read from there. The full restriction is done before output.
+        start, stop = box_in_parent[:, 0] + 1, box_in_parent[:, 1] - 1
+        parent_cells = np.stack(np.meshgrid(*[np.arange(a, b) for a, b in zip(start, stop)], indexing='ij'),
+                                axis=-1).reshape(-1, dim)
+        in_band = np.any((parent_cells < start + band_width) | (parent_cells >= stop - band_width), axis=1)
+        children = []
+        for child in np.ndindex(*(2,) * dim):
+            children.append(2 * (parent_cells - box_in_parent[:, 0]) + np.array(child) + gl_f)
+        children = np.stack(children, axis=1)                                # (cells, 2^dim, dim)
+
+        keep = self._fluid(parent, parent_cells + gl_p)
+        for c in range(children.shape[1]):
+            keep &= self._fluid(fine, children[:, c])
+
+        def restriction_indices(selection):
+            return (tuple((parent_cells[selection] + gl_p).T),
+                    [tuple(children[selection][:, c].T) for c in range(children.shape[1])])
+
+        self.band = restriction_indices(keep & in_band)
+        self.full = restriction_indices(keep)
+
+    @staticmethod
+    def _fluid(level, cells):
+        bh = level.boundary_handling
+        flags = level.data_handling.cpu_arrays[bh.flag_array_name]
+        return (flags[tuple(cells.T)] & bh.flag_interface.domain_flag) != 0
+
+    def to_device(self, xp):
+        convert = lambda index: tuple(xp.asarray(i) for i in index)  # noqa: E731
+        self.ghost_index = convert(self.ghost_index)
+        self.corner_index = [convert(c) for c in self.corner_index]
+        self.corner_weight = [xp.asarray(w) for w in self.corner_weight]
+        self.band = (convert(self.band[0]), [convert(c) for c in self.band[1]])
+        self.full = (convert(self.full[0]), [convert(c) for c in self.full[1]])
+
+
+class RefinedGrid:
+    """Hierarchy of nested, twice as fine `LatticeBoltzmannStep` patches with sub-cycling.
+
+    Args:
+        domain_size: number of level-0 cells
+        boxes: one box per refined level, each a sequence of (start, stop) per axis in level-0 cells
+               (integers, or floats relative to the domain size). Each box has to lie inside the box of
+               the previous level with a margin of at least two cells of that level, and may not touch the
+               domain boundary.
+        lbm_config: `LBMConfig`, its relaxation rate and force are those of level 0. Only the shear relaxation
+                    rate is rescaled, so it has to be given as `relaxation_rate`; the second rate of TRT
+                    follows from the magic parameter on every level.
+        periodicity: periodicity of level 0
+        config: `CreateKernelConfig`
+    """
+
+    def __init__(self, domain_size, boxes, lbm_config, periodicity=False, config=None):
+        from dataclasses import replace
+        from pystencils import CreateKernelConfig, create_data_handling
+        from lbmpy.lbstep import LatticeBoltzmannStep
+
+        if config is None:
+            config = CreateKernelConfig()
+        target = config.get_target()
+        self._gpu = target.is_gpu()
+        domain_size = tuple(domain_size)
+        dim = len(domain_size)
+        if isinstance(periodicity, bool):
+            periodicity = (periodicity,) * dim
+
+        omega_0 = lbm_config.relaxation_rate
+        if omega_0 is None:
+            raise ValueError(f"RefinedGrid rescales a single relaxation rate per level, set lbm_config.relaxation_rate "
+                             f"instead of relaxation_rates={lbm_config.relaxation_rates}")
+
+        self.boxes = []                   # in level-0 cells
+        self.levels = []
+        self.relaxation_rates = []
+        for k in range(len(boxes) + 1):
+            if k == 0:
+                shape = domain_size
+                box = np.array([[0, s] for s in domain_size])
+            else:
+                box = self._normalize_box(boxes[k - 1], domain_size, k)
+                self._check_nesting(box, self.boxes[-1], k)
+                shape = tuple(int((b - a) * 2 ** k) for a, b in box)
+            self.boxes.append(box)
+
+            omega = _refined_relaxation_rate(omega_0, 2 ** k)
+            dh = create_data_handling(shape, default_ghost_layers=1, periodicity=periodicity if k == 0 else False,
+                                      default_target=target, parallel=False)
+            level_config = replace(lbm_config, relaxation_rate=omega, **_refined_force(lbm_config, 2 ** k))
+            level = LatticeBoltzmannStep(data_handling=dh, lbm_config=level_config, config=config, name='lbm')
+            self.levels.append(level)
+            self.relaxation_rates.append(omega)
+
+        self.method = self.levels[0].method
+        self.time_steps_run = 0
+        self.name = 'refined'
+        self._couplings = None
+        self._compile_conversions()
+
+    # ----------------------------------------------- geometry -----------------------------------------------------
+
+    @staticmethod
+    def _normalize_box(box, domain_size, level):
+        resolution = 2 ** (level - 1)  # box edges have to be parent cell faces
+        result = []
+        for (start, stop), size in zip(box, domain_size):
+            if isinstance(start, float):
+                start = start * size
+            if isinstance(stop, float):
+                stop = stop * size
+            result.append((np.round(start * resolution) / resolution, np.round(stop * resolution) / resolution))
+        return np.array(result)
+
+    @staticmethod
+    def _check_nesting(box, parent_box, level):
+        margin = 2 / 2 ** (level - 1)
+        if np.any(box[:, 0] - parent_box[:, 0] < margin) or np.any(parent_box[:, 1] - box[:, 1] < margin):
+            raise ValueError(f"Box of level {level} {box.tolist()} has to lie inside the box of level {level - 1} "
+                             f"{parent_box.tolist()} with a margin of two level-{level - 1} cells")
+        if np.any(box[:, 1] <= box[:, 0]):
+            raise ValueError(f"Box of level {level} is empty: {box.tolist()}")
+
+    def level_coordinates(self, level, *level_0_coordinates):
+        """Converts level-0 coordinates to the cell coordinates of `level`"""
+        box = self.boxes[level]
+        return tuple((x - box[d, 0]) * 2 ** level for d, x in enumerate(level_0_coordinates))
+
+    def set_boundary(self, boundary_obj, mask_callback, levels=None):
+        """Sets `boundary_obj` on all (or the given) levels. `mask_callback` receives cell midpoints in
+        level-0 coordinates, so one callback describes the obstacle on every level."""
+        levels = range(len(self.levels)) if levels is None else levels
+        for k in levels:
+            box, factor = self.boxes[k], 2 ** k
+
+            def level_callback(*coordinates, box=box, factor=factor):
+                return mask_callback(*(box[d, 0] + x / factor for d, x in enumerate(coordinates)))
+
+            self.levels[k].boundary_handling.set_boundary(boundary_obj, mask_callback=level_callback)
+        self._couplings = None
+
+    # ----------------------------------------------- PDF conversion -----------------------------------------------
+
+    def _compile_conversions(self):
+        method = self.method
+        q, dim = len(method.stencil), method.dim
+        pdf_symbols = sp.symbols(f'f_:{q}')
+        rho, u = sp.Symbol('rho_out'), sp.symbols(f'u_out_:{dim}')
+        ac = method.conserved_quantity_computation.output_equations_from_pdfs(
+            pdf_symbols, {'density': rho, 'velocity': u}).new_without_subexpressions()
+        outputs = {a.lhs: a.rhs for a in ac.main_assignments}
+        self._macroscopic = sp.lambdify(pdf_symbols, [outputs[rho]] + [outputs[c] for c in u], 'numpy', cse=True)
+
+        # the equilibrium is a polynomial in (rho, delta_rho, u): evaluated as monomials @ coefficients,
+        # which costs a handful of array operations instead of one per term
+        cqc = method.conserved_quantity_computation
+        arguments = [cqc.density_symbol, cqc.density_deviation_symbol] + list(cqc.velocity_symbols)
+        terms = [sp.Poly(sp.expand(e), *arguments).terms() for e in method.get_equilibrium_terms()]
+        exponents = sorted({monomial for t in terms for monomial, _ in t})
+        row = {monomial: i for i, monomial in enumerate(exponents)}
+        coefficients = np.zeros((len(exponents), q))
+        for i, t in enumerate(terms):
+            for monomial, coefficient in t:
+                coefficients[row[monomial], i] = float(coefficient)
+        self._equilibrium_exponents = np.array(exponents)
+        self._equilibrium_coefficients = coefficients
+
+    def _rescale(self, pdfs, factor):
+        """feq + factor * (f - feq) for PDFs of shape (n, q)"""
+        xp = self._xp
+        rho, *u = self._macroscopic(*pdfs.T)
+        arguments = xp.stack([xp.broadcast_to(xp.asarray(a, dtype=pdfs.dtype), pdfs.shape[:1])
+                              for a in [rho, rho - 1] + u])
+        exponents = self._equilibrium_exponents
+        powers = [xp.ones_like(arguments)]
+        for _ in range(exponents.max()):
+            powers.append(powers[-1] * arguments)
+        powers = xp.stack(powers, axis=1)                                     # (argument, power, cell)
+        monomials = xp.prod(powers[np.arange(exponents.shape[1]), exponents], axis=1)   # (monomial, cell)
+        feq = monomials.T @ xp.asarray(self._equilibrium_coefficients)
+        return feq + factor * (pdfs - feq)
+
+    def _nonequilibrium_factor(self, k):
+        """Scaling of the post-collision non-equilibrium part from level k-1 to level k"""
+        tau_coarse, tau_fine = 1 / self.relaxation_rates[k - 1], 1 / self.relaxation_rates[k]
+        if abs(tau_coarse - 1) < 1e-12:
+            raise ValueError("The non-equilibrium rescaling is singular for relaxation rate 1 on a coarse level")
+        return (tau_fine - 1) / (2 * (tau_coarse - 1))
+
+    # ----------------------------------------------- time stepping ------------------------------------------------
+
+    @property
+    def _xp(self):
+        if self._gpu:
+            import cupy
+            return cupy
+        return np
+
+    def _arrays(self, level):
+        dh = level.data_handling
+        return dh.gpu_arrays if self._gpu else dh.cpu_arrays
+
+    def _setup_couplings(self):
+        self._couplings = [None]
+        for k in range(1, len(self.levels)):
+            box_in_parent = (self.boxes[k] - self.boxes[k - 1][:, :1]) * 2 ** (k - 1)
+            coupling = _LevelCoupling(self.levels[k], self.levels[k - 1], box_in_parent.astype(np.int64))
+            if self._gpu:
+                coupling.to_device(self._xp)
+            self._couplings.append(coupling)
+
+    def _gather_parent(self, k):
+        coupling = self._couplings[k]
+        pdfs = self._arrays(self.levels[k - 1])[self.levels[k - 1].pdf_array_name]
+        return sum(w * pdfs[index] for index, w in zip(coupling.corner_index, coupling.corner_weight))
+
+    def _fill_ghosts(self, k, parent_pdfs):
+        level = self.levels[k]
+        pdfs = self._arrays(level)[level.pdf_array_name]
+        pdfs[self._couplings[k].ghost_index] = self._rescale(parent_pdfs, self._nonequilibrium_factor(k))
+
+    def _restrict(self, k, full=False):
+        parent_index, children_index = self._couplings[k].full if full else self._couplings[k].band
+        fine = self._arrays(self.levels[k])[self.levels[k].pdf_array_name]
+        parent = self._arrays(self.levels[k - 1])[self.levels[k - 1].pdf_array_name]
+        average = sum(fine[c] for c in children_index) / len(children_index)
+        parent[parent_index] = self._rescale(average, 1 / self._nonequilibrium_factor(k))
+
+    def _advance(self, k):
+        level = self.levels[k]
+        refined = k + 1 < len(self.levels)
+        if refined:
+            old = self._gather_parent(k + 1)
+        level.time_step()
+        level.time_steps_run += 1
+        if refined:
+            new = self._gather_parent(k + 1)
+            self._fill_ghosts(k + 1, old)
+            self._advance(k + 1)
+            self._fill_ghosts(k + 1, (old + new) / 2)
+            self._advance(k + 1)
+            self._restrict(k + 1)
+
+    def pre_run(self):
+        if self._couplings is None:
+            self._setup_couplings()
+        for level in self.levels:
+            level.pre_run()
+
+    def post_run(self):
+        """Restricts the complete fine solutions to their parents and computes the macroscopic fields"""
+        for k in reversed(range(1, len(self.levels))):
+            self._restrict(k, full=True)
+        for level in self.levels:
+            level.post_run()
+
+    def time_step(self):
+        """One time step of level 0, i.e. 2^k steps of level k"""
+        self._advance(0)
+
+    def run(self, time_steps):
+        """Advances all levels by `time_steps` level-0 steps."""
+        self.pre_run()
+        for _ in range(time_steps):
+            self._advance(0)
+            self.time_steps_run += 1
+        self.post_run()
+
+    # ----------------------------------------------- setup and output ---------------------------------------------
+
+    def initialize(self, velocity=None, density=1.0):
+        """Equilibrium initialization of all levels.
+
+        `velocity` is a constant tuple or a callback getting level-0 cell midpoints and returning the
+        velocity components.
+        """
+        for k, level in enumerate(self.levels):
+            dh = level.data_handling
+            box, factor = self.boxes[k], 2 ** k
+            for b in dh.iterate(ghost_layers=True):
+                b[level.density_data_name].fill(density)
+                if velocity is None:
+                    b[level.velocity_data_name].fill(0.0)
+                elif callable(velocity):
+                    coordinates = [box[d, 0] + x / factor for d, x in enumerate(b.midpoint_arrays)]
+                    for d, component in enumerate(velocity(*coordinates)):
+                        b[level.velocity_data_name][..., d] = component
+                else:
+                    for d, component in enumerate(velocity):
+                        b[level.velocity_data_name][..., d] = component
+            level.set_pdf_fields_from_macroscopic_values()
+
+    @property
+    def domain_size(self):
+        return self.levels[0].data_handling.shape
+
+    def level_cells(self):
+        return [int(np.prod(level.data_handling.shape)) for level in self.levels]
+
+    @property
+    def number_of_cells(self):
+        """Cell updates per level-0 time step (level k is updated 2^k times), as used for MLUPS"""
+        return sum(cells * 2 ** k for k, cells in enumerate(self.level_cells()))
+
+    def cell_count_report(self):
+        """Cells and cell updates compared with a uniform grid at the resolution of the finest level"""
+        finest = len(self.levels) - 1
+        uniform_cells = int(np.prod(self.domain_size)) * 2 ** (finest * self.method.dim)
+        uniform_updates = uniform_cells * 2 ** finest
+        cells = sum(self.level_cells())
+        lines = [f"{'level':>5s} {'box (level-0 cells)':>30s} {'shape':>14s} {'cells':>10s} {'omega':>10s}"]
+        for k, level in enumerate(self.levels):
+            box = ' x '.join(f"[{a:g}, {b:g})" for a, b in self.boxes[k])
+            lines.append(f"{k:5d} {box:>30s} {str(level.data_handling.shape):>14s} {self.level_cells()[k]:10d} "
+                         f"{self.relaxation_rates[k]:10.6f}")
+        lines.append(f"refined: {cells} cells, {self.number_of_cells} cell updates per level-0 step")
+        lines.append(f"uniform at level {finest} resolution: {uniform_cells} cells, {uniform_updates} cell updates "
+                     f"-> {uniform_cells / cells:.1f}x fewer cells, {uniform_updates / self.number_of_cells:.1f}x "
+                     f"fewer updates")
+        return "\n".join(lines)
+
+    def velocity_slice(self, slice_obj=None, masked=True, level=0):
+        """Velocity of `level`; level 0 covers the whole domain and contains the restricted fine solution"""
+        return self.levels[level].velocity_slice(slice_obj, masked)
+
+    def density_slice(self, slice_obj=None, masked=True, level=0):
+        return self.levels[level].density_slice(slice_obj, masked)
@@ -0,0 +1,88 @@
+"""
+Scenario registry
+
+A scenario is a factory function that builds a ready-to-run lbmpy scenario object (usually a
+`LatticeBoltzmannStep`). Factories are registered under a name together with their default
+parameters, so they can be listed and created by name from Python or from the command line.
+
+Registering a factory does not import lbmpy - factories import what they need in their body.
+"""
+
+import importlib
+from dataclasses import dataclass, field
+
+# modules whose import registers the built-in scenarios
+_BUILTIN_MODULES = ('learn_lbmpy.scenarios',)
+
+_registry = {}
+_builtins_loaded = False
+
+
+@dataclass
+class ScenarioSpec:
+    """Registry entry of a single scenario."""
+    name: str
+    factory: callable
+    description: str = ''
+    defaults: dict = field(default_factory=dict)
+    tags: tuple = ()
+
+    def create(self, **params):
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise TypeError(f"Scenario '{self.name}' got unknown parameter(s) {sorted(unknown)}. "
+                            f"Valid parameters are {sorted(self.defaults)}")
+        kwargs = dict(self.defaults)
+        kwargs.update(params)
+        return self.factory(**kwargs)
+
+
+def register_scenario(name, description='', tags=(), **defaults):
+    """Decorator registering a scenario factory.
+
+    Args:
+        name: name used to look the scenario up, e.g. on the command line
+        description: one line description shown by `python -m learn_lbmpy list`
+        tags: free-form tags, e.g. ('2D', 'periodic')
+        defaults: default values of all parameters the factory accepts
+
+    Example:
+        @register_scenario('my_channel', description='force driven channel', domain_size=(300, 100))
+        def my_channel(domain_size):
+            ...
+    """
+    def decorator(factory):
+        if name in _registry and _registry[name].factory is not factory:
+            raise ValueError(f"A scenario named '{name}' is already registered")
+        doc = description or (factory.__doc__ or '').strip().split('\n')[0]
+        _registry[name] = ScenarioSpec(name, factory, doc, dict(defaults), tuple(tags))
+        return factory
+    return decorator
+
+
+def _load_builtins():
+    global _builtins_loaded
+    if not _builtins_loaded:
+        _builtins_loaded = True
+        for module in _BUILTIN_MODULES:
+            importlib.import_module(module)
+
+
+def get_scenario(name):
+    """Returns the `ScenarioSpec` registered under `name`."""
+    _load_builtins()
+    try:
+        return _registry[name]
+    except KeyError:
+        raise KeyError(f"Unknown scenario '{name}'. Available: {', '.join(sorted(_registry))}") from None
+
+
+def list_scenarios():
+    """Returns all registered `ScenarioSpec` objects sorted by name."""
+    _load_builtins()
+    return [_registry[n] for n in sorted(_registry)]
+
+
+def create_scenario(name, **params):
+    """Creates the scenario registered under `name`, overriding its defaults with `params`."""
+    return get_scenario(name).create(**params)
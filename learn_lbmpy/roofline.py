@@ -0,0 +1,240 @@
+"""
+Operation counts and roofline estimates of stream-collide kernels
+
+`03_defining_lbm_methods/01_lbm_method.py` shows SRT, MRT, central-moment and cumulant methods by their
+moments and relaxation rates, not by what they cost. For an `LBMConfig` the `Roofline` counts, per cell
+update of the generated stream-collide kernel,
+
+- the floating point operations of the update rule (additions, multiplications, divisions, square roots),
+- the loads and stores: distinct field accesses read on the right-hand sides, and written,
+- the bytes moved for them and the arithmetic intensity (operations per byte),
+
+and estimates the attainable throughput from two measured machine numbers: the memory bandwidth of
+copying an array larger than the caches (STREAM copy, bytes read plus bytes written) and the arithmetic
+throughput of a pystencils kernel with many independent multiply-adds per cell, compiled like the LB
+kernels. The estimate is
+
+    MLUPS = min(bandwidth / bytes per cell, peak / operations per cell)
+
+The copy has as many stores as loads, like a stream-collide kernel, so the write-allocate traffic of the
+stores is part of the measured bandwidth and not counted separately. The estimate is compared with
+the measured throughput of the kernel alone (no ghost layer synchronization, no boundaries). Divisions
+and square roots count as one operation but take longer, so kernels with many of them (cumulants) stay
+further below the estimate.
+
+Example:
+    roofline = Roofline()
+    for method in ('SRT', 'TRT', 'MRT', 'CUMULANT'):
+        roofline.evaluate(method, LBMConfig(stencil=LBStencil(Stencil.D3Q27), method=Method[method]))
+    print(roofline.report())
+
+From the command line: `python -m learn_lbmpy roofline SRT MRT CUMULANT:D3Q27 --size 128 128 128`.
+"""
+
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class KernelCost:
+    """Cost of one cell update, and the estimated and measured throughput in MLUPS"""
+    label: str
+    operations: dict
+    loads: int
+    stores: int
+    bytes_per_cell: int
+    memory_mlups: float = None
+    compute_mlups: float = None
+    measured_mlups: float = None
+    domain_size: tuple = field(default=None)
+
+    @property
+    def flops(self):
+        return sum(self.operations.values())
+
+    @property
+    def intensity(self):
+        """Operations per byte"""
+        return self.flops / self.bytes_per_cell
+
+    @property
+    def estimated_mlups(self):
+        if self.memory_mlups is None:
+            return None
+        return min(self.memory_mlups, self.compute_mlups)
+
+    @property
+    def bound(self):
+        if self.memory_mlups is None:
+            return None
+        return 'memory' if self.memory_mlups <= self.compute_mlups else 'compute'
+
+    def as_dict(self):
+        return {'label': self.label, 'operations': self.operations, 'flops': self.flops, 'loads': self.loads,
+                'stores': self.stores, 'bytes_per_cell': self.bytes_per_cell, 'intensity': self.intensity,
+                'memory_mlups': self.memory_mlups, 'compute_mlups': self.compute_mlups,
+                'estimated_mlups': self.estimated_mlups, 'bound': self.bound,
+                'measured_mlups': self.measured_mlups, 'domain_size': self.domain_size}
+
+
+def count_kernel_cost(update_rule, label='', itemsize=8):
+    """`KernelCost` of an update rule (an `AssignmentCollection` as passed to `create_kernel`)"""
+    from pystencils import Field
+
+    from learn_lbmpy.codegen_timing import _operation_count
+
+    operations = _operation_count(update_rule) or {}
+    written = {a.lhs for a in update_rule.main_assignments if isinstance(a.lhs, Field.Access)}
+    read = set()
+    for a in update_rule.all_assignments:
+        read.update(s for s in a.rhs.atoms(Field.Access))
+    return KernelCost(label, operations, len(read), len(written), itemsize * (len(read) + len(written)))
+
+
+def _best_time(function, repeats):
+    function()
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure_machine(array_bytes=256e6, repeats=5, config=None):
+    """Memory bandwidth (bytes/s) and arithmetic throughput (operations/s), see the module docstring.
+
+    Args:
+        array_bytes: size of each of the two arrays of the copy; larger than the last-level cache
+        repeats: the best of `repeats` runs is taken
+        config: pystencils `CreateKernelConfig` (CPU), e.g. with OpenMP
+    """
+    import pystencils as ps
+    import sympy as sp
+
+    from learn_lbmpy.codegen_timing import _operation_count
+
+    if config is None:
+        config = ps.CreateKernelConfig()
+
+    # STREAM copy: bytes read plus bytes written
+    values = int(array_bytes / 8)
+    src, dst = np.ones(values), np.zeros(values)
+    bandwidth = (src.nbytes + dst.nbytes) / _best_time(lambda: np.copyto(dst, src), repeats)
+
+    # 8 independent chains of 32 multiply-adds per cell on an array that stays in the L2 cache
+    x_array, y_array = np.full(32768, 0.5), np.zeros(32768)
+    x, y = ps.fields('x, y: double[1D]', x=x_array, y=y_array)
+    chains = 8
+    accumulators = [x.center + j for j in range(chains)]
+    assignments = []
+    for i in range(32):
+        symbols = sp.symbols(f"a_{i}_:{chains}")
+        assignments += [ps.Assignment(s, a * 0.999 + x.center) for s, a in zip(symbols, accumulators)]
+        accumulators = list(symbols)
+    assignments.append(ps.Assignment(y.center, sum(accumulators)))
+    operations = sum((_operation_count(assignments) or {}).values())
+    peak_kernel = ps.create_kernel(assignments, config=config).compile()
+
+    def peak_run():
+        for _ in range(20):
+            peak_kernel(x=x_array, y=y_array)
+
+    peak = 20 * operations * x_array.size / _best_time(peak_run, repeats)
+    del src, dst
+    return {'bandwidth': bandwidth, 'peak_flops': peak}
+
+
+def _pdf_data_handling(q, domain_size):
+    """Periodic data handling with the PDF arrays `src` and `dst` (SoA layout, like `LatticeBoltzmannStep`)"""
+    import pystencils as ps
+
+    dh = ps.create_data_handling(tuple(domain_size), periodicity=True, default_layout='fzyx')
+    for name in ('src', 'dst'):
+        dh.add_array(name, values_per_cell=q, dtype=np.float64)
+    return dh
+
+
+def measure_mlups(update_rule, data_handling, steps=10, repeats=3, config=None):
+    """MLUPS of the kernel of `update_rule` on the arrays of `data_handling`, without synchronization.
+
+    The update rule reads the field `src` and writes `dst` of the data handling; both are set to the fluid at rest.
+    """
+    import pystencils as ps
+
+    if config is None:
+        config = ps.CreateKernelConfig()
+    kernel = ps.create_kernel(update_rule, config=config).compile()
+    method = update_rule.method
+    rest = 0.0 if method.conserved_quantity_computation.zero_centered_pdfs else np.array(method.weights, dtype=float)
+    for name in ('src', 'dst'):
+        data_handling.cpu_arrays[name][...] = rest
+
+    def run():
+        for _ in range(steps):
+            data_handling.run_kernel(kernel)
+            data_handling.swap('src', 'dst')
+
+    return steps * int(np.prod(data_handling.shape)) / _best_time(run, repeats) * 1e-6
+
+
+class Roofline:
+    """Operation counts, roofline estimates and measured throughput of LB kernels, see the module docstring.
+
+    Args:
+        machine: dict with 'bandwidth' (bytes/s) and 'peak_flops' (operations/s); measured if None
+        config: pystencils `CreateKernelConfig` of the kernels (CPU)
+    """
+
+    def __init__(self, machine=None, config=None):
+        self.config = config
+        self.machine = machine if machine is not None else measure_machine(config=config)
+        self.kernels = []
+
+    def evaluate(self, label, lbm_config, domain_size=None, measure=True, steps=10, repeats=3):
+        """Counts the kernel of `lbm_config` and, if `measure`, runs it on `domain_size`.
+
+        The default domains, 128^3 and 2048^2, hold PDF arrays of 300 MB or more, larger than most caches.
+        """
+        from lbmpy import LBMOptimisation, create_lb_update_rule
+        from pystencils import fields
+
+        dim = lbm_config.stencil.D
+        q = lbm_config.stencil.Q
+        if domain_size is None:
+            domain_size = (128,) * 3 if dim == 3 else (2048, 2048)
+        if measure:
+            # fields of fixed size, as `LatticeBoltzmannStep` compiles its kernel for
+            dh = _pdf_data_handling(q, domain_size)
+            src, dst = dh.fields['src'], dh.fields['dst']
+        else:
+            src, dst = fields(f"src({q}), dst({q}): double[{dim}D]")
+        update_rule = create_lb_update_rule(
+            lbm_config=lbm_config, lbm_optimisation=LBMOptimisation(symbolic_field=src, symbolic_temporary_field=dst))
+        cost = count_kernel_cost(update_rule, label)
+        cost.memory_mlups = self.machine['bandwidth'] / cost.bytes_per_cell * 1e-6
+        cost.compute_mlups = self.machine['peak_flops'] / max(cost.flops, 1) * 1e-6
+        if measure:
+            cost.domain_size = tuple(domain_size)
+            cost.measured_mlups = measure_mlups(update_rule, dh, steps, repeats, self.config)
+        self.kernels.append(cost)
+        return cost
+
+    def report(self):
+        lines = [f"memory bandwidth {self.machine['bandwidth'] / 1e9:.1f} GB/s, "
+                 f"arithmetic throughput {self.machine['peak_flops'] / 1e9:.1f} GFLOP/s",
+                 f"{'kernel':22s}{'flops':>7s}{'div/sqrt':>9s}{'loads':>7s}{'stores':>7s}{'bytes':>7s}"
+                 f"{'flop/B':>8s}{'bound':>9s}{'estimate':>10s}{'measured':>10s}{'ratio':>7s}"]
+        for k in self.kernels:
+            slow = sum(v for key, v in k.operations.items() if 'div' in key or 'sqrt' in key)
+            measured = f"{k.measured_mlups:10.1f}{k.measured_mlups / k.estimated_mlups:7.0%}" \
+                if k.measured_mlups is not None else f"{'-':>10s}{'-':>7s}"
+            lines.append(f"{k.label:22s}{k.flops:7d}{slow:9d}{k.loads:7d}{k.stores:7d}{k.bytes_per_cell:7d}"
+                         f"{k.intensity:8.2f}{k.bound:>9s}{k.estimated_mlups:10.1f}{measured}")
+        lines.append("estimate and measured in MLUPS; ratio = measured / estimate")
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return {'machine': self.machine, 'kernels': [k.as_dict() for k in self.kernels]}
@@ -0,0 +1,513 @@
+"""
+Built-in scenarios
+
+Factory functions for the setups used throughout `tutorials/`. Factories return a
+`LatticeBoltzmannStep` (or an object with the same `run`/`velocity_slice` interface, such as
+`PeriodicEnsemble`) and import lbmpy only when they are called, so listing or looking up
+scenarios stays cheap.
+"""
+
+from learn_lbmpy.registry import register_scenario
+
+
+def _kernel_config(target=None, vectorize=False):
+    """Kernel configuration for `target`. `vectorize` (True for the best instruction set, or 'avx2', 'avx512')
+    requests explicit SIMD code on CPUs, see `learn_lbmpy.targets.vectorize_config`."""
+    from pystencils import CreateKernelConfig
+    from learn_lbmpy.targets import detect_target, vectorize_config
+
+    if target is None:
+        target = detect_target()
+    elif isinstance(target, str):
+        from pystencils import Target
+        target = Target.GPU if target.lower() == 'gpu' else Target.CPU
+    config = CreateKernelConfig(target=target)
+    if vectorize:
+        config = vectorize_config(config, 'best' if vectorize is True else vectorize)
+    return config
+
+
+def _prepared(solver, *boundary_handlings):
+    """Builds the boundary index lists of `solver` now, vectorized (see `learn_lbmpy.index_lists`)"""
+    from learn_lbmpy import index_lists
+    index_lists.prepare(*boundary_handlings)
+    return solver
+
+
+def _method(method):
+    from lbmpy import Method
+    return method if isinstance(method, Method) else Method[method.upper()]
+
+
+def _stencil(stencil):
+    from lbmpy import LBStencil, Stencil
+    return stencil if isinstance(stencil, LBStencil) else LBStencil(Stencil[stencil.upper()])
+
+
+def _set_obstacle(scenario, mask_callback, obstacle_forces):
+    """Sets `NoSlip("obstacle")`, or its force accumulating variant for `learn_lbmpy.forces.ForceEvaluator`"""
+    if obstacle_forces:
+        from learn_lbmpy.forces import MomentumExchangeNoSlip, attach_force_buffers
+        obstacle = MomentumExchangeNoSlip("obstacle")
+        attach_force_buffers(scenario, obstacle)
+    else:
+        from lbmpy.boundaries import NoSlip
+        obstacle = NoSlip("obstacle")
+    scenario.boundary_handling.set_boundary(obstacle, mask_callback=mask_callback)
+
+
+def shear_layer_velocity(width, height, velocity_magnitude=0.05, perturbation=0.1, seed=None):
+    """Initial velocity of the shear layer used in `01_hello_lbmpy/02_fully_periodic_flow.py`.
+
+    The fluid moves to the right everywhere except in a stripe in the middle, where it moves left.
+    A small random y component triggers the instability.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    init_vel = np.zeros((width, height, 2))
+    init_vel[:, :, 0] = velocity_magnitude
+    init_vel[:, height // 3: height // 3 * 2, 0] = -velocity_magnitude
+    init_vel[:, :, 1] = perturbation * velocity_magnitude * rng.random((width, height))
+    return init_vel
+
+
+@register_scenario('lid_driven_cavity', description='2D/3D lid-driven cavity (00_lbmpy_overview, 01_hello_lbmpy)',
+                   tags=('2D', '3D', 'walls'),
+                   domain_size=(100, 100), method='SRT', relaxation_rate=1.6, lid_velocity=0.005,
+                   target=None, vectorize=False)
+def lid_driven_cavity(domain_size, method, relaxation_rate, lid_velocity, target, vectorize):
+    from lbmpy import LBMConfig
+    from lbmpy.scenarios import create_lid_driven_cavity
+
+    lbm_config = LBMConfig(method=_method(method), relaxation_rate=relaxation_rate)
+    return create_lid_driven_cavity(domain_size=tuple(domain_size), lid_velocity=lid_velocity,
+                                    lbm_config=lbm_config, config=_kernel_config(target, vectorize))
+
+
+@register_scenario('shear_layer', description='fully periodic shear layer (01_hello_lbmpy/02_fully_periodic_flow)',
+                   tags=('2D', 'periodic'),
+                   width=200, height=60, velocity_magnitude=0.05, method='SRT', relaxation_rate=1.97,
+                   compressible=False, seed=None, target=None, vectorize=False)
+def shear_layer(width, height, velocity_magnitude, method, relaxation_rate, compressible, seed, target, vectorize):
+    from lbmpy import LBMConfig
+    from lbmpy.scenarios import create_fully_periodic_flow
+
+    init_vel = shear_layer_velocity(width, height, velocity_magnitude, seed=seed)
+    lbm_config = LBMConfig(method=_method(method), relaxation_rate=relaxation_rate, compressible=compressible)
+    return create_fully_periodic_flow(initial_velocity=init_vel, lbm_config=lbm_config,
+                                      config=_kernel_config(target, vectorize))
+
+
+def taylor_green_fields(domain_size, velocity_magnitude, viscosity=0.0, time=0):
+    """Velocity (nx, ny, 2) and density (nx, ny) of the decaying 2D Taylor-Green vortex at the cell centres.
+
+    u = U sin(kx x) cos(ky y) e^(-nu (kx^2 + ky^2) t), v = -U kx/ky cos(kx x) sin(ky y) e^(...), with one period
+    per domain length. The density carries the pressure p = -U^2/4 (cos 2kx x + (kx/ky)^2 cos 2ky y) e^(2 ...).
+    """
+    import numpy as np
+
+    kx, ky = (2 * np.pi / n for n in domain_size)
+    x, y = np.meshgrid(*(np.arange(n) + 0.5 for n in domain_size), indexing='ij')
+    decay = np.exp(-viscosity * (kx ** 2 + ky ** 2) * time)
+    velocity = np.empty(tuple(domain_size) + (2,))
+    velocity[..., 0] = velocity_magnitude * np.sin(kx * x) * np.cos(ky * y) * decay
+    velocity[..., 1] = -velocity_magnitude * kx / ky * np.cos(kx * x) * np.sin(ky * y) * decay
+    pressure = -velocity_magnitude ** 2 / 4 * (np.cos(2 * kx * x) + (kx / ky) ** 2 * np.cos(2 * ky * y)) * decay ** 2
+    return velocity, 1 + 3 * pressure
+
+
+@register_scenario('taylor_green', description='decaying 2D Taylor-Green vortex in a fully periodic box',
+                   tags=('2D', 'periodic'),
+                   domain_size=(64, 64), velocity_magnitude=0.02, method='SRT', relaxation_rate=1.6,
+                   compressible=False, target=None, vectorize=False)
+def taylor_green(domain_size, velocity_magnitude, method, relaxation_rate, compressible, target, vectorize):
+    from lbmpy import LBMConfig
+    from lbmpy.scenarios import create_fully_periodic_flow
+
+    velocity, density = taylor_green_fields(tuple(domain_size), velocity_magnitude)
+    lbm_config = LBMConfig(method=_method(method), relaxation_rate=relaxation_rate, compressible=compressible)
+    scenario = create_fully_periodic_flow(initial_velocity=velocity, lbm_config=lbm_config,
+                                          config=_kernel_config(target, vectorize))
+    for b in scenario.data_handling.iterate(ghost_layers=False):
+        b[scenario.density_data_name][...] = density[b.global_slice]
+    scenario.set_pdf_fields_from_macroscopic_values()
+    return scenario
+
+
+@register_scenario('channel', description='force driven 2D channel, optional sphere (01_hello_lbmpy/04_channel_flow)',
+                   tags=('2D', 'walls', 'force'),
+                   domain_size=(300, 100), force=1e-7, initial_velocity=(0.025, 0), relaxation_rate=1.97,
+                   obstacle_radius=0, obstacle_forces=False, target=None, vectorize=False)
+def channel(domain_size, force, initial_velocity, relaxation_rate, obstacle_radius, obstacle_forces, target, vectorize):
+    from lbmpy import LBMConfig
+    from lbmpy.scenarios import create_channel
+
+    lbm_config = LBMConfig(relaxation_rate=relaxation_rate)
+    scenario = create_channel(domain_size=tuple(domain_size), force=force, initial_velocity=tuple(initial_velocity),
+                              lbm_config=lbm_config, config=_kernel_config(target, vectorize))
+    if obstacle_radius:
+        mid = (0.5 * domain_size[0], 0.5 * domain_size[1])
+
+        def set_sphere(x, y):
+            return (x - mid[0]) ** 2 + (y - mid[1]) ** 2 < obstacle_radius ** 2
+
+        _set_obstacle(scenario, set_sphere, obstacle_forces)
+    return scenario
+
+
+@register_scenario('pipe', description='periodic 3D pipe driven by a body force (02_geom_and_bcs/01_geometry)',
+                   tags=('3D', 'periodic', 'force'),
+                   domain_size=(64, 16, 16), stencil='D3Q27', method='SRT', relaxation_rate=1.9, force=1e-6,
+                   target=None, vectorize=False)
+def pipe(domain_size, stencil, method, relaxation_rate, force, target, vectorize):
+    from lbmpy import LBMConfig
+    from lbmpy.boundaries import NoSlip
+    from lbmpy.lbstep import LatticeBoltzmannStep
+
+    domain_size = tuple(domain_size)
+    radius = domain_size[1] / 2
+
+    def pipe_geometry_callback(x, y, z):
+        return (y - domain_size[1] / 2) ** 2 + (z - domain_size[2] / 2) ** 2 > radius ** 2
+
+    lbm_config = LBMConfig(stencil=_stencil(stencil), method=_method(method), relaxation_rate=relaxation_rate,
+                           force=(force, 0, 0))
+    scenario = LatticeBoltzmannStep(domain_size=domain_size, periodicity=(True, False, False),
+                                    lbm_config=lbm_config, config=_kernel_config(target, vectorize))
+    scenario.boundary_handling.set_boundary(NoSlip("wall"), mask_callback=pipe_geometry_callback)
+    return scenario
+
+
+@register_scenario('mesh_obstacle', description='periodic 3D flow past a triangle mesh read from an STL file',
+                   tags=('3D', 'periodic', 'force', 'obstacle'),
+                   mesh=None, domain_size=(96, 48, 48), obstacle_size=16, stencil='D3Q19', method='SRT',
+                   relaxation_rate=1.9, force=1e-6, interpolated=False, target=None, vectorize=False)
+def mesh_obstacle(mesh, domain_size, stencil, method, relaxation_rate, force, obstacle_size, interpolated,
+                  target, vectorize):
+    """The mesh (STL file name or triangles, default a sphere) is scaled to `obstacle_size` cells and placed
+    at a third of the domain length. `interpolated=True` uses `NoSlipLinearBouzidi` with wall distances
+    computed from the mesh instead of simple bounce-back (see `learn_lbmpy.voxelizer`)."""
+    from lbmpy import LBMConfig
+    from lbmpy.boundaries import NoSlip, NoSlipLinearBouzidi
+    from lbmpy.lbstep import LatticeBoltzmannStep
+    from learn_lbmpy import index_lists
+    from learn_lbmpy.voxelizer import place, sphere_mesh, voxelize
+
+    domain_size = tuple(domain_size)
+    if mesh is None:
+        mesh = sphere_mesh(subdivisions=4)
+    centre = (domain_size[0] / 3, domain_size[1] / 2, domain_size[2] / 2)
+    origin, spacing = place(mesh, obstacle_size, centre)
+    geometry = voxelize(mesh, domain_size, origin, spacing)
+
+    lbm_config = LBMConfig(stencil=_stencil(stencil), method=_method(method), relaxation_rate=relaxation_rate,
+                           force=(force, 0, 0))
+    scenario = LatticeBoltzmannStep(domain_size=domain_size, periodicity=True,
+                                    lbm_config=lbm_config, config=_kernel_config(target, vectorize))
+    if interpolated:
+        obstacle = NoSlipLinearBouzidi("obstacle", init_wall_distance=geometry.wall_distance_callback)
+    else:
+        obstacle = NoSlip("obstacle")
+    scenario.boundary_handling.set_boundary(obstacle, mask_callback=geometry.mask_callback)
+    index_lists.prepare(scenario.boundary_handling)
+    return scenario
+
+
+@register_scenario('porous_media', description='body-force driven flow through a random sphere packing',
+                   tags=('3D', 'periodic', 'force', 'porous'),
+                   domain_size=(64, 64, 64), porosity=0.4, sphere_radius=6, overlap=True, seed=0, stencil='D3Q19',
+                   method='TRT', relaxation_rate=1.0, force=1e-6, dtype='float64', target=None, vectorize=False)
+def porous_media(domain_size, porosity, sphere_radius, overlap, seed, stencil, method, relaxation_rate, force, dtype,
+                 target, vectorize):
+    """Fully periodic box with a `random_sphere_packing` as `NoSlip("solid")`, driven along x like the pipe
+    of `02_geom_and_bcs`. With TRT the second relaxation rate follows from the magic parameter 3/16, which
+    places the bounce-back wall half-way between the cells independently of the viscosity.
+    `dtype='float32'` halves the memory (D3Q19 at 256^3: 2.6 GB of PDFs instead of 5.1 GB).
+    The packing is stored in `scenario.packing` for `learn_lbmpy.porous.PermeabilityRun`."""
+    import numpy as np
+    import sympy as sp
+    from lbmpy import LBMConfig
+    from lbmpy.boundaries import NoSlip
+    from lbmpy.lbstep import LatticeBoltzmannStep
+    from lbmpy.relaxationrates import relaxation_rate_from_magic_number
+    from learn_lbmpy import index_lists
+    from learn_lbmpy.porous import random_sphere_packing
+
+    domain_size = tuple(domain_size)
+    solid, centres, radii = random_sphere_packing(domain_size, porosity, sphere_radius, overlap=overlap, seed=seed)
+
+    method = _method(method)
+    if method.name == 'TRT':
+        rates = dict(relaxation_rates=[relaxation_rate,
+                                       relaxation_rate_from_magic_number(relaxation_rate, sp.Rational(3, 16))])
+    else:
+        rates = dict(relaxation_rate=relaxation_rate)
+    force_vector = tuple(force if d == 0 else 0 for d in range(len(domain_size)))
+    lbm_config = LBMConfig(stencil=_stencil(stencil), method=method, force=force_vector, **rates)
+    config = _kernel_config(target, vectorize)
+    config.default_dtype = dtype
+    scenario = LatticeBoltzmannStep(domain_size=domain_size, periodicity=True, lbm_config=lbm_config, config=config)
+
+    def packing_callback(*midpoints):
+        index = tuple(np.floor(m).astype(np.int64) % n for m, n in zip(midpoints, domain_size))
+        return solid[index]
+
+    scenario.boundary_handling.set_boundary(NoSlip("solid"), mask_callback=packing_callback)
+    scenario.packing = {'centres': centres, 'radii': radii, 'porosity': 1 - float(solid.mean())}
+    index_lists.prepare(scenario.boundary_handling)
+    return scenario
+
+
+@register_scenario('cylinder', description='high-Re flow around a cylinder (04_cumulant_lbm/01_cumulant_lbm)',
+                   tags=('2D', 'inflow', 'obstacle'),
+                   reference_length=30, maximal_velocity=0.05, reynolds_number=100000, method='CUMULANT',
+                   obstacle_forces=False, target=None, vectorize=False)
+def cylinder(reference_length, maximal_velocity, reynolds_number, method, obstacle_forces, target, vectorize):
+    from lbmpy import LBMConfig, LBStencil, Stencil
+    from lbmpy.boundaries import UBB, ExtrapolationOutflow, NoSlip
+    from lbmpy.lbstep import LatticeBoltzmannStep
+    from lbmpy.relaxationrates import relaxation_rate_from_lattice_viscosity
+    from pystencils.slicing import slice_from_direction
+
+    kinematic_viscosity = (reference_length * maximal_velocity) / reynolds_number
+    omega = relaxation_rate_from_lattice_viscosity(kinematic_viscosity)
+    initial_velocity = (maximal_velocity, 0)
+
+    stencil = LBStencil(Stencil.D2Q9)
+    domain_size = (reference_length * 12, reference_length * 4)
+    dim = len(domain_size)
+
+    lbm_config = LBMConfig(stencil=stencil, method=_method(method), relaxation_rate=omega, compressible=True)
+    scenario = LatticeBoltzmannStep(domain_size=domain_size, periodicity=(False, False),
+                                    lbm_config=lbm_config, config=_kernel_config(target, vectorize))
+
+    mid = (domain_size[0] // 3, domain_size[1] // 2)
+    radius = reference_length // 2
+
+    def set_sphere(x, y, *_):
+        return (x - mid[0]) ** 2 + (y - mid[1]) ** 2 < radius ** 2
+
+    bh = scenario.boundary_handling
+    bh.set_boundary(UBB(initial_velocity), slice_from_direction('W', dim))
+    bh.set_boundary(ExtrapolationOutflow(stencil[4], scenario.method), slice_from_direction('E', dim))
+    for direction in ('N', 'S'):
+        bh.set_boundary(NoSlip("wall"), slice_from_direction(direction, dim))
+    _set_obstacle(scenario, set_sphere, obstacle_forces)
+
+    dh = scenario.data_handling
+    for b in dh.iterate(ghost_layers=True):
+        b[scenario.velocity_data_name][..., 0] = maximal_velocity
+    scenario.set_pdf_fields_from_macroscopic_values()
+    return scenario
+
+
+_CYLINDER_REFINEMENT_BOXES = {
+    1: [],
+    2: [((0.2, 0.8), (0.2, 0.8))],
+    3: [((0.2, 0.8), (0.2, 0.8)), ((0.25, 0.55), (0.28, 0.72))],
+}
+
+
+@register_scenario('cylinder_refined', description='cylinder with nested refined patches around body and wake',
+                   tags=('2D', 'inflow', 'obstacle', 'refinement'),
+                   reference_length=30, levels=3, maximal_velocity=0.05, reynolds_number=100000, method='CUMULANT',
+                   boxes=None, target=None)
+def cylinder_refined(reference_length, levels, maximal_velocity, reynolds_number, method, boxes, target):
+    """`cylinder` with the same resolution of the body (`reference_length` cells of the finest level),
+    but the fine cells only in `boxes` (default: wake box and body box, see `learn_lbmpy.refinement`)."""
+    from lbmpy import LBMConfig, LBStencil, Stencil
+    from lbmpy.boundaries import UBB, ExtrapolationOutflow, NoSlip
+    from lbmpy.relaxationrates import relaxation_rate_from_lattice_viscosity
+    from pystencils.slicing import slice_from_direction
+    from learn_lbmpy.refinement import RefinedGrid
+
+    if boxes is None:
+        if levels not in _CYLINDER_REFINEMENT_BOXES:
+            raise ValueError(f"No default boxes for {levels} levels, pass boxes=[...]")
+        boxes = _CYLINDER_REFINEMENT_BOXES[levels]
+    levels = len(boxes) + 1
+    coarsening = 2 ** (levels - 1)
+    if (reference_length * 4) % coarsening:
+        raise ValueError(f"4 * reference_length has to be divisible by {coarsening} for {levels} levels")
+
+    # viscosity of the finest level, level 0 is derived from it
+    kinematic_viscosity = (reference_length * maximal_velocity) / reynolds_number
+    omega_finest = relaxation_rate_from_lattice_viscosity(kinematic_viscosity)
+    omega = 1 / (0.5 + (1 / omega_finest - 0.5) * coarsening)
+
+    stencil = LBStencil(Stencil.D2Q9)
+    domain_size = (reference_length * 12 // coarsening, reference_length * 4 // coarsening)
+    dim = len(domain_size)
+    lbm_config = LBMConfig(stencil=stencil, method=_method(method), relaxation_rate=omega, compressible=True)
+    grid = RefinedGrid(domain_size, boxes, lbm_config=lbm_config, config=_kernel_config(target))
+
+    mid = ((reference_length * 12 // 3) / coarsening, (reference_length * 4 // 2) / coarsening)
+    radius = (reference_length // 2) / coarsening
+
+    def set_sphere(x, y, *_):
+        return (x - mid[0]) ** 2 + (y - mid[1]) ** 2 < radius ** 2
+
+    bh = grid.levels[0].boundary_handling
+    bh.set_boundary(UBB((maximal_velocity, 0)), slice_from_direction('W', dim))
+    bh.set_boundary(ExtrapolationOutflow(stencil[4], grid.method), slice_from_direction('E', dim))
+    for direction in ('N', 'S'):
+        bh.set_boundary(NoSlip("wall"), slice_from_direction(direction, dim))
+    grid.set_boundary(NoSlip("obstacle"), mask_callback=set_sphere)
+    grid.initialize(velocity=(maximal_velocity, 0))
+    return grid
+
+
+@register_scenario('shear_layer_ensemble', description='N randomly perturbed shear layers advanced as one batch',
+                   tags=('2D', 'periodic', 'ensemble'),
+                   members=16, width=100, height=100, velocity_magnitude=0.05, method='SRT', relaxation_rate=1.97,
+                   compressible=False, seed=0, target=None)
+def shear_layer_ensemble(members, width, height, velocity_magnitude, method, relaxation_rate, compressible, seed,
+                         target):
+    from lbmpy import LBMConfig
+    from learn_lbmpy.ensemble import PeriodicEnsemble
+
+    velocities = [shear_layer_velocity(width, height, velocity_magnitude, seed=seed + m) for m in range(members)]
+    lbm_config = LBMConfig(method=_method(method), relaxation_rate=relaxation_rate, compressible=compressible)
+    return PeriodicEnsemble(velocities, lbm_config=lbm_config, config=_kernel_config(target))
+
+
+@register_scenario('rayleigh_benard', description='Rayleigh-Benard convection, hot bottom and cold top wall (thermal)',
+                   tags=('2D', '3D', 'thermal', 'walls'),
+                   domain_size=(128, 64), rayleigh_number=5000, prandtl_number=0.71, method='SRT', fused=True,
+                   velocity_scale=0.05, seed=0, target=None)
+def rayleigh_benard(domain_size, rayleigh_number, prandtl_number, method, fused, velocity_scale, seed, target):
+    from learn_lbmpy.thermal import ThermalConvection
+
+    dim = len(domain_size)
+    hot, cold = ('S', 'N') if dim == 2 else ('B', 'T')
+    solver = ThermalConvection(tuple(domain_size), rayleigh_number, prandtl_number, hot_wall=hot, cold_wall=cold,
+                               fused=fused, method=method, velocity_scale=velocity_scale, seed=seed,
+                               config=_kernel_config(target), name='rayleigh_benard')
+    return _prepared(solver, solver.boundary_handling, solver.thermal_boundary_handling)
+
+
+@register_scenario('heated_cavity', description='differentially heated cavity, hot left and cold right wall (thermal)',
+                   tags=('2D', '3D', 'thermal', 'walls'),
+                   domain_size=(64, 64), rayleigh_number=1e4, prandtl_number=0.71, method='SRT', fused=True,
+                   velocity_scale=0.05, target=None)
+def heated_cavity(domain_size, rayleigh_number, prandtl_number, method, fused, velocity_scale, target):
+    from learn_lbmpy.thermal import ThermalConvection
+
+    adiabatic = ('S', 'N') if len(domain_size) == 2 else ('S', 'N', 'B', 'T')
+    solver = ThermalConvection(tuple(domain_size), rayleigh_number, prandtl_number, hot_wall='W', cold_wall='E',
+                               adiabatic_walls=adiabatic, fused=fused, method=method, velocity_scale=velocity_scale,
+                               perturbation=0.0, config=_kernel_config(target), name='heated_cavity')
+    return _prepared(solver, solver.boundary_handling, solver.thermal_boundary_handling)
+
+
+def _multiphase(domain_size, radius, interaction_strength, bubble=False, wall=None, **kwargs):
+    from learn_lbmpy.multiphase import PseudopotentialMultiphase, coexistence_densities, droplet_density
+
+    liquid, vapour = coexistence_densities(interaction_strength)
+    density = droplet_density(tuple(domain_size), radius=radius, liquid=liquid, vapour=vapour, width=4.0,
+                              bubble=bubble, wall=wall)
+    solver = PseudopotentialMultiphase(density, interaction_strength=interaction_strength, **kwargs)
+    return _prepared(solver, solver.boundary_handling)
+
+
+@register_scenario('droplet', description='Shan-Chen liquid droplet in its vapour, fully periodic (multiphase)',
+                   tags=('2D', '3D', 'multiphase', 'periodic'),
+                   domain_size=(100, 100), radius=20, interaction_strength=-5.0, method='SRT', fused=True, target=None)
+def droplet(domain_size, radius, interaction_strength, method, fused, target):
+    return _multiphase(domain_size, radius, interaction_strength, method=method, fused=fused,
+                       config=_kernel_config(target), name='droplet')
+
+
+@register_scenario('bubble', description='Shan-Chen vapour bubble in its liquid, fully periodic (multiphase)',
+                   tags=('2D', '3D', 'multiphase', 'periodic'),
+                   domain_size=(100, 100), radius=25, interaction_strength=-5.0, method='SRT', fused=True, target=None)
+def bubble(domain_size, radius, interaction_strength, method, fused, target):
+    return _multiphase(domain_size, radius, interaction_strength, bubble=True, method=method, fused=fused,
+                       config=_kernel_config(target), name='bubble')
+
+
+@register_scenario('sessile_droplet', description='Shan-Chen droplet on a wall with a contact angle (multiphase)',
+                   tags=('2D', '3D', 'multiphase', 'walls'),
+                   domain_size=(160, 80), radius=25, interaction_strength=-5.0, wall_density=0.5, method='SRT',
+                   fused=True, target=None)
+def sessile_droplet(domain_size, radius, interaction_strength, wall_density, method, fused, target):
+    walls = ('S', 'N') if len(domain_size) == 2 else ('B', 'T')
+    return _multiphase(domain_size, radius, interaction_strength, wall=walls[0], walls=walls,
+                       wall_density=wall_density, method=method, fused=fused, config=_kernel_config(target),
+                       name='sessile_droplet')
+
+
+@register_scenario('nonnewtonian_channel', description='force driven channel of a power-law, Carreau or Bingham fluid',
+                   tags=('2D', '3D', 'walls', 'force', 'nonnewtonian'),
+                   domain_size=(8, 64), model='power_law', force=None, method='MRT', iterations=3, target=None)
+def nonnewtonian_channel(domain_size, model, force, method, iterations, target):
+    from dataclasses import replace
+    from lbmpy import LBMConfig
+    from lbmpy.scenarios import create_channel
+    from learn_lbmpy.nonnewtonian import CHANNEL_MODELS, non_newtonian_collision_rule
+
+    if isinstance(model, str):
+        model, default_force = CHANNEL_MODELS[model]
+        force = default_force if force is None else force
+    if force is None:
+        raise ValueError("nonnewtonian_channel needs a force for a custom viscosity model")
+    dim = len(domain_size)
+    lbm_config = LBMConfig(stencil=_stencil('D2Q9' if dim == 2 else 'D3Q19'), method=_method(method),
+                           relaxation_rate=1.0, force=(force,) + (0,) * (dim - 1))
+    collision_rule = non_newtonian_collision_rule(lbm_config, model, iterations)
+    scenario = create_channel(domain_size=tuple(domain_size), force=force, duct=True,
+                              lbm_config=replace(lbm_config, collision_rule=collision_rule),
+                              config=_kernel_config(target))
+    scenario.viscosity_model, scenario.force = model, force
+    return scenario
+
+
+@register_scenario('smagorinsky_channel', description='LES of a force driven channel with a cylinder, Smagorinsky '
+                   'model and in-kernel statistics (turbulence/06_smagorinsky)', tags=('2D', 'walls', 'force', 'les'),
+                   domain_size=(300, 100), force=1e-6, relaxation_rate=1.999, smagorinsky_constant=0.12,
+                   obstacle_radius=10, statistics=True, target=None)
+def smagorinsky_channel(domain_size, force, relaxation_rate, smagorinsky_constant, obstacle_radius, statistics,
+                        target):
+    from dataclasses import replace
+    from lbmpy import ForceModel, LBMConfig, Method, create_lb_collision_rule
+    from lbmpy.enums import SubgridScaleModel
+    from lbmpy.scenarios import create_channel
+    from pystencils import create_data_handling
+
+    config = _kernel_config(target)
+    dh = create_data_handling(tuple(domain_size), periodicity=(True, False), default_target=config.target)
+    lbm_config = LBMConfig(stencil=_stencil('D2Q9'), method=Method.MRT, force=(force, 0),
+                           force_model=ForceModel.LUO, relaxation_rates=[relaxation_rate, 1.9, 1.9, 1.9],
+                           subgrid_scale_model=(SubgridScaleModel.SMAGORINSKY, smagorinsky_constant))
+    kernel_params = {}
+    if statistics:
+        from learn_lbmpy.turbulence_statistics import WEIGHT, add_running_statistics, add_statistics_arrays
+        collision_rule = create_lb_collision_rule(lbm_config=lbm_config)
+        collision_rule = add_running_statistics(collision_rule, *add_statistics_arrays(dh))
+        lbm_config = replace(lbm_config, collision_rule=collision_rule)
+        kernel_params[WEIGHT] = 0.0
+    scenario = create_channel(force=force, data_handling=dh, lbm_config=lbm_config, config=config,
+                              kernel_params=kernel_params)
+    if obstacle_radius:
+        mid = (domain_size[0] // 5, domain_size[1] // 2)
+
+        def set_sphere(x, y):
+            return (x - mid[0]) ** 2 + (y - mid[1]) ** 2 < obstacle_radius ** 2
+
+        _set_obstacle(scenario, set_sphere, False)
+    return scenario
+
+
+@register_scenario('thermocapillary_layer', description='Marangoni flow in a layer heated periodically from below '
+                   '(multi-rate coupling)', tags=('2D', '3D', 'thermal', 'walls', 'multirate'),
+                   domain_size=(128, 32), viscosity=0.1, prandtl_number=1.0, surface_tension_gradient=1e-4,
+                   thermal_every=4, method='SRT', target=None)
+def thermocapillary_layer(domain_size, viscosity, prandtl_number, surface_tension_gradient, thermal_every, method,
+                          target):
+    from learn_lbmpy.thermocapillary import ThermocapillaryLayer
+
+    solver = ThermocapillaryLayer(tuple(domain_size), viscosity, prandtl_number, surface_tension_gradient,
+                                  thermal_every=thermal_every, method=method, config=_kernel_config(target),
+                                  name='thermocapillary_layer')
+    return _prepared(solver, solver.boundary_handling, solver.thermal_boundary_handling)
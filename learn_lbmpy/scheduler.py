@@ -0,0 +1,269 @@
+"""
+Multi-rate scheduling of coupled physics modules
+
+A coupled problem (flow, temperature, interface forces, ...) is advanced by several kernels that read and write
+a few arrays each. `ThermalConvection` runs all of them every time step and synchronizes the ghost layers of all
+PDF arrays before. `MultiRateScheduler` takes one task per physics module instead, each with its own rate:
+
+- `every=n`: the task runs every n-th time step (super-cycling), for slowly varying fields. The module itself has
+  to advance by n time steps per call, e.g. a thermal LB solver with n times the diffusivity and velocity.
+- `substeps=k`: the task runs k times per time step (sub-cycling), for fast or stiff fields.
+
+The order of the tasks within a time step follows from the declared data: a task that reads an array runs after
+the tasks that write it. Cyclic couplings (flow -> temperature -> surface force -> flow) are broken in the order
+the tasks were added; the first task of the cycle reads the values of the previous step. Ghost layers are
+synchronized only before a task that reads an array with neighbour access (`ghost_layers`) and only if the array
+was written since its last synchronization. The arrays of one task are synchronized in a single call.
+
+The schedule is built once for a cycle of 2 lcm(every) time steps. Like in `LatticeBoltzmannStep.get_time_loop`
+the kernels get their arrays bound while building and the source and destination arrays are swapped at build
+time, so running the schedule is a loop over pre-bound calls.
+
+Example:
+    scheduler = MultiRateScheduler(dh)
+    scheduler.add('flow', [flow_boundaries, flow_kernel], ghost_layers=['pdfs'], reads=['force'],
+                  writes=['pdfs', 'velocity'], swaps=[('pdfs', 'pdfs_tmp')])
+    scheduler.add('temperature', [thermal_boundaries, thermal_kernel], every=4, ghost_layers=['g'],
+                  reads=['velocity'], writes=['g', 'temperature'], swaps=[('g', 'g_tmp')])
+    scheduler.run(1000)
+    print(scheduler.describe())
+"""
+
+import math
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Task:
+    """A physics module: calls that advance it by one of its time steps, and the arrays it uses"""
+    name: str
+    calls: list
+    """
+    Compiled kernels (arrays bound from the data handling), boundary handlings (`add_fixed_steps`) or
+    functions without arguments (called as they are; they must not rely on swapped array names)
+    """
+    every: int = 1
+    substeps: int = 1
+    reads: tuple = ()
+    writes: tuple = ()
+    """
+    Arrays changed by the task, after its swaps: the source array of a swapped pair
+    """
+    ghost_layers: tuple = ()
+    """
+    Arrays read with neighbour access, synchronized before the task if they changed
+    """
+    swaps: tuple = ()
+    data_handling: object = field(default=None, repr=False)
+
+
+class _CallCollector:
+    """Stands in for a `TimeLoop` in `add_fixed_steps` of boundary handlings"""
+
+    def __init__(self):
+        self.calls = []
+
+    def add_call(self, functor, argument_list):
+        if not isinstance(argument_list, list):
+            argument_list = [argument_list]
+        self.calls += [(functor, kwargs) for kwargs in argument_list]
+
+
+class MultiRateScheduler:
+    """Runs tasks at individual rates in dependency order, see the module docstring.
+
+    Args:
+        data_handling: default data handling of the tasks
+    """
+
+    def __init__(self, data_handling=None):
+        self.data_handling = data_handling
+        self.tasks = []
+        self.time_steps_run = 0
+        self._stale = None      # arrays changed outside of the schedule, None: all
+        self._swapped = set()   # arrays currently exchanged with their partner relative to the cycle start
+        self._invalidate()
+
+    def add(self, name, calls, every=1, substeps=1, reads=(), writes=(), ghost_layers=(), swaps=(),
+            data_handling=None):
+        """Adds a task, see `Task`. Returns the task."""
+        data_handling = data_handling or self.data_handling
+        if data_handling is None:
+            raise ValueError(f"task {name!r} has no data handling")
+        if every < 1 or substeps < 1:
+            raise ValueError("every and substeps have to be positive")
+        if any(task.name == name for task in self.tasks):
+            raise ValueError(f"a task {name!r} exists already")
+        task = Task(name, list(calls), every, substeps, tuple(reads), tuple(writes), tuple(ghost_layers),
+                    tuple(tuple(pair) for pair in swaps), data_handling)
+        self.tasks.append(task)
+        self._invalidate()
+        return task
+
+    def _invalidate(self):
+        # the new schedule starts with the arrays as they are named now
+        self._plan = None
+        self._swapped = set()
+        self._cycle_start = self.time_steps_run
+
+    def mark_stale(self, *names):
+        """Ghost layers of `names` (default: all arrays) are synchronized before the next step"""
+        if not names or self._stale is None:
+            self._stale = None
+        else:
+            for task in self.tasks:
+                self._stale.update(self._key(task, n) for n in names if n in task.ghost_layers)
+
+    # ---- schedule ----
+
+    def _key(self, task, name):
+        return id(task.data_handling), name
+
+    def order(self):
+        """Tasks in the order they run within a time step"""
+        writers = {}
+        for i, task in enumerate(self.tasks):
+            for name in task.writes:
+                writers.setdefault(self._key(task, name), set()).add(i)
+        depends = [set().union(*(writers.get(self._key(task, n), set()) for n in task.reads + task.ghost_layers))
+                   - {i} for i, task in enumerate(self.tasks)]
+        remaining, result = list(range(len(self.tasks))), []
+        while remaining:
+            ready = [i for i in remaining if not depends[i] & set(remaining)]
+            # a cycle: the earliest task reads the other values of the previous step
+            i = ready[0] if ready else remaining[0]
+            result.append(self.tasks[i])
+            remaining.remove(i)
+        return result
+
+    @property
+    def cycle(self):
+        """Time steps after which the schedule repeats"""
+        period = 1
+        for task in self.tasks:
+            period = period * task.every // math.gcd(period, task.every)
+        return 2 * period
+
+    def _sync_function(self, data_handling, names, cache):
+        key = id(data_handling), tuple(sorted(names))
+        if key not in cache:
+            target = data_handling.default_target
+            cache[key] = data_handling.synchronization_function(list(key[1]), target=target)
+        return cache[key]
+
+    def _build(self):
+        """Pre-bound calls per time step of the cycle and the statistics of the schedule"""
+        order, cycle = self.order(), self.cycle
+        all_ghost = {self._key(t, n) for t in self.tasks for n in t.ghost_layers}
+        data_handlings = {id(t.data_handling): t.data_handling for t in self.tasks}
+        partner = {}
+        for task in self.tasks:
+            for a, b in task.swaps:
+                partner[self._key(task, a)], partner[self._key(task, b)] = self._key(task, b), self._key(task, a)
+        cache = {}
+
+        # the first pass starts with all ghost layers out of date and gives the state at the end of a cycle,
+        # which is the state at the start of the cycles that follow
+        dirty = set(all_ghost)
+        for _ in range(2):
+            plan, swapped, swapped_before = [], set(), []
+            stats = {'cycle': cycle, 'order': [t.name for t in order], 'task_calls': dict.fromkeys(
+                     (t.name for t in self.tasks), 0), 'syncs': 0, 'synced_arrays': 0, 'syncs_naive': 0,
+                     'synced_arrays_naive': 0}
+            for step in range(cycle):
+                swapped_before.append(frozenset(swapped))
+                calls = []
+                for task in order:
+                    if step % task.every:
+                        continue
+                    dh = task.data_handling
+                    gpu = dh.default_target.is_gpu()
+                    for _ in range(task.substeps):
+                        keys = [self._key(task, n) for n in task.ghost_layers]
+                        needed = [k for k in keys if k in dirty]
+                        stats['task_calls'][task.name] += 1
+                        stats['syncs_naive'] += bool(keys)
+                        stats['synced_arrays_naive'] += len(keys)
+                        if needed:
+                            # sync functions look arrays up by name, at run time without the build swaps
+                            names = [(partner[k] if k in swapped else k)[1] for k in needed]
+                            calls.append((self._sync_function(dh, names, cache), {}))
+                            stats['syncs'] += 1
+                            stats['synced_arrays'] += len(needed)
+                            dirty.difference_update(needed)
+                        for call in task.calls:
+                            if hasattr(call, 'add_fixed_steps'):
+                                collector = _CallCollector()
+                                call.add_fixed_steps(collector)
+                                calls += collector.calls
+                            elif hasattr(call, 'target'):
+                                calls += [(call, kwargs) for kwargs in dh.get_kernel_kwargs(call)]
+                            else:
+                                calls.append((call, {}))
+                        for a, b in task.swaps:
+                            dh.swap(a, b, gpu)
+                            swapped ^= {self._key(task, a), self._key(task, b)}
+                        dirty.update(self._key(task, n) for n in task.writes)
+                plan.append(calls)
+            assert not swapped, "every swap pair has to be exchanged an even number of times per cycle"
+        self._plan, self._swapped_before, self._partner = plan, swapped_before, partner
+        self._data_handlings = data_handlings
+        self.statistics = stats
+        return plan
+
+    def _set_swap_state(self, keys):
+        """Exchanges the swap pairs so that the arrays swapped relative to the cycle start are `keys`"""
+        pairs = {tuple(sorted((key, self._partner[key]))) for key in set(keys) ^ self._swapped}
+        for (dh_id, a), (_, b) in pairs:
+            dh = self._data_handlings[dh_id]
+            dh.swap(a, b, dh.default_target.is_gpu())
+        self._swapped = set(keys)
+
+    # ---- running ----
+
+    def run(self, time_steps):
+        plan = self._plan or self._build()
+        cycle = len(plan)
+        position = (self.time_steps_run - self._cycle_start) % cycle
+        # arrays changed from outside are synchronized by their current names
+        stale = {self._key(t, n) for t in self.tasks for n in t.ghost_layers} if self._stale is None \
+            else self._stale
+        for dh_id, dh in self._data_handlings.items():
+            names = sorted(name for key, name in stale if key == dh_id)
+            if names:
+                dh.synchronization_function(names, target=dh.default_target)()
+        self._stale = set()
+
+        self._set_swap_state(set())
+        for _ in range(time_steps):
+            for function, kwargs in plan[position]:
+                function(**kwargs)
+            position = (position + 1) % cycle
+        self._set_swap_state(self._swapped_before[position])
+        self.time_steps_run += time_steps
+
+    def benchmark_run(self, time_steps):
+        """Runs `time_steps` steps and returns the seconds per time step"""
+        import time
+
+        if self._plan is None:
+            self._build()
+        start = time.perf_counter()
+        self.run(time_steps)
+        return (time.perf_counter() - start) / time_steps
+
+    def describe(self):
+        """The order of the tasks, their rates and the synchronizations per cycle"""
+        if self._plan is None:
+            self._build()
+        stats = self.statistics
+        lines = [f"cycle of {stats['cycle']} time steps, order: {' -> '.join(stats['order'])}"]
+        for task in self.order():
+            rate = f"every {task.every}" if task.every > 1 else "every step"
+            if task.substeps > 1:
+                rate += f", {task.substeps} substeps"
+            lines.append(f"  {task.name:16s} {rate:28s} {stats['task_calls'][task.name]:4d} calls per cycle")
+        lines.append(f"  ghost layer syncs per cycle: {stats['syncs']} ({stats['synced_arrays']} arrays), "
+                     f"{stats['syncs_naive']} ({stats['synced_arrays_naive']} arrays) when every task syncs "
+                     f"its arrays")
+        return '\n'.join(lines)
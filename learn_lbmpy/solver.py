@@ -0,0 +1,211 @@
+"""
+Time stepping and results shared by the hand-built solvers
+
+`ThermalConvection`, `PseudopotentialMultiphase` and `PeriodicEnsemble` are not `LatticeBoltzmannStep`s, but
+advance their PDFs the same way: synchronize the ghost layers, run the boundary handlings, run the kernels
+and swap the source and destination arrays. `FixedStepSolver` implements this once, with a time loop built
+like `LatticeBoltzmannStep.get_time_loop`. `Solver` holds what is left when the time stepping is done
+elsewhere (e.g. by a `MultiRateScheduler`): the data handling and the macroscopic values.
+
+`FixedStepSolver.fixed_step_calls` and, for a `LatticeBoltzmannStep`, `lb_step_calls` return the calls of the
+two steps of the fixed time loop with the phase they belong to ('sync', 'boundary' or 'collision_stream') and a
+label, for tools that run the steps themselves (`ForceEvaluator`, `StepProfiler`).
+
+A solver sets in its constructor:
+
+    _data_handling, _gpu, domain_size, velocity_data_name
+    _getter_kernel          kernel writing the macroscopic values (None if the update kernels write them)
+    _macroscopic_names      arrays copied back from the GPU before they are read
+
+and for a `FixedStepSolver` additionally:
+
+    time_steps_run = 0
+    _kernels                compiled kernels of one time step
+    _sync_src, _sync_tmp    ghost layer synchronization of the source and of the destination arrays
+    _boundary_handlings     boundary handlings run before the kernels
+    _calls()                kernels of one time step and the ghost layer synchronizations between them
+    _swap_pairs             (source, destination) array names swapped after every step
+"""
+
+import numpy as np
+
+
+def _bound_calls(phase, label, function, argument_list):
+    """(phase, label, function, kwargs) for every kwargs dict in `argument_list`, as `TimeLoop.add_call` takes them"""
+    if not isinstance(argument_list, list):
+        argument_list = [argument_list]
+    return [(phase, label, function, kwargs) for kwargs in argument_list]
+
+
+class _CallList(list):
+    """Stands in for a `TimeLoop` in `add_fixed_steps` and keeps the (function, kwargs) added to it"""
+
+    def add_call(self, function, argument_list):
+        self.extend((function, kwargs) for _, _, _, kwargs in _bound_calls(None, None, function, argument_list))
+
+
+def _boundary_name(boundary_handling, flags, index_array):
+    """Name of the boundary object linked by `index_array`: the one flagged in the cell of its first link"""
+    from pystencils.boundaries.createindexlist import boundary_index_array_coordinate_names, direction_member_name
+
+    link = index_array[:1]
+    link = link.get() if hasattr(link, 'get') else link
+    direction = boundary_handling.stencil[int(link[direction_member_name][0])]
+    cell = tuple(int(link[name][0]) + d for name, d in zip(boundary_index_array_coordinate_names, direction))
+    for boundary in boundary_handling.boundary_objects:
+        if flags[cell] & boundary_handling.get_flag(boundary):
+            return boundary.name
+    return 'boundary'
+
+
+def boundary_calls(boundary_handling, **kernel_params):
+    """('boundary', name of the boundary object, kernel, kwargs) of the calls `boundary_handling` adds to a time loop"""
+    calls = _CallList()
+    boundary_handling.add_fixed_steps(calls, **kernel_params)
+    flags = boundary_handling.data_handling.gather_array(boundary_handling.flag_array_name, ghost_layers=True)
+    return [('boundary', _boundary_name(boundary_handling, flags, kwargs['indexField']), function, kwargs)
+            for function, kwargs in calls]
+
+
+def lb_step_calls(scenario):
+    """Calls of the two fixed steps of a `LatticeBoltzmannStep`, rebuilt from its public attributes the way its
+    `get_time_loop` builds them. Returns the steps and the swapped array pairs like
+    `FixedStepSolver.fixed_step_calls`."""
+    scenario.pre_run()  # make sure GPU arrays are allocated
+    dh, lbm_config, kernel_params = scenario.data_handling, scenario.lbm_config, scenario.kernel_params
+    src, tmp = lbm_config.field_name, lbm_config.temporary_field_name
+    target = dh.default_target
+    syncs = [dh.synchronization_function([name], lbm_config.stencil.name, target, stencil_restricted=True)
+             for name in (src, tmp)]
+    kernel = scenario.ast.compile()
+    stream = None
+    if tmp not in {f.name for f in scenario.ast.fields_accessed}:
+        # collide stream: the kernel of `scenario.ast` only collides
+        from lbmpy import create_lb_function
+        stream = create_lb_function(lbm_config=lbm_config, lbm_optimisation=scenario.lbm_optimisation,
+                                    config=scenario.config, kernel_type='stream_pull_only')
+
+    steps = []
+    for t in range(2):
+        calls = [('sync', 'sync', syncs[t], {})] + boundary_calls(scenario.boundary_handling, **kernel_params)
+        kernel_calls = _bound_calls('collision_stream', 'stream_collide' if stream is None else 'collide', kernel,
+                                    dh.get_kernel_kwargs(kernel, **kernel_params))
+        if stream is None:
+            calls += kernel_calls
+        else:
+            calls = kernel_calls + calls
+            calls += _bound_calls('collision_stream', 'stream', stream, dh.get_kernel_kwargs(stream, **kernel_params))
+        steps.append(calls)
+        dh.swap(src, tmp, target.is_gpu())
+    return steps, [(src, tmp)]
+
+
+class Solver:
+    """Data handling and macroscopic values of a solver, see the module docstring"""
+
+    _getter_kernel = None
+    _macroscopic_names = ()
+    _macroscopic_up_to_date = False
+
+    @property
+    def data_handling(self):
+        return self._data_handling
+
+    @property
+    def number_of_cells(self):
+        return int(np.prod(self.domain_size))
+
+    def _update_macroscopic_values(self):
+        if not self._macroscopic_up_to_date:
+            dh = self._data_handling
+            if self._getter_kernel is not None:
+                dh.run_kernel(self._getter_kernel)
+            if self._gpu:
+                for name in self._macroscopic_names:
+                    dh.to_cpu(name)
+            self._macroscopic_up_to_date = True
+
+    def _macroscopic_array(self, name, slice_obj=None):
+        """Interior of the up-to-date array `name`, optionally sliced"""
+        self._update_macroscopic_values()
+        result = self._data_handling.gather_array(name)
+        return result if slice_obj is None else result[slice_obj]
+
+    @property
+    def velocity(self):
+        return self._macroscopic_array(self.velocity_data_name)
+
+    def velocity_slice(self, slice_obj=None, masked=False):
+        """Velocity of the interior, mirrors `LatticeBoltzmannStep.velocity_slice`"""
+        return self._macroscopic_array(self.velocity_data_name, slice_obj)
+
+
+class FixedStepSolver(Solver):
+    """Solver advanced by a fixed sequence of calls per time step, see the module docstring"""
+
+    _boundary_handlings = ()
+    _swap_pairs = ()
+
+    def _calls(self):
+        """Kernels and other functions of one time step, run after the boundary handlings"""
+        return self._kernels
+
+    def time_step(self):
+        dh = self._data_handling
+        self._sync_src()
+        for boundary_handling in self._boundary_handlings:
+            boundary_handling()
+        for call in self._calls():
+            if call in self._kernels:
+                dh.run_kernel(call)
+            else:
+                call()
+        for pair in self._swap_pairs:
+            dh.swap(*pair, self._gpu)
+        self._macroscopic_up_to_date = False
+
+    def fixed_step_calls(self):
+        """Calls of the two steps of the fixed time loop, as lists of (phase, label, function, kwargs) with the
+        kernel arguments bound, and the (source, destination) array pairs swapped after each step"""
+        dh = self._data_handling
+        steps = []
+        for t in range(2):
+            calls = [('sync', 'sync', self._sync_src if t == 0 else self._sync_tmp, {})]
+            for boundary_handling in self._boundary_handlings:
+                calls += boundary_calls(boundary_handling)
+            for call in self._calls():
+                if call in self._kernels:
+                    label = call.kernel.name if len(self._kernels) > 1 else 'stream_collide'
+                    calls += _bound_calls('collision_stream', label, call, dh.get_kernel_kwargs(call))
+                else:
+                    calls.append(('sync', 'sync', call, {}))
+            steps.append(calls)
+            for pair in self._swap_pairs:
+                dh.swap(*pair, self._gpu)
+        return steps, self._swap_pairs
+
+    def get_time_loop(self):
+        """Time loop with pre-bound kernel arguments, built like `LatticeBoltzmannStep.get_time_loop`"""
+        from pystencils.timeloop import TimeLoop
+
+        fixed_loop = TimeLoop(steps=2)
+        fixed_loop.add_single_step_function(self.time_step)
+        steps, _ = self.fixed_step_calls()
+        for calls in steps:
+            for _, _, function, kwargs in calls:
+                fixed_loop.add_call(function, kwargs)
+        return fixed_loop
+
+    def run(self, time_steps):
+        time_loop = self.get_time_loop()
+        time_loop.run(time_steps)
+        self.time_steps_run += time_loop.time_steps_run
+        self._macroscopic_up_to_date = False
+
+    def benchmark_run(self, time_steps):
+        """Runs `time_steps` steps and returns the throughput in MLUPS"""
+        time_loop = self.get_time_loop()
+        duration_of_time_step = time_loop.benchmark_run(time_steps)
+        self.time_steps_run += time_loop.time_steps_run
+        self._macroscopic_up_to_date = False
+        return self.number_of_cells / duration_of_time_step * 1e-6
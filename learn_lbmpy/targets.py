@@ -0,0 +1,151 @@
+"""
+Target detection shared by all scenarios.
+
+Every tutorial script repeats the same block: try to import cupy and pick `Target.GPU` if it is
+available, `Target.CPU` otherwise. This module does the check once per process and caches it.
+Setting the environment variable `LEARN_LBMPY_TARGET` to `cpu` or `gpu` skips the (slow) cupy import.
+
+`vectorize_config` turns a CPU kernel configuration into one generating explicit AVX2/AVX-512
+intrinsics, and falls back to the scalar configuration where the CPU or the field layout does not allow it.
+"""
+
+import functools
+import os
+
+
+@functools.lru_cache(maxsize=None)
+def gpu_available():
+    """True if cupy can be imported and sees at least one device."""
+    try:
+        import cupy
+    except ImportError:
+        return False
+    try:
+        return cupy.cuda.runtime.getDeviceCount() > 0
+    except Exception:
+        return False
+
+
+def detect_target(prefer_gpu=True):
+    """Returns the pystencils target to run on.
+
+    Args:
+        prefer_gpu: use the GPU if cupy is installed and a device is present
+
+    Returns:
+        `pystencils.Target.GPU` or `pystencils.Target.CPU`
+    """
+    from pystencils import Target
+
+    requested = os.environ.get('LEARN_LBMPY_TARGET', '').lower()
+    if requested == 'cpu':
+        return Target.CPU
+    if requested == 'gpu':
+        return Target.GPU
+    if requested:
+        raise ValueError(f"LEARN_LBMPY_TARGET must be 'cpu' or 'gpu', not {requested!r}")
+
+    if prefer_gpu and gpu_available():
+        return Target.GPU
+    return Target.CPU
+
+
+# ----------------------------------------------- SIMD vectorization -------------------------------------------------
+
+# instruction set name -> (CPU flags it needs, pystencils target attribute)
+_INSTRUCTION_SETS = {
+    'sse': ({'sse', 'sse2', 'ssse3', 'sse4_1', 'sse4_2'}, 'X86_SSE'),
+    'avx2': ({'avx', 'avx2', 'fma'}, 'X86_AVX'),
+    'avx512': ({'avx512f'}, 'X86_AVX512'),
+}
+
+# field layouts whose innermost spatial coordinate has stride one
+_VECTORIZABLE_LAYOUTS = ('fzyx', 'soa', 'f', 'reverse_numpy')
+
+
+def _cpu_flags():
+    try:
+        from cpuinfo import get_cpu_info
+        return set(get_cpu_info().get('flags', ()))
+    except ImportError:
+        pass
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return set(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+@functools.lru_cache(maxsize=None)
+def cpu_instruction_sets():
+    """x86 vector instruction sets of this CPU that pystencils can generate code for, least capable first.
+
+    pystencils itself needs the optional `py-cpuinfo` package for this check, so on Linux the flags are read
+    from `/proc/cpuinfo` instead. Other CPUs (e.g. ARM) report no instruction sets.
+    """
+    import platform
+    if platform.machine() not in ('x86_64', 'AMD64', 'x86', 'i386'):
+        return ()
+    flags = _cpu_flags()
+    return tuple(name for name, (required, _) in _INSTRUCTION_SETS.items() if required <= flags)
+
+
+def simd_unsupported_reason(instruction_set='best', target=None, layout='fzyx'):
+    """Why SIMD code can not be generated for this combination, or None if it can"""
+    from pystencils import Target
+
+    if target is not None and target.is_gpu():
+        return "the target is a GPU"
+    if str(layout).lower() not in _VECTORIZABLE_LAYOUTS:
+        return f"layout '{layout}' has no unit stride in the innermost loop, use 'fzyx'"
+    available = cpu_instruction_sets()
+    if not available:
+        return "no supported x86 vector instruction set detected on this CPU"
+    if instruction_set != 'best' and instruction_set not in available:
+        if instruction_set not in _INSTRUCTION_SETS:
+            return f"unknown instruction set '{instruction_set}', use one of {tuple(_INSTRUCTION_SETS)} or 'best'"
+        return f"this CPU does not support {instruction_set} (available: {', '.join(available)})"
+    if not hasattr(Target, _INSTRUCTION_SETS[available[-1]][1]):
+        return "the installed pystencils has no x86 vector targets"
+    return None
+
+
+def vectorize_config(config=None, instruction_set='best', nontemporal_stores=False, layout='fzyx'):
+    """Kernel configuration generating explicit SIMD intrinsics.
+
+    Args:
+        config: `CreateKernelConfig` to start from (not modified), default a CPU configuration
+        instruction_set: 'avx2', 'avx512', 'sse' or 'best' (the most capable one of this CPU)
+        nontemporal_stores: write the PDFs with streaming stores that bypass the cache
+        layout: field layout of the kernels' fields, only SoA layouts ('fzyx') can be vectorized
+
+    Returns:
+        the vectorized configuration, or `config` unchanged with a warning if vectorization is not possible
+        (GPU target, AoS layout, instruction set not supported by the CPU)
+
+    The fields have to be allocated with an aligned, padded innermost dimension. `LatticeBoltzmannStep`
+    does that by itself (`alignment_if_vectorized`), hand-built data handlings need `alignment=True` in
+    `dh.add_array`.
+    """
+    import copy
+    import warnings
+    from pystencils import CreateKernelConfig, Target
+
+    if config is None:
+        config = CreateKernelConfig(target=Target.CPU)
+    reason = simd_unsupported_reason(instruction_set, config.get_target(), layout)
+    if reason is not None:
+        warnings.warn(f"SIMD vectorization disabled: {reason}", RuntimeWarning, stacklevel=2)
+        return config
+
+    name = cpu_instruction_sets()[-1] if instruction_set == 'best' else instruction_set
+    vectorized = copy.deepcopy(config)
+    vectorized.target = getattr(Target, _INSTRUCTION_SETS[name][1])
+    vectorized.cpu.vectorize.enable = True
+    vectorized.cpu.vectorize.assume_aligned = True
+    vectorized.cpu.vectorize.assume_inner_stride_one = True
+    vectorized.cpu.vectorize.use_nontemporal_stores = nontemporal_stores
+    return vectorized
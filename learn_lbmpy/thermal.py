@@ -0,0 +1,313 @@
+"""
+Natural convection with a double-distribution thermal LB model
+
+The flow is described by the usual PDFs f (D2Q9/D3Q19, incompressible, Guo forcing), the temperature by a
+second set of PDFs g that solve the advection-diffusion equation (D2Q9/D3Q7, SRT with the first-order
+equilibrium g_eq = w_i T (1 + c_i.u / c_s^2)). The two are coupled both ways:
+
+- the velocity of the flow advects the temperature,
+- the temperature drives the flow with the Boussinesq buoyancy force F = g beta (T - T_ref), pointing up
+  (along y in 2D, along z in 3D).
+
+With `fused=True` (default) both distributions are advanced in one kernel: every cell pulls its f and g,
+computes T from g and the forced velocity from f, and collides both. T and u never go through memory. With
+`fused=False` the update is split into two kernels like two independent LB solvers: the flow kernel reads T
+from a field written by the thermal kernel of the previous step and writes u, which the thermal kernel then
+reads. Per cell and step the split variant moves 2 (D + 1) extra values and sweeps the domain twice
+(`benchmarks/thermal_fused.py`).
+
+The walls are given by direction: `hot_wall` and `cold_wall` are isothermal (anti-bounce-back of g,
+`DiffusionDirichlet`), `adiabatic_walls` have zero heat flux (bounce-back of g). All walls are no-slip for
+the flow, axes without walls are periodic. The parameters follow from the Rayleigh and Prandtl numbers with
+the distance H between the hot and the cold wall and the free-fall velocity U = sqrt(g beta dT H), which
+sets the Mach number:
+
+    nu = U H sqrt(Pr / Ra),   alpha = nu / Pr,   g beta = U^2 / (H dT)
+
+Example:
+    cavity = ThermalConvection((64, 64), rayleigh_number=1e4, hot_wall='W', cold_wall='E',
+                               adiabatic_walls=('S', 'N'))
+    cavity.run(20000)
+    print(cavity.nusselt_number(), REFERENCE_NUSSELT_CAVITY[1e4])
+"""
+
+import numpy as np
+
+from learn_lbmpy.solver import FixedStepSolver
+
+# differentially heated square cavity, Pr = 0.71: average Nusselt number (de Vahl Davis 1983)
+REFERENCE_NUSSELT_CAVITY = {1e3: 1.118, 1e4: 2.243, 1e5: 4.519, 1e6: 8.800}
+
+# critical Rayleigh number of Rayleigh-Benard convection between two rigid walls
+CRITICAL_RAYLEIGH_NUMBER = 1707.76
+
+_AXES = {'W': (0, -1), 'E': (0, 1), 'S': (1, -1), 'N': (1, 1), 'B': (2, -1), 'T': (2, 1)}
+
+
+def thermal_parameters(rayleigh_number, prandtl_number=0.71, height=64, temperature_difference=1.0,
+                       velocity_scale=0.05):
+    """Lattice parameters for the given Rayleigh and Prandtl number, see the module docstring.
+
+    Both lattices used here have c_s^2 = 1/3, so the relaxation rates follow from nu and alpha alike.
+    """
+    viscosity = velocity_scale * height * np.sqrt(prandtl_number / rayleigh_number)
+    diffusivity = viscosity / prandtl_number
+    return {'viscosity': viscosity, 'diffusivity': diffusivity,
+            'gravity_beta': velocity_scale ** 2 / (height * temperature_difference),
+            'relaxation_rate': 1 / (3 * viscosity + 0.5),
+            'thermal_relaxation_rate': 1 / (3 * diffusivity + 0.5)}
+
+
+def _without_outputs(collection, fields):
+    """Turns the main assignments writing to `fields` into subexpressions with plain symbols.
+
+    Returns the new collection and a dict mapping each written field access to its symbol.
+    """
+    import sympy as sp
+    from pystencils import Assignment
+
+    names = {f.name for f in fields}
+    main, subexpressions, symbols = [], list(collection.subexpressions), {}
+    for a in collection.main_assignments:
+        if a.lhs.field.name in names:
+            symbol = sp.Symbol(f"{a.lhs.field.name}_{'_'.join(map(str, a.lhs.index)) or 0}")
+            subexpressions.append(Assignment(symbol, a.rhs))
+            symbols[a.lhs] = symbol
+        else:
+            main.append(a)
+    return collection.copy(main, subexpressions), symbols
+
+
+def coupled_update_rules(flow_config, thermal_config, pdfs, thermal_pdfs, velocity, temperature,
+                         gravity_beta, reference_temperature, fused=True):
+    """Update rules of the flow and the temperature distribution.
+
+    Args:
+        flow_config, thermal_config: `LBMConfig` of both distributions, without force and velocity input
+        pdfs, thermal_pdfs: (source, destination) field pairs of f and g
+        velocity, temperature: fields of u and T
+        gravity_beta: g beta of the Boussinesq force, which points along the last axis
+        reference_temperature: temperature without buoyancy
+        fused: return one update rule for both distributions instead of one per distribution
+
+    Returns:
+        list with the fused rule, or with the rules of the flow and of the temperature, and the
+        (flow, thermal) LB methods
+    """
+    import sympy as sp
+    from dataclasses import replace
+    from lbmpy import ForceModel, LBMOptimisation, create_lb_update_rule
+    from pystencils import AssignmentCollection
+
+    dim = velocity.spatial_dimensions
+    t = sp.Symbol('T') if fused else temperature.center
+    force = [0] * (dim - 1) + [gravity_beta * (t - reference_temperature)]
+
+    flow = create_lb_update_rule(
+        lbm_config=replace(flow_config, force=tuple(force), force_model=ForceModel.GUO,
+                           output={'velocity': velocity}),
+        lbm_optimisation=LBMOptimisation(symbolic_field=pdfs[0], symbolic_temporary_field=pdfs[1]))
+    thermal = create_lb_update_rule(
+        lbm_config=replace(thermal_config, velocity_input=velocity, output={'density': temperature}),
+        lbm_optimisation=LBMOptimisation(symbolic_field=thermal_pdfs[0], symbolic_temporary_field=thermal_pdfs[1]))
+    methods = flow.method, thermal.method
+    if not fused:
+        return [flow, thermal], methods
+
+    # the subexpressions of both rules have the same names (rho, vel0Term, ...)
+    thermal = thermal.new_with_substitutions({a.lhs: sp.Symbol(f"{a.lhs.name}_g") for a in thermal.subexpressions},
+                                             substitute_on_lhs=True)
+    flow, velocity_symbols = _without_outputs(flow, [velocity])
+    thermal, temperature_symbols = _without_outputs(thermal, [temperature])
+    thermal = thermal.new_with_substitutions(velocity_symbols)
+    (temperature_symbol,) = temperature_symbols.values()
+
+    fused_rule = AssignmentCollection(flow.main_assignments + thermal.main_assignments,
+                                      thermal.subexpressions + flow.subexpressions)
+    fused_rule = fused_rule.new_with_substitutions({t: temperature_symbol})
+    fused_rule.topological_sort(sort_subexpressions=True, sort_main_assignments=False)
+    return [fused_rule], methods
+
+
+class ThermalConvection(FixedStepSolver):
+    """Buoyancy driven flow between a hot and a cold wall.
+
+    Args:
+        domain_size: cells per axis; up is the last axis
+        rayleigh_number, prandtl_number: based on the distance between the hot and the cold wall
+        hot_wall, cold_wall: directions ('W', 'E', 'S', 'N', 'B', 'T') of the isothermal walls
+        adiabatic_walls: directions of no-slip walls without heat flux
+        fused: advance f and g in one kernel instead of two
+        method: collision model of the flow ('SRT', 'TRT', 'MRT', ...)
+        stencil, thermal_stencil: default D2Q9/D2Q9 in 2D and D3Q19/D3Q7 in 3D
+        velocity_scale: free-fall velocity sqrt(g beta dT H) in lattice units
+        temperatures: (cold, hot) wall temperatures
+        perturbation: amplitude of the random noise on the initial, linear temperature profile, relative to dT
+        seed: seed of the noise
+        config: pystencils `CreateKernelConfig`; by default the target from `detect_target()` is used
+        name: prefix of the arrays in the data handling
+    """
+
+    def __init__(self, domain_size, rayleigh_number, prandtl_number=0.71, hot_wall='S', cold_wall='N',
+                 adiabatic_walls=(), fused=True, method='SRT', stencil=None, thermal_stencil=None,
+                 velocity_scale=0.05, temperatures=(0.0, 1.0), perturbation=1e-3, seed=None, config=None,
+                 name='thermal'):
+        import pystencils as ps
+        from lbmpy import LBMConfig, LBStencil, Method, Stencil
+        from lbmpy.boundaries import DiffusionDirichlet, NoSlip
+        from lbmpy.boundaries.boundaryhandling import LatticeBoltzmannBoundaryHandling
+        from pystencils.slicing import slice_from_direction
+
+        from learn_lbmpy.targets import detect_target
+
+        self.name = name
+        self.domain_size = tuple(domain_size)
+        self.dim = len(self.domain_size)
+        self.fused = fused
+        self.time_steps_run = 0
+        if config is None:
+            config = ps.CreateKernelConfig(target=detect_target())
+        target = config.get_target()
+        self._gpu = target.is_gpu()
+
+        hot_axis, cold_axis = _AXES[hot_wall][0], _AXES[cold_wall][0]
+        if hot_axis != cold_axis or hot_wall == cold_wall:
+            raise ValueError("hot_wall and cold_wall must be opposite walls")
+        walls = (hot_wall, cold_wall) + tuple(adiabatic_walls)
+        if any(_AXES[w][0] >= self.dim for w in walls):
+            raise ValueError(f"walls {walls} do not exist in {self.dim}D")
+        self.heated_axis = hot_axis
+        self._hot_to_cold = -_AXES[hot_wall][1]
+        self.height = self.domain_size[hot_axis]
+        self.temperatures = tuple(temperatures)
+        self.temperature_difference = temperatures[1] - temperatures[0]
+        self.reference_temperature = 0.5 * (temperatures[0] + temperatures[1])
+        self.rayleigh_number, self.prandtl_number = rayleigh_number, prandtl_number
+        self.parameters = thermal_parameters(rayleigh_number, prandtl_number, self.height,
+                                             self.temperature_difference, velocity_scale)
+
+        if stencil is None:
+            stencil = 'D2Q9' if self.dim == 2 else 'D3Q19'
+        if thermal_stencil is None:
+            thermal_stencil = 'D2Q9' if self.dim == 2 else 'D3Q7'
+        stencil, thermal_stencil = (s if isinstance(s, LBStencil) else LBStencil(Stencil[s.upper()])
+                                    for s in (stencil, thermal_stencil))
+        method = method if isinstance(method, Method) else Method[method.upper()]
+        flow_config = LBMConfig(stencil=stencil, method=method, compressible=False,
+                                relaxation_rate=self.parameters['relaxation_rate'])
+        thermal_config = LBMConfig(stencil=thermal_stencil, method=Method.SRT, compressible=True,
+                                   zero_centered=False, equilibrium_order=1,
+                                   relaxation_rate=self.parameters['thermal_relaxation_rate'])
+
+        periodicity = tuple(not any(_AXES[w][0] == axis for w in walls) for axis in range(self.dim))
+        dh = ps.create_data_handling(self.domain_size, periodicity=periodicity, default_target=target)
+        self._data_handling = dh
+        self._pdf_names = (f'{name}_pdfs', f'{name}_pdfs_tmp')
+        self._thermal_names = (f'{name}_thermal_pdfs', f'{name}_thermal_pdfs_tmp')
+        self.velocity_data_name, self.temperature_data_name = f'{name}_velocity', f'{name}_temperature'
+        q, q_thermal = stencil.Q, thermal_stencil.Q
+        pdfs = (dh.add_array(self._pdf_names[0], values_per_cell=q, gpu=self._gpu),
+                dh.add_array(self._pdf_names[1], values_per_cell=q, gpu=self._gpu, cpu=not self._gpu))
+        thermal_pdfs = (dh.add_array(self._thermal_names[0], values_per_cell=q_thermal, gpu=self._gpu),
+                        dh.add_array(self._thermal_names[1], values_per_cell=q_thermal, gpu=self._gpu,
+                                     cpu=not self._gpu))
+        velocity = dh.add_array(self.velocity_data_name, values_per_cell=self.dim, gpu=self._gpu)
+        temperature = dh.add_array(self.temperature_data_name, values_per_cell=1, gpu=self._gpu)
+
+        rules, (self.method, self.thermal_method) = coupled_update_rules(
+            flow_config, thermal_config, pdfs, thermal_pdfs, velocity, temperature,
+            self.parameters['gravity_beta'], self.reference_temperature, fused)
+        self._kernels = []
+        for rule, kernel_name in zip(rules, ['flow_thermal'] if fused else ['flow', 'thermal']):
+            kernel_config = config.copy()
+            kernel_config.function_name = kernel_name
+            self._kernels.append(ps.create_kernel(rule, config=kernel_config).compile())
+        getter_kernel = ps.create_kernel(self._getter_assignments(pdfs[0], thermal_pdfs[0], velocity, temperature),
+                                         config=config).compile()
+        # the split kernels write u and T themselves; running the getter would change their input
+        self._getter_kernel = getter_kernel if fused else None
+        self._macroscopic_names = (self.velocity_data_name, self.temperature_data_name)
+
+        self._sync_src = dh.synchronization_function([self._pdf_names[0], self._thermal_names[0]], target=target)
+        self._sync_tmp = dh.synchronization_function([self._pdf_names[1], self._thermal_names[1]], target=target)
+
+        self.boundary_handling = LatticeBoltzmannBoundaryHandling(
+            self.method, dh, self._pdf_names[0], name=f'{name}_flow_bh', target=target,
+            openmp=config.cpu_openmp)
+        self.thermal_boundary_handling = LatticeBoltzmannBoundaryHandling(
+            self.thermal_method, dh, self._thermal_names[0], name=f'{name}_thermal_bh', target=target,
+            openmp=config.cpu_openmp)
+        for wall in walls:
+            self.boundary_handling.set_boundary(NoSlip('wall'), slice_from_direction(wall, self.dim))
+        self.thermal_boundary_handling.set_boundary(DiffusionDirichlet(temperatures[1], name='hot'),
+                                                    slice_from_direction(hot_wall, self.dim))
+        self.thermal_boundary_handling.set_boundary(DiffusionDirichlet(temperatures[0], name='cold'),
+                                                    slice_from_direction(cold_wall, self.dim))
+        for wall in adiabatic_walls:
+            self.thermal_boundary_handling.set_boundary(NoSlip('adiabatic'), slice_from_direction(wall, self.dim))
+        self._boundary_handlings = (self.boundary_handling, self.thermal_boundary_handling)
+        self._swap_pairs = (self._pdf_names, self._thermal_names)
+
+        self._initialize(perturbation, seed, getter_kernel)
+
+    # ---- setup ----
+
+    def _getter_assignments(self, pdfs, thermal_pdfs, velocity, temperature):
+        """T from g, then u from f with the force shift of the Boussinesq force at that T"""
+        import sympy as sp
+        from lbmpy.macroscopic_value_kernels import macroscopic_values_getter
+        from pystencils import Assignment
+
+        t = sp.Symbol('T')
+        getter = macroscopic_values_getter(self.method, None, velocity, pdfs)
+        # the force of the split flow rule reads T from its field, the fused one from the symbol
+        getter = getter.new_with_substitutions({temperature.center: t})
+        return getter.copy(getter.main_assignments + [Assignment(temperature.center, t)],
+                           [Assignment(t, sum(thermal_pdfs.center_vector))] + getter.subexpressions)
+
+    def _initialize(self, perturbation, seed, getter_kernel):
+        """Fluid at rest, linear temperature profile between the walls plus random noise"""
+        dh = self._data_handling
+        shape = self.domain_size
+        position = (np.arange(shape[self.heated_axis]) + 0.5) / shape[self.heated_axis]
+        cold, hot = self.temperatures
+        profile = hot + (cold - hot) * position
+        if self._hot_to_cold < 0:
+            profile = profile[::-1]
+        temperature = np.broadcast_to(profile.reshape([-1 if a == self.heated_axis else 1
+                                                       for a in range(self.dim)]), shape).copy()
+        noise = np.random.default_rng(seed).standard_normal(shape)
+        temperature += perturbation * self.temperature_difference * noise
+
+        weights = np.array([float(w) for w in self.method.weights])
+        thermal_weights = np.array([float(w) for w in self.thermal_method.weights])
+        dh.fill(self._pdf_names[0], 0.0, ghost_layers=True)
+        dh.fill(self._thermal_names[0], 0.0, ghost_layers=True)
+        inner = (slice(1, -1),) * self.dim
+        dh.cpu_arrays[self._pdf_names[0]][inner] = weights
+        dh.cpu_arrays[self._thermal_names[0]][inner] = temperature[..., np.newaxis] * thermal_weights
+        if self._gpu:
+            dh.all_to_gpu()
+        # the split kernels read u and T of the previous step from their fields
+        dh.run_kernel(getter_kernel)
+        self._macroscopic_up_to_date = False
+
+    # ---- results ----
+
+    @property
+    def temperature(self):
+        return self._macroscopic_array(self.temperature_data_name)
+
+    def temperature_slice(self, slice_obj=None):
+        return self._macroscopic_array(self.temperature_data_name, slice_obj)
+
+    def nusselt_number(self):
+        """Volume averaged Nusselt number 1 + <u_n T> H / (alpha dT), u_n from the hot to the cold wall.
+
+        Pure conduction gives 1. The average of the conductive flux over the domain is alpha dT / H for
+        any temperature field, so only the convective part has to be summed up.
+        """
+        u = self.velocity[..., self.heated_axis]
+        t = self.temperature
+        convective = np.mean(u * t) * self._hot_to_cold
+        return float(1 + convective * self.height / (self.parameters['diffusivity'] * self.temperature_difference))
@@ -0,0 +1,252 @@
+"""
+Thermocapillary (Marangoni) flow in a liquid layer with a free surface
+
+The layer lies on a no-slip wall with the periodic temperature T_w = A cos(k x), k = 2 pi / L, and has a flat,
+adiabatic free surface at the top. The surface tension sigma = sigma_0 - gamma (T - T_0) falls with the
+temperature, so the surface is pulled from hot to cold regions by the tangential stress -gamma grad_s T, which
+drives a row of counter-rotating cells. Three modules are coupled, each with its own kernel:
+
+- flow: incompressible LB (D2Q9/D3Q19, Guo forcing), no-slip bottom, free-slip top, reads the surface force,
+- temperature: advection-diffusion LB of the double-distribution model of `learn_lbmpy.thermal` (D2Q9/D3Q7),
+- surface force: the Marangoni stress as a body force in the top cell layer, from the temperature gradient.
+
+They run in a `MultiRateScheduler`. The temperature changes much slower than the flow, so with `thermal_every=n`
+the thermal kernel and the surface force are updated every n-th step only. The thermal solver then takes time
+steps of n: its relaxation rate is set for the diffusivity n alpha and it is advected with n u.
+
+For small Marangoni and Reynolds numbers the temperature is that of pure conduction and the flow is Stokes flow
+with the surface velocity given by `stokes_velocity_amplitude`.
+
+Example:
+    layer = ThermocapillaryLayer((128, 32), thermal_every=4)
+    layer.run(30000)
+    print(layer.surface_velocity_amplitude(), stokes_velocity_amplitude(128, 32, 0.1, 1e-4, 0.5, y=31.5))
+"""
+
+import numpy as np
+
+from learn_lbmpy.solver import Solver
+
+
+def stokes_velocity_amplitude(length, height, viscosity, surface_tension_gradient, temperature_amplitude, y=None):
+    """Amplitude of u_x = U(y) sin(k x) for Stokes flow and conductive heat transport, at height `y` (default: the
+    surface).
+
+    The temperature is T = A cos(k x) cosh(k (H - y)) / cosh(k H), so the surface stress is tau sin(k x) with
+    tau = gamma A k / cosh(k H). The stream function f(y) sin(k x) solves f'''' - 2 k^2 f'' + k^4 f = 0 with
+    f = f' = 0 at the wall, f = 0 and nu f'' = tau at the surface. Lattice units with rho = 1.
+    """
+    k = 2 * np.pi / length
+    tau = surface_tension_gradient * temperature_amplitude * k / np.cosh(k * height)
+
+    def basis(y):
+        """f, f', f'' of cosh(ky), y cosh(ky), sinh(ky), y sinh(ky)"""
+        c, s = np.cosh(k * y), np.sinh(k * y)
+        return np.array([[c, y * c, s, y * s],
+                         [k * s, c + k * y * s, k * c, s + k * y * c],
+                         [k * k * c, 2 * k * s + k * k * y * c, k * k * s, 2 * k * c + k * k * y * s]])
+
+    bottom, top = basis(0.0), basis(float(height))
+    matrix = np.array([bottom[0], bottom[1], top[0], viscosity * top[2]])
+    coefficients = np.linalg.solve(matrix, [0.0, 0.0, 0.0, tau])
+    y = height if y is None else np.asarray(y, dtype=float)
+    return np.einsum('i...,i->...', basis(y)[1], coefficients)
+
+
+class ThermocapillaryLayer(Solver):
+    """Marangoni flow in a layer heated periodically from below, see the module docstring.
+
+    Args:
+        domain_size: (L, H) or (L, W, H); periodic along all but the last axis, the free surface is on top
+        viscosity, prandtl_number: kinematic viscosity and nu / alpha, lattice units
+        surface_tension_gradient: gamma = -d sigma / d T (kinematic)
+        temperature_amplitude: A of the wall temperature A cos(2 pi x / L)
+        thermal_every: update the temperature and the surface force every n-th step
+        surface_every: update the surface force every n-th step, default `thermal_every`
+        method: collision model of the flow
+        stencil, thermal_stencil: default D2Q9/D2Q9 in 2D and D3Q19/D3Q7 in 3D
+        config: pystencils `CreateKernelConfig`; by default the target from `detect_target()` is used
+        name: prefix of the arrays in the data handling
+    """
+
+    def __init__(self, domain_size=(128, 32), viscosity=0.1, prandtl_number=1.0, surface_tension_gradient=1e-4,
+                 temperature_amplitude=0.5, thermal_every=1, surface_every=None, method='SRT', stencil=None,
+                 thermal_stencil=None, config=None, name='thermocapillary'):
+        import pystencils as ps
+        from lbmpy import LBMConfig, LBStencil, Method, Stencil
+
+        from learn_lbmpy.scheduler import MultiRateScheduler
+        from learn_lbmpy.targets import detect_target
+
+        self.name = name
+        self.domain_size = tuple(domain_size)
+        self.dim = len(self.domain_size)
+        self.length, self.height = self.domain_size[0], self.domain_size[-1]
+        self.viscosity = viscosity
+        self.diffusivity = viscosity / prandtl_number
+        self.surface_tension_gradient = surface_tension_gradient
+        self.temperature_amplitude = temperature_amplitude
+        self.thermal_every = thermal_every
+        self.surface_every = thermal_every if surface_every is None else surface_every
+        if config is None:
+            config = ps.CreateKernelConfig(target=detect_target())
+        self._config = config
+        target = config.get_target()
+        self._gpu = target.is_gpu()
+
+        if stencil is None:
+            stencil = 'D2Q9' if self.dim == 2 else 'D3Q19'
+        if thermal_stencil is None:
+            thermal_stencil = 'D2Q9' if self.dim == 2 else 'D3Q7'
+        stencil, thermal_stencil = (s if isinstance(s, LBStencil) else LBStencil(Stencil[s.upper()])
+                                    for s in (stencil, thermal_stencil))
+        method = method if isinstance(method, Method) else Method[method.upper()]
+        self.flow_config = LBMConfig(stencil=stencil, method=method, compressible=False,
+                                     relaxation_rate=1 / (3 * viscosity + 0.5))
+        self.thermal_config = LBMConfig(stencil=thermal_stencil, method=Method.SRT, compressible=True,
+                                        zero_centered=False, equilibrium_order=1,
+                                        relaxation_rate=1 / (3 * self.diffusivity * thermal_every + 0.5))
+
+        dh = ps.create_data_handling(self.domain_size, periodicity=(True,) * (self.dim - 1) + (False,),
+                                     default_target=target)
+        self._data_handling = dh
+        self._names = {key: f'{name}_{key}' for key in ('pdfs', 'pdfs_tmp', 'thermal_pdfs', 'thermal_pdfs_tmp',
+                                                        'velocity', 'temperature', 'force')}
+        sizes = {'pdfs': stencil.Q, 'pdfs_tmp': stencil.Q, 'thermal_pdfs': thermal_stencil.Q,
+                 'thermal_pdfs_tmp': thermal_stencil.Q, 'velocity': self.dim, 'temperature': 1, 'force': self.dim}
+        self._fields = {key: dh.add_array(self._names[key], values_per_cell=sizes[key], gpu=self._gpu,
+                                          cpu=not (self._gpu and key.endswith('_tmp')))
+                        for key in self._names}
+        self.velocity_data_name = self._names['velocity']
+        self.temperature_data_name = self._names['temperature']
+        self._macroscopic_names = (self.velocity_data_name, self.temperature_data_name)
+
+        self._kernels = {key: self._compile(rule, key) for key, rule in self._update_rules().items()}
+        self._setup_boundaries()
+        self._initialize()
+
+        n = self._names
+        self.scheduler = MultiRateScheduler(dh)
+        self.scheduler.add('flow', [self.boundary_handling, self._kernels['flow']], ghost_layers=[n['pdfs']],
+                           reads=[n['force']], writes=[n['pdfs'], n['velocity']], swaps=[(n['pdfs'], n['pdfs_tmp'])])
+        self.scheduler.add('temperature', [self.thermal_boundary_handling, self._kernels['temperature']],
+                           every=thermal_every, ghost_layers=[n['thermal_pdfs']], reads=[n['velocity']],
+                           writes=[n['thermal_pdfs'], n['temperature']],
+                           swaps=[(n['thermal_pdfs'], n['thermal_pdfs_tmp'])])
+        self.scheduler.add('surface_force', [self._kernels['surface_force']], every=self.surface_every,
+                           ghost_layers=[n['temperature']], reads=[n['temperature']], writes=[n['force']])
+
+    # ---- setup ----
+
+    def _update_rules(self):
+        from dataclasses import replace
+        from lbmpy import ForceModel, LBMOptimisation, create_lb_update_rule
+        from pystencils import Assignment
+
+        f = self._fields
+        velocity, temperature, force = f['velocity'], f['temperature'], f['force']
+        flow = create_lb_update_rule(
+            lbm_config=replace(self.flow_config, force=tuple(force.center_vector), force_model=ForceModel.GUO,
+                               output={'velocity': velocity}),
+            lbm_optimisation=LBMOptimisation(symbolic_field=f['pdfs'], symbolic_temporary_field=f['pdfs_tmp']))
+        thermal = create_lb_update_rule(
+            lbm_config=replace(self.thermal_config, velocity_input=velocity, output={'density': temperature}),
+            lbm_optimisation=LBMOptimisation(symbolic_field=f['thermal_pdfs'],
+                                             symbolic_temporary_field=f['thermal_pdfs_tmp']))
+        # one thermal step covers `thermal_every` flow steps
+        thermal = thermal.new_with_substitutions({velocity.center(i): self.thermal_every * velocity.center(i)
+                                                  for i in range(self.dim)})
+        self.method, self.thermal_method = flow.method, thermal.method
+
+        # Marangoni stress -gamma grad_s T as a force density in the layer of cells below the surface
+        surface_force = []
+        for i in range(self.dim - 1):
+            offset = tuple(int(j == i) for j in range(self.dim))
+            gradient = (temperature[offset] - temperature[tuple(-o for o in offset)]) / 2
+            surface_force.append(Assignment(force.center(i), -self.surface_tension_gradient * gradient))
+        return {'flow': flow, 'temperature': thermal, 'surface_force': surface_force}
+
+    def _compile(self, rule, name):
+        import pystencils as ps
+
+        kernel_config = self._config.copy()
+        kernel_config.function_name = name
+        if name == 'surface_force':
+            kernel_config.iteration_slice = (slice(1, -1),) * (self.dim - 1) + (-2,)
+        return ps.create_kernel(rule, config=kernel_config).compile()
+
+    def _setup_boundaries(self):
+        from lbmpy.boundaries import DiffusionDirichlet, FreeSlip, NoSlip
+        from lbmpy.boundaries.boundaryhandling import LatticeBoltzmannBoundaryHandling
+        from pystencils.slicing import slice_from_direction
+
+        dh, target = self._data_handling, self._config.get_target()
+        bottom, top = ('S', 'N') if self.dim == 2 else ('B', 'T')
+        self.boundary_handling = LatticeBoltzmannBoundaryHandling(
+            self.method, dh, self._names['pdfs'], name=f'{self.name}_flow_bh', target=target,
+            openmp=self._config.cpu_openmp)
+        self.thermal_boundary_handling = LatticeBoltzmannBoundaryHandling(
+            self.thermal_method, dh, self._names['thermal_pdfs'], name=f'{self.name}_thermal_bh', target=target,
+            openmp=self._config.cpu_openmp)
+        normal = (0,) * (self.dim - 1) + (-1,)
+        self.boundary_handling.set_boundary(NoSlip('wall'), slice_from_direction(bottom, self.dim))
+        self.boundary_handling.set_boundary(FreeSlip(self.method.stencil, normal_direction=normal, name='surface'),
+                                            slice_from_direction(top, self.dim))
+
+        def wall_temperature(boundary_data, **_):
+            # where the link crosses the wall; the index list counts the ghost layer, cell centres are at 0.5, 1.5, ...
+            x = boundary_data.index_array['x'] - 0.5 + 0.5 * boundary_data.link_offsets()[:, 0]
+            boundary_data['concentration'] = self.wall_temperature(x)
+
+        self.thermal_boundary_handling.set_boundary(DiffusionDirichlet(wall_temperature, name='heated_wall'),
+                                                    slice_from_direction(bottom, self.dim))
+        self.thermal_boundary_handling.set_boundary(NoSlip('adiabatic'), slice_from_direction(top, self.dim))
+
+    def wall_temperature(self, x):
+        return self.temperature_amplitude * np.cos(2 * np.pi * x / self.length)
+
+    def _initialize(self):
+        """Fluid at rest (zero-centered PDFs), T = 0, no surface force"""
+        dh = self._data_handling
+        for name in self._names.values():
+            dh.fill(name, 0.0, ghost_layers=True)
+        if self._gpu:
+            dh.all_to_gpu()
+
+    # ---- time stepping ----
+
+    def run(self, time_steps):
+        self.scheduler.run(time_steps)
+        self._macroscopic_up_to_date = False
+
+    def benchmark_run(self, time_steps):
+        """Runs `time_steps` steps and returns the throughput in MLUPS"""
+        duration_of_time_step = self.scheduler.benchmark_run(time_steps)
+        self._macroscopic_up_to_date = False
+        return self.number_of_cells / duration_of_time_step * 1e-6
+
+    @property
+    def time_steps_run(self):
+        return self.scheduler.time_steps_run
+
+    # ---- results ----
+    # the kernels write u and T themselves, there is no getter kernel: `velocity` is that of the last flow step
+
+    @property
+    def temperature(self):
+        """Temperature of the last thermal step"""
+        return self._macroscopic_array(self.temperature_data_name)
+
+    def temperature_slice(self, slice_obj=None):
+        return self._macroscopic_array(self.temperature_data_name, slice_obj)
+
+    def velocity_amplitude(self):
+        """U(y) of u_x = U(y) sin(k x), fitted per cell layer; y = 0.5, 1.5, ... above the wall"""
+        u = self.velocity[..., 0]
+        u = u.reshape(self.length, -1, self.height).mean(axis=1)
+        x = np.arange(self.length) + 0.5
+        return 2 * np.mean(u * np.sin(2 * np.pi * x / self.length)[:, np.newaxis], axis=0)
+
+    def surface_velocity_amplitude(self):
+        """Amplitude of u_x in the cell layer below the surface, at y = H - 1/2"""
+        return self.velocity_amplitude()[-1]
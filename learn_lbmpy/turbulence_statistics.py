@@ -0,0 +1,183 @@
+"""
+Running turbulence statistics accumulated inside the LBM kernel
+
+Mean velocity, RMS fluctuations and Reynolds stresses of an LES need long time averages. Storing snapshots
+for them costs a full field per sample; here the stream-collide kernel itself updates per-cell accumulators
+in every time step with Welford's algorithm (as `lbmpy.flow_statistics.welford_assignments`), using the
+velocity it computes anyway:
+
+    n     = n + w
+    delta = w (u - mean)
+    mean  = mean + delta / n
+    M_ij  = M_ij + delta_i (u_j - mean_j)
+
+The mean and the sums of products of the fluctuations M stay accurate over millions of samples, where
+plain sums of u and u u would cancel. `w` is the kernel parameter `statistics_weight`: 1 accumulates,
+0 leaves the accumulators untouched. Starting, stopping and resetting the statistics therefore needs no
+new kernel, and a run without statistics costs only the extra loads and stores of the accumulators.
+
+Accumulators of a data handling named `statistics` (double precision):
+    statistics_mean      dim values, mean velocity
+    statistics_products  dim (dim + 1) / 2 values, M in the order xx, xy, (xz,) yy, (yz, zz)
+    statistics_count     number of samples
+
+Example:
+    scenario = create_scenario('smagorinsky_channel')
+    statistics = RunningStatistics(scenario)
+    scenario.run(60000)                         # spin-up, nothing accumulated
+    statistics.start()
+    scenario.run(40000)
+    mean, covariance = statistics.averaged(axis=0)   # profiles across the channel
+"""
+
+import numpy as np
+import sympy as sp
+
+WEIGHT = 'statistics_weight'
+
+
+def _pairs(dim):
+    return [(i, j) for i in range(dim) for j in range(i, dim)]
+
+
+def add_statistics_arrays(data_handling, name='statistics', gpu=None):
+    """Adds the accumulator arrays `<name>_mean`, `<name>_products` and `<name>_count` to `data_handling`.
+
+    Returns:
+        tuple of the fields (mean, products, count), see `add_running_statistics`
+    """
+    dim = data_handling.dim
+    if gpu is None:
+        gpu = data_handling.default_target.is_gpu()
+    fields = tuple(data_handling.add_array(f'{name}_{suffix}', values_per_cell=values, dtype=np.float64, gpu=gpu)
+                   for suffix, values in (('mean', dim), ('products', len(_pairs(dim))), ('count', 1)))
+    for field in fields:
+        data_handling.fill(field.name, 0.0, ghost_layers=True)
+    return fields
+
+
+def add_running_statistics(collision_rule, mean_field, products_field, count_field, weight=sp.Symbol(WEIGHT)):
+    """Appends the Welford update of the velocity statistics to `collision_rule`.
+
+    The velocity is the macroscopic velocity of the pre-collision PDFs (with the force shift of the method).
+    `scenario.velocity` is computed from the PDFs after collision, so with a body force it lies one force
+    above the mean accumulated here.
+
+    Args:
+        collision_rule: collision rule of the stream-collide kernel
+        mean_field, products_field, count_field: accumulator fields, see `add_statistics_arrays`
+        weight: symbol of the kernel parameter switching the accumulation on (1) and off (0)
+    """
+    from pystencils import Assignment
+
+    method = collision_rule.method
+    dim = method.dim
+    u = sp.symbols(f'statistics_velocity_:{dim}')
+    cqc = method.conserved_quantity_computation
+    velocity = cqc.output_equations_from_pdfs(method.pre_collision_pdf_symbols, {'velocity': u})
+    # the velocity subexpressions (vel0Term, ...) also exist in the collision rule itself
+    renamed = {a.lhs: sp.Symbol(f'statistics_{a.lhs.name}') for a in velocity.subexpressions}
+    velocity = velocity.new_with_substitutions(renamed, substitute_on_lhs=True)
+
+    count = sp.Symbol('statistics_count')
+    inverse_count = sp.Symbol('statistics_inverse_count')
+    delta = sp.symbols(f'statistics_delta_:{dim}')
+    mean = sp.symbols(f'statistics_mean_:{dim}')
+    eqs = velocity.all_assignments
+    eqs += [Assignment(count, count_field.center + weight),
+            Assignment(inverse_count, 1 / sp.Max(count, 1))]
+    eqs += [Assignment(delta[i], weight * (u[i] - mean_field.center(i))) for i in range(dim)]
+    eqs += [Assignment(mean[i], mean_field.center(i) + delta[i] * inverse_count) for i in range(dim)]
+
+    collision_rule = collision_rule.copy()
+    collision_rule.subexpressions += eqs
+    collision_rule.main_assignments += [Assignment(mean_field.center(i), mean[i]) for i in range(dim)]
+    collision_rule.main_assignments += [
+        Assignment(products_field.center(k), products_field.center(k) + delta[i] * (u[j] - mean[j]))
+        for k, (i, j) in enumerate(_pairs(dim))]
+    collision_rule.main_assignments.append(Assignment(count_field.center, count))
+    return collision_rule
+
+
+class RunningStatistics:
+    """Start, stop and read the in-kernel statistics of a scenario.
+
+    The scenario has to be built with `add_running_statistics` on the accumulators `<name>_*` of its data
+    handling (e.g. the `smagorinsky_channel` scenario). The statistics start stopped; the weight only takes
+    effect with the next `scenario.run()`.
+    """
+
+    def __init__(self, scenario, name='statistics'):
+        self.scenario = scenario
+        self.name = name
+        dh = scenario.data_handling
+        self._names = [f'{name}_{suffix}' for suffix in ('mean', 'products', 'count')]
+        missing = [n for n in self._names if n not in dh.array_names]
+        if missing:
+            raise ValueError(f"Scenario has no statistics accumulators {missing}")
+        scenario.kernel_params.setdefault(WEIGHT, 0.0)
+
+    @property
+    def active(self):
+        return self.scenario.kernel_params[WEIGHT] != 0
+
+    def start(self):
+        """Accumulates a sample in every following time step"""
+        self.scenario.kernel_params[WEIGHT] = 1.0
+
+    def stop(self):
+        """Keeps the accumulators as they are; `start()` continues the same statistics"""
+        self.scenario.kernel_params[WEIGHT] = 0.0
+
+    def reset(self):
+        """Discards all samples"""
+        for name in self._names:
+            self.scenario.data_handling.fill(name, 0.0, ghost_layers=True)
+
+    def _gather(self, name):
+        dh = self.scenario.data_handling
+        if dh.is_on_gpu(name):
+            dh.to_cpu(name)
+        return dh.gather_array(name).copy()
+
+    @property
+    def samples(self):
+        """Number of time steps accumulated"""
+        return int(np.max(self._gather(self._names[2])))
+
+    @property
+    def mean_velocity(self):
+        """Time-averaged velocity, shape (*domain_size, dim)"""
+        return self._gather(self._names[0])
+
+    @property
+    def covariance(self):
+        """<u_i' u_j'> of the velocity fluctuations (biased, M / n), shape (*domain_size, dim, dim)"""
+        products = self._gather(self._names[1])
+        count = np.maximum(self._gather(self._names[2]), 1)
+        dim = self.scenario.data_handling.dim
+        result = np.empty(products.shape[:-1] + (dim, dim))
+        for k, (i, j) in enumerate(_pairs(dim)):
+            result[..., i, j] = result[..., j, i] = products[..., k] / count
+        return result
+
+    @property
+    def rms_velocity(self):
+        """RMS of the velocity fluctuations per component, shape (*domain_size, dim)"""
+        return np.sqrt(np.maximum(np.diagonal(self.covariance, axis1=-2, axis2=-1), 0))
+
+    @property
+    def reynolds_stress(self):
+        """Kinematic Reynolds stress tensor -<u_i' u_j'>, shape (*domain_size, dim, dim)"""
+        return -self.covariance
+
+    def averaged(self, axis=0):
+        """Mean velocity and covariance pooled over the homogeneous `axis` (or tuple of axes).
+
+        The covariance of the pooled samples also contains the spread of the cell means along `axis`.
+        """
+        mean, covariance = self.mean_velocity, self.covariance
+        pooled_mean = mean.mean(axis=axis, keepdims=True)
+        spread = mean - pooled_mean
+        pooled = (covariance + spread[..., :, None] * spread[..., None, :]).mean(axis=axis)
+        return np.squeeze(pooled_mean, axis=axis), pooled
@@ -0,0 +1,286 @@
+"""
+Validation against analytical and reference solutions
+
+The tutorials plot their velocity profiles (`channel_flow_profile.png`, `pipe_velocity_profile.png`)
+but nothing checks them. The cases below run small versions of these flows to a steady state (or for a
+fixed time) and compare them with a reference:
+
+- `poiseuille_channel`   force driven 2D channel, parabolic profile with the walls half a cell outside
+- `poiseuille_pipe`      force driven 3D pipe, u(r) = g/(4 nu) (R^2 - r^2); the staircase wall limits the accuracy
+- `taylor_green`         decaying Taylor-Green vortex, velocity field and effective viscosity
+- `lid_driven_cavity`    Re = 100 cavity, u on the vertical centre line against Ghia, Ghia & Shin (1982)
+- `refined_forced_flow`  uniformly accelerated periodic flow on a `RefinedGrid`: the refined patch has to keep
+                         up with the coarse level and stay free of cross flow
+
+Every case has tolerances for its error norms and a throughput floor for its time steps, in MLUPS
+(scenario creation and kernel compilation are reported but not timed against it). The floor does not
+depend on the number of steps a case needs to converge. A case passes if it converged, all errors are
+within their tolerance and its time steps ran at least at the floor, so one run catches both accuracy and
+performance regressions. The floors are about half the throughput measured on one core of the development
+machine, so a kernel that gets 2x slower fails; `budget_scale` divides them for slower machines.
+
+    python -m learn_lbmpy validate                          # all cases, exit code 1 on a failure
+    python -m learn_lbmpy validate taylor_green --budget-scale 2 --json validation.json
+"""
+
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Ghia, Ghia & Shin (1982), Re = 100: u / U_lid on the vertical centre line, (y, u)
+GHIA_RE100_U = (
+    (1.0000, 1.00000), (0.9766, 0.84123), (0.9688, 0.78871), (0.9609, 0.73722), (0.9531, 0.68717),
+    (0.8516, 0.23151), (0.7344, 0.00332), (0.6172, -0.13641), (0.5000, -0.20581), (0.4531, -0.21090),
+    (0.2813, -0.15662), (0.1719, -0.10150), (0.1016, -0.06434), (0.0703, -0.04775), (0.0625, -0.04192),
+    (0.0547, -0.03717), (0.0000, 0.00000),
+)
+
+_cases = {}
+
+
+@dataclass
+class ValidationCase:
+    """A validation case: `function(stopwatch)` returns a dict of error norms"""
+    name: str
+    function: callable
+    description: str = ''
+    min_mlups: float = 1.0
+    tolerances: dict = field(default_factory=dict)
+
+
+@dataclass
+class ValidationResult:
+    name: str
+    errors: dict
+    tolerances: dict
+    run_time: float
+    min_mlups: float
+    setup_time: float
+    time_steps: int
+    cell_updates: int
+    converged: bool = True
+
+    @property
+    def accurate(self):
+        return self.converged and all(self.errors[key] <= tolerance for key, tolerance in self.tolerances.items())
+
+    @property
+    def within_budget(self):
+        return self.mlups >= self.min_mlups
+
+    @property
+    def passed(self):
+        return self.accurate and self.within_budget
+
+    @property
+    def mlups(self):
+        return self.cell_updates / self.run_time * 1e-6 if self.run_time else 0.0
+
+    def as_dict(self):
+        return {'name': self.name, 'passed': self.passed, 'converged': self.converged, 'accurate': self.accurate,
+                'within_budget': self.within_budget, 'errors': self.errors, 'tolerances': self.tolerances,
+                'run_time': self.run_time, 'min_mlups': self.min_mlups, 'setup_time': self.setup_time,
+                'time_steps': self.time_steps, 'mlups': self.mlups}
+
+
+class Stopwatch:
+    """Times the time steps of a case, separately from its setup"""
+
+    def __init__(self):
+        self.run_time = 0.0
+        self.time_steps = 0
+        self.cell_updates = 0
+        self.converged = True
+
+    def run(self, scenario, time_steps):
+        start = time.perf_counter()
+        scenario.run(time_steps)
+        self.run_time += time.perf_counter() - start
+        self.time_steps += time_steps
+        self.cell_updates += time_steps * scenario.number_of_cells
+
+    def run_to_steady_state(self, scenario, observable, chunk=1000, tolerance=1e-5, max_steps=100000):
+        """Runs in chunks until `observable(scenario)` changes by less than `tolerance` (max norm) per chunk.
+
+        If that does not happen within `max_steps`, the last value is returned and the case fails as not
+        converged.
+        """
+        current = previous = observable(scenario)
+        for _ in range(max(1, max_steps // chunk)):
+            self.run(scenario, chunk)
+            current = observable(scenario)
+            if np.max(np.abs(current - previous)) < tolerance:
+                return current
+            previous = current
+        self.converged = False
+        return current
+
+
+def validation_case(name, description='', min_mlups=1.0, **tolerances):
+    """Decorator registering `function(stopwatch) -> {error name: value}` with a throughput floor and tolerances"""
+    def decorator(function):
+        _cases[name] = ValidationCase(name, function, description or (function.__doc__ or '').strip(),
+                                      min_mlups, tolerances)
+        return function
+    return decorator
+
+
+def list_cases():
+    return list(_cases.values())
+
+
+def error_norms(values, reference, scale=None):
+    """Relative L2 error and maximum error, both relative to the maximum of `reference` (or `scale`)"""
+    values, reference = np.asarray(values, dtype=float), np.asarray(reference, dtype=float)
+    scale = np.max(np.abs(reference)) if scale is None else scale
+    return {'l2': float(np.sqrt(np.mean((values - reference) ** 2) / np.mean(reference ** 2))),
+            'max': float(np.max(np.abs(values - reference)) / scale)}
+
+
+def _viscosity(relaxation_rate):
+    return (1 / relaxation_rate - 0.5) / 3
+
+
+# ---- cases ----
+
+# measured 18-22 MLUPS
+@validation_case('poiseuille_channel', min_mlups=10, l2=0.005, max=0.005)
+def poiseuille_channel(stopwatch, height=32, force=1e-6, relaxation_rate=1.0):
+    """Force driven 2D channel (04_channel_flow) against the parabolic Poiseuille profile"""
+    from learn_lbmpy.registry import create_scenario
+
+    scenario = create_scenario('channel', domain_size=(8, height), force=force, initial_velocity=(0, 0),
+                               relaxation_rate=relaxation_rate)
+
+    def profile(s):
+        return np.asarray(s.velocity[:, :])[..., 0].mean(axis=0)
+
+    u = stopwatch.run_to_steady_state(scenario, profile, tolerance=1e-6 * force / _viscosity(relaxation_rate))
+    # half-way bounce-back: the walls lie half a cell outside the first and last fluid cell
+    y = np.arange(height) + 0.5
+    u_exact = force / (2 * _viscosity(relaxation_rate)) * y * (height - y)
+    return error_norms(u, u_exact)
+
+
+# measured 12.3-12.6 MLUPS
+@validation_case('poiseuille_pipe', min_mlups=7, l2=0.04, max=0.06)
+def poiseuille_pipe(stopwatch, diameter=24, force=1e-6, relaxation_rate=1.0):
+    """Force driven 3D pipe (02_geom_and_bcs) against u(r) = g/(4 nu) (R^2 - r^2)"""
+    from learn_lbmpy.registry import create_scenario
+
+    scenario = create_scenario('pipe', domain_size=(4, diameter, diameter), stencil='D3Q19', force=force,
+                               relaxation_rate=relaxation_rate)
+
+    def cross_section(s):
+        return np.ma.filled(s.velocity[:, :, :][..., 0].mean(axis=0), 0.0)
+
+    u = stopwatch.run_to_steady_state(scenario, cross_section, tolerance=1e-6 * force / _viscosity(relaxation_rate))
+    radius = diameter / 2
+    y, z = np.meshgrid(np.arange(diameter) + 0.5, np.arange(diameter) + 0.5, indexing='ij')
+    r2 = (y - radius) ** 2 + (z - radius) ** 2
+    fluid = r2 <= radius ** 2
+    u_exact = force / (4 * _viscosity(relaxation_rate)) * (radius ** 2 - r2)
+    return error_norms(u[fluid], u_exact[fluid])
+
+
+# measured 22-33 MLUPS; 311 steps of 32^2 cells, so the call overhead shows
+@validation_case('taylor_green', min_mlups=12, l2=0.015, max=0.015, viscosity=0.01)
+def taylor_green(stopwatch, size=32, velocity_magnitude=0.02, relaxation_rate=1.6, decay_times=1.0):
+    """Taylor-Green vortex: velocity field after `decay_times` e-folding times and the viscosity of the decay"""
+    from learn_lbmpy.registry import create_scenario
+    from learn_lbmpy.scenarios import taylor_green_fields
+
+    nu = _viscosity(relaxation_rate)
+    k2 = 2 * (2 * np.pi / size) ** 2
+    time_steps = int(round(decay_times / (nu * k2)))
+    scenario = create_scenario('taylor_green', domain_size=(size, size), velocity_magnitude=velocity_magnitude,
+                               relaxation_rate=relaxation_rate)
+    energy_0 = np.sum(np.asarray(scenario.velocity[:, :]) ** 2)
+    stopwatch.run(scenario, time_steps)
+    u = np.asarray(scenario.velocity[:, :])
+    u_exact, _ = taylor_green_fields((size, size), velocity_magnitude, nu, time_steps)
+
+    errors = error_norms(u, u_exact)
+    # E(t) = E(0) exp(-2 nu k^2 t)
+    nu_measured = -np.log(np.sum(u ** 2) / energy_0) / (2 * k2 * time_steps)
+    errors['viscosity'] = float(abs(nu_measured - nu) / nu)
+    return errors
+
+
+# measured 105-109 MLUPS
+@validation_case('lid_driven_cavity', min_mlups=60, l2=0.01, max=0.01)
+def lid_driven_cavity(stopwatch, size=64, lid_velocity=0.1, reynolds_number=100):
+    """Re = 100 cavity: u / U on the vertical centre line against Ghia et al. (1982)"""
+    from learn_lbmpy.registry import create_scenario
+
+    nu = lid_velocity * size / reynolds_number
+    scenario = create_scenario('lid_driven_cavity', domain_size=(size, size), lid_velocity=lid_velocity,
+                               relaxation_rate=1 / (3 * nu + 0.5))
+
+    def centre_line(s):
+        u = np.asarray(s.velocity[:, :])[..., 0]
+        return 0.5 * (u[(size - 1) // 2, :] + u[size // 2, :]) / lid_velocity
+
+    u = stopwatch.run_to_steady_state(scenario, centre_line, tolerance=1e-5)
+    reference = np.array(GHIA_RE100_U)
+    inner = (reference[:, 0] > 0) & (reference[:, 0] < 1)     # the end points are the wall velocities
+    u_at_reference = np.interp(reference[inner, 0], (np.arange(size) + 0.5) / size, u)
+    return {'l2': float(np.sqrt(np.mean((u_at_reference - reference[inner, 1]) ** 2))),
+            'max': float(np.max(np.abs(u_at_reference - reference[inner, 1])))}
+
+
+# measured 5.4-5.5 MLUPS, the level coupling runs in NumPy
+@validation_case('refined_forced_flow', min_mlups=3, velocity=0.02, cross_flow=0.02)
+def refined_forced_flow(stopwatch, size=40, force=1e-5, relaxation_rate=1.6, time_steps=100):
+    """Body force on a periodic RefinedGrid with one patch: u of the patch against u of the coarse level"""
+    from lbmpy import ForceModel, LBMConfig
+
+    from learn_lbmpy.refinement import RefinedGrid
+
+    quarter = size // 4
+    grid = RefinedGrid((size, size), boxes=[((quarter, size - quarter),) * 2], periodicity=True,
+                       lbm_config=LBMConfig(relaxation_rate=relaxation_rate, force=(force, 0),
+                                            force_model=ForceModel.GUO))
+    grid.initialize()
+    stopwatch.run(grid, time_steps)
+    coarse = np.asarray(grid.velocity_slice(masked=False))
+    fine = np.asarray(grid.velocity_slice(masked=False, level=1))
+    # level 0 holds the restricted patch solution inside the box, compare with the cells outside
+    outside = np.ones((size, size), dtype=bool)
+    outside[quarter:size - quarter, quarter:size - quarter] = False
+    u_coarse = coarse[outside][:, 0].mean()
+    return {'velocity': float(np.max(np.abs(fine[..., 0] - u_coarse)) / u_coarse),
+            'cross_flow': float(max(np.max(np.abs(coarse[..., 1])), np.max(np.abs(fine[..., 1]))) / u_coarse)}
+
+
+# ---- running ----
+
+def run_case(name, budget_scale=1.0):
+    case = _cases[name]
+    stopwatch = Stopwatch()
+    start = time.perf_counter()
+    errors = case.function(stopwatch)
+    setup_time = time.perf_counter() - start - stopwatch.run_time
+    return ValidationResult(name, errors, dict(case.tolerances), stopwatch.run_time, case.min_mlups / budget_scale,
+                            setup_time, stopwatch.time_steps, stopwatch.cell_updates, stopwatch.converged)
+
+
+def run_validation(names=None, budget_scale=1.0, verbose=False):
+    """Runs the cases `names` (default: all) and returns their `ValidationResult`s"""
+    results = []
+    for name in names or list(_cases):
+        results.append(run_case(name, budget_scale))
+        if verbose:
+            print(format_result(results[-1]), flush=True)
+    return results
+
+
+def format_result(result):
+    errors = ', '.join(f"{key} {value:.2e}{'' if value <= result.tolerances.get(key, np.inf) else ' (!)'}"
+                       f"{'/' + format(result.tolerances[key], '.2g') if key in result.tolerances else ''}"
+                       for key, value in result.errors.items())
+    status = 'PASS' if result.passed else ('FAIL steady state' if not result.converged else
+                                           'FAIL accuracy' if not result.accurate else 'FAIL budget')
+    return (f"{result.name:20s} {status:17s} {result.mlups:6.1f}/{result.min_mlups:.3g} MLUPS"
+            f" ({result.time_steps} steps in {result.run_time:.2f} s, setup {result.setup_time:.1f} s)  {errors}")
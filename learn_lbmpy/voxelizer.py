@@ -0,0 +1,324 @@
+"""
+Triangle mesh import and voxelization
+
+So far geometry was written as analytic callbacks like `pipe_geometry_callback` in
+`02_geom_and_bcs`. This module reads STL files (ASCII or binary) and turns the closed triangle
+mesh into a solid mask on the lattice:
+
+- ray parity: for every row of cell centres along x the intersections with the mesh are computed
+  for a whole tile of rows at once against the triangles overlapping that tile; cells behind an odd
+  number of intersections are solid. Tiles are processed by a thread pool.
+- link-wise wall distances: for interpolated bounce-back (`NoSlipLinearBouzidi`,
+  `QuadraticBounceBack`) the fraction q of each boundary link in front of the surface is computed by
+  segment/triangle intersection.
+
+Voxelizations are cached on disk, keyed by a hash of the triangles, the domain size, origin and
+spacing (directory `$LEARN_LBMPY_CACHE` or `~/.cache/learn_lbmpy`).
+
+Example:
+    geometry = voxelize('part.stl', domain_size=(256, 128, 128), spacing=0.5, origin=(-10, -32, -32))
+    bh.set_boundary(NoSlip('part'), mask_callback=geometry.mask_callback)
+    # or with interpolated bounce-back
+    bh.set_boundary(NoSlipLinearBouzidi('part', init_wall_distance=geometry.wall_distance_callback),
+                    mask_callback=geometry.mask_callback)
+"""
+
+import hashlib
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_CACHE_VERSION = b'voxelizer-1'
+
+# Rays are shifted by this fraction of a cell, so cell centres lying exactly on mesh edges or vertices
+# (common for meshes built on the same grid) do not hit two triangles at once.
+_RAY_JITTER = (1.1e-6, 1.7e-6)
+
+
+# ----------------------------------------------- mesh input ---------------------------------------------------------
+
+def load_stl(filename):
+    """Reads an ASCII or binary STL file and returns the triangles as array of shape (n, 3, 3)"""
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    if len(data) >= 84:
+        count = struct.unpack('<I', data[80:84])[0]
+        if len(data) == 84 + 50 * count:
+            record = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+            return np.frombuffer(data, dtype=record, count=count, offset=84)['vertices'].astype(np.float64)
+
+    vertices = [line.split()[1:4] for line in data.decode('ascii', errors='replace').splitlines()
+                if line.strip().startswith('vertex')]
+    if not vertices or len(vertices) % 3:
+        raise ValueError(f"{filename} is neither a binary nor an ASCII STL file")
+    return np.array(vertices, dtype=np.float64).reshape(-1, 3, 3)
+
+
+def save_stl(filename, triangles):
+    """Writes triangles of shape (n, 3, 3) as binary STL"""
+    triangles = np.asarray(triangles, dtype=np.float64)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-300)
+    record = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+    out = np.zeros(len(triangles), dtype=record)
+    out['normal'] = normals
+    out['vertices'] = triangles
+    with open(filename, 'wb') as f:
+        f.write(b'learn_lbmpy'.ljust(80, b' '))
+        f.write(struct.pack('<I', len(triangles)))
+        f.write(out.tobytes())
+
+
+def sphere_mesh(center=(0, 0, 0), radius=1.0, subdivisions=3):
+    """Triangulated sphere (icosphere), e.g. to test the voxelizer against the analytic sphere"""
+    t = (1 + 5 ** 0.5) / 2
+    vertices = [(-1, t, 0), (1, t, 0), (-1, -t, 0), (1, -t, 0), (0, -1, t), (0, 1, t), (0, -1, -t), (0, 1, -t),
+                (t, 0, -1), (t, 0, 1), (-t, 0, -1), (-t, 0, 1)]
+    faces = [(0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11), (1, 5, 9), (5, 11, 4), (11, 10, 2),
+             (10, 7, 6), (7, 1, 8), (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9), (4, 9, 5), (2, 4, 11),
+             (6, 2, 10), (8, 6, 7), (9, 8, 1)]
+    triangles = np.array(vertices, dtype=np.float64)[np.array(faces)]
+    for _ in range(subdivisions):
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        ab, bc, ca = (a + b) / 2, (b + c) / 2, (c + a) / 2
+        triangles = np.concatenate([np.stack(t, axis=1) for t in [(a, ab, ca), (b, bc, ab), (c, ca, bc),
+                                                                    (ab, bc, ca)]])
+    triangles /= np.linalg.norm(triangles, axis=-1, keepdims=True)
+    return np.asarray(center, dtype=np.float64) + radius * triangles
+
+
+def _as_triangles(mesh):
+    if isinstance(mesh, (str, os.PathLike)):
+        return load_stl(mesh)
+    triangles = np.asarray(mesh, dtype=np.float64)
+    if triangles.ndim != 3 or triangles.shape[1:] != (3, 3):
+        raise ValueError(f"Expected triangles of shape (n, 3, 3), got {triangles.shape}")
+    return triangles
+
+
+def mesh_hash(triangles):
+    return hashlib.sha1(np.ascontiguousarray(triangles, dtype=np.float64).tobytes()).hexdigest()
+
+
+def place(mesh, size, centre):
+    """Origin and spacing that scale the largest bounding box extent of `mesh` to `size` cells and put the
+    centre of the bounding box at lattice position `centre`"""
+    triangles = _as_triangles(mesh)
+    lower, upper = triangles.reshape(-1, 3).min(axis=0), triangles.reshape(-1, 3).max(axis=0)
+    spacing = float(np.max(upper - lower)) / size
+    origin = (lower + upper) / 2 - np.asarray(centre, dtype=np.float64) * spacing
+    return tuple(origin), spacing
+
+
+def fit_to_domain(mesh, domain_size, padding=2):
+    """Origin and spacing that fit the bounding box of `mesh` into `domain_size` cells with `padding`
+    cells on each side (same spacing on all axes)"""
+    triangles = _as_triangles(mesh)
+    extent = np.ptp(triangles.reshape(-1, 3), axis=0)
+    available = np.array(domain_size, dtype=np.float64) - 2 * padding
+    size = float(np.min(available * np.max(extent) / extent))
+    return place(triangles, size, np.array(domain_size) / 2)
+
+
+# ----------------------------------------------- voxelization -------------------------------------------------------
+
+def _voxelize_tile(triangles, bounds, x_centres, y_centres, z_centres):
+    """Solid mask of shape (nx, len(y_centres), len(z_centres)) by ray parity along x"""
+    y_low, y_high, z_low, z_high = y_centres[0], y_centres[-1], z_centres[0], z_centres[-1]
+    candidates = (bounds[:, 0, 1] <= y_high) & (bounds[:, 1, 1] >= y_low) & \
+                 (bounds[:, 0, 2] <= z_high) & (bounds[:, 1, 2] >= z_low)
+    nx = len(x_centres)
+    result = np.zeros((nx, len(y_centres), len(z_centres)), dtype=bool)
+    tri = triangles[candidates]
+    if len(tri) == 0:
+        return result
+
+    y, z = np.meshgrid(y_centres, z_centres, indexing='ij')
+    y, z = y.reshape(-1, 1), z.reshape(-1, 1)
+    (x0, y0, z0), (x1, y1, z1), (x2, y2, z2) = [tri[:, k].T for k in range(3)]
+
+    # edge functions of the triangles projected onto the y-z plane
+    w0 = (y1 - y) * (z2 - z) - (y2 - y) * (z1 - z)
+    w1 = (y2 - y) * (z0 - z) - (y0 - y) * (z2 - z)
+    w2 = (y0 - y) * (z1 - z) - (y1 - y) * (z0 - z)
+    area = w0 + w1 + w2
+    inside = (((w0 >= 0) & (w1 >= 0) & (w2 >= 0)) | ((w0 <= 0) & (w1 <= 0) & (w2 <= 0))) & (np.abs(area) > 1e-300)
+
+    ray, triangle = np.nonzero(inside)
+    if len(ray) == 0:
+        return result
+    a = area[ray, triangle]
+    x_hit = (w0[ray, triangle] * x0[triangle] + w1[ray, triangle] * x1[triangle] +
+             w2[ray, triangle] * x2[triangle]) / a
+
+    # every hit flips all cells behind it: count hits left of each cell centre, solid where odd
+    first_cell = np.clip(np.searchsorted(x_centres, x_hit), 0, nx)
+    flips = np.zeros((len(y_centres) * len(z_centres), nx + 1), dtype=np.int32)
+    np.add.at(flips, (ray, first_cell), 1)
+    parity = np.cumsum(flips[:, :nx], axis=1) % 2
+    return parity.T.reshape(nx, len(y_centres), len(z_centres)).astype(bool)
+
+
+def _voxelize(triangles, domain_size, origin, spacing, tile, workers):
+    origin, spacing = np.asarray(origin, dtype=np.float64), float(spacing)
+    centres = [origin[d] + (np.arange(domain_size[d]) + 0.5) * spacing for d in range(3)]
+    centres[1] = centres[1] + _RAY_JITTER[0] * spacing
+    centres[2] = centres[2] + _RAY_JITTER[1] * spacing
+    bounds = np.stack([triangles.min(axis=1), triangles.max(axis=1)], axis=1)    # (n, 2, 3)
+
+    solid = np.zeros(domain_size, dtype=bool)
+    tiles = [(slice(j, min(j + tile, domain_size[1])), slice(k, min(k + tile, domain_size[2])))
+             for j in range(0, domain_size[1], tile) for k in range(0, domain_size[2], tile)]
+
+    def work(tile_slices):
+        sy, sz = tile_slices
+        solid[:, sy, sz] = _voxelize_tile(triangles, bounds, centres[0], centres[1][sy], centres[2][sz])
+
+    if workers == 1:
+        for t in tiles:
+            work(t)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(work, tiles))
+    return solid
+
+
+def default_cache_dir():
+    return os.environ.get('LEARN_LBMPY_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'learn_lbmpy'))
+
+
+def voxelize(mesh, domain_size, origin=(0.0, 0.0, 0.0), spacing=1.0, tile=32, workers=None, cache=True,
+             cache_dir=None):
+    """Voxelizes a closed triangle mesh on a 3D lattice.
+
+    Args:
+        mesh: STL file name or triangles of shape (n, 3, 3)
+        domain_size: number of cells (nx, ny, nz)
+        origin: mesh coordinates of the lower corner of cell (0, 0, 0)
+        spacing: cell size in mesh units (see `fit_to_domain`)
+        tile: rays per tile edge, a tile of tile x tile rays is intersected with its triangles at once
+        workers: threads of the pool (None: number of CPUs, 1: serial)
+        cache: read and write the disk cache
+        cache_dir: cache directory, default `default_cache_dir()`
+
+    Returns:
+        `Voxelization`
+    """
+    triangles = _as_triangles(mesh)
+    domain_size = tuple(int(s) for s in domain_size)
+    if len(domain_size) != 3:
+        raise ValueError("Triangle meshes can only be voxelized on 3D domains")
+    origin = tuple(float(o) for o in origin)
+    spacing = float(spacing)
+
+    key = hashlib.sha1(_CACHE_VERSION + mesh_hash(triangles).encode() +
+                       repr((domain_size, origin, spacing)).encode()).hexdigest()
+    cache_file = os.path.join(cache_dir or default_cache_dir(), f'voxels_{key}.npz')
+    if cache and os.path.exists(cache_file):
+        with np.load(cache_file) as f:
+            solid = np.unpackbits(f['solid'], count=int(np.prod(domain_size))).reshape(domain_size).astype(bool)
+        return Voxelization(solid, triangles, origin, spacing, from_cache=True)
+
+    solid = _voxelize(triangles, domain_size, origin, spacing, tile, workers)
+    if cache:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temporary = cache_file + '.part.npz'
+        np.savez_compressed(temporary, solid=np.packbits(solid.ravel()))
+        os.replace(temporary, cache_file)
+    return Voxelization(solid, triangles, origin, spacing)
+
+
+# ----------------------------------------------- wall distances -----------------------------------------------------
+
+def segment_intersections(triangles, start, direction, chunk=128):
+    """Fraction t in (0, 1] along each segment `start + t * direction` where it first hits a triangle,
+    NaN where it does not (vectorized Moeller-Trumbore, segments processed in spatially sorted chunks)."""
+    start, direction = np.asarray(start, dtype=np.float64), np.asarray(direction, dtype=np.float64)
+    # triangles sorted by centroid x: a chunk only looks at the window of triangles that can reach its x range
+    centroid_x = triangles[:, :, 0].mean(axis=1)
+    triangles = triangles[np.argsort(centroid_x)]
+    centroid_x = np.sort(centroid_x)
+    reach = float(np.max(np.abs(triangles[:, :, 0] - centroid_x[:, np.newaxis]))) if len(triangles) else 0.0
+    v0 = triangles[:, 0]
+    e1, e2 = triangles[:, 1] - v0, triangles[:, 2] - v0
+    low, high = triangles.min(axis=1), triangles.max(axis=1)
+    result = np.full(len(start), np.nan)
+
+    order = np.lexsort(np.floor(start / 4).T[::-1])
+    for begin in range(0, len(order), chunk):
+        idx = order[begin:begin + chunk]
+        o, d = start[idx], direction[idx]
+        chunk_low, chunk_high = np.minimum(o, o + d).min(axis=0), np.maximum(o, o + d).max(axis=0)
+        window = slice(np.searchsorted(centroid_x, chunk_low[0] - reach),
+                       np.searchsorted(centroid_x, chunk_high[0] + reach, side='right'))
+        candidates = np.all((low[window] <= chunk_high) & (high[window] >= chunk_low), axis=1)
+        if not candidates.any():
+            continue
+        c_v0, c_e1, c_e2 = v0[window][candidates], e1[window][candidates], e2[window][candidates]
+
+        p = np.cross(d[:, np.newaxis, :], c_e2[np.newaxis])
+        det = np.einsum('tk,stk->st', c_e1, p)
+        valid = np.abs(det) > 1e-14
+        inv = np.where(valid, 1 / np.where(valid, det, 1), 0)
+        s = o[:, np.newaxis, :] - c_v0[np.newaxis]
+        u = np.einsum('stk,stk->st', s, p) * inv
+        q = np.cross(s, c_e1[np.newaxis])
+        v = np.einsum('sk,stk->st', d, q) * inv
+        t = np.einsum('tk,stk->st', c_e2, q) * inv
+        hit = valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0) & (t <= 1)
+        t = np.where(hit, t, np.inf).min(axis=1)
+        result[idx] = np.where(np.isfinite(t), t, np.nan)
+    return result
+
+
+class Voxelization:
+    """Solid mask of a voxelized mesh plus everything needed to hand it to a boundary handling.
+
+    Attributes:
+        solid: bool array of the domain size, True where the cell centre lies inside the mesh
+        fluid: its complement
+        from_cache: True if the mask was read from the disk cache
+    """
+
+    def __init__(self, solid, triangles, origin, spacing, from_cache=False):
+        self.solid = solid
+        self.triangles = triangles
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.spacing = spacing
+        self.from_cache = from_cache
+
+    @property
+    def fluid(self):
+        return ~self.solid
+
+    @property
+    def solid_fraction(self):
+        return float(self.solid.mean())
+
+    def mask_callback(self, *midpoints):
+        """`mask_callback` for `set_boundary`: looks the cell midpoints up in the solid mask"""
+        index = [np.floor(m).astype(np.int64) for m in midpoints]
+        valid = np.all([(i >= 0) & (i < s) for i, s in zip(index, self.solid.shape)], axis=0)
+        result = np.zeros(np.broadcast(*midpoints).shape, dtype=bool)
+        clipped = tuple(np.clip(i, 0, s - 1) for i, s in zip(index, self.solid.shape))
+        result[valid] = self.solid[clipped][valid]
+        return result
+
+    def link_wall_distances(self, cell_positions, link_offsets):
+        """Wall distance q in (0, 1] for links from fluid cell midpoints (lattice coordinates, shape (n, 3))
+        along `link_offsets` (n, 3); 0.5 (simple bounce-back) where no surface is found on the link."""
+        start = self.origin + np.asarray(cell_positions, dtype=np.float64) * self.spacing
+        direction = np.asarray(link_offsets, dtype=np.float64) * self.spacing
+        q = segment_intersections(self.triangles, start, direction)
+        return np.where(np.isnan(q), 0.5, q)
+
+    def wall_distance_callback(self, boundary_data, **_):
+        """`init_wall_distance` callback for `NoSlipLinearBouzidi` / `QuadraticBounceBack`"""
+        # `non_boundary_cell_positions` subtracts the ghost layers twice: the block offset handed to the
+        # setter by the boundary handling already starts at -ghost_layers
+        positions = np.stack([boundary_data.index_array[name] + boundary_data.offset[d] + 0.5
+                              for d, name in enumerate('xyz')], axis=-1)
+        boundary_data['q'] = self.link_wall_distances(positions, boundary_data.link_offsets())
@@ -47,6 +47,8 @@ if __name__ == "__main__":
                                   config=CreateKernelConfig(target=Target.CPU))
     print(channel_scenario._lbmKernels[0].ast)
 
+    # 10000 steps are far from the steady state, which takes several 100000 steps on this grid. Most of them
+    # can be run on a coarser grid first, see 05_coarse_to_fine.py
     channel_scenario.run(10000)
     plt.figure(dpi=200)
     plt.vector_field(channel_scenario.velocity[:, :], step=4)
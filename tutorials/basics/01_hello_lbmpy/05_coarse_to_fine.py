@@ -0,0 +1,111 @@
+from lbmpy.session import *
+import time
+
+# The channel of 04_channel_flow.py develops slowly: the slowest mode of the profile decays with H^2 / (pi^2 nu),
+# about 100000 steps for H = 50 and relaxation rate 1.97. On a grid coarsened by FACTOR with the same relaxation
+# rate (diffusive scaling, same Reynolds number) the flow develops in FACTOR^2 times fewer steps on FACTOR^2
+# times fewer cells. The coarse steady state is interpolated onto the fine grid, which then only has to remove
+# the interpolation and discretization differences. `python -m learn_lbmpy multilevel` does the same for the
+# registered scenarios (learn_lbmpy/multilevel.py).
+
+OMEGA, FORCE, FACTOR, TOLERANCE = 1.97, 1e-7, 2, 1e-5
+
+
+def channel(domain_size, force):
+    return create_channel(domain_size=domain_size, force=force, lbm_config=LBMConfig(relaxation_rate=OMEGA))
+
+
+def poiseuille(height, force):
+    # walls half a cell outside the first and last cell centre (halfway bounce-back)
+    nu = (1 / OMEGA - 0.5) / 3
+    y = np.arange(height) + 0.5
+    return force / (2 * nu) * y * (height - y)
+
+
+def run_to_steady_state(scenario, chunk, max_steps, reference):
+    # relative velocity change per chunk below TOLERANCE; records the error against the analytical profile
+    previous, steps, errors = scenario.velocity[:, :, 0].copy(), 0, []
+    while steps < max_steps:
+        scenario.run(chunk)
+        steps += chunk
+        current = scenario.velocity[:, :, 0].copy()
+        errors.append((steps, np.abs(current.mean(axis=0) - reference).max() / reference.max()))
+        if np.abs(current - previous).max() < TOLERANCE * np.abs(current).max():
+            break
+        previous = current
+    return steps, errors
+
+
+def refine(array, factor, periodic):
+    # cubic interpolation of cell-centred values along every axis; at walls the 4-point stencil is shifted inwards
+    for axis, wrap in enumerate(periodic):
+        n = array.shape[axis]
+        position = (np.arange(n * factor) + 0.5) / factor - 0.5
+        first = np.floor(position).astype(int) - 1
+        if not wrap:
+            first = np.clip(first, 0, n - 4)
+        t = position - first
+        shape = [1] * array.ndim
+        shape[axis] = -1
+        result = 0
+        for j in range(4):
+            weight = np.prod([(t - m) / (j - m) for m in range(4) if m != j], axis=0).reshape(shape)
+            result = result + weight * np.take(array, (first + j) % n, axis=axis)
+        array = result
+    return array
+
+
+if __name__ == "__main__":
+    test_run = 'is_test_run' in globals()
+    width, height = (40, 12) if test_run else (150, 50)
+    chunk, max_steps = (20, 100) if test_run else (500, 2000000)
+    reference = poiseuille(height, FORCE)
+
+    # Step 1) Coarse grid: same relaxation rate, lattice velocity FACTOR and force FACTOR^3 times larger.
+    # A coarse step covers FACTOR^2 fine steps of physical time.
+    start = time.perf_counter()
+    coarse = channel((width // FACTOR, height // FACTOR), FORCE * FACTOR ** 3)
+    coarse_steps, _ = run_to_steady_state(coarse, chunk // FACTOR ** 2, max_steps // FACTOR ** 2,
+                                          poiseuille(height // FACTOR, FORCE * FACTOR ** 3))
+    coarse_time = time.perf_counter() - start
+
+    # Step 2) Non-equilibrium part of the coarse PDFs: the PDFs minus their equilibrium. The PDFs are stored
+    # after collision; with equal relaxation rates the part scales with the velocity gradient, 1 / FACTOR^2.
+    dh = coarse.data_handling
+    pdfs = dh.gather_array(coarse.pdf_array_name).copy()
+    coarse.set_pdf_fields_from_macroscopic_values()
+    non_equilibrium = pdfs - dh.gather_array(coarse.pdf_array_name)
+
+    # Step 3) Fine grid: equilibrium of the interpolated velocity (density is constant in this channel) plus the
+    # interpolated non-equilibrium part
+    start = time.perf_counter()
+    fine = channel((width, height), FORCE)
+    periodic = fine.data_handling.periodicity
+    fine.data_handling.cpu_arrays[fine.velocity_data_name][1:-1, 1:-1] = \
+        refine(dh.gather_array(coarse.velocity_data_name), FACTOR, periodic) / FACTOR
+    fine.set_pdf_fields_from_macroscopic_values()
+    fine.data_handling.cpu_arrays[fine.pdf_array_name][1:-1, 1:-1] += \
+        refine(non_equilibrium, FACTOR, periodic) / FACTOR ** 2
+    fine_steps, warm_errors = run_to_steady_state(fine, chunk, max_steps, reference)
+    fine_time = time.perf_counter() - start
+
+    # Step 4) The same fine channel from a cold start
+    start = time.perf_counter()
+    cold = channel((width, height), FORCE)
+    cold_steps, cold_errors = run_to_steady_state(cold, chunk, max_steps, reference)
+    cold_time = time.perf_counter() - start
+
+    print(f"coarse grid: {coarse_steps} steps ({coarse_steps / FACTOR ** 4:.0f} fine steps of work), {coarse_time:.1f} s")
+    print(f"fine grid after the coarse start: {fine_steps} steps, {fine_time:.1f} s")
+    print(f"fine grid from a cold start: {cold_steps} steps, {cold_time:.1f} s")
+    print(f"fine steps saved: {cold_steps - fine_steps}, error of the profiles {warm_errors[-1][1]:.1e} "
+          f"and {cold_errors[-1][1]:.1e}")
+
+    plt.figure(dpi=200)
+    plt.semilogy(*zip(*cold_errors), label='cold start')
+    plt.semilogy(*zip(*warm_errors), label=f'after 1/{FACTOR} coarse grid')
+    plt.xlabel('fine time steps')
+    plt.ylabel('max error of the mean profile (relative)')
+    plt.legend()
+    plt.savefig("coarse_to_fine_convergence.png")
+    plt.clf()
@@ -0,0 +1,72 @@
+from lbmpy.session import *
+from lbmpy.lbstep import LatticeBoltzmannStep
+from pystencils.sympyextensions import count_operations
+import time
+
+# What do the methods of 01_lbm_method.py cost? For each method the stream-collide update rule is
+# generated and counted: floating point operations, PDF loads and stores, bytes per cell update. A kernel
+# with few operations per byte is limited by the memory bandwidth, so the throughput is at best
+#     MLUPS = bandwidth / bytes per cell
+# The bandwidth is measured by copying a large array (STREAM copy) and compared with the measured kernel.
+
+
+def best_time(function, repeats=3):
+    function()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def kernel_cost(lbm_config):
+    # Step 1) Update rule as it goes into create_kernel
+    q, dim = lbm_config.stencil.Q, lbm_config.stencil.D
+    src, dst = ps.fields(f"src({q}), dst({q}): double[{dim}D]")
+    update = create_lb_update_rule(lbm_config=lbm_config,
+                                   lbm_optimisation=LBMOptimisation(symbolic_field=src, symbolic_temporary_field=dst))
+
+    # Step 2) Operations, and distinct field accesses read and written
+    operations = count_operations(update.all_assignments, only_type=None)
+    loads = set().union(*(a.rhs.atoms(ps.Field.Access) for a in update.all_assignments))
+    stores = [a.lhs for a in update.main_assignments]
+    return sum(operations.values()), operations['divs'] + operations['sqrts'], len(loads), len(stores)
+
+
+def measured_mlups(lbm_config, domain_size, steps):
+    # Step 3) The kernel alone: no ghost layer synchronization, no boundaries
+    step = LatticeBoltzmannStep(domain_size=domain_size, periodicity=True, lbm_config=lbm_config)
+    dh, kernel = step.data_handling, step._lbmKernels[0]
+
+    def run():
+        for _ in range(steps):
+            dh.run_kernel(kernel, **step.kernel_params)
+            dh.swap(step.pdf_array_name, step._tmp_arr_name)
+
+    return steps * np.prod(domain_size) / best_time(run) * 1e-6
+
+
+if __name__ == "__main__":
+    test_run = 'is_test_run' in globals()
+    domain_size, steps = ((16, 16, 16), 1) if test_run else ((128, 128, 128), 10)
+
+    # Step 4) Memory bandwidth: bytes read plus bytes written by a copy larger than the caches
+    a = np.ones(2 ** 22 if test_run else 2 ** 25)
+    b = np.zeros_like(a)
+    bandwidth = 2 * a.nbytes / best_time(lambda: np.copyto(b, a))
+    print(f"STREAM copy: {bandwidth / 1e9:.1f} GB/s")
+
+    methods = [(Method.SRT, Stencil.D3Q19), (Method.TRT, Stencil.D3Q19), (Method.MRT, Stencil.D3Q19),
+               (Method.CENTRAL_MOMENT, Stencil.D3Q27), (Method.CUMULANT, Stencil.D3Q27)]
+    print(f"{'method':24s}{'flops':>7s}{'div/sqrt':>9s}{'loads':>7s}{'stores':>7s}{'flop/B':>8s}"
+          f"{'estimate':>10s}{'measured':>10s}")
+    for method, stencil in methods:
+        lbm_config = LBMConfig(stencil=LBStencil(stencil), method=method, relaxation_rate=1.8,
+                               compressible=method == Method.CUMULANT)
+        flops, slow, loads, stores = kernel_cost(lbm_config)
+        bytes_per_cell = 8 * (loads + stores)
+        estimate = bandwidth / bytes_per_cell * 1e-6
+        mlups = measured_mlups(lbm_config, domain_size, steps)
+        print(f"{method.name + ' ' + stencil.name:24s}{flops:7d}{slow:9d}{loads:7d}{stores:7d}"
+              f"{flops / bytes_per_cell:8.2f}{estimate:10.1f}{mlups:10.1f}")
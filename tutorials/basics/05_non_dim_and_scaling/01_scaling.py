@@ -42,7 +42,12 @@ if __name__ == "__main__":
     def set_obstacle_mask(x, y, *_):
         return (x-obstacle_midpoint[0])**2 + (y-obstacle_midpoint[1])**2 < obstacle_radius**2
 
+    # The animation is only shown once all 600 frames are computed. A channel with an obstacle can be watched
+    # while it runs with the live viewer instead: python -m learn_lbmpy run channel --set obstacle_radius=15 --live
     if 'is_test_run' not in globals():
+        # most of the initial steps can be run on a grid coarsened by 2 and interpolated onto this one, see
+        # ../01_hello_lbmpy/05_coarse_to_fine.py and
+        # python -m learn_lbmpy multilevel channel --set obstacle_radius=15 --steps 30000 --compare
         scenario1.run(30000)  # initial steps
 
         def run():
@@ -70,9 +75,7 @@ if __name__ == "__main__":
                     print("Animation saved as GIF instead")
                 except Exception as e3:
                     print(f"All save methods failed: {e3}")
-        
-        # type(animation)
-        # input()
+
     # else:
     #     scenario1.run(10)
     #     res = None
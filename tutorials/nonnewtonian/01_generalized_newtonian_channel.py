@@ -0,0 +1,112 @@
+from lbmpy.session import *
+from lbmpy.relaxationrates import get_shear_relaxation_rate, lattice_viscosity_from_relaxation_rate, \
+    relaxation_rate_from_lattice_viscosity
+from lbmpy.simplificationfactory import create_simplification_strategy
+from lbmpy.utils import frobenius_norm, second_order_moment_tensor
+
+# Channel flow of fluids whose viscosity depends on the local shear rate. Like the Smagorinsky model in
+# turbulence/06_smagorinsky.py, the shear rate is computed in the collision kernel from the non-equilibrium
+# PDFs of the cell itself,
+#     shear_rate = 3 omega / 2 sqrt(2 Pi_neq : Pi_neq),
+# and the shear relaxation rate omega follows from the viscosity nu(shear_rate). As omega appears on both
+# sides, a few fixed-point iterations shear_rate -> nu -> omega -> shear_rate are done in the kernel.
+# omega is clamped to [OMEGA_MIN, OMEGA_MAX] to keep the simulation stable.
+
+OMEGA_MIN, OMEGA_MAX = 0.2, 1.98
+
+
+def power_law(consistency, flow_index):
+    return lambda shear_rate: consistency * shear_rate ** (flow_index - 1)
+
+
+def carreau(nu_0, nu_inf, time_constant, flow_index):
+    return lambda shear_rate: nu_inf + (nu_0 - nu_inf) * (1 + (time_constant * shear_rate) ** 2) ** ((flow_index - 1) / 2)
+
+
+def bingham(plastic_viscosity, yield_stress, m=1e3):
+    # Papanastasiou regularization: nu stays finite in the unyielded plug
+    def viscosity(shear_rate):
+        exp = sp.exp if isinstance(shear_rate, sp.Basic) else np.exp
+        return plastic_viscosity + yield_stress * (1 - exp(-m * shear_rate)) / shear_rate
+    return viscosity
+
+
+def clamp(omega):
+    return sp.Piecewise((OMEGA_MIN, omega < OMEGA_MIN), (OMEGA_MAX, omega > OMEGA_MAX), (omega, True))
+
+
+def non_newtonian_collision_rule(viscosity, iterations=3):
+    # Step 1) MRT collision rule with a symbolic shear relaxation rate, not yet simplified
+    omega = sp.Symbol('omega')
+    lbm_config = LBMConfig(stencil=Stencil.D2Q9, method=Method.MRT, relaxation_rate=omega, force=(FORCE, 0))
+    collision_rule = create_lb_collision_rule(lbm_config=lbm_config,
+                                              lbm_optimisation=LBMOptimisation(simplification=False))
+    method = collision_rule.method
+
+    # Step 2) Norm of the non-equilibrium second moment, from the PDFs of the cell
+    f_neq = sp.Matrix(method.pre_collision_pdf_symbols) - method.get_equilibrium_terms()
+    pi_neq = sp.Symbol('Pi_neq')
+    equations = [ps.Assignment(pi_neq, frobenius_norm(second_order_moment_tensor(f_neq, method.stencil), factor=2))]
+
+    # Step 3) Fixed-point iterations, started from omega = 1 (incompressible method: rho = 1)
+    omega_i = sp.Integer(1)
+    for i in range(iterations):
+        shear_rate, nu, omega_new = sp.symbols(f"shear_rate_{i} nu_{i} omega_{i}")
+        equations += [ps.Assignment(shear_rate, sp.Max(sp.Rational(3, 2) * omega_i * pi_neq, 1e-12)),
+                      ps.Assignment(nu, viscosity(shear_rate)),
+                      ps.Assignment(omega_new, clamp(relaxation_rate_from_lattice_viscosity(nu)))]
+        omega_i = omega_new
+
+    # Step 4) The local omega replaces the shear relaxation rate, then the rule is simplified
+    collision_rule = collision_rule.new_with_substitutions({get_shear_relaxation_rate(method): omega_i})
+    collision_rule.subexpressions += equations
+    collision_rule.topological_sort(sort_subexpressions=True, sort_main_assignments=False)
+    return create_simplification_strategy(method)(collision_rule)
+
+
+def reference_profile(viscosity, height):
+    # Steady state: the shear stress FORCE * |y - H/2| equals nu(shear_rate) * shear_rate with nu limited
+    # like omega in the kernel. Solved for the shear rate by bisection and integrated from the wall.
+    nu_min = lattice_viscosity_from_relaxation_rate(OMEGA_MAX)
+    nu_max = lattice_viscosity_from_relaxation_rate(OMEGA_MIN)
+    y = np.linspace(0, height / 2, 2001)
+    stress = FORCE * (height / 2 - y)
+    low, high = np.full_like(y, 1e-14), np.full_like(y, 10.0)
+    for _ in range(100):
+        middle = 0.5 * (low + high)
+        too_small = middle * np.clip(viscosity(middle), nu_min, nu_max) < stress
+        low, high = np.where(too_small, middle, low), np.where(too_small, high, middle)
+    shear_rate = 0.5 * (low + high)
+    u = np.concatenate(([0.0], np.cumsum(0.5 * (shear_rate[1:] + shear_rate[:-1]) * np.diff(y))))
+    cells = np.arange(height) + 0.5
+    return np.interp(np.minimum(cells, height - cells), y, u)
+
+
+if __name__ == "__main__":
+    test_run = 'is_test_run' in globals()
+    FORCE, HEIGHT = 2e-5, 64
+    steps = 10 if test_run else 40000
+
+    fluids = {'Newtonian (nu = 1/6)': lambda shear_rate: 1 / 6 + 0 * shear_rate,
+              'power law (K = 0.01, n = 0.5)': power_law(0.01, 0.5),
+              'Carreau (nu_0 = 0.3, nu_inf = 0.005, lambda = 200, n = 0.5)': carreau(0.3, 0.005, 200.0, 0.5),
+              'Bingham (nu_p = 0.05, tau_y = 1e-4)': bingham(0.05, 1e-4)}
+
+    plt.figure(dpi=200)
+    for label, viscosity in fluids.items():
+        collision_rule = non_newtonian_collision_rule(viscosity)
+        channel = create_channel((8, HEIGHT), force=FORCE, lbm_config=LBMConfig(collision_rule=collision_rule,
+                                                                                 force=(FORCE, 0)))
+        channel.run(steps)
+        u = channel.velocity[:, :][..., 0].mean(axis=0)
+        u_ref = reference_profile(viscosity, HEIGHT)
+        print(f"  {label}: u_max = {u.max():.4f}, reference {u_ref.max():.4f}, "
+              f"max error {np.abs(u - u_ref).max() / u_ref.max():.2%}")
+        line, = plt.plot(np.arange(HEIGHT) + 0.5, u, 'o', markersize=2)
+        plt.plot(np.arange(HEIGHT) + 0.5, u_ref, color=line.get_color(), label=label, linewidth=0.8)
+
+    plt.xlabel('y')
+    plt.ylabel('u_x')
+    plt.legend(fontsize=5)
+    plt.title("Channel profiles: simulation (dots) and steady-state solution (lines)")
+    plt.savefig("channel_profiles.png")
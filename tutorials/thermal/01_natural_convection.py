@@ -0,0 +1,158 @@
+from lbmpy.session import *
+from lbmpy.boundaries import DiffusionDirichlet
+from lbmpy.macroscopic_value_kernels import macroscopic_values_getter
+from dataclasses import replace
+
+# Natural convection with two distributions: f for the flow, g for the temperature T.
+# The flow drives the temperature by advection, the temperature drives the flow with the
+# Boussinesq force F = g*beta*(T - T_ref) pointing up (+y). Both distributions are advanced
+# by ONE fused kernel: each cell pulls f and g, computes T and u and collides both.
+
+
+def fused_update_rule(flow_config, thermal_config, src, dst, g_src, g_dst, vel_field, temp_field, g_beta, t_ref):
+    T = sp.Symbol('T')
+
+    # Flow: Guo force depending on the symbol T; the velocity is written to vel_field for now
+    flow = create_lb_update_rule(
+        lbm_config=replace(flow_config, force=(0, g_beta * (T - t_ref)), force_model=ForceModel.GUO,
+                           output={'velocity': vel_field}),
+        lbm_optimisation=LBMOptimisation(symbolic_field=src, symbolic_temporary_field=dst))
+
+    # Temperature: first-order equilibrium w_i T (1 + 3 c_i.u) with u read from vel_field
+    thermal = create_lb_update_rule(
+        lbm_config=replace(thermal_config, velocity_input=vel_field, output={'density': temp_field}),
+        lbm_optimisation=LBMOptimisation(symbolic_field=g_src, symbolic_temporary_field=g_dst))
+
+    # Both rules name their subexpressions rho, vel0Term, ... -> rename those of the thermal rule
+    thermal = thermal.new_with_substitutions({a.lhs: sp.Symbol(a.lhs.name + '_g') for a in thermal.subexpressions},
+                                             substitute_on_lhs=True)
+
+    # The writes of u and T become subexpressions, so the coupling stays in registers
+    u = [sp.Symbol(f'u_cell_{i}') for i in range(2)]
+    subexpressions = flow.subexpressions + thermal.subexpressions
+    main = []
+    for a in flow.main_assignments + thermal.main_assignments:
+        if a.lhs.field == vel_field:
+            subexpressions.append(ps.Assignment(u[a.lhs.index[0]], a.rhs))
+        elif a.lhs.field == temp_field:
+            subexpressions.append(ps.Assignment(T, a.rhs))
+        else:
+            main.append(a)
+
+    fused = ps.AssignmentCollection(main, subexpressions)
+    fused = fused.new_with_substitutions({vel_field.center(i): u[i] for i in range(2)})
+    fused.topological_sort(sort_subexpressions=True, sort_main_assignments=False)
+    return fused, flow.method, thermal.method
+
+
+def setup(domain_size, rayleigh_number, prandtl_number, hot_wall, cold_wall, adiabatic_walls, periodicity):
+    height = domain_size[0] if hot_wall in ('W', 'E') else domain_size[1]
+
+    # Step 1) Lattice parameters from Ra and Pr. The free-fall velocity U = sqrt(g beta dT H) is kept at
+    # 0.05 (low Mach number); nu = U H sqrt(Pr/Ra), alpha = nu/Pr and c_s^2 = 1/3 for both lattices.
+    velocity_scale, delta_t = 0.05, 1.0
+    nu = velocity_scale * height * np.sqrt(prandtl_number / rayleigh_number)
+    alpha = nu / prandtl_number
+    g_beta = velocity_scale ** 2 / (height * delta_t)
+    omega, omega_t = 1 / (3 * nu + 0.5), 1 / (3 * alpha + 0.5)
+    print(f"Ra = {rayleigh_number:g}, Pr = {prandtl_number}: nu = {nu:.4f}, alpha = {alpha:.4f}, "
+          f"omega = {omega:.3f}, omega_T = {omega_t:.3f}")
+
+    # Step 2) Arrays: two PDF sets with their temporary copies, plus u and T for output
+    dh = ps.create_data_handling(domain_size=domain_size, periodicity=periodicity)
+    src = dh.add_array('src', values_per_cell=9)
+    dst = dh.add_array('dst', values_per_cell=9)
+    g_src = dh.add_array('g_src', values_per_cell=9)
+    g_dst = dh.add_array('g_dst', values_per_cell=9)
+    vel_field = dh.add_array('velField', values_per_cell=2)
+    temp_field = dh.add_array('tempField', values_per_cell=1)
+
+    # Step 3) Methods and the fused update rule
+    flow_config = LBMConfig(stencil=Stencil.D2Q9, method=Method.SRT, relaxation_rate=omega, compressible=False)
+    thermal_config = LBMConfig(stencil=Stencil.D2Q9, method=Method.SRT, relaxation_rate=omega_t,
+                               compressible=True, zero_centered=False, equilibrium_order=1)
+    update, flow_method, thermal_method = fused_update_rule(flow_config, thermal_config, src, dst, g_src, g_dst,
+                                                            vel_field, temp_field, g_beta, 0.5)
+    kernel = ps.create_kernel(update, target=dh.default_target).compile()
+
+    # Step 4) Getter for the output: T from g, u from f with the force shift at that T
+    getter = macroscopic_values_getter(flow_method, None, vel_field, src)
+    T = sp.Symbol('T')
+    getter = ps.AssignmentCollection(getter.main_assignments + [ps.Assignment(temp_field.center, T)],
+                                     [ps.Assignment(T, sum(g_src.center_vector))] + getter.subexpressions)
+    getter_kernel = ps.create_kernel(getter, target=dh.default_target).compile()
+
+    # Step 5) Boundaries: no-slip walls for f; fixed temperatures (anti-bounce-back) on the hot and
+    # cold wall and zero heat flux (bounce-back) on the adiabatic walls for g
+    bh = LatticeBoltzmannBoundaryHandling(flow_method, dh, 'src', name="bh")
+    bh_t = LatticeBoltzmannBoundaryHandling(thermal_method, dh, 'g_src', name="bh_t")
+    for direction in (hot_wall, cold_wall) + adiabatic_walls:
+        bh.set_boundary(NoSlip("wall"), slice_from_direction(direction, 2))
+    bh_t.set_boundary(DiffusionDirichlet(1.0, name='hot'), slice_from_direction(hot_wall, 2))
+    bh_t.set_boundary(DiffusionDirichlet(0.0, name='cold'), slice_from_direction(cold_wall, 2))
+    for direction in adiabatic_walls:
+        bh_t.set_boundary(NoSlip("adiabatic"), slice_from_direction(direction, 2))
+
+    # Step 6) Initial state: fluid at rest, linear temperature between the walls plus a small
+    # perturbation with one roll pair per domain width to trigger the Rayleigh-Benard instability
+    x, y = np.meshgrid(np.arange(domain_size[0]) + 0.5, np.arange(domain_size[1]) + 0.5, indexing='ij')
+    position = {'W': x / domain_size[0], 'E': 1 - x / domain_size[0],
+                'S': y / domain_size[1], 'N': 1 - y / domain_size[1]}[hot_wall]
+    temperature = 1.0 - position + 0.01 * np.sin(np.pi * position) * np.cos(2 * np.pi * x / domain_size[0])
+    dh.fill('src', 0.0, ghost_layers=True)
+    dh.fill('g_src', 0.0, ghost_layers=True)
+    dh.cpu_arrays['src'][1:-1, 1:-1] = [float(w) for w in flow_method.weights]
+    dh.cpu_arrays['g_src'][1:-1, 1:-1] = temperature[..., np.newaxis] * [float(w) for w in thermal_method.weights]
+
+    sync = dh.synchronization_function(['src', 'g_src'])
+
+    def timeloop(time_steps):
+        for i in range(time_steps):
+            sync()
+            bh()
+            bh_t()
+            dh.run_kernel(kernel)
+            dh.swap('src', 'dst')
+            dh.swap('g_src', 'g_dst')
+        dh.run_kernel(getter_kernel)
+
+    def nusselt_number(axis):
+        # volume average: Nu = 1 + <u_n T> H / (alpha dT), u_n pointing from the hot to the cold wall
+        sign = 1 if hot_wall in ('W', 'S') else -1
+        u_n = sign * dh.gather_array('velField')[..., axis]
+        return 1 + np.mean(u_n * dh.gather_array('tempField')) * height / alpha
+
+    return dh, timeloop, nusselt_number
+
+
+def plot(dh, title, filename):
+    plt.figure(dpi=200)
+    velocity = dh.gather_array('velField')
+    plt.scalar_field(dh.gather_array('tempField'), cmap='coolwarm')
+    plt.streamplot(np.arange(velocity.shape[0]), np.arange(velocity.shape[1]),
+                   velocity[..., 0].T, velocity[..., 1].T, color='k', linewidth=0.5)
+    plt.title(title)
+    plt.savefig(filename)
+    plt.clf()
+
+
+if __name__ == "__main__":
+    test_run = 'is_test_run' in globals()
+
+    # Part A) Differentially heated cavity: hot left wall, cold right wall, adiabatic top and bottom.
+    # Reference: de Vahl Davis (1983), Pr = 0.71, Ra = 1e4 -> Nu = 2.243
+    dh, timeloop, nusselt_number = setup((64, 64), 1e4, 0.71, 'W', 'E', ('S', 'N'), (False, False))
+    chunks, steps = (1, 10) if test_run else (10, 3000)
+    for chunk in range(chunks):
+        timeloop(steps)
+        print(f"  cavity, step {(chunk + 1) * steps:6d}: Nu = {nusselt_number(0):.4f} (de Vahl Davis: 2.243)")
+    plot(dh, "Differentially heated cavity, Ra = 1e4", "heated_cavity.png")
+
+    # Part B) Rayleigh-Benard convection: hot bottom, cold top, periodic in x. Above the critical
+    # Rayleigh number (1708 for rigid walls) the conduction state breaks up into convection rolls.
+    dh, timeloop, nusselt_number = setup((128, 64), 5000, 0.71, 'S', 'N', (), (True, False))
+    chunks, steps = (1, 10) if test_run else (10, 4000)
+    for chunk in range(chunks):
+        timeloop(steps)
+        print(f"  Rayleigh-Benard, step {(chunk + 1) * steps:6d}: Nu = {nusselt_number(1):.4f}")
+    plot(dh, "Rayleigh-Benard convection, Ra = 5000", "rayleigh_benard.png")
@@ -0,0 +1,179 @@
+from lbmpy.session import *
+from lbmpy.boundaries import DiffusionDirichlet, FreeSlip
+from dataclasses import replace
+import time
+
+# Thermocapillary (Marangoni) flow: a liquid layer on a wall with the temperature A cos(k x) has a free
+# surface on top. The surface tension sigma = sigma_0 - gamma T is lower where the liquid is warm, so the
+# surface is pulled towards the cold regions by the stress -gamma dT/dx. Three physics modules are coupled:
+#   flow           LB for the velocity, driven by the surface force
+#   temperature    LB for T (advection-diffusion), advected by the velocity
+#   surface_force  Marangoni stress in the top cell layer, from the temperature gradient
+# The temperature changes much slower than the flow. A small scheduler runs each module at its own rate:
+# the temperature and the surface force only every THERMAL_EVERY steps, with a thermal time step that
+# is THERMAL_EVERY times larger (diffusivity and advection velocity scaled accordingly).
+
+LENGTH, HEIGHT = 128, 32
+NU, PRANDTL, GAMMA, AMPLITUDE = 0.1, 1.0, 1e-4, 0.5
+
+
+class Scheduler:
+    """Runs tasks at their own rates, ordered by the data they read and write, and synchronizes ghost layers
+    only when they are out of date"""
+
+    def __init__(self, dh):
+        self.dh, self.tasks, self.dirty, self.syncs, self.step = dh, [], None, 0, 0
+
+    def add(self, name, calls, every=1, reads=(), writes=(), ghost_layers=(), swaps=()):
+        self.tasks.append(dict(name=name, calls=calls, every=every, reads=reads, writes=writes,
+                               ghost_layers=ghost_layers, swaps=swaps))
+
+    def order(self):
+        # a task runs after the tasks writing what it reads; in a cycle the first task added goes first
+        remaining, result = list(self.tasks), []
+        while remaining:
+            ready = [t for t in remaining if not any(set(t['reads']) & set(o['writes'])
+                                                     for o in remaining if o is not t)]
+            task = (ready or remaining)[0]
+            result.append(task)
+            remaining.remove(task)
+        return result
+
+    def run(self, time_steps):
+        order = self.order()
+        if self.dirty is None:
+            self.dirty = {name for t in self.tasks for name in t['ghost_layers']}
+        for _ in range(time_steps):
+            for task in order:
+                if self.step % task['every']:
+                    continue
+                needed = [name for name in task['ghost_layers'] if name in self.dirty]
+                if needed:
+                    self.dh.synchronization_function(needed)()
+                    self.dirty -= set(needed)
+                    self.syncs += 1
+                for call in task['calls']:
+                    call()
+                for a, b in task['swaps']:
+                    self.dh.swap(a, b)
+                self.dirty |= set(task['writes'])
+            self.step += 1
+
+
+def setup(thermal_every):
+    # Step 1) Arrays: PDFs of flow and temperature with their temporary copies, velocity, T and the force.
+    # Periodic in x, wall at the bottom and free surface at the top.
+    dh = ps.create_data_handling(domain_size=(LENGTH, HEIGHT), periodicity=(True, False))
+    src, dst = dh.add_array('src', values_per_cell=9), dh.add_array('dst', values_per_cell=9)
+    g_src, g_dst = dh.add_array('g_src', values_per_cell=9), dh.add_array('g_dst', values_per_cell=9)
+    vel_field = dh.add_array('velField', values_per_cell=2)
+    temp_field = dh.add_array('tempField', values_per_cell=1)
+    force_field = dh.add_array('forceField', values_per_cell=2)
+    for name in dh.array_names:
+        dh.fill(name, 0.0, ghost_layers=True)
+
+    # Step 2) Flow kernel: Guo force read from forceField, velocity written to velField
+    flow_config = LBMConfig(stencil=Stencil.D2Q9, method=Method.SRT, relaxation_rate=1 / (3 * NU + 0.5),
+                            compressible=False)
+    flow = create_lb_update_rule(
+        lbm_config=replace(flow_config, force=tuple(force_field.center_vector), force_model=ForceModel.GUO,
+                           output={'velocity': vel_field}),
+        lbm_optimisation=LBMOptimisation(symbolic_field=src, symbolic_temporary_field=dst))
+    flow_kernel = ps.create_kernel(flow, target=dh.default_target).compile()
+
+    # Step 3) Thermal kernel: one call advances T by `thermal_every` flow steps, so the diffusivity and the
+    # advecting velocity are multiplied by `thermal_every`
+    alpha = NU / PRANDTL
+    thermal_config = LBMConfig(stencil=Stencil.D2Q9, method=Method.SRT, compressible=True, zero_centered=False,
+                               equilibrium_order=1, relaxation_rate=1 / (3 * alpha * thermal_every + 0.5))
+    thermal = create_lb_update_rule(
+        lbm_config=replace(thermal_config, velocity_input=vel_field, output={'density': temp_field}),
+        lbm_optimisation=LBMOptimisation(symbolic_field=g_src, symbolic_temporary_field=g_dst))
+    thermal = thermal.new_with_substitutions({vel_field.center(i): thermal_every * vel_field.center(i)
+                                              for i in range(2)})
+    thermal_kernel = ps.create_kernel(thermal, target=dh.default_target).compile()
+
+    # Step 4) Surface force: -gamma dT/dx as a force density in the top cell layer (iteration_slice counts
+    # the ghost layers: interior in x, last interior row in y)
+    surface_force = [ps.Assignment(force_field.center(0), -GAMMA * (temp_field[1, 0] - temp_field[-1, 0]) / 2)]
+    config = ps.CreateKernelConfig(target=dh.default_target, iteration_slice=(slice(1, -1), -2))
+    surface_kernel = ps.create_kernel(surface_force, config=config).compile()
+
+    # Step 5) Boundaries: no-slip wall with T = A cos(k x) at the bottom, free-slip and adiabatic surface on top
+    bh = LatticeBoltzmannBoundaryHandling(flow.method, dh, 'src', name="bh")
+    bh.set_boundary(NoSlip("wall"), slice_from_direction('S', 2))
+    bh.set_boundary(FreeSlip(flow.method.stencil, normal_direction=(0, -1)), slice_from_direction('N', 2))
+
+    def wall_temperature(boundary_data, **_):
+        # x where the link crosses the wall; the index list counts the ghost layer
+        x = boundary_data.index_array['x'] - 0.5 + 0.5 * boundary_data.link_offsets()[:, 0]
+        boundary_data['concentration'] = AMPLITUDE * np.cos(2 * np.pi * x / LENGTH)
+
+    bh_t = LatticeBoltzmannBoundaryHandling(thermal.method, dh, 'g_src', name="bh_t")
+    bh_t.set_boundary(DiffusionDirichlet(wall_temperature), slice_from_direction('S', 2))
+    bh_t.set_boundary(NoSlip("adiabatic"), slice_from_direction('N', 2))
+
+    # Step 6) Tasks, on purpose not in the order they have to run in. The ghost layers of the PDFs are needed
+    # for streaming, those of T for the gradient.
+    scheduler = Scheduler(dh)
+    scheduler.add('surface_force', [lambda: dh.run_kernel(surface_kernel)], every=thermal_every,
+                  reads=['tempField'], writes=['forceField'], ghost_layers=['tempField'])
+    scheduler.add('temperature', [bh_t, lambda: dh.run_kernel(thermal_kernel)], every=thermal_every,
+                  reads=['velField'], writes=['g_src', 'tempField'], ghost_layers=['g_src'],
+                  swaps=[('g_src', 'g_dst')])
+    scheduler.add('flow', [bh, lambda: dh.run_kernel(flow_kernel)], reads=['forceField'],
+                  writes=['src', 'velField'], ghost_layers=['src'], swaps=[('src', 'dst')])
+    return dh, scheduler
+
+
+def stokes_amplitude(y):
+    # Small Marangoni and Reynolds numbers: T from pure conduction, Stokes flow u_x = f'(y) sin(k x) with
+    # f'''' - 2 k^2 f'' + k^4 f = 0, f = f' = 0 at the wall, f = 0 and nu f'' = gamma A k / cosh(k H) on top
+    k = 2 * np.pi / LENGTH
+    tau = GAMMA * AMPLITUDE * k / np.cosh(k * HEIGHT)
+
+    def basis(y):
+        c, s = np.cosh(k * y), np.sinh(k * y)
+        return np.array([[c, y * c, s, y * s],
+                         [k * s, c + k * y * s, k * c, s + k * y * c],
+                         [k * k * c, 2 * k * s + k * k * y * c, k * k * s, 2 * k * c + k * k * y * s]])
+
+    bottom, top = basis(0.0), basis(float(HEIGHT))
+    coefficients = np.linalg.solve([bottom[0], bottom[1], top[0], NU * top[2]], [0, 0, 0, tau])
+    return basis(y)[1].T @ coefficients
+
+
+if __name__ == "__main__":
+    test_run = 'is_test_run' in globals()
+    steps = 8 if test_run else 20000
+
+    y = np.arange(HEIGHT) + 0.5
+    reference = stokes_amplitude(y)
+    x = np.arange(LENGTH) + 0.5
+    plt.figure(dpi=200)
+    for thermal_every in (1, 4):
+        dh, scheduler = setup(thermal_every)
+        print(f"thermal_every = {thermal_every}: order {' -> '.join(t['name'] for t in scheduler.order())}")
+        start = time.perf_counter()
+        scheduler.run(steps)
+        duration = time.perf_counter() - start
+        # amplitude of u_x = U(y) sin(k x)
+        amplitude = 2 * np.mean(dh.gather_array('velField')[..., 0] * np.sin(2 * np.pi * x / LENGTH)[:, None], axis=0)
+        error = np.abs(amplitude - reference).max() / np.abs(reference).max()
+        print(f"  {steps} steps in {duration:.1f} s, {scheduler.syncs / steps:.2f} ghost layer syncs per step, "
+              f"surface velocity {amplitude[-1]:.3e} (Stokes {reference[-1]:.3e}), max error {error:.1%}")
+        plt.plot(amplitude, y, 'o', markersize=2, label=f"LBM, T every {thermal_every} steps")
+    plt.plot(reference, y, 'k', linewidth=0.8, label='Stokes flow')
+    plt.xlabel('amplitude of u_x')
+    plt.ylabel('y')
+    plt.legend()
+    plt.savefig("velocity_profile.png")
+    plt.clf()
+
+    plt.figure(dpi=200)
+    velocity = dh.gather_array('velField')
+    plt.scalar_field(dh.gather_array('tempField'), cmap='coolwarm')
+    plt.streamplot(np.arange(LENGTH), np.arange(HEIGHT), velocity[..., 0].T, velocity[..., 1].T, color='k',
+                   linewidth=0.5)
+    plt.title("Temperature and streamlines")
+    plt.savefig("marangoni_layer.png")
@@ -6,6 +6,11 @@ from pystencils.simp import sympy_cse
 from lbmpy.chapman_enskog import ChapmanEnskogAnalysis, CeMoment
 from lbmpy.chapman_enskog.chapman_enskog import remove_higher_order_u
 
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from learn_lbmpy.turbulence_statistics import add_running_statistics, add_statistics_arrays
+
 def second_order_moment_tensor(function_values, stencil):
     assert len(function_values) == len(stencil)
     dim = len(stencil[0])
@@ -17,9 +22,9 @@ def frobenius_norm(matrix, factor=1):
 
 def smagorinsky_equations(ω_0, ω_total, method):
     f_neq = sp.Matrix(method.pre_collision_pdf_symbols) - method.get_equilibrium_terms()
-    return [sp.Eq(τ_0, 1 / ω_0),
-            sp.Eq(Π, frobenius_norm(second_order_moment_tensor(f_neq, method.stencil), factor=2)),
-            sp.Eq(ω_total, 1 / τ_val)]
+    return [ps.Assignment(τ_0, 1 / ω_0),
+            ps.Assignment(Π, frobenius_norm(second_order_moment_tensor(f_neq, method.stencil), factor=2)),
+            ps.Assignment(ω_total, 1 / τ_val)]
 
 def get_Π_1(ce_analysis, component):
     val = ce_analysis.higher_order_moments[component]
@@ -64,8 +69,16 @@ if __name__ == "__main__":
     collision_rule.topological_sort(sort_subexpressions=True, sort_main_assignments=False)
     print(collision_rule)
 
-    ch = create_channel((300, 100), force=1e-6, collision_rule=collision_rule,
-                    kernel_params={"C_S": 0.12, "omega": 1.999})
+    # Running statistics: accumulators for the mean velocity, the sums of products of the fluctuations and the
+    # sample count live next to the PDFs and are updated by the LBM kernel itself (Welford's algorithm, see
+    # learn_lbmpy.turbulence_statistics), so no snapshots are stored.
+    # The kernel parameter "statistics_weight" switches the accumulation on (1) and off (0).
+    dh = ps.create_data_handling((300, 100), periodicity=(True, False))
+    u_mean, u_products, samples = add_statistics_arrays(dh)  # products: xx, xy, yy
+    collision_rule = add_running_statistics(collision_rule, u_mean, u_products, samples)
+
+    ch = create_channel(force=1e-6, data_handling=dh, collision_rule=collision_rule,
+                    kernel_params={"C_S": 0.12, "omega": 1.999, "statistics_weight": 0.0})
     ch.run(5000)
 
     plt.figure(dpi=200)
@@ -73,6 +86,31 @@ if __name__ == "__main__":
     plt.savefig("velocity_field.png")
     print(f'max velocity = {np.max(ch.velocity[:, :])}')
 
+    # The channel stays laminar; a cylinder makes it shed vortices, which turn turbulent after about 60000 steps
+    test_run = 'is_test_run' in globals()
+    ch.boundary_handling.set_boundary(NoSlip("obstacle"), mask_callback=lambda x, y: (x - 60)**2 + (y - 50)**2 < 10**2)
+    ch.run(100 if test_run else 55000)
+
+    ch.kernel_params["statistics_weight"] = 1.0   # start
+    ch.run(100 if test_run else 40000)
+    ch.kernel_params["statistics_weight"] = 0.0   # stop; dh.fill(name, 0.0) on the three arrays resets
+    n = dh.gather_array(samples.name)
+    mean = dh.gather_array(u_mean.name)
+    covariance = dh.gather_array(u_products.name) / np.maximum(n, 1)[..., np.newaxis]
+    print(f"samples = {int(n.max())}")
+
+    fig, axes = plt.subplots(4, 1, figsize=(8, 10), dpi=200)
+    for ax, (title, values) in zip(axes, [("mean u_x", mean[..., 0]),
+                                          ("rms u_x'", np.sqrt(covariance[..., 0])),
+                                          ("rms u_y'", np.sqrt(covariance[..., 2])),
+                                          ("Reynolds stress -<u_x' u_y'>", -covariance[..., 1])]):
+        image = ax.imshow(values.T, origin='lower')
+        fig.colorbar(image, ax=ax)
+        ax.set_title(title)
+    plt.tight_layout()
+    plt.savefig("turbulence_statistics.png")
+    plt.clf()
+
     compressible_model = create_lb_method(stencil=Stencil.D2Q9, compressible=True, zero_centered=False)
     incompressible_model = create_lb_method(stencil=Stencil.D2Q9, compressible=False, zero_centered=False)
 